@@ -7,22 +7,37 @@ serverless payments sandbox including API Gateway, Lambda functions,
 DynamoDB tables, SNS topics, and monitoring resources.
 """
 
+import os
+import sys
+
 import aws_cdk as cdk
 from aws_cdk import (
     Stack,
     aws_apigateway as apigateway,
+    aws_applicationautoscaling as appscaling,
     aws_lambda as lambda_,
+    aws_lambda_event_sources as lambda_event_sources,
     aws_dynamodb as dynamodb,
     aws_sns as sns,
+    aws_sns_subscriptions as sns_subscriptions,
+    aws_sqs as sqs,
     aws_stepfunctions as sfn,
+    aws_stepfunctions_tasks as sfn_tasks,
+    aws_events as events,
+    aws_events_targets as events_targets,
     aws_cloudwatch as cloudwatch,
     aws_iam as iam,
     aws_logs as logs,
     Duration,
     RemovalPolicy,
+    Size,
 )
 from constructs import Construct
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from telemetry import PHASES
+
 
 class PaymentsSandboxStack(Stack):
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
@@ -44,6 +59,8 @@ class PaymentsSandboxStack(Stack):
             removal_policy=RemovalPolicy.DESTROY,  # For development
             time_to_live_attribute="ttl",
             point_in_time_recovery=True,
+            # Feeds the read projections (see projections.py)
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES,
         )
 
         # Global Secondary Index for card_id lookups
@@ -60,6 +77,82 @@ class PaymentsSandboxStack(Stack):
             projection_type=dynamodb.ProjectionType.ALL,
         )
 
+        # Global Secondary Index for T+1 settlement: "<date>#<shard>" buckets
+        # spread one day's captures/refunds over SETTLEMENT_SHARDS partitions
+        self.payments_table.add_global_secondary_index(
+            index_name="settlement_index",
+            partition_key=dynamodb.Attribute(
+                name="settlement_bucket",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="created_at",
+                type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.ALL,
+        )
+
+        # Global Secondary Index for merchant/time range queries: partition
+        # keys are "<merchant_id>#<period>" (month, or day/hour for hot merchants)
+        self.payments_table.add_global_secondary_index(
+            index_name="merchant_index",
+            partition_key=dynamodb.Attribute(
+                name="merchant_bucket",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="created_at",
+                type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.ALL,
+        )
+
+        # Idempotency records, keyed by a 16-byte hash of operation and key
+        # and expired by TTL after IDEMPOTENCY_TTL_HOURS
+        self.idempotency_table = dynamodb.Table(
+            self, "IdempotencyTable",
+            table_name="payments-idempotency",
+            partition_key=dynamodb.Attribute(
+                name="k",
+                type=dynamodb.AttributeType.BINARY
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,  # For development
+            time_to_live_attribute="ttl",
+        )
+
+        # Read projections behind the dashboard endpoints: recent transactions,
+        # merchant and daily totals, webhook delivery status (see projections.py)
+        self.projections_table = dynamodb.Table(
+            self, "ProjectionsTable",
+            table_name="payments-projections",
+            partition_key=dynamodb.Attribute(
+                name="pk",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="sk",
+                type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.DESTROY,  # For development
+            time_to_live_attribute="ttl",
+        )
+
+        # Change feeds: recent rows ordered by the time they were last projected
+        self.projections_table.add_global_secondary_index(
+            index_name="changes_index",
+            partition_key=dynamodb.Attribute(
+                name="pk",
+                type=dynamodb.AttributeType.STRING
+            ),
+            sort_key=dynamodb.Attribute(
+                name="changed",
+                type=dynamodb.AttributeType.STRING
+            ),
+            projection_type=dynamodb.ProjectionType.ALL,
+        )
+
         # SNS Topic for Webhooks
         self.webhook_topic = sns.Topic(
             self, "WebhookTopic",
@@ -78,22 +171,246 @@ class PaymentsSandboxStack(Stack):
             memory_size=512,
             environment={
                 "PAYMENTS_TABLE": self.payments_table.table_name,
+                "IDEMPOTENCY_TABLE": self.idempotency_table.table_name,
+                "IDEMPOTENCY_FILTER_CAPACITY": "200000",
+                "IDEMPOTENCY_FILTER_FP_RATE": "0.01",
+                "PROJECTIONS_TABLE": self.projections_table.table_name,
+                "PROJECTIONS_MODE": "stream",
+                "CHANGE_FEED_LAG_SECONDS": "5",
+                "BASE_CURRENCY": "USD",
+                "AUTHORIZATION_LIMIT": "1000000",
+                "FX_REFRESH_SECONDS": "300",
+                "RISK_ENABLED": "true",
+                # Flag rule breaks without declining until the rules are tuned; "enforce" declines
+                "RISK_MODE": "log",
+                "RISK_BUDGET_MS": "0.5",
+                "SIMULATION_PROFILE": "",
+                "SIMULATION_MERCHANT_PROFILES": "",
+                "SIMULATION_ALLOW_HEADER": "false",
                 "WEBHOOK_TOPIC_ARN": self.webhook_topic.topic_arn,
                 "POWERTOOLS_SERVICE_NAME": "payments-api",
+                "POWERTOOLS_METRICS_NAMESPACE": "PaymentsSandbox",
                 "LOG_LEVEL": "INFO",
+                "MERCHANT_BUCKET_GRANULARITY": "month",
+                "MERCHANT_BUCKET_OVERRIDES": "",
+                "ADMISSION_MERCHANT_RATE": "50",
+                "ADMISSION_MERCHANT_BURST": "100",
+                "ADMISSION_MAX_IN_FLIGHT": "64",
+                "ADMISSION_LATENCY_THRESHOLD_MS": "250",
+                "AWS_MAX_POOL_CONNECTIONS": "50",
+                "AWS_MAX_ATTEMPTS": "3",
+                "REQUEST_BUDGET_MS": "10000",
+                "BREAKER_FAILURE_THRESHOLD": "5",
+                "BREAKER_RESET_SECONDS": "10",
+                "PROFILER_ENABLED": "false",
+                "PROFILER_SAMPLE_RATE": "0.01",
+                "PROFILER_THRESHOLD_MS": "1000",
+                "TRAFFIC_CAPTURE_ENABLED": "false",
+                "TRAFFIC_CAPTURE_SAMPLE_RATE": "0.01",
             },
             log_retention=logs.RetentionDays.ONE_WEEK,
         )
 
         # Grant permissions to Lambda
         self.payments_table.grant_read_write_data(self.payment_lambda)
+        self.idempotency_table.grant_read_write_data(self.payment_lambda)
+        self.projections_table.grant_read_data(self.payment_lambda)
         self.webhook_topic.grant_publish(self.payment_lambda)
+        # Warm-up reads the topic's attributes to open SNS connections
+        self.payment_lambda.add_to_role_policy(iam.PolicyStatement(
+            actions=["sns:GetTopicAttributes"],
+            resources=[self.webhook_topic.topic_arn],
+        ))
+
+        # API Gateway invokes the "live" alias, whose provisioned containers are
+        # initialized ahead of traffic and warm up during init (see warmup.py)
+        self.payment_alias = lambda_.Alias(
+            self, "PaymentAPILiveAlias",
+            alias_name="live",
+            version=self.payment_lambda.current_version,
+            provisioned_concurrent_executions=2,
+        )
+        provisioned_scaling = self.payment_alias.add_auto_scaling(min_capacity=2, max_capacity=20)
+        provisioned_scaling.scale_on_utilization(utilization_target=0.7)
+        # Raise the floor ahead of the weekday peak and drop it overnight (UTC)
+        provisioned_scaling.scale_on_schedule(
+            "ScaleUpForPeak",
+            schedule=appscaling.Schedule.cron(week_day="MON-FRI", hour="7", minute="45"),
+            min_capacity=5,
+        )
+        provisioned_scaling.scale_on_schedule(
+            "ScaleDownOvernight",
+            schedule=appscaling.Schedule.cron(hour="20", minute="0"),
+            min_capacity=2,
+        )
+
+        # Periodic warm-up ping, so idle pooled connections are reopened
+        # before a request needs them
+        events.Rule(
+            self, "PaymentAPIWarmupRule",
+            schedule=events.Schedule.rate(Duration.minutes(5)),
+            targets=[events_targets.LambdaFunction(
+                self.payment_alias,
+                event=events.RuleTargetInput.from_object({"warmup": True}),
+            )],
+        )
+
+        # Stream consumer that keeps the read projections; a failed record is
+        # retried from itself rather than replaying the whole batch
+        self.projections_lambda = lambda_.Function(
+            self, "ProjectionsFunction",
+            function_name="payments-projections",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="projections.lambda_handler",
+            code=lambda_.Code.from_asset("src"),
+            timeout=Duration.seconds(60),
+            memory_size=512,
+            environment={
+                "PROJECTIONS_TABLE": self.projections_table.table_name,
+                "PROJECTION_RETENTION_DAYS": "7",
+                "BASE_CURRENCY": "USD",
+                "HOT_KEY_WRITES_PER_SECOND": "25",
+                "COUNTER_MAX_SHARDS": "16",
+                "MERCHANT_COUNTER_SHARDS": "",
+                "POWERTOOLS_SERVICE_NAME": "payments-projections",
+                "LOG_LEVEL": "INFO",
+            },
+            log_retention=logs.RetentionDays.ONE_WEEK,
+        )
+        self.projections_table.grant_read_write_data(self.projections_lambda)
+        # Records still failing after the retries are split out by bisection and
+        # their stream positions sent here, instead of being dropped silently
+        self.projections_failure_queue = sqs.Queue(
+            self, "ProjectionsFailureQueue",
+            queue_name="payments-projections-failures",
+            retention_period=Duration.days(14),
+        )
+        self.projections_lambda.add_event_source(lambda_event_sources.DynamoEventSource(
+            self.payments_table,
+            starting_position=lambda_.StartingPosition.TRIM_HORIZON,
+            batch_size=100,
+            max_batching_window=Duration.seconds(1),
+            retry_attempts=10,
+            bisect_batch_on_error=True,
+            on_failure=lambda_event_sources.SqsDlq(self.projections_failure_queue),
+            report_batch_item_failures=True,
+        ))
+
+        # Records each webhook the topic accepts, for the delivery-status projection
+        self.webhook_status_lambda = lambda_.Function(
+            self, "WebhookStatusFunction",
+            function_name="payments-webhook-status",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="projections.webhook_handler",
+            code=lambda_.Code.from_asset("src"),
+            timeout=Duration.seconds(30),
+            memory_size=256,
+            environment={
+                "PROJECTIONS_TABLE": self.projections_table.table_name,
+                "PROJECTION_RETENTION_DAYS": "7",
+                "POWERTOOLS_SERVICE_NAME": "payments-webhook-status",
+                "LOG_LEVEL": "INFO",
+            },
+            log_retention=logs.RetentionDays.ONE_WEEK,
+        )
+        self.projections_table.grant_write_data(self.webhook_status_lambda)
+        self.webhook_topic.add_subscription(sns_subscriptions.LambdaSubscription(self.webhook_status_lambda))
+
+        # Webhook delivery to merchant endpoints: the queue collects published
+        # events for the batching window, and endpoints in batch mode get them
+        # coalesced into signed batch payloads (see webhook_delivery.py)
+        webhook_delivery_dlq = sqs.Queue(
+            self, "WebhookDeliveryDLQ",
+            queue_name="payments-webhook-deliveries-dlq",
+            retention_period=Duration.days(14),
+        )
+        self.webhook_delivery_queue = sqs.Queue(
+            self, "WebhookDeliveryQueue",
+            queue_name="payments-webhook-deliveries",
+            # Six times the delivery function's timeout, as Lambda recommends for SQS sources
+            visibility_timeout=Duration.seconds(360),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=8, queue=webhook_delivery_dlq),
+        )
+        self.webhook_topic.add_subscription(sns_subscriptions.SqsSubscription(self.webhook_delivery_queue))
+        self.webhook_delivery_lambda = lambda_.Function(
+            self, "WebhookDeliveryFunction",
+            function_name="payments-webhook-delivery",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="webhook_delivery.lambda_handler",
+            code=lambda_.Code.from_asset("src"),
+            timeout=Duration.seconds(60),
+            memory_size=256,
+            environment={
+                "WEBHOOK_ENDPOINTS": "[]",
+                "WEBHOOK_BATCH_MAX_EVENTS": "100",
+                "WEBHOOK_DELIVERY_TIMEOUT_S": "5",
+                "POWERTOOLS_SERVICE_NAME": "payments-webhook-delivery",
+                "LOG_LEVEL": "INFO",
+            },
+            log_retention=logs.RetentionDays.ONE_WEEK,
+        )
+        self.webhook_delivery_lambda.add_event_source(lambda_event_sources.SqsEventSource(
+            self.webhook_delivery_queue,
+            # Small enough for single-mode endpoints to be sent within the timeout;
+            # the handler also stops before its deadline and returns the rest
+            batch_size=100,
+            # How long events are coalesced before a delivery
+            max_batching_window=Duration.seconds(1),
+            report_batch_item_failures=True,
+        ))
+
+        # Lambda Function for nightly T+1 settlement
+        self.settlement_lambda = lambda_.Function(
+            self, "SettlementFunction",
+            function_name="payments-settlement",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="settlement.lambda_handler",
+            code=lambda_.Code.from_asset("src"),
+            timeout=Duration.minutes(15),
+            memory_size=1769,
+            environment={
+                "PAYMENTS_TABLE": self.payments_table.table_name,
+                "WEBHOOK_TOPIC_ARN": self.webhook_topic.topic_arn,
+                "SETTLEMENT_READ_MODE": "index",
+                "SETTLEMENT_SHARDS": "16",
+                "SETTLEMENT_WORKERS": "16",
+                "AWS_MAX_POOL_CONNECTIONS": "32",
+                "POWERTOOLS_SERVICE_NAME": "payments-settlement",
+                "LOG_LEVEL": "INFO",
+            },
+            log_retention=logs.RetentionDays.ONE_WEEK,
+        )
+        self.payments_table.grant_read_write_data(self.settlement_lambda)
+        self.webhook_topic.grant_publish(self.settlement_lambda)
+
+        # Step Functions state machine that runs settlement for the previous day
+        settle_task = sfn_tasks.LambdaInvoke(
+            self, "SettleLedger",
+            lambda_function=self.settlement_lambda,
+            payload_response_only=True,
+            retry_on_service_exceptions=True,
+        )
+        self.settlement_state_machine = sfn.StateMachine(
+            self, "SettlementStateMachine",
+            state_machine_name="payments-settlement",
+            definition_body=sfn.DefinitionBody.from_chainable(settle_task),
+            timeout=Duration.minutes(30),
+        )
+
+        # Nightly trigger at 02:00 UTC
+        events.Rule(
+            self, "NightlySettlementRule",
+            schedule=events.Schedule.cron(minute="0", hour="2"),
+            targets=[events_targets.SfnStateMachine(self.settlement_state_machine)],
+        )
 
         # API Gateway
         self.api = apigateway.RestApi(
             self, "PaymentsAPI",
             rest_api_name="payments-sandbox-api",
             description="Serverless Payments Sandbox API",
+            # gzip/deflate/identity negotiated by API Gateway, outside Lambda CPU time
+            min_compression_size=Size.kibibytes(1),
             default_cors_preflight_options=apigateway.CorsOptions(
                 allow_origins=["*"],  # Configure appropriately for production
                 allow_methods=["GET", "POST", "PUT", "DELETE"],
@@ -132,7 +449,7 @@ class PaymentsSandboxStack(Stack):
 
         # Lambda Integration
         lambda_integration = apigateway.LambdaIntegration(
-            self.payment_lambda,
+            self.payment_alias,
             request_templates={"application/json": '{ "statusCode": "200" }'}
         )
 
@@ -172,6 +489,49 @@ class PaymentsSandboxStack(Stack):
             }
         )
 
+        # Bulk NDJSON ingestion endpoint (API Gateway buffers up to 10 MB per
+        # upload; larger files should be split or sent to a long-running host)
+        self.api.root.add_resource("ingest").add_resource("payments").add_method(
+            "POST",
+            lambda_integration,
+            api_key_required=True
+        )
+
+        # Merchant range query and report endpoints
+        merchant_resource = self.api.root.add_resource("merchants").add_resource("{merchant_id}")
+        merchant_resource.add_resource("transactions").add_method(
+            "GET",
+            lambda_integration,
+            api_key_required=True
+        )
+        merchant_resource.add_resource("report").add_method(
+            "GET",
+            lambda_integration,
+            api_key_required=True
+        )
+
+        # Dashboard read endpoints, served from the read projections
+        transactions_resource = self.api.root.add_resource("transactions")
+        transactions_resource.add_method("GET", lambda_integration, api_key_required=True)
+        transactions_resource.add_resource("changes").add_method(
+            "GET",
+            lambda_integration,
+            api_key_required=True
+        )
+        self.api.root.add_resource("metrics").add_method("GET", lambda_integration, api_key_required=True)
+        webhook_events_resource = self.api.root.add_resource("webhooks").add_resource("events")
+        webhook_events_resource.add_method("GET", lambda_integration, api_key_required=True)
+        webhook_events_resource.add_resource("changes").add_method(
+            "GET",
+            lambda_integration,
+            api_key_required=True
+        )
+        merchant_resource.add_resource("totals").add_method(
+            "GET",
+            lambda_integration,
+            api_key_required=True
+        )
+
         # Health check endpoint
         health_resource = self.api.root.add_resource("health")
         health_resource.add_method("GET", lambda_integration)
@@ -213,6 +573,83 @@ class PaymentsSandboxStack(Stack):
             )
         )
 
+        # Per-phase latency widgets, one per phase timed by telemetry.py, fed by its EMF records
+        phase_widgets = []
+        for phase in PHASES:
+            phase_widgets.append(
+                cloudwatch.GraphWidget(
+                    title=f"Phase latency: {phase}",
+                    left=[
+                        cloudwatch.MathExpression(
+                            expression=(
+                                "SEARCH('{PaymentsSandbox,endpoint,outcome,service} "
+                                f"MetricName=\"{phase}_ms\"', '{statistic}', 300)"
+                            ),
+                            label=statistic,
+                            period=Duration.minutes(5),
+                        )
+                        for statistic in ["p95", "p99"]
+                    ],
+                    width=8,
+                )
+            )
+        dashboard.add_widgets(*phase_widgets)
+
+        # Provisioned concurrency: utilization drives autoscaling; spillover
+        # invocations ran on on-demand (possibly cold) containers
+        dashboard.add_widgets(
+            cloudwatch.GraphWidget(
+                title="Provisioned concurrency",
+                left=[
+                    self.payment_alias.metric(
+                        "ProvisionedConcurrencyUtilization",
+                        period=Duration.minutes(5),
+                        statistic="Maximum",
+                    )
+                ],
+                right=[
+                    self.payment_alias.metric(
+                        "ProvisionedConcurrencySpilloverInvocations",
+                        period=Duration.minutes(5),
+                        statistic="Sum",
+                    )
+                ],
+                width=24,
+            )
+        )
+
+        # Admission control counters (flushed by admission.py)
+        dashboard.add_widgets(
+            cloudwatch.GraphWidget(
+                title="Admission control",
+                left=[
+                    cloudwatch.Metric(
+                        namespace="PaymentsSandbox",
+                        metric_name=name,
+                        dimensions_map={"component": "admission", "service": "payments-api"},
+                        statistic="Sum",
+                        period=Duration.minutes(5),
+                    )
+                    for name in ["admitted", "shed_rate_limited", "shed_in_flight", "shed_latency"]
+                ],
+                width=24,
+            )
+        )
+
+        # Stream records the projections consumer gave up on
+        dashboard.add_widgets(
+            cloudwatch.GraphWidget(
+                title="Projection failures",
+                left=[
+                    self.projections_failure_queue.metric_approximate_number_of_messages_visible(
+                        period=Duration.minutes(5),
+                        statistic="Maximum",
+                    )
+                ],
+                width=24,
+            )
+        )
+
         # Output the API URL
         cdk.CfnOutput(
             self, "APIURL",
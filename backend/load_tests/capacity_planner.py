@@ -0,0 +1,264 @@
+"""
+DynamoDB capacity planner for Serverless Payments Sandbox
+
+Projects the DynamoDB capacity and monthly cost of a target request rate
+from two measurements of the same load test:
+- Consumed capacity per endpoint, phase and table: the `consumed_capacity`
+  section of GET /health once the test has run (a saved /health response,
+  or the API's base URL to fetch it from), or the EMF records the API and
+  the stream consumers logged during the test (a `.log` or `.jsonl` file,
+  such as `aws logs filter-log-events` output); several sources are summed
+- The request mix and measured throughput: a traffic replay run
+  (`python src/traffic.py replay ... --output run.json`) or the
+  `<prefix>_stats.csv` Locust writes with `--csv <prefix>`
+
+The target rate is split over endpoints by the load test's mix, and each
+endpoint is charged its measured capacity per request. The projection
+consumers (PROJECTIONS_MODE=stream) write off the request path, so their
+capacity is charged per API request measured in the same sources. The
+report ranks
+access patterns (endpoint and phase) by projected cost, sizes each table
+in on-demand request units and in provisioned RCU/WCU, and prices both.
+Projections are only as good as the mix: a load test that skips an
+endpoint plans no capacity for it.
+
+Usage:
+    python load_tests/capacity_planner.py --capacity http://localhost:8000 --load-test run.json --target-tps 1000
+    python load_tests/capacity_planner.py --capacity api.log --capacity projections.log --load-test run.json \
+        --target-tps 1000
+"""
+
+import argparse
+import csv
+import json
+import math
+import sys
+import urllib.request
+from typing import Any, Dict, Iterable, List, Optional
+
+# us-east-1 standard table class prices (November 2024), per million request units
+ON_DEMAND_READ_PRICE = 0.125
+ON_DEMAND_WRITE_PRICE = 0.625
+
+# us-east-1 standard table class prices, per provisioned unit per hour
+PROVISIONED_RCU_HOUR_PRICE = 0.00013
+PROVISIONED_WCU_HOUR_PRICE = 0.00065
+
+HOURS_PER_MONTH = 730
+
+# Auto scaling's default target: provisioned capacity is kept this busy at most
+TARGET_UTILIZATION = 0.7
+
+# Stream and topic consumers of the API's writes, as named in src/telemetry.py
+CONSUMER_ENDPOINTS = ('stream:projections', 'sns:projections')
+
+def _add_units(entry: Dict[str, Any], phase: str, table_name: str, rcu: float, wcu: float) -> None:
+    for group in (entry, entry['phases'].setdefault(phase, {'rcu': 0.0, 'wcu': 0.0}),
+                  entry['tables'].setdefault(table_name, {'rcu': 0.0, 'wcu': 0.0})):
+        group['rcu'] += rcu
+        group['wcu'] += wcu
+
+def emf_capacity(lines: Iterable[str]) -> Dict[str, Any]:
+    """Consumed capacity per endpoint summed from logged EMF records"""
+    capacity: Dict[str, Any] = {}
+    for line in lines:
+        # Exported log lines may carry a prefix before the JSON record
+        start = line.find('{"_aws"')
+        if start < 0:
+            continue
+        record = json.loads(line[start:])
+        consumed = record.get('consumed_capacity')
+        if not consumed:
+            continue
+        entry = capacity.setdefault(record['endpoint'], {'requests': 0, 'rcu': 0.0, 'wcu': 0.0, 'phases': {}, 'tables': {}})
+        entry['requests'] += consumed['requests']
+        for phase, table_name, rcu, wcu in consumed['units']:
+            _add_units(entry, phase, table_name, rcu, wcu)
+    return capacity
+
+def merge_capacity(sources: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Capacity of several sources summed per endpoint, phase and table"""
+    merged: Dict[str, Any] = {}
+    for capacity in sources:
+        for endpoint, measured in capacity.items():
+            entry = merged.setdefault(endpoint, {'requests': 0, 'rcu': 0.0, 'wcu': 0.0, 'phases': {}, 'tables': {}})
+            entry['requests'] += measured['requests']
+            entry['rcu'] += measured['rcu']
+            entry['wcu'] += measured['wcu']
+            for key in ('phases', 'tables'):
+                for name, units in measured[key].items():
+                    group = entry[key].setdefault(name, {'rcu': 0.0, 'wcu': 0.0})
+                    group['rcu'] += units['rcu']
+                    group['wcu'] += units['wcu']
+    return merged
+
+def load_capacity(source: str) -> Dict[str, Any]:
+    """Consumed capacity per endpoint from a /health response file, a base URL or an EMF log"""
+    if source.endswith(('.log', '.jsonl')):
+        with open(source) as f:
+            return emf_capacity(f)
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(f"{source.rstrip('/')}/health", timeout=10) as response:
+            health = json.load(response)
+    else:
+        with open(source) as f:
+            health = json.load(f)
+    return health.get('consumed_capacity', health)
+
+def load_mix(path: str) -> Dict[str, Any]:
+    """Requests per endpoint and overall requests/sec of a replay run or Locust stats CSV"""
+    requests: Dict[str, int] = {}
+    if path.endswith('.csv'):
+        with open(path, newline='') as f:
+            rows = [row for row in csv.DictReader(f) if row['Name'] != 'Aggregated']
+        for row in rows:
+            requests[row['Name']] = requests.get(row['Name'], 0) + int(row['Request Count'])
+        requests_per_second = sum(float(row['Requests/s']) for row in rows)
+    else:
+        with open(path) as f:
+            run = json.load(f)
+        for request in run['requests']:
+            # Replay endpoints are "METHOD /route"; capacity is keyed by route
+            endpoint = request['endpoint'].split(' ', 1)[-1]
+            requests[endpoint] = requests.get(endpoint, 0) + 1
+        requests_per_second = len(run['requests']) / run['elapsed_s'] if run['elapsed_s'] else 0.0
+    return {'requests': requests, 'requests_per_second': requests_per_second}
+
+def monthly_on_demand_cost(rcu_per_second: float, wcu_per_second: float) -> float:
+    units_per_month = HOURS_PER_MONTH * 3600 / 1e6
+    return units_per_month * (rcu_per_second * ON_DEMAND_READ_PRICE + wcu_per_second * ON_DEMAND_WRITE_PRICE)
+
+def provisioned_units(units_per_second: float) -> int:
+    """Provisioned units that serve a rate at the target utilization"""
+    return max(1, math.ceil(units_per_second / TARGET_UTILIZATION))
+
+def plan(capacity: Dict[str, Any], mix: Dict[str, Any], target_tps: float,
+         average_tps: Optional[float] = None) -> Dict[str, Any]:
+    """Capacity and cost at target_tps; on-demand cost is billed at average_tps (default: target_tps)"""
+    average_tps = target_tps if average_tps is None else average_tps
+    total_requests = sum(mix['requests'].values())
+    if not total_requests:
+        raise ValueError("The load test made no requests")
+
+    patterns = []
+    tables: Dict[str, Dict[str, float]] = {}
+    unmeasured = []
+    # (endpoint, capacity, scale to the target, requests each unit is charged over)
+    charged = []
+    for endpoint, requests in sorted(mix['requests'].items()):
+        measured = capacity.get(endpoint)
+        if not measured or not measured['requests']:
+            unmeasured.append(endpoint)
+            continue
+        # Rate of this endpoint at the target, divided by the requests the capacity was measured over
+        charged.append((endpoint, measured, target_tps * requests / total_requests / measured['requests'],
+                        measured['requests']))
+    api_requests = sum(measured['requests'] for endpoint, measured in capacity.items()
+                       if endpoint not in CONSUMER_ENDPOINTS and measured['phases'])
+    for endpoint in CONSUMER_ENDPOINTS:
+        measured = capacity.get(endpoint)
+        if measured and api_requests:
+            # Consumers project the API's writes, so they scale with its requests, not their own records
+            charged.append((endpoint, measured, target_tps / api_requests, api_requests))
+
+    for endpoint, measured, scale, per in charged:
+        for phase, units in measured['phases'].items():
+            rcu, wcu = units['rcu'] * scale, units['wcu'] * scale
+            patterns.append({
+                'endpoint': endpoint,
+                'phase': phase,
+                'rcu_per_request': round(units['rcu'] / per, 3),
+                'wcu_per_request': round(units['wcu'] / per, 3),
+                'rcu_per_second': round(rcu, 2),
+                'wcu_per_second': round(wcu, 2),
+                'monthly_cost': monthly_on_demand_cost(rcu, wcu) * average_tps / target_tps,
+            })
+        for table_name, units in measured['tables'].items():
+            table = tables.setdefault(table_name, {'rcu_per_second': 0.0, 'wcu_per_second': 0.0})
+            table['rcu_per_second'] += units['rcu'] * scale
+            table['wcu_per_second'] += units['wcu'] * scale
+
+    total_cost = sum(pattern['monthly_cost'] for pattern in patterns)
+    for pattern in patterns:
+        pattern['cost_share'] = round(pattern['monthly_cost'] / total_cost, 4) if total_cost else 0.0
+        pattern['monthly_cost'] = round(pattern['monthly_cost'], 2)
+    patterns.sort(key=lambda pattern: pattern['monthly_cost'], reverse=True)
+
+    sized = {}
+    for table_name, rates in sorted(tables.items()):
+        rcu, wcu = provisioned_units(rates['rcu_per_second']), provisioned_units(rates['wcu_per_second'])
+        sized[table_name] = {
+            'rcu_per_second': round(rates['rcu_per_second'], 2),
+            'wcu_per_second': round(rates['wcu_per_second'], 2),
+            'provisioned_rcu': rcu,
+            'provisioned_wcu': wcu,
+            'on_demand_monthly_cost': round(
+                monthly_on_demand_cost(rates['rcu_per_second'], rates['wcu_per_second']) * average_tps / target_tps, 2
+            ),
+            'provisioned_monthly_cost': round(
+                HOURS_PER_MONTH * (rcu * PROVISIONED_RCU_HOUR_PRICE + wcu * PROVISIONED_WCU_HOUR_PRICE), 2
+            ),
+        }
+
+    measured_tps = mix['requests_per_second']
+    return {
+        'target_tps': target_tps,
+        'average_tps': average_tps,
+        'measured_tps': round(measured_tps, 1),
+        # How far the projection extrapolates beyond the rate actually tested
+        'scale_factor': round(target_tps / measured_tps, 1) if measured_tps else None,
+        'unmeasured_endpoints': unmeasured,
+        'patterns': patterns,
+        'tables': sized,
+        'on_demand_monthly_cost': round(sum(table['on_demand_monthly_cost'] for table in sized.values()), 2),
+        'provisioned_monthly_cost': round(sum(table['provisioned_monthly_cost'] for table in sized.values()), 2),
+    }
+
+def format_plan(result: Dict[str, Any], top: int = 10) -> str:
+    lines = [
+        f"Projected at {result['target_tps']:g} TPS (load test ran at {result['measured_tps']:g} TPS)",
+        "",
+        f"{'endpoint':<36} {'phase':<18} {'RCU/req':>8} {'WCU/req':>8} {'RCU/s':>9} {'WCU/s':>9} "
+        f"{'$/month':>10} {'share':>6}",
+    ]
+    for pattern in result['patterns'][:top]:
+        lines.append(
+            f"{pattern['endpoint'][:36]:<36} {pattern['phase']:<18} {pattern['rcu_per_request']:>8g} "
+            f"{pattern['wcu_per_request']:>8g} {pattern['rcu_per_second']:>9g} {pattern['wcu_per_second']:>9g} "
+            f"{pattern['monthly_cost']:>10,.2f} {pattern['cost_share']:>6.1%}"
+        )
+    lines += ["", f"{'table':<36} {'RCU/s':>9} {'WCU/s':>9} {'prov RCU':>9} {'prov WCU':>9} "
+                  f"{'on-demand $':>12} {'provisioned $':>14}"]
+    for table_name, table in result['tables'].items():
+        lines.append(
+            f"{table_name[:36]:<36} {table['rcu_per_second']:>9g} {table['wcu_per_second']:>9g} "
+            f"{table['provisioned_rcu']:>9} {table['provisioned_wcu']:>9} "
+            f"{table['on_demand_monthly_cost']:>12,.2f} {table['provisioned_monthly_cost']:>14,.2f}"
+        )
+    lines += ["", f"Monthly: on-demand ${result['on_demand_monthly_cost']:,.2f}, "
+                  f"provisioned ${result['provisioned_monthly_cost']:,.2f}"]
+    if result['unmeasured_endpoints']:
+        lines.append(f"No capacity measured for: {', '.join(result['unmeasured_endpoints'])}")
+    return '\n'.join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Project DynamoDB capacity and cost at a target request rate")
+    parser.add_argument('--capacity', required=True, action='append',
+                        help="saved /health response, the API base URL, or logged EMF records; repeatable")
+    parser.add_argument('--load-test', required=True, help="traffic replay run (JSON) or Locust stats (CSV)")
+    parser.add_argument('--target-tps', type=float, required=True, help="peak requests per second to plan for")
+    parser.add_argument('--average-tps', type=float, help="average requests per second billed on demand")
+    parser.add_argument('--top', type=int, default=10, help="access patterns to list")
+    parser.add_argument('--output', help="write the plan as JSON")
+    args = parser.parse_args()
+
+    capacity = merge_capacity([load_capacity(source) for source in args.capacity])
+    result = plan(capacity, load_mix(args.load_test), args.target_tps, args.average_tps)
+    print(format_plan(result, args.top))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0 if result['patterns'] else 1)
+
+if __name__ == '__main__':
+    main()
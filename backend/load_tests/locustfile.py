@@ -21,8 +21,14 @@ class PaymentsUser(HttpUser):
     }
 
     def random_card(self):
-        # Always returns a valid Visa test card
-        return "4242424242424242"
+        # A Luhn-valid Visa-format number with random digits, so the risk
+        # rules' per-card velocity sees many cards rather than one
+        digits = [4] + [random.randint(0, 9) for _ in range(14)]
+        checksum = sum(sum(divmod(d * 2, 10)) for d in digits[-1::-2]) + sum(digits[-2::-2])
+        return ''.join(map(str, digits)) + str(-checksum % 10)
+
+    def random_holder(self):
+        return f"Test User {random.randint(1, 1000)}"
 
     def random_idempotency_key(self):
         return ''.join(random.choices(string.ascii_letters + string.digits, k=16))
@@ -33,7 +39,7 @@ class PaymentsUser(HttpUser):
             "amount": random.randint(100, 10000),
             "currency": "USD",
             "card_number": self.random_card(),
-            "card_holder": "Test User",
+            "card_holder": self.random_holder(),
             "expiry_month": random.randint(1, 12),
             "expiry_year": 2026,
             "cvv": "123",
@@ -0,0 +1,159 @@
+"""
+Throughput benchmark for the multi-worker mock server
+
+Starts mock_server.py with 1, 2, 4 and 8 workers and drives each with
+keep-alive HTTP clients running in separate processes:
+- Read mix: merchant-indexed /transactions queries and /metrics
+- Optional writes (--write-ratio) through POST /mock/transactions
+- After each run, every worker must report the same totals
+
+Run the clients on cores the server is not using (or another host with
+--host) to measure server scaling rather than client contention.
+
+Usage:
+    python load_tests/mock_server_benchmark.py --duration 10 --output results.json
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+MOCK_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mock_server.py')
+MERCHANTS = ["amazon", "visa", "starbucks", "apple", "netflix", "uber", "delta_airlines", "walmart", "target", "shell_oil"]
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def wait_until_healthy(host: str, port: int, timeout: float = 30) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=1)
+            connection.request("GET", "/health")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"mock server on port {port} did not become healthy")
+
+def client_loop(host: str, port: int, duration: float, write_ratio: float, seed: int) -> Dict[str, Any]:
+    """One client process: issue requests over a keep-alive connection until the deadline"""
+    rng = random.Random(seed)
+    connection = http.client.HTTPConnection(host, port, timeout=10)
+    latencies: List[float] = []
+    requests = reads = writes = errors = 0
+    deadline = time.perf_counter() + duration
+
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            if rng.random() < write_ratio:
+                body = json.dumps({"amount": rng.randint(100, 10000), "merchant_id": rng.choice(MERCHANTS)})
+                connection.request("POST", "/mock/transactions", body, {"Content-Type": "application/json"})
+                writes += 1
+            elif rng.random() < 0.8:
+                connection.request("GET", f"/transactions?merchant_id={rng.choice(MERCHANTS)}&limit=20")
+                reads += 1
+            else:
+                connection.request("GET", "/metrics")
+                reads += 1
+            response = connection.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=10)
+        latencies.append((time.perf_counter() - started) * 1000)
+        requests += 1
+
+    return {'requests': requests, 'reads': reads, 'writes': writes, 'errors': errors, 'latencies': latencies}
+
+def worker_totals(host: str, port: int, probes: int) -> List[int]:
+    """total_transactions reported over fresh connections (spread across workers)"""
+    totals = []
+    for _ in range(probes):
+        connection = http.client.HTTPConnection(host, port, timeout=5)
+        connection.request("GET", "/mock/metrics", headers={"Connection": "close"})
+        totals.append(json.loads(connection.getresponse().read())['total_transactions'])
+        connection.close()
+    return totals
+
+def run_level(workers: int, args) -> Dict[str, Any]:
+    server = None
+    if args.start_server:
+        server = subprocess.Popen(
+            [sys.executable, MOCK_SERVER, '--workers', str(workers), '--port', str(args.port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+    try:
+        wait_until_healthy(args.host, args.port)
+        # Warm every worker's view before timing
+        worker_totals(args.host, args.port, workers * 4)
+
+        with multiprocessing.Pool(args.clients) as pool:
+            results = pool.starmap(client_loop, [
+                (args.host, args.port, args.duration, args.write_ratio, seed) for seed in range(args.clients)
+            ])
+
+        latencies = [value for result in results for value in result['latencies']]
+        totals = worker_totals(args.host, args.port, workers * 4)
+        requests = sum(result['requests'] for result in results)
+        return {
+            'workers': workers,
+            'clients': args.clients,
+            'requests': requests,
+            'writes': sum(result['writes'] for result in results),
+            'errors': sum(result['errors'] for result in results),
+            'rps': round(requests / args.duration, 1),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'consistent': len(set(totals)) == 1,
+            'total_transactions': totals[0],
+        }
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the mock server at several worker counts")
+    parser.add_argument('--workers', default="1,2,4,8", help="Comma-separated worker counts")
+    parser.add_argument('--clients', type=int, default=os.cpu_count() or 4, help="Client processes")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per worker count")
+    parser.add_argument('--write-ratio', type=float, default=0.05)
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=3100)
+    parser.add_argument('--no-start-server', dest='start_server', action='store_false',
+                        help="Benchmark an already running server (single level)")
+    parser.add_argument('--output', help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'workers':>7} {'rps':>10} {'p50_ms':>8} {'p99_ms':>8} {'errors':>7} {'consistent':>10}")
+    for workers in (int(value) for value in args.workers.split(',')):
+        result = run_level(workers, args)
+        results.append(result)
+        print(f"{result['workers']:>7} {result['rps']:>10} {result['p50_ms']:>8} {result['p99_ms']:>8} "
+              f"{result['errors']:>7} {str(result['consistent']):>10}")
+
+    baseline = results[0]['rps'] or 1
+    for result in results:
+        result['speedup'] = round(result['rps'] / baseline, 2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'cpu_count': os.cpu_count(), 'results': results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
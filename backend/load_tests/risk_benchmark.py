@@ -0,0 +1,95 @@
+"""
+Latency benchmark for the velocity risk-scoring stage
+
+Feeds RiskEngine.score() a stream of authorizations at a simulated peak
+rate and reports the time the stage adds per authorization:
+- Every card, holder and amount is distinct and merchants stay under
+  their limit, so any decline is a false positive of the sketches; the
+  false-decline rate is reported alongside the latencies
+- The clock is simulated, so minutes of traffic at --tps run in seconds
+  and every window and slot rotation is exercised
+- Exits non-zero if p99 reaches --max-p99-ms
+
+Usage:
+    python load_tests/risk_benchmark.py --tps 1000 --seconds 900 --output results.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from risk import RiskEngine, velocity_keys
+
+# Spread widely enough that no merchant reaches merchant_per_minute
+MERCHANTS = [f"merchant_{n}" for n in range(500)]
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class SimulatedClock:
+    def __init__(self, start: float):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+def run(tps: float, seconds: float, seed: int = 7) -> Dict[str, Any]:
+    """Score tps * seconds distinct authorizations; latency in milliseconds"""
+    rng = random.Random(seed)
+    clock = SimulatedClock(1_700_000_000.0)
+    engine = RiskEngine(enabled=True, mode='enforce', clock=clock)
+    latencies: List[float] = []
+    declined = 0
+
+    for i in range(int(tps * seconds)):
+        clock.now += 1 / tps
+        keys = velocity_keys(
+            f"{i % 10000:016d}", f"holder {i}", rng.choice(MERCHANTS), 100 + i % 1000000, "USD"
+        )
+        started = time.perf_counter()
+        if engine.score(keys) is not None:
+            declined += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    stats = engine.stats()
+    return {
+        'tps': tps,
+        'authorizations': len(latencies),
+        'p50_ms': round(percentile(latencies, 50), 4),
+        'p99_ms': round(percentile(latencies, 99), 4),
+        'p999_ms': round(percentile(latencies, 99.9), 4),
+        'mean_ms': round(sum(latencies) / len(latencies), 4) if latencies else 0.0,
+        'false_decline_rate': round(declined / len(latencies), 6) if latencies else 0.0,
+        'declines_by_rule': stats['declines_by_rule'],
+        'budget_exceeded': stats['budget_exceeded'],
+        'memory_bytes': stats['memory_bytes'],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the velocity risk-scoring stage")
+    parser.add_argument('--tps', type=float, default=1000, help="simulated authorizations per second")
+    parser.add_argument('--seconds', type=float, default=900, help="simulated duration (covers every window)")
+    parser.add_argument('--max-p99-ms', type=float, default=1.0)
+    parser.add_argument('--output', help="write the results as JSON")
+    args = parser.parse_args()
+
+    result = run(args.tps, args.seconds)
+    print(f"{result['authorizations']} authorizations at {args.tps:g} TPS: "
+          f"p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, p99.9 {result['p999_ms']} ms, "
+          f"false declines {result['false_decline_rate']:.4%}, {result['memory_bytes'] / 2**20:.1f} MiB")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0 if result['p99_ms'] < args.max_p99_ms else 1)
+
+if __name__ == '__main__':
+    main()
@@ -4,19 +4,39 @@ Mock API Server for Local Development
 
 This server provides mock endpoints that simulate the AWS Lambda API
 for local frontend development and testing.
+
+Run with --workers N to serve from N processes; all workers share one
+store (see src/shared_store.py), so every worker sees every write.
 """
 
+import argparse
+import atexit
 import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
 import uuid
 import random
-from datetime import datetime, timedelta
-from typing import Dict, List, Any
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Any, Optional
 
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 
+# Share pure-Python modules with the Lambda code in src/
+sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
+
+from currency import base_amount
+from settlement import previous_day, run_settlement
+from response_shaping import CompressionMiddleware, json_response, parse_fields
+from shared_store import SharedStore, SharedStoreLedger, default_store_path, remove_store
+from simulation import SIMULATION_HEADER, Simulator
+from webhook_delivery import WEBHOOK_BATCH_MAX_EVENTS
+
 app = FastAPI(
     title="Payments Sandbox Mock API",
     description="Mock API for local development",
@@ -32,11 +52,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Mock data storage
-mock_transactions = []
-mock_metrics = {}
-mock_webhook_events = []
-mock_webhook_endpoints = []
+# Negotiated br/gzip for list responses above COMPRESSION_MIN_BYTES
+app.add_middleware(CompressionMiddleware)
+
+# Mock data storage, shared by every worker process. Workers started with
+# --workers inherit MOCK_STORE_PATH from the parent process.
+OWNS_STORE = 'MOCK_STORE_PATH' not in os.environ
+MOCK_STORE_PATH = os.environ.get('MOCK_STORE_PATH') or default_store_path()
+store = SharedStore(MOCK_STORE_PATH)
+if OWNS_STORE:
+    atexit.register(remove_store, MOCK_STORE_PATH)
+
+# Local view of the store's metrics, updated in place by store.refresh().
+# Collections are read with store.select(): they may hold expired slots
+mock_metrics = store.metrics
+
+# Items expire as DynamoDB's TTL would expire them in production
+TRANSACTION_TTL = timedelta(days=30)
+WEBHOOK_EVENT_TTL = timedelta(days=7)
+
+def ttl_after(created_at: str, ttl: timedelta) -> int:
+    """Epoch seconds of a naive-UTC timestamp plus a TTL"""
+    return int((datetime.fromisoformat(created_at) + ttl).replace(tzinfo=timezone.utc).timestamp())
+
+# Simulated processor latency and outcomes, per worker; the mock always honours the profile header
+simulator = Simulator(allow_header=True)
+
+def add_transaction(transaction: Dict[str, Any]) -> None:
+    """Append a transaction to the shared store"""
+    store.write([("transaction", transaction)])
+
+def query_merchant_transactions(
+    merchant_id: str, start: str, end: str, limit: int, fields: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """Newest-first transactions of one merchant in [start, end] via the index"""
+    return store.merchant_transactions(merchant_id, start, end, limit, fields)
+
+def requested_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parse a ?fields= parameter, rejecting invalid names with 400"""
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.middleware("http")
+async def refresh_store(request: Request, call_next):
+    # Lock-free catch-up on writes made by other workers
+    store.refresh()
+    return await call_next(request)
 
 # Pydantic models
 class TransactionRequest(BaseModel):
@@ -51,11 +114,14 @@ class WebhookEndpointRequest(BaseModel):
     url: str = Field(..., min_length=1)
     events: List[str] = Field(default_factory=list)
     description: str = Field(default="")
+    # 'batch' coalesces events into signed batch deliveries (see webhook_delivery.py)
+    delivery: str = Field(default="single", pattern="^(single|batch)$")
+    batch_max_events: int = Field(default=WEBHOOK_BATCH_MAX_EVENTS, ge=1, le=1000)
 
 # Initialize mock data
 def initialize_mock_data():
     """Initialize mock data for development with realistic values"""
-    global mock_transactions, mock_metrics, mock_webhook_events
+    records = []
     merchant_names = [
         "Amazon", "Visa", "Starbucks", "Apple", "Netflix", "Uber", "Delta Airlines", "Walmart", "Target", "Shell Oil"
     ]
@@ -79,24 +145,16 @@ def initialize_mock_data():
             "created_at": (datetime.utcnow() - timedelta(days=random.randint(0, 30))).isoformat(),
             "description": random.choice(descriptions)
         }
-        mock_transactions.append(transaction)
+        transaction["ttl"] = ttl_after(transaction["created_at"], TRANSACTION_TTL)
+        records.append(("transaction", transaction))
     
-    # Generate mock metrics
-    mock_metrics.update({
-        "total_transactions": len(mock_transactions),
-        "total_volume": sum(t["amount"] for t in mock_transactions),
-        "success_rate": 95.2,
-        "active_merchants": 10,
+    # Generate mock metrics. Totals are kept by the store; chart fields
+    # (daily_volume, transaction_types, ...) come from the rollups
+    records.append(("metrics", {
         "transaction_growth_rate": 12.5,
         "volume_growth_rate": 8.3,
         "success_rate_change": 2.1,
         "merchant_growth_rate": 15.0,
-        "daily_volume": [random.randint(50000, 200000) for _ in range(7)],
-        "transaction_types": [
-            {"type": "authorization", "count": 25},
-            {"type": "capture", "count": 20},
-            {"type": "refund", "count": 5}
-        ],
         "recent_activity": [
             {
                 "type": "transaction",
@@ -111,7 +169,7 @@ def initialize_mock_data():
                 "time_ago": "5 minutes ago"
             }
         ]
-    })
+    }))
     
     # Generate mock webhook events
     for i in range(20):
@@ -123,7 +181,11 @@ def initialize_mock_data():
             "response_time": random.randint(50, 500) if random.random() > 0.2 else None,
             "created_at": (datetime.utcnow() - timedelta(hours=random.randint(0, 24))).isoformat()
         }
-        mock_webhook_events.append(event)
+        event["ttl"] = ttl_after(event["created_at"], WEBHOOK_EVENT_TTL)
+        records.append(("webhook_event", event))
+
+    # The first worker to start seeds the shared store
+    store.seed_if_empty(records)
 
 # Initialize data on startup
 @app.on_event("startup")
@@ -141,23 +203,92 @@ async def health_check():
 
 # Mock transactions endpoint
 @app.get("/mock/transactions")
-async def get_transactions():
-    return mock_transactions
+async def get_transactions(
+    merchant_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = None
+):
+    selected = requested_fields(fields)
+    if merchant_id is None:
+        return json_response(store.select("transactions", selected))
+    return json_response(query_merchant_transactions(merchant_id, start or "", end or "~", limit, selected))
 
 # Mock metrics endpoint
+def rollup_metrics() -> Dict[str, Any]:
+    """Dashboard chart fields computed from the rollups in O(buckets)"""
+    now = datetime.utcnow()
+    week_start = (now - timedelta(days=6)).replace(hour=0, minute=0, second=0, microsecond=0)
+    month_start = now - timedelta(days=30)
+    daily = store.rollups.query(week_start.isoformat(), now.isoformat(), resolution="day")
+    by_type = store.rollups.totals(month_start.isoformat(), now.isoformat(), "type", resolution="day")
+    by_status = store.rollups.totals(month_start.isoformat(), now.isoformat(), "status", resolution="day")
+    by_merchant = store.rollups.totals(month_start.isoformat(), now.isoformat(), "merchant", resolution="day")
+
+    total = sum(s["count"] for s in by_status.values())
+    failed = sum(by_status.get(status, {"count": 0})["count"] for status in ("failed", "declined"))
+    return {
+        "daily_volume": [point["volume"] for point in daily["points"]],
+        "transaction_types": [
+            {"type": type_, "count": summary["count"]}
+            for type_, summary in sorted(by_type.items(), key=lambda item: -item[1]["count"])
+        ],
+        "success_rate": round(100 * (total - failed) / total, 1) if total else 100.0,
+        "active_merchants": len(by_merchant),
+    }
+
 @app.get("/mock/metrics")
 async def get_metrics():
-    return mock_metrics
+    return {**mock_metrics, **rollup_metrics(), "simulation": simulator.stats()}
+
+# Time-series query over the rollups
+@app.get("/mock/metrics/timeseries")
+async def get_metrics_timeseries(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    resolution: Optional[str] = Query(None, pattern="^(minute|hour|day)$"),
+    group_by: Optional[str] = Query(None, pattern="^(type|status|merchant)$")
+):
+    end = end or datetime.utcnow().isoformat()
+    start = start or (datetime.fromisoformat(end) - timedelta(hours=24)).isoformat()
+    try:
+        return store.rollups.query(start, end, resolution, group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 # Mock webhook events endpoint
 @app.get("/mock/webhooks")
-async def get_webhook_events():
-    return mock_webhook_events
+async def get_webhook_events(fields: Optional[str] = None):
+    return json_response(store.select("webhook_events", requested_fields(fields)))
+
+# Change feeds: items inserted or updated since an opaque cursor
+def change_feed(collection: str, since: Optional[str], limit: int, fields: Optional[str]):
+    try:
+        return json_response(store.changes(collection, since, limit, requested_fields(fields)))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/mock/transactions/changes")
+async def get_transaction_changes(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    fields: Optional[str] = None
+):
+    return change_feed("transactions", since, limit, fields)
+
+@app.get("/mock/webhooks/changes")
+async def get_webhook_event_changes(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    fields: Optional[str] = None
+):
+    return change_feed("webhook_events", since, limit, fields)
 
 # Mock webhook endpoints endpoint
 @app.get("/mock/webhook-endpoints")
 async def get_webhook_endpoints():
-    return mock_webhook_endpoints
+    return store.select("webhook_endpoints")
 
 # Create webhook endpoint
 @app.post("/mock/webhook-endpoints")
@@ -167,59 +298,184 @@ async def create_webhook_endpoint(request: WebhookEndpointRequest):
         "url": request.url,
         "events": request.events,
         "description": request.description,
+        "delivery": request.delivery,
+        "batch_max_events": request.batch_max_events,
         "status": "active",
         "created_at": datetime.utcnow().isoformat()
     }
-    mock_webhook_endpoints.append(endpoint)
+    store.write([("webhook_endpoint", endpoint)])
     return endpoint
 
 # Create transaction endpoint
-@app.post("/mock/transactions")
-async def create_transaction(request: TransactionRequest):
+def record_transaction(request: TransactionRequest, status: Optional[str] = None) -> Dict[str, Any]:
+    """Store a new transaction, with a random status unless one is given"""
     transaction = {
         "transaction_id": f"txn_{uuid.uuid4().hex[:16]}",
         "type": request.type,
         "amount": request.amount,
         "currency": request.currency,
-        "status": "approved" if random.random() > 0.1 else "failed",
+        "status": status or ("approved" if random.random() > 0.1 else "failed"),
         "merchant_id": request.merchant_id,
         "created_at": datetime.utcnow().isoformat(),
         "description": request.description
     }
-    mock_transactions.append(transaction)
-    
-    # Update metrics
-    mock_metrics["total_transactions"] += 1
-    mock_metrics["total_volume"] += request.amount
+    transaction["ttl"] = ttl_after(transaction["created_at"], TRANSACTION_TTL)
+    # Converted once at today's rate, so every worker counts the same base volume
+    transaction["base_amount"] = base_amount(transaction)
+    # Metrics totals are updated by the store as the record is applied
+    add_transaction(transaction)
     
     return transaction
 
+@app.post("/mock/transactions")
+async def create_transaction(request: TransactionRequest):
+    return record_transaction(request)
+
+# Run T+1 settlement against the in-process store
+@app.post("/mock/settlement/run")
+async def run_mock_settlement(settlement_date: Optional[str] = None):
+    endpoints = store.select("webhook_endpoints", ["url"])
+
+    def record_webhooks(events):
+        created_at = datetime.utcnow().isoformat()
+        store.write(("webhook_event", {
+            "event_id": f"evt_{uuid.uuid4().hex[:16]}",
+            "event_type": event_type,
+            "status": "pending",
+            "endpoint_url": endpoints[0]["url"] if endpoints else None,
+            "response_time": None,
+            "created_at": created_at,
+            "ttl": ttl_after(created_at, WEBHOOK_EVENT_TTL),
+            "data": data
+        }) for event_type, data in events)
+
+    ledger = SharedStoreLedger(store, on_publish=record_webhooks)
+    return run_settlement(ledger, settlement_date or previous_day(), workers=4)
+
+# Settlement records written by the runs above
+@app.get("/mock/settlements")
+async def get_settlements(fields: Optional[str] = None):
+    return json_response(store.select("settlements", requested_fields(fields)))
+
+async def simulated_transaction(endpoint: str, request: TransactionRequest, profile: Optional[str]):
+    """Create a transaction after the simulated processor call of its profile"""
+    try:
+        outcome = await simulator.call(endpoint, request.merchant_id, profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if outcome == "error":
+        raise HTTPException(status_code=502, detail="Payment processor unavailable")
+    return record_transaction(request, status="declined" if outcome == "declined" else None)
+
 # Real payment endpoints (simplified for mock)
 @app.post("/payments/authorize")
-async def authorize_payment(request: TransactionRequest, x_idempotency_key: str = Header(...)):
-    return await create_transaction(request)
+async def authorize_payment(
+    request: TransactionRequest,
+    x_idempotency_key: str = Header(...),
+    x_simulation_profile: Optional[str] = Header(None, alias=SIMULATION_HEADER)
+):
+    return await simulated_transaction("authorize", request, x_simulation_profile)
 
 @app.post("/payments/capture")
-async def capture_payment(request: TransactionRequest, x_idempotency_key: str = Header(...)):
-    return await create_transaction(request)
+async def capture_payment(
+    request: TransactionRequest,
+    x_idempotency_key: str = Header(...),
+    x_simulation_profile: Optional[str] = Header(None, alias=SIMULATION_HEADER)
+):
+    return await simulated_transaction("capture", request, x_simulation_profile)
 
 @app.post("/payments/refund")
-async def refund_payment(request: TransactionRequest, x_idempotency_key: str = Header(...)):
-    return await create_transaction(request)
+async def refund_payment(
+    request: TransactionRequest,
+    x_idempotency_key: str = Header(...),
+    x_simulation_profile: Optional[str] = Header(None, alias=SIMULATION_HEADER)
+):
+    return await simulated_transaction("refund", request, x_simulation_profile)
 
 # --- ALIAS ROUTES for frontend compatibility ---
 @app.get("/metrics")
 async def get_metrics_alias():
     return await get_metrics()
 
+@app.get("/metrics/timeseries")
+async def get_metrics_timeseries_alias(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    resolution: Optional[str] = Query(None, pattern="^(minute|hour|day)$"),
+    group_by: Optional[str] = Query(None, pattern="^(type|status|merchant)$")
+):
+    return await get_metrics_timeseries(start, end, resolution, group_by)
+
 @app.get("/transactions")
-async def get_transactions_alias():
-    return await get_transactions()
+async def get_transactions_alias(
+    merchant_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    fields: Optional[str] = None
+):
+    return await get_transactions(merchant_id, start, end, limit, fields)
 
 @app.get("/webhooks/events")
-async def get_webhook_events_alias():
-    return await get_webhook_events()
+async def get_webhook_events_alias(fields: Optional[str] = None):
+    return await get_webhook_events(fields)
 
-if __name__ == "__main__":
+@app.get("/transactions/changes")
+async def get_transaction_changes_alias(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    fields: Optional[str] = None
+):
+    return change_feed("transactions", since, limit, fields)
+
+@app.get("/webhooks/events/changes")
+async def get_webhook_event_changes_alias(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    fields: Optional[str] = None
+):
+    return change_feed("webhook_events", since, limit, fields)
+
+def serve_worker(sock: socket.socket) -> None:
+    """Run one uvicorn worker on an inherited listening socket"""
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=3000) 
\ No newline at end of file
+    uvicorn.Server(uvicorn.Config("mock_server:app")).run(sockets=[sock])
+
+def serve(host: str, port: int, workers: int) -> None:
+    """Serve from several worker processes sharing one listening socket and store"""
+    # IPPROTO_TCP matters: asyncio only enables TCP_NODELAY on connections
+    # accepted from TCP-protocol sockets, and Nagle adds ~40ms per response
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.set_inheritable(True)
+
+    os.environ['MOCK_STORE_PATH'] = MOCK_STORE_PATH
+    processes = [multiprocessing.Process(target=serve_worker, args=(sock,)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the payments mock API server")
+    parser.add_argument('--host', default="0.0.0.0")
+    parser.add_argument('--port', type=int, default=3000)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('MOCK_WORKERS', '1')))
+    args = parser.parse_args()
+
+    # Exit normally on SIGTERM so atexit removes the shared store file
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if args.workers == 1:
+        import uvicorn
+        uvicorn.run(app, host=args.host, port=args.port)
+    else:
+        serve(args.host, args.port, args.workers)
@@ -0,0 +1,204 @@
+"""
+Admission Control for Serverless Payments Sandbox
+
+This module sheds load in front of the /payments/* routes:
+- Per-merchant_id token buckets held in memory (LRU-bounded)
+- A hard cap on in-flight payment requests per process
+- Latency-aware shedding: while the EWMA of ledger write latency is above
+  a threshold, merchants that are actively draining their bucket are shed
+  first, so well-behaved merchants keep flat tail latency
+- 429 responses with Retry-After, and counters flushed as EMF records
+
+State is per process (per Lambda container), so limits are approximate
+across a fleet; the API Gateway usage plan remains the global backstop.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from telemetry import current_timer, emit_counters
+
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+ADMISSION_MERCHANT_RATE = float(os.environ.get('ADMISSION_MERCHANT_RATE', '50'))
+ADMISSION_MERCHANT_BURST = float(os.environ.get('ADMISSION_MERCHANT_BURST', '100'))
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '64'))
+ADMISSION_LATENCY_THRESHOLD_MS = float(os.environ.get('ADMISSION_LATENCY_THRESHOLD_MS', '250'))
+ADMISSION_FLUSH_SECONDS = float(os.environ.get('ADMISSION_FLUSH_SECONDS', '60'))
+
+# Merchants tracked before the least recently seen bucket is evicted
+MAX_TRACKED_MERCHANTS = 10000
+
+# Weight of the newest latency observation in the EWMA
+LATENCY_EWMA_ALPHA = 0.2
+
+# During latency overload, merchants below this bucket fill are shed
+HEAVY_MERCHANT_FILL = 0.5
+
+class TokenBucket:
+    """Classic token bucket refilled lazily on access"""
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def fill_fraction(self) -> float:
+        return self.tokens / self.burst
+
+    def try_acquire(self, now: float) -> Tuple[bool, float]:
+        """Take one token; on failure return the seconds until one is available"""
+        self.refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True, 0.0
+        return False, (1 - self.tokens) / self.rate
+
+class Rejection:
+    """Why a request was shed and when the client may retry"""
+
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Per-merchant rate limits plus overload shedding for one process"""
+
+    def __init__(
+        self,
+        rate: float = ADMISSION_MERCHANT_RATE,
+        burst: float = ADMISSION_MERCHANT_BURST,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        latency_threshold_ms: float = ADMISSION_LATENCY_THRESHOLD_MS,
+        clock=time.monotonic
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.latency_threshold_ms = latency_threshold_ms
+        self.clock = clock
+        self.buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        self.in_flight = 0
+        self.latency_ewma_ms = 0.0
+        self.counters: Dict[str, int] = {
+            'admitted': 0,
+            'shed_rate_limited': 0,
+            'shed_in_flight': 0,
+            'shed_latency': 0,
+        }
+        self._lock = threading.Lock()
+        self._last_flush = clock()
+
+    def _bucket(self, merchant_id: str, now: float) -> TokenBucket:
+        bucket = self.buckets.get(merchant_id)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst, now)
+            self.buckets[merchant_id] = bucket
+            if len(self.buckets) > MAX_TRACKED_MERCHANTS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(merchant_id)
+        return bucket
+
+    def try_admit(self, merchant_id: str) -> Optional[Rejection]:
+        """Admit a request (counting it in flight) or return why it was shed"""
+        with self._lock:
+            now = self.clock()
+            if self.in_flight >= self.max_in_flight:
+                self.counters['shed_in_flight'] += 1
+                return Rejection('in_flight', 1.0)
+
+            bucket = self._bucket(merchant_id, now)
+            bucket.refill(now)
+            if self.latency_ewma_ms > self.latency_threshold_ms and bucket.fill_fraction() < HEAVY_MERCHANT_FILL:
+                self.counters['shed_latency'] += 1
+                return Rejection('latency', 1.0)
+
+            admitted, retry_after = bucket.try_acquire(now)
+            if not admitted:
+                self.counters['shed_rate_limited'] += 1
+                return Rejection('rate_limited', retry_after)
+
+            self.in_flight += 1
+            self.counters['admitted'] += 1
+            return None
+
+    def release(self, backend_latency_ms: Optional[float] = None) -> None:
+        """Finish an admitted request, folding in its observed backend latency"""
+        with self._lock:
+            self.in_flight -= 1
+            if backend_latency_ms is not None:
+                self.latency_ewma_ms += LATENCY_EWMA_ALPHA * (backend_latency_ms - self.latency_ewma_ms)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Current counters and gauges"""
+        with self._lock:
+            return {
+                **self.counters,
+                'in_flight': self.in_flight,
+                'tracked_merchants': len(self.buckets),
+                'backend_latency_ewma_ms': round(self.latency_ewma_ms, 3),
+            }
+
+    def maybe_flush(self) -> None:
+        """Emit and reset the counters at most every ADMISSION_FLUSH_SECONDS"""
+        now = self.clock()
+        if now - self._last_flush < ADMISSION_FLUSH_SECONDS:
+            return
+        with self._lock:
+            counters = dict(self.counters)
+            for name in self.counters:
+                self.counters[name] = 0
+            self._last_flush = now
+        try:
+            emit_counters(counters, {'component': 'admission'})
+        except Exception as e:
+            print(f"Failed to emit admission counters: {e}")
+
+async def extract_merchant_id(request: Request) -> str:
+    """merchant_id from the X-Merchant-Id header or the JSON request body"""
+    merchant_id = request.headers.get('X-Merchant-Id')
+    if merchant_id:
+        return merchant_id
+    try:
+        return str(json.loads(await request.body()).get('merchant_id') or 'unknown')
+    except Exception:
+        return 'unknown'
+
+def install_admission(app: FastAPI, controller: AdmissionController) -> None:
+    """Install admission control in front of the /payments/* routes"""
+
+    @app.middleware("http")
+    async def admission_middleware(request: Request, call_next):
+        if not ADMISSION_ENABLED or not request.url.path.startswith('/payments/'):
+            return await call_next(request)
+
+        rejection = controller.try_admit(await extract_merchant_id(request))
+        if rejection is not None:
+            controller.maybe_flush()
+            return JSONResponse(
+                status_code=429,
+                content={'detail': f"Request shed by admission control ({rejection.reason})"},
+                headers={'Retry-After': str(max(1, math.ceil(rejection.retry_after)))}
+            )
+
+        backend_latency_ms = None
+        try:
+            response = await call_next(request)
+            backend_latency_ms = current_timer().phases.get('ledger_write')
+            return response
+        finally:
+            controller.release(backend_latency_ms)
+            controller.maybe_flush()
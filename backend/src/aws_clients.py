@@ -0,0 +1,303 @@
+"""
+AWS Client Factory for Serverless Payments Sandbox
+
+This module owns every boto3 client and resource the payment code uses:
+- Explicit connection pool sizing, TCP keep-alive and adaptive retries
+- Read timeouts chosen per call from the request's remaining latency
+  budget (clients are cached per timeout tier so pools stay warm)
+- Per-dependency circuit breakers that fail fast while DynamoDB or SNS
+  is degraded instead of stacking up Lambda timeouts
+- Middleware that derives the request deadline from REQUEST_BUDGET_MS and
+  the Lambda context's remaining time
+- Every DynamoDB call asks for ReturnConsumedCapacity, and the units it
+  consumed are charged to the current request's phase (see telemetry.py)
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError as BotocoreConnectionError, HTTPClientError
+from botocore.parsers import ResponseParserError
+from fastapi import FastAPI, Request
+
+from telemetry import current_timer
+
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '50'))
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '3'))
+AWS_CONNECT_TIMEOUT_S = float(os.environ.get('AWS_CONNECT_TIMEOUT_S', '1'))
+REQUEST_BUDGET_MS = float(os.environ.get('REQUEST_BUDGET_MS', '10000'))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '5'))
+BREAKER_RESET_SECONDS = float(os.environ.get('BREAKER_RESET_SECONDS', '10'))
+
+# Read timeouts a call may be given; the largest one that fits the budget wins
+READ_TIMEOUT_TIERS = (0.25, 0.5, 1.0, 2.0, 5.0)
+
+# Calls are refused outright below this much remaining budget
+MIN_CALL_BUDGET_MS = 50
+
+# Time reserved at the end of a Lambda invocation for the response
+LAMBDA_SAFETY_MARGIN_MS = 500
+
+# Error codes that indicate a degraded dependency rather than a bad request
+DEPENDENCY_ERROR_CODES = {
+    'InternalServerError',
+    'InternalFailure',
+    'ServiceUnavailable',
+    'ThrottlingException',
+    'Throttling',
+    'ProvisionedThroughputExceededException',
+    'RequestLimitExceeded',
+}
+
+# DynamoDB operations that report consumed capacity, by the kind of units they consume
+CAPACITY_READ_OPERATIONS = {'GetItem', 'BatchGetItem', 'Query', 'Scan', 'TransactGetItems'}
+CAPACITY_WRITE_OPERATIONS = {'PutItem', 'UpdateItem', 'DeleteItem', 'BatchWriteItem', 'TransactWriteItems'}
+
+class DependencyUnavailable(Exception):
+    """A dependency call was refused without being attempted"""
+
+class CircuitOpenError(DependencyUnavailable):
+    """The dependency's circuit breaker is open"""
+
+class BudgetExhausted(DependencyUnavailable):
+    """Not enough request budget left to make the call"""
+
+def boto_config(read_timeout: float, max_pool_connections: int = AWS_MAX_POOL_CONNECTIONS) -> Config:
+    """botocore Config with pooled keep-alive connections and adaptive retries"""
+    return Config(
+        max_pool_connections=max_pool_connections,
+        tcp_keepalive=True,
+        connect_timeout=AWS_CONNECT_TIMEOUT_S,
+        read_timeout=read_timeout,
+        retries={'mode': 'adaptive', 'total_max_attempts': AWS_MAX_ATTEMPTS},
+    )
+
+_session = boto3.session.Session()
+_cache: Dict[Tuple, Any] = {}
+_cache_lock = threading.Lock()
+
+def _cached(key: Tuple, create: Callable[[], Any]) -> Any:
+    obj = _cache.get(key)
+    if obj is None:
+        with _cache_lock:
+            obj = _cache.get(key)
+            if obj is None:
+                obj = create()
+                _cache[key] = obj
+    return obj
+
+def consumed_units(operation: str, consumed: Any) -> List[Tuple[str, float, float]]:
+    """(table, read units, write units) of a ConsumedCapacity response field"""
+    if not consumed:
+        return []
+    units = []
+    for entry in consumed if isinstance(consumed, list) else [consumed]:
+        total = float(entry.get('CapacityUnits', 0))
+        read = entry.get('ReadCapacityUnits')
+        write = entry.get('WriteCapacityUnits')
+        if read is None and write is None:
+            # TOTAL only splits units for transactions; otherwise the operation decides
+            read, write = (total, 0.0) if operation in CAPACITY_READ_OPERATIONS else (0.0, total)
+        units.append((entry.get('TableName', ''), float(read or 0), float(write or 0)))
+    return units
+
+def _request_consumed_capacity(params: Dict[str, Any], model, **_) -> None:
+    if model.name in CAPACITY_READ_OPERATIONS or model.name in CAPACITY_WRITE_OPERATIONS:
+        params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+
+def _record_consumed_capacity(parsed: Dict[str, Any], model, **_) -> None:
+    for table_name, read, write in consumed_units(model.name, parsed.get('ConsumedCapacity')):
+        current_timer().consume(table_name, read, write)
+
+def track_consumed_capacity(dynamodb_client) -> None:
+    """Make a DynamoDB client report the capacity each call consumed to the request timer"""
+    events = dynamodb_client.meta.events
+    events.register('before-parameter-build.dynamodb', _request_consumed_capacity)
+    events.register('after-call.dynamodb', _record_consumed_capacity)
+
+def _with_capacity_tracking(service: str, client_or_resource):
+    if service == 'dynamodb':
+        track_consumed_capacity(getattr(client_or_resource.meta, 'client', client_or_resource))
+    return client_or_resource
+
+def client(service: str, read_timeout: float = READ_TIMEOUT_TIERS[-1], endpoint_url: Optional[str] = None,
+           max_pool_connections: int = AWS_MAX_POOL_CONNECTIONS):
+    """Cached low-level client for a service and timeout tier"""
+    return _cached(
+        ('client', service, read_timeout, endpoint_url, max_pool_connections),
+        lambda: _with_capacity_tracking(service, _session.client(
+            service, endpoint_url=endpoint_url, config=boto_config(read_timeout, max_pool_connections)
+        ))
+    )
+
+def resource(service: str, read_timeout: float = READ_TIMEOUT_TIERS[-1], endpoint_url: Optional[str] = None,
+             max_pool_connections: int = AWS_MAX_POOL_CONNECTIONS):
+    """Cached resource for a service and timeout tier"""
+    return _cached(
+        ('resource', service, read_timeout, endpoint_url, max_pool_connections),
+        lambda: _with_capacity_tracking(service, _session.resource(
+            service, endpoint_url=endpoint_url, config=boto_config(read_timeout, max_pool_connections)
+        ))
+    )
+
+def is_dependency_failure(error: Exception) -> bool:
+    """Whether an error should count against a dependency's circuit breaker"""
+    if isinstance(error, (BotocoreConnectionError, HTTPClientError, ResponseParserError)):
+        return True
+    if isinstance(error, ClientError):
+        code = error.response.get('Error', {}).get('Code', '')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return code in DEPENDENCY_ERROR_CODES or status >= 500
+    return False
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.counters = {'opened': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        """Raise CircuitOpenError unless a call may proceed"""
+        with self._lock:
+            if self.state == 'closed':
+                return
+            if self.state == 'open' and self.clock() - self.opened_at >= self.reset_seconds:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self.probe_in_flight:
+                self.probe_in_flight = True
+                return
+            self.counters['rejected'] += 1
+        raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.probe_in_flight = False
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    self.counters['opened'] += 1
+                self.state = 'open'
+                self.opened_at = self.clock()
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Invoke fn through the breaker"""
+        self.allow()
+        try:
+            result = fn(*args, **kwargs)
+        except DependencyUnavailable:
+            with self._lock:
+                self.probe_in_flight = False
+            raise
+        except Exception as e:
+            if is_dependency_failure(e):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        self.record_success()
+        return result
+
+breakers = {
+    'dynamodb': CircuitBreaker('dynamodb'),
+    'sns': CircuitBreaker('sns'),
+    # Read projections fail on their own, never fast-failing ledger writes
+    'projections': CircuitBreaker('projections'),
+}
+
+_deadline: ContextVar[Optional[float]] = ContextVar('request_deadline', default=None)
+
+def remaining_ms() -> Optional[float]:
+    """Milliseconds left in the current request's budget (None outside a request)"""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return (deadline - time.monotonic()) * 1000
+
+@contextmanager
+def request_budget(budget_ms: float) -> Iterator[None]:
+    """Give AWS calls made inside the block budget_ms from now"""
+    token = _deadline.set(time.monotonic() + budget_ms / 1000)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def call_timeout() -> float:
+    """Largest read timeout tier that leaves room for retries within the budget"""
+    remaining = remaining_ms()
+    if remaining is None:
+        return READ_TIMEOUT_TIERS[-1]
+    if remaining < MIN_CALL_BUDGET_MS:
+        raise BudgetExhausted(f"{remaining:.0f}ms of request budget left")
+    per_attempt_s = remaining / 1000 / AWS_MAX_ATTEMPTS
+    fitting = [tier for tier in READ_TIMEOUT_TIERS if tier <= per_attempt_s]
+    return fitting[-1] if fitting else READ_TIMEOUT_TIERS[0]
+
+class GuardedClient:
+    """Client proxy: per-call timeout tier plus circuit breaker on every API call"""
+
+    def __init__(self, factory: Callable[[float], Any], breaker: CircuitBreaker):
+        self._factory = factory
+        self._breaker = breaker
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._factory(READ_TIMEOUT_TIERS[-1]), name)
+        if not callable(attr):
+            return attr
+
+        def guarded_call(*args, **kwargs):
+            return self._breaker.call(lambda: getattr(self._factory(call_timeout()), name)(*args, **kwargs))
+        return guarded_call
+
+class _GuardedMeta:
+    def __init__(self, client: GuardedClient):
+        self.client = client
+
+class GuardedTable:
+    """DynamoDB Table proxy with the same guarantees as GuardedClient"""
+
+    def __init__(self, table_name: str, breaker: CircuitBreaker, endpoint_url: Optional[str] = None):
+        self.name = table_name
+        self._tables = GuardedClient(
+            lambda timeout: resource('dynamodb', timeout, endpoint_url).Table(table_name), breaker
+        )
+        self.meta = _GuardedMeta(GuardedClient(
+            lambda timeout: resource('dynamodb', timeout, endpoint_url).meta.client, breaker
+        ))
+
+    def __getattr__(self, name: str):
+        return getattr(self._tables, name)
+
+def install_deadline(app: FastAPI) -> None:
+    """Install middleware that sets each request's latency budget"""
+
+    @app.middleware("http")
+    async def deadline_middleware(request: Request, call_next):
+        budget_ms = REQUEST_BUDGET_MS
+        lambda_context = request.scope.get('aws.context')
+        if lambda_context is not None:
+            budget_ms = min(budget_ms, lambda_context.get_remaining_time_in_millis() - LAMBDA_SAFETY_MARGIN_MS)
+        with request_budget(budget_ms):
+            return await call_next(request)
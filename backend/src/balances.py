@@ -0,0 +1,120 @@
+"""
+Running Balances for Serverless Payments Sandbox
+
+This module keeps captured-so-far and refunded-so-far counters on a
+balance record next to each authorization and capture:
+- Balance records use the sentinel sort key 'balance' and the parent's
+  auth_id / transaction_id as partition key, so they can be addressed
+  directly from a capture or refund request
+- Captures and refunds validate and record in one TransactWriteItems call:
+  a conditional counter update on the parent plus the child ledger rows
+- Concurrent requests can never over-capture or over-refund, and no child
+  transactions are read to compute what has already been applied
+- Callers can add conditional items of their own (an idempotency claim) to
+  the same transaction; if one of those fails, the cancellation is raised
+  as is, even when the balance condition failed too
+"""
+
+import time
+from typing import Any, Dict, List, Optional
+
+BALANCE_SORT_KEY = 'balance'
+
+# Attempts for a transaction cancelled by a concurrent write to the same item
+TRANSACTION_CONFLICT_ATTEMPTS = 3
+
+class BalanceCheckFailed(Exception):
+    """The parent balance record is missing, in the wrong state, or exhausted"""
+
+    def __init__(self, balance: Optional[Dict[str, Any]]):
+        super().__init__("Balance condition check failed")
+        self.balance = balance
+
+def balance_key(parent_id: str) -> Dict[str, str]:
+    """Primary key of the balance record for an authorization or capture"""
+    return {'transaction_id': parent_id, 'created_at': BALANCE_SORT_KEY}
+
+def authorization_balance(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Balance record for a newly written authorization"""
+    return {
+        **balance_key(item['auth_id']),
+        'type': 'authorization_balance',
+        'status': item['status'],
+        'ledger_transaction_id': item['transaction_id'],
+        'merchant_id': item['merchant_id'],
+        'currency': item['currency'],
+        'amount': item['amount'],
+        'captured_amount': 0,
+        'capturable_amount': item['amount'],
+        'ttl': item['ttl']
+    }
+
+def capture_balance(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Balance record for a newly written capture"""
+    return {
+        **balance_key(item['transaction_id']),
+        'type': 'capture_balance',
+        'status': item['status'],
+        'parent_type': 'capture',
+        'auth_id': item['auth_id'],
+        'merchant_id': item['merchant_id'],
+        'currency': item['currency'],
+        'amount': item['amount'],
+        'refunded_amount': 0,
+        'refundable_amount': item['amount'],
+        'ttl': item['ttl']
+    }
+
+def put_items(table, items: List[Dict[str, Any]], extra_items: Optional[List[Dict[str, Any]]] = None) -> None:
+    """Write several items, plus any extra TransactWriteItems entries, atomically in one round trip"""
+    table.meta.client.transact_write_items(
+        TransactItems=[{'Put': {'TableName': table.name, 'Item': item}} for item in items] + (extra_items or [])
+    )
+
+def apply_to_balance(
+    table,
+    parent_id: str,
+    applied_field: str,
+    remaining_field: str,
+    amount: int,
+    condition: str,
+    condition_names: Dict[str, str],
+    condition_values: Dict[str, Any],
+    child_items: List[Dict[str, Any]],
+    extra_items: Optional[List[Dict[str, Any]]] = None
+) -> None:
+    """Move amount from remaining_field to applied_field and write child rows atomically"""
+    client = table.meta.client
+    update = {
+        'Update': {
+            'TableName': table.name,
+            'Key': balance_key(parent_id),
+            'UpdateExpression': f"SET {applied_field} = {applied_field} + :amount, "
+                                f"{remaining_field} = {remaining_field} - :amount",
+            'ConditionExpression': f"attribute_exists(transaction_id) AND {remaining_field} >= :amount AND {condition}",
+            'ExpressionAttributeValues': {':amount': amount, **condition_values},
+            'ReturnValuesOnConditionCheckFailure': 'ALL_OLD'
+        }
+    }
+    if condition_names:
+        update['Update']['ExpressionAttributeNames'] = condition_names
+    puts = [{'Put': {'TableName': table.name, 'Item': item}} for item in child_items] + (extra_items or [])
+
+    for attempt in range(TRANSACTION_CONFLICT_ATTEMPTS):
+        try:
+            client.transact_write_items(TransactItems=[update] + puts)
+            return
+        except client.exceptions.TransactionCanceledException as e:
+            reasons = e.response.get('CancellationReasons', [])
+            parent_reason = reasons[0] if reasons else {}
+            extra_failed = any(r.get('Code') == 'ConditionalCheckFailed' for r in reasons[1:])
+            if parent_reason.get('Code') == 'ConditionalCheckFailed' and not extra_failed:
+                balance = parent_reason.get('Item')
+                if balance is None:
+                    # Failure path only: fetch the record to explain the rejection
+                    balance = table.get_item(Key=balance_key(parent_id)).get('Item')
+                raise BalanceCheckFailed(balance)
+            if extra_failed or not any(r.get('Code') == 'TransactionConflict' for r in reasons) \
+                    or attempt == TRANSACTION_CONFLICT_ATTEMPTS - 1:
+                raise
+            time.sleep(0.01 * (2 ** attempt))
@@ -0,0 +1,329 @@
+"""
+Bulk Ingestion for Serverless Payments Sandbox
+
+This module streams NDJSON uploads of authorizations, captures and refunds
+into the ledger:
+- Rows are parsed and validated one at a time as the body arrives, with
+  the same request models as the single-payment endpoints
+- Valid rows are grouped into batches of INGEST_BATCH_SIZE and handed to
+  at most INGEST_MAX_IN_FLIGHT concurrent batch writers
+- While every writer is busy the body is not read any further, so a fast
+  client is slowed to the store's write rate and memory stays bounded by
+  batch size x in-flight batches, however large the upload
+- One NDJSON result line per row (accepted, replayed or rejected with the
+  validation or write error) streams back in input order, then a summary
+
+Upload rows look like:
+    {"operation": "authorize", "idempotency_key": "k1", "request": {...}}
+
+Run as a script, this module is the matching CLI: it uploads a file with
+chunked transfer encoding and prints results while the upload proceeds.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import ssl
+import sys
+import threading
+import time
+from collections import deque
+from http.client import HTTPResponse
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple, Type
+from urllib.parse import urlsplit
+
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+
+INGEST_BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', '100'))
+INGEST_MAX_IN_FLIGHT = int(os.environ.get('INGEST_MAX_IN_FLIGHT', '4'))
+
+# Longest accepted NDJSON row; longer rows are rejected without buffering them
+MAX_ROW_BYTES = 16 * 1024
+
+# DynamoDB limit per BatchGetItem call
+BATCH_GET_LIMIT = 100
+
+# Rounds of UnprocessedKeys retries before giving up
+UNPROCESSED_RETRY_ATTEMPTS = 5
+
+# Upload chunk size used by the CLI
+UPLOAD_CHUNK_BYTES = 64 * 1024
+
+class RowError(Exception):
+    """A row that was rejected, with the status the single-row endpoint would return"""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class IngestRow:
+    """One validated upload row"""
+
+    __slots__ = ('line', 'operation', 'idempotency_key', 'request')
+
+    def __init__(self, line: int, operation: str, idempotency_key: str, request: BaseModel):
+        self.line = line
+        self.operation = operation
+        self.idempotency_key = idempotency_key
+        self.request = request
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_row_bytes: int = MAX_ROW_BYTES) -> AsyncIterator[Optional[bytes]]:
+    """Lines of a body as it arrives; None stands in for a line over max_row_bytes"""
+    buffer = bytearray()
+    oversized = False
+    async for chunk in chunks:
+        start = 0
+        while True:
+            newline = chunk.find(b'\n', start)
+            if newline == -1:
+                break
+            buffer += chunk[start:newline]
+            yield None if oversized or len(buffer) > max_row_bytes else bytes(buffer)
+            buffer.clear()
+            oversized = False
+            start = newline + 1
+        if not oversized:
+            buffer += chunk[start:]
+            if len(buffer) > max_row_bytes:
+                oversized = True
+                buffer.clear()
+    if oversized:
+        yield None
+    elif buffer:
+        yield bytes(buffer)
+
+def validation_detail(error: ValidationError) -> str:
+    return '; '.join(
+        f"{'.'.join(str(part) for part in e['loc']) or 'request'}: {e['msg']}" for e in error.errors()
+    )
+
+def parse_row(line_number: int, line: bytes, models: Dict[str, Type[BaseModel]]) -> IngestRow:
+    """Decode and validate one upload row, raising RowError if it is unusable"""
+    try:
+        row = json.loads(line)
+    except ValueError:
+        raise RowError(400, "Row is not valid JSON")
+    if not isinstance(row, dict):
+        raise RowError(400, "Row must be a JSON object")
+
+    operation = row.get('operation')
+    if operation not in models:
+        raise RowError(400, f"operation must be one of: {', '.join(models)}")
+    idempotency_key = row.get('idempotency_key')
+    if not isinstance(idempotency_key, str) or not idempotency_key:
+        raise RowError(400, "idempotency_key is required")
+    if not isinstance(row.get('request'), dict):
+        raise RowError(400, "request must be a JSON object")
+
+    try:
+        request = models[operation](**row['request'])
+    except ValidationError as e:
+        raise RowError(422, validation_detail(e))
+    return IngestRow(line_number, operation, idempotency_key, request)
+
+def row_result(line: int, idempotency_key: Optional[str], outcome: Any) -> Dict[str, Any]:
+    """Result line for a row: a RowError or an (outcome, response body) pair"""
+    result = {'line': line, 'idempotency_key': idempotency_key}
+    if isinstance(outcome, RowError):
+        result['outcome'] = 'rejected'
+        result['error'] = {'status_code': outcome.status_code, 'detail': outcome.detail}
+    else:
+        result['outcome'], result['result'] = outcome
+    return result
+
+class BulkIngestor:
+    """Ingests one NDJSON upload through a batch writer with bounded concurrency"""
+
+    def __init__(
+        self,
+        models: Dict[str, Type[BaseModel]],
+        write_batch: Callable[[List[IngestRow]], List[Any]],
+        batch_size: int = INGEST_BATCH_SIZE,
+        max_in_flight: int = INGEST_MAX_IN_FLIGHT,
+        max_row_bytes: int = MAX_ROW_BYTES
+    ):
+        self.models = models
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_row_bytes = max_row_bytes
+
+    def _write(self, entries: List[Tuple[int, Any]]) -> List[Dict[str, Any]]:
+        """Write a batch's valid rows and merge their outcomes with its rejected rows"""
+        rows = [entry for _, entry in entries if isinstance(entry, IngestRow)]
+        outcomes: List[Any] = []
+        if rows:
+            try:
+                outcomes = self.write_batch(rows)
+            except Exception as e:
+                print(f"Failed to write ingestion batch: {e}")
+                outcomes = [RowError(503, "Batch write failed, retry these rows")] * len(rows)
+        by_line = {row.line: (row.idempotency_key, outcome) for row, outcome in zip(rows, outcomes)}
+
+        results = []
+        for line, entry in entries:
+            if isinstance(entry, IngestRow):
+                results.append(row_result(line, *by_line[line]))
+            else:
+                results.append(row_result(line, None, entry))
+        return results
+
+    async def run(self, chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+        """Result per row in input order, followed by a summary"""
+        started = time.perf_counter()
+        counts = {'rows': 0, 'accepted': 0, 'replayed': 0, 'rejected': 0}
+        in_flight: deque = deque()
+        batch: List[Tuple[int, Any]] = []
+        line_number = 0
+
+        def submit():
+            in_flight.append(asyncio.ensure_future(asyncio.to_thread(self._write, batch)))
+
+        def tally(results):
+            for result in results:
+                counts['rows'] += 1
+                counts[result['outcome']] += 1
+            return results
+
+        async for line in iter_lines(chunks, self.max_row_bytes):
+            line_number += 1
+            if line is None:
+                batch.append((line_number, RowError(413, f"Row exceeds {self.max_row_bytes} bytes")))
+            elif line.strip():
+                try:
+                    batch.append((line_number, parse_row(line_number, line, self.models)))
+                except RowError as e:
+                    batch.append((line_number, e))
+
+            if len(batch) >= self.batch_size:
+                submit()
+                batch = []
+                # Backpressure: with every writer busy, stop reading the body
+                # until the oldest batch has been written
+                while len(in_flight) >= self.max_in_flight:
+                    for result in tally(await in_flight.popleft()):
+                        yield result
+            while in_flight and in_flight[0].done():
+                for result in tally(in_flight.popleft().result()):
+                    yield result
+
+        if batch:
+            submit()
+        while in_flight:
+            for result in tally(await in_flight.popleft()):
+                yield result
+
+        elapsed = time.perf_counter() - started
+        yield {'summary': {
+            **counts,
+            'elapsed_ms': round(elapsed * 1000, 1),
+            'rows_per_second': round(counts['rows'] / elapsed, 1) if elapsed else 0.0
+        }}
+
+async def ndjson_stream(results: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    async for result in results:
+        yield json.dumps(result, separators=(',', ':'), default=str).encode('utf-8') + b'\n'
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """StreamingResponse that leaves receive() to the endpoint
+
+    StreamingResponse normally listens for a disconnect on receive() while
+    it streams, which would swallow the request body chunks the ingestor
+    is still reading. A client that goes away is noticed on send instead.
+    """
+
+    media_type = 'application/x-ndjson'
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+def batch_get_items(client, table_name: str, keys: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Items found for a list of primary keys (in no particular order)"""
+    items: List[Dict[str, Any]] = []
+    unique = list({tuple(sorted(key.items())): key for key in keys}.values())
+    for offset in range(0, len(unique), BATCH_GET_LIMIT):
+        request = {table_name: {'Keys': unique[offset:offset + BATCH_GET_LIMIT]}}
+        for attempt in range(UNPROCESSED_RETRY_ATTEMPTS):
+            response = client.batch_get_item(RequestItems=request)
+            items.extend(response.get('Responses', {}).get(table_name, []))
+            request = response.get('UnprocessedKeys') or {}
+            if not request:
+                break
+            time.sleep(0.01 * (2 ** attempt))
+        else:
+            raise RuntimeError("Batch lookup left keys unprocessed")
+    return items
+
+def upload(url: str, path: str, headers: Dict[str, str], on_result: Callable[[Dict[str, Any]], None]) -> None:
+    """Stream a file to the ingestion endpoint while reading results as they arrive"""
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    sock = socket.create_connection((parts.hostname, port))
+    if parts.scheme == 'https':
+        sock = ssl.create_default_context().wrap_socket(sock, server_hostname=parts.hostname)
+    target = parts.path + (f"?{parts.query}" if parts.query else '')
+    head = [f"POST {target} HTTP/1.1", f"Host: {parts.netloc}", "Content-Type: application/x-ndjson",
+            "Transfer-Encoding: chunked", "Connection: close"]
+    head += [f"{name}: {value}" for name, value in headers.items()]
+
+    def send_body():
+        # Results are read concurrently: the server stops reading the upload
+        # while it has results the client has not consumed
+        try:
+            sock.sendall(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(UPLOAD_CHUNK_BYTES), b''):
+                    sock.sendall(f"{len(block):x}\r\n".encode('ascii') + block + b'\r\n')
+            sock.sendall(b'0\r\n\r\n')
+        except OSError as e:
+            print(f"Upload stopped: {e}", file=sys.stderr)
+
+    sender = threading.Thread(target=send_body, daemon=True)
+    sender.start()
+    response = HTTPResponse(sock, method='POST')
+    try:
+        response.begin()
+        if response.status != 200:
+            raise SystemExit(f"Ingestion failed: HTTP {response.status} {response.read().decode('utf-8', 'replace')}")
+        for line in iter(response.readline, b''):
+            if line.strip():
+                on_result(json.loads(line))
+    finally:
+        response.close()
+        sock.close()
+        sender.join(timeout=1)
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream an NDJSON file of payments to the bulk ingestion endpoint")
+    parser.add_argument('path', help="NDJSON file with one operation per line")
+    parser.add_argument('--url', default=os.environ.get('PAYMENTS_API_URL', 'http://localhost:8000'),
+                        help="Base URL of the payments API")
+    parser.add_argument('--api-key', default=os.environ.get('PAYMENTS_API_KEY'), help="Sent as X-API-Key")
+    parser.add_argument('--publish-webhooks', action='store_true', help="Publish a webhook per accepted row")
+    parser.add_argument('--errors', help="Write rejected rows to this file instead of stderr")
+    args = parser.parse_args()
+
+    headers = {'X-API-Key': args.api_key} if args.api_key else {}
+    query = '?publish_webhooks=true' if args.publish_webhooks else ''
+    errors = open(args.errors, 'w') if args.errors else sys.stderr
+
+    def on_result(result):
+        if 'summary' in result:
+            print(json.dumps(result['summary'], indent=2))
+        elif result['outcome'] == 'rejected':
+            errors.write(json.dumps(result) + '\n')
+
+    try:
+        upload(args.url.rstrip('/') + '/ingest/payments' + query, args.path, headers, on_result)
+    finally:
+        if errors is not sys.stderr:
+            errors.close()
+
+if __name__ == "__main__":
+    main()
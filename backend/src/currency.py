@@ -0,0 +1,195 @@
+"""
+Currency Conversion for Serverless Payments Sandbox
+
+This module normalizes amounts in any supported currency to one base currency:
+- An in-memory rate table, loaded from the JSON file at FX_RATES_PATH or,
+  without one, from the built-in stub rates, and reloaded at most every
+  FX_REFRESH_SECONDS when next read; a failed reload keeps the old table
+- Rates are exact decimals, kept as reduced integer ratios between minor
+  units (cents, yen, fils), so conversions are integer multiply-and-divide
+  with round-half-even and never touch floating point
+- The authorization limit (AUTHORIZATION_LIMIT, in base minor units) is
+  precomputed per currency whenever the table loads, so the hot-path check
+  is one dict lookup and one comparison
+- Reports convert in bulk: amounts are summed per currency first and each
+  currency's total is converted once
+
+Rate file format (rates are base-currency units per unit of each currency):
+    {"base": "USD", "rates": {"EUR": "1.0852", "JPY": "0.006712"}, "minor_units": {"JPY": 0}}
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+BASE_CURRENCY = os.environ.get('BASE_CURRENCY', 'USD')
+FX_RATES_PATH = os.environ.get('FX_RATES_PATH', '')
+FX_REFRESH_SECONDS = float(os.environ.get('FX_REFRESH_SECONDS', '300'))
+AUTHORIZATION_LIMIT = int(os.environ.get('AUTHORIZATION_LIMIT', '1000000'))  # $10,000 in cents
+
+# ISO 4217 minor-unit exponents that differ from 2
+MINOR_UNITS = {
+    'BHD': 3, 'CLP': 0, 'ISK': 0, 'JOD': 3, 'JPY': 0, 'KRW': 0, 'KWD': 3, 'OMR': 3, 'TND': 3, 'VND': 0,
+}
+
+# Stub rates, in USD per unit of each currency
+DEFAULT_RATES = {
+    'USD': '1',
+    'EUR': '1.0852',
+    'GBP': '1.2718',
+    'JPY': '0.006712',
+    'CAD': '0.7341',
+    'AUD': '0.6627',
+    'CHF': '1.1294',
+    'MXN': '0.05468',
+    'INR': '0.01198',
+    'KRW': '0.000731',
+    'KWD': '3.2551',
+}
+
+def minor_units(currency: str, overrides: Optional[Dict[str, int]] = None) -> int:
+    """Decimal places of a currency's minor unit"""
+    if overrides and currency in overrides:
+        return overrides[currency]
+    return MINOR_UNITS.get(currency, 2)
+
+def round_half_even(numerator: int, denominator: int) -> int:
+    """numerator / denominator rounded to the nearest integer, ties to even"""
+    quotient, remainder = divmod(numerator, denominator)
+    twice = 2 * remainder
+    if twice > denominator or (twice == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+class RateTable:
+    """One immutable load of the rate table
+
+    ratios maps each currency to (numerator, denominator) such that
+    base minor units = amount * numerator / denominator.
+    """
+
+    def __init__(self, base: str, rates: Dict[str, Any], source: str,
+                 minor_unit_overrides: Optional[Dict[str, int]] = None,
+                 limit: int = AUTHORIZATION_LIMIT):
+        self.base = base
+        self.source = source
+        self.loaded_at = datetime.utcnow().isoformat()
+        base_exponent = minor_units(base, minor_unit_overrides)
+
+        self.ratios: Dict[str, Tuple[int, int]] = {base: (1, 1)}
+        for currency, rate in rates.items():
+            try:
+                value = Decimal(str(rate))
+            except InvalidOperation:
+                raise ValueError(f"Invalid rate for {currency}: {rate!r}")
+            if not value.is_finite() or value <= 0:
+                raise ValueError(f"Invalid rate for {currency}: {rate!r}")
+            rate_numerator, rate_denominator = value.as_integer_ratio()
+            numerator = rate_numerator * 10 ** base_exponent
+            denominator = rate_denominator * 10 ** minor_units(currency, minor_unit_overrides)
+            divisor = math.gcd(numerator, denominator)
+            self.ratios[currency] = (numerator // divisor, denominator // divisor)
+        if self.ratios[base] != (1, 1):
+            raise ValueError(f"Rate of the base currency {base} must be 1")
+
+        # Largest amount per currency whose exact base value is within the limit
+        self.limits: Dict[str, int] = {
+            currency: limit * denominator // numerator
+            for currency, (numerator, denominator) in self.ratios.items()
+        }
+
+    def to_base(self, amount: int, currency: str) -> int:
+        """An amount in base-currency minor units"""
+        numerator, denominator = self.ratios[currency]
+        return round_half_even(amount * numerator, denominator)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'base': self.base,
+            'source': self.source,
+            'loaded_at': self.loaded_at,
+            'currencies': len(self.ratios),
+        }
+
+def load_rates(path: str = '', limit: int = AUTHORIZATION_LIMIT) -> RateTable:
+    """Rate table from a JSON file, or the stub rates without one"""
+    if not path:
+        return RateTable(BASE_CURRENCY, DEFAULT_RATES, 'stub', limit=limit)
+    with open(path) as f:
+        data = json.load(f)
+    base = data.get('base', BASE_CURRENCY)
+    return RateTable(base, {base: '1', **data['rates']}, path, data.get('minor_units'), limit)
+
+class Rates:
+    """The current rate table, reloaded lazily once it is FX_REFRESH_SECONDS old"""
+
+    def __init__(self, path: str = FX_RATES_PATH, refresh_seconds: float = FX_REFRESH_SECONDS,
+                 limit: int = AUTHORIZATION_LIMIT, clock=time.monotonic):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.limit = limit
+        self.clock = clock
+        self._refresh_lock = threading.Lock()
+        self.table = load_rates(path, limit)
+        self.next_refresh = clock() + refresh_seconds
+
+    def current(self) -> RateTable:
+        """The rate table, starting a reload first if it is due"""
+        if self.clock() >= self.next_refresh and self._refresh_lock.acquire(blocking=False):
+            # One thread reloads; the others keep reading the old table meanwhile
+            try:
+                self.next_refresh = self.clock() + self.refresh_seconds
+                self.table = load_rates(self.path, self.limit)
+            except Exception as e:
+                print(f"Failed to reload FX rates from {self.path or 'stub'}: {e}")
+            finally:
+                self._refresh_lock.release()
+        return self.table
+
+    def within_limit(self, amount: int, currency: str) -> Optional[bool]:
+        """Whether an amount is within the authorization limit; None for an unsupported currency"""
+        limit = self.current().limits.get(currency)
+        return None if limit is None else amount <= limit
+
+    def supported(self, currency: str) -> bool:
+        return currency in self.current().ratios
+
+    def to_base(self, amount: int, currency: str) -> int:
+        return self.current().to_base(amount, currency)
+
+    def sum_to_base(self, totals: Dict[str, int]) -> int:
+        """Base value of per-currency totals, converting each currency once
+
+        Unsupported currencies (never authorized) count as nothing.
+        """
+        table = self.current()
+        return sum(table.to_base(amount, currency) for currency, amount in totals.items() if currency in table.ratios)
+
+    def convert_many(self, amounts: Iterable[int], currencies: Iterable[str]) -> int:
+        """Base value of parallel amounts and currencies, summed per currency first"""
+        totals: Dict[str, int] = {}
+        for amount, currency in zip(amounts, currencies):
+            totals[currency] = totals.get(currency, 0) + int(amount)
+        return self.sum_to_base(totals)
+
+    def stats(self) -> Dict[str, Any]:
+        return self.current().stats()
+
+rates = Rates()
+
+def base_amount(transaction: Dict[str, Any]) -> int:
+    """A transaction's amount in base minor units, as stamped or at current rates"""
+    if transaction.get('base_amount') is not None:
+        return int(transaction['base_amount'])
+    amount = int(transaction.get('amount') or 0)
+    currency = transaction.get('currency') or BASE_CURRENCY
+    try:
+        return rates.to_base(amount, currency)
+    except KeyError:
+        # Unsupported currencies are never authorized; count nothing rather than a raw amount
+        return 0
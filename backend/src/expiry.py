@@ -0,0 +1,105 @@
+"""
+TTL Expiry Engine for Serverless Payments Sandbox
+
+This module expires in-memory items with DynamoDB's `ttl` semantics:
+- An item whose `ttl` (epoch seconds) has passed is expired; items
+  without a `ttl` never expire
+- A hierarchical timing wheel holds the deadlines: scheduling is O(1), and
+  each item moves down at most `levels` wheels before it expires, so
+  expiry costs amortized O(1) per item however many items are held
+- Advancing skips the ticks of empty wheels, so catching up after a long
+  idle period costs O(levels * slots), not O(ticks)
+
+Items expire at most one tick late and never early.
+"""
+
+import math
+from typing import Any, Dict, Hashable, List, Tuple
+
+class TimingWheel:
+    """Deadlines of keyed items, expired in O(1) amortized per item"""
+
+    def __init__(self, now: float, tick_seconds: float = 1.0, slots: int = 64, levels: int = 4):
+        self.tick = tick_seconds
+        self.slots = slots
+        self.levels = levels
+        # Every deadline at or before this tick has been expired
+        self.current = int(now // tick_seconds)
+        self.wheels: List[List[List[Tuple[Hashable, int]]]] = [[[] for _ in range(slots)] for _ in range(levels)]
+        # Entries per wheel, stale ones included; lets advance() skip empty wheels
+        self.sizes = [0] * levels
+        self.ready: List[Tuple[Hashable, int]] = []
+        # key -> deadline tick; entries whose deadline differs are stale
+        self.deadlines: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.deadlines)
+
+    def schedule(self, key: Hashable, expires_at: float) -> None:
+        """Expire key once expires_at (epoch seconds) has passed, replacing any earlier deadline"""
+        deadline = math.ceil(expires_at / self.tick)
+        if self.deadlines.get(key) == deadline:
+            return
+        self.deadlines[key] = deadline
+        self._place(key, deadline)
+
+    def cancel(self, key: Hashable) -> None:
+        self.deadlines.pop(key, None)
+
+    def pending(self, now: float) -> bool:
+        """Whether advance(now) could expire anything"""
+        return bool(self.ready) or (bool(self.deadlines) and now // self.tick > self.current)
+
+    def advance(self, now: float) -> List[Any]:
+        """Keys whose deadline passed by now"""
+        target = int(now // self.tick)
+        expired = self._take(self.ready)
+        self.ready = []
+        while self.current < target:
+            level = next((level for level in range(self.levels) if self.sizes[level]), None)
+            if level is None:
+                self.current = target
+                break
+            if level:
+                # Nothing can happen before the next slot boundary of the lowest non-empty wheel
+                span = self.slots ** level
+                self.current = min(target, (self.current // span + 1) * span - 1)
+                if self.current == target:
+                    break
+            self.current += 1
+            for upper in range(self.levels - 1, 0, -1):
+                span = self.slots ** upper
+                if self.current % span == 0:
+                    for key, deadline in self._clear(upper, (self.current // span) % self.slots):
+                        self._place(key, deadline)
+            expired.extend(self._take(self._clear(0, self.current % self.slots)))
+            expired.extend(self._take(self.ready))
+            self.ready = []
+        return expired
+
+    def _place(self, key: Hashable, deadline: int) -> None:
+        delta = deadline - self.current
+        if delta <= 0:
+            self.ready.append((key, deadline))
+            return
+        level = 0
+        while level < self.levels - 1 and delta >= self.slots ** (level + 1):
+            level += 1
+        # Past the top wheel's range, the slot wraps and the entry is placed again when it cascades
+        self.wheels[level][(deadline // self.slots ** level) % self.slots].append((key, deadline))
+        self.sizes[level] += 1
+
+    def _clear(self, level: int, slot: int) -> List[Tuple[Hashable, int]]:
+        entries = self.wheels[level][slot]
+        self.wheels[level][slot] = []
+        self.sizes[level] -= len(entries)
+        return entries
+
+    def _take(self, entries: List[Tuple[Hashable, int]]) -> List[Any]:
+        """Keys of the entries that are still current, removed from the wheel"""
+        keys = []
+        for key, deadline in entries:
+            if self.deadlines.get(key) == deadline:
+                del self.deadlines[key]
+                keys.append(key)
+        return keys
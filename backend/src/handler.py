@@ -7,28 +7,82 @@ This module implements the core payment processing logic including:
 - Refund processing
 - Idempotency handling
 - Webhook delivery
+- Bulk NDJSON ingestion
+- Dashboard reads (transactions, metrics, webhook events) served from
+  read projections, never from the ledger
 """
 
 import json
 import os
+import time
 import uuid
-import hashlib
-import hmac
+from collections import deque
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional
+from typing import Annotated, Dict, Any, List, Optional, Tuple
 
-import boto3
-from fastapi import FastAPI, HTTPException, Header, Request
+from fastapi import FastAPI, HTTPException, Header, Query, Request
 from fastapi.responses import JSONResponse
 from mangum import Mangum
-from pydantic import BaseModel, Field, validator
+from pydantic import AfterValidator, BaseModel, Field, field_validator
 
-# Initialize AWS clients
-dynamodb = boto3.resource('dynamodb')
-sns = boto3.client('sns')
-table = dynamodb.Table(os.environ['PAYMENTS_TABLE'])
+from admission import AdmissionController, install_admission
+from aws_clients import (
+    REQUEST_BUDGET_MS, DependencyUnavailable, GuardedClient, GuardedTable, breakers, client, install_deadline,
+    request_budget
+)
+from balances import BalanceCheckFailed, apply_to_balance, authorization_balance, capture_balance, put_items
+from bulk_ingest import (
+    BulkIngestor, IngestRow, NDJSONStreamingResponse, RowError, batch_get_items, ndjson_stream
+)
+from currency import rates
+from idempotency import IDEMPOTENCY_TABLE, IdempotencyStore, stored_result
+from merchant_index import merchant_bucket, merchant_report, query_merchant_transactions
+from profiler import install_profiler
+from projections import PROJECTIONS_TABLE, RECENT_PARTITION, WEBHOOK_PARTITION, ProjectionStore
+from response_shaping import json_response, parse_fields
+from risk import RiskEngine, velocity_keys
+from simulation import SIMULATION_HEADER, Simulator
+from single_flight import BodyMismatch, SingleFlight, fingerprint
+from settlement import settlement_bucket
+from sharded_counters import HotKeyDetector
+from telemetry import capacity_usage, current_timer, instrument
+from traffic import install_traffic_capture
+from warmup import is_warmup_event, warm_on_init, warm_up
+from webhooks import build_webhook_message
+
+# Initialize AWS clients (pooled, budget-aware and behind circuit breakers)
+sns = GuardedClient(lambda timeout: client('sns', timeout), breakers['sns'])
+table = GuardedTable(os.environ['PAYMENTS_TABLE'], breakers['dynamodb'])
+idempotency = IdempotencyStore(GuardedTable(IDEMPOTENCY_TABLE, breakers['dynamodb']))
 webhook_topic_arn = os.environ['WEBHOOK_TOPIC_ARN']
 
+# Read models for the dashboard endpoints, kept by the stream consumers (or inline, locally)
+projections = ProjectionStore(GuardedTable(PROJECTIONS_TABLE, breakers['projections']))
+
+# Writes per ledger index partition, to report the keys a merchant or settlement bucket makes hot
+ledger_hot_keys = HotKeyDetector()
+LEDGER_INDEX_KEYS = {
+    'merchant_index': 'merchant_bucket',
+    'settlement_index': 'settlement_bucket',
+}
+
+# Velocity counters of the authorizations this container has seen
+risk = RiskEngine()
+
+# Simulated upstream processor (no delay unless a profile is configured)
+simulator = Simulator()
+
+# Webhooks that could not be published while SNS was unavailable
+WEBHOOK_OUTBOX_LIMIT = int(os.environ.get('WEBHOOK_OUTBOX_LIMIT', '1000'))
+WEBHOOK_OUTBOX_DRAIN_BATCH = 25
+webhook_outbox: deque = deque(maxlen=WEBHOOK_OUTBOX_LIMIT)
+
+# Consistent reads of a concurrently claimed idempotency key before answering 409
+REPLAY_ATTEMPTS = 4
+
+# Concurrent requests with the same idempotency key run once per container
+single_flight = SingleFlight()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Serverless Payments Sandbox API",
@@ -38,10 +92,34 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
+# Per-request latency budget used to size AWS call timeouts
+install_deadline(app)
+
+# Per-merchant admission control and load shedding for /payments/* routes
+admission_controller = AdmissionController()
+install_admission(app, admission_controller)
+
+# Per-phase latency metrics (CloudWatch EMF); registered after admission
+# control so it wraps it and shed requests are recorded too
+instrument(app)
+
+# On-demand sampling profiler (no-op unless PROFILER_ENABLED=true)
+install_profiler(app)
+
+# Production traffic capture for replay testing (no-op unless TRAFFIC_CAPTURE_ENABLED=true);
+# outermost, so recorded latencies include every other middleware
+install_traffic_capture(app)
+
+def upper_currency(v):
+    # Currency codes are matched against rate tables and balances as upper case
+    return v.upper()
+
+Currency = Annotated[str, AfterValidator(upper_currency)]
+
 # Pydantic models for request/response validation
 class AuthorizationRequest(BaseModel):
     amount: int = Field(..., gt=0, description="Amount in cents")
-    currency: str = Field(default="USD", max_length=3)
+    currency: Currency = Field(default="USD", max_length=3)
     card_number: str = Field(..., min_length=13, max_length=19)
     card_holder: str = Field(..., min_length=1, max_length=100)
     expiry_month: int = Field(..., ge=1, le=12)
@@ -50,7 +128,8 @@ class AuthorizationRequest(BaseModel):
     merchant_id: str = Field(..., min_length=1, max_length=50)
     description: Optional[str] = Field(None, max_length=200)
 
-    @validator('card_number')
+    @field_validator('card_number')
+    @classmethod
     def validate_card_number(cls, v):
         # Basic Luhn algorithm check
         if not v.isdigit():
@@ -71,14 +150,14 @@ class AuthorizationRequest(BaseModel):
 class CaptureRequest(BaseModel):
     auth_id: str = Field(..., min_length=1, max_length=50)
     amount: int = Field(..., gt=0, description="Amount in cents")
-    currency: str = Field(default="USD", max_length=3)
+    currency: Currency = Field(default="USD", max_length=3)
     merchant_id: str = Field(..., min_length=1, max_length=50)
     description: Optional[str] = Field(None, max_length=200)
 
 class RefundRequest(BaseModel):
     transaction_id: str = Field(..., min_length=1, max_length=50)
     amount: int = Field(..., gt=0, description="Amount in cents")
-    currency: str = Field(default="USD", max_length=3)
+    currency: Currency = Field(default="USD", max_length=3)
     merchant_id: str = Field(..., min_length=1, max_length=50)
     reason: Optional[str] = Field(None, max_length=200)
 
@@ -91,95 +170,129 @@ class PaymentResponse(BaseModel):
     auth_id: Optional[str] = None
     message: Optional[str] = None
 
-def generate_hmac_signature(payload: str, secret: str) -> str:
-    """Generate HMAC signature for webhook security"""
-    return hmac.new(
-        secret.encode('utf-8'),
-        payload.encode('utf-8'),
-        hashlib.sha256
-    ).hexdigest()
+def send_webhook(event_type: str, message: Dict[str, Any]) -> Optional[str]:
+    """Send one signed webhook message to SNS and return its message ID"""
+    response = sns.publish(
+        TopicArn=webhook_topic_arn,
+        Message=json.dumps(message),
+        MessageAttributes={
+            'event_type': {
+                'DataType': 'String',
+                'StringValue': event_type
+            }
+        }
+    )
+    return response.get('MessageId')
+
+def drain_webhook_outbox(limit: int = WEBHOOK_OUTBOX_DRAIN_BATCH) -> int:
+    """Retry queued webhooks in order, stopping at the first failure"""
+    sent = 0
+    while webhook_outbox and sent < limit:
+        event_type, message = webhook_outbox.popleft()
+        try:
+            message_id = send_webhook(event_type, message)
+        except Exception:
+            webhook_outbox.appendleft((event_type, message))
+            break
+        projections.published(message_id, message)
+        sent += 1
+    return sent
 
 def publish_webhook(event_type: str, data: Dict[str, Any]) -> None:
-    """Publish webhook event to SNS"""
+    """Publish webhook event to SNS, queueing it while SNS is unavailable"""
     try:
-        webhook_payload = {
-            "event_type": event_type,
-            "timestamp": datetime.utcnow().isoformat(),
-            "data": data
-        }
-        
-        # In production, get secret from SSM Parameter Store
-        secret = "webhook-secret-key"  # Replace with SSM lookup
-        signature = generate_hmac_signature(json.dumps(webhook_payload), secret)
-        
-        message = {
-            "payload": webhook_payload,
-            "signature": signature
-        }
-        
-        sns.publish(
-            TopicArn=webhook_topic_arn,
-            Message=json.dumps(message),
-            MessageAttributes={
-                'event_type': {
-                    'DataType': 'String',
-                    'StringValue': event_type
-                }
-            }
-        )
+        message = build_webhook_message(event_type, data)
     except Exception as e:
         print(f"Failed to publish webhook: {e}")
+        return
+
+    try:
+        message_id = send_webhook(event_type, message)
+    except Exception as e:
+        webhook_outbox.append((event_type, message))
+        print(f"Failed to publish webhook, queued for retry: {e}")
+        return
+    projections.published(message_id, message)
+    drain_webhook_outbox()
+
+def storage_error(error: Exception, detail: str) -> HTTPException:
+    """503 with Retry-After when DynamoDB is failing fast, 500 otherwise"""
+    if isinstance(error, DependencyUnavailable):
+        return HTTPException(
+            status_code=503,
+            detail="Payment storage temporarily unavailable",
+            headers={'Retry-After': '1'}
+        )
+    return HTTPException(status_code=500, detail=detail)
+
+def ledger_written(items: List[Dict[str, Any]]) -> None:
+    """Count the index partitions of ledger rows just written and project the rows"""
+    for item in items:
+        for index_name, attribute in LEDGER_INDEX_KEYS.items():
+            if item.get(attribute):
+                # Each shard of a sharded merchant era is a key of its own
+                ledger_hot_keys.record((index_name, item[attribute]), 1)
+    projections.written(items)
 
 def check_idempotency(idempotency_key: str, operation: str) -> Optional[Dict[str, Any]]:
     """Check for existing transaction with same idempotency key"""
     try:
-        response = table.get_item(
-            Key={
-                'transaction_id': f"{operation}_{idempotency_key}",
-                'created_at': 'idempotency_check'
-            }
-        )
-        return response.get('Item')
+        result = idempotency.lookup(idempotency_key, operation)
+        return {'result': result} if result is not None else None
     except Exception:
         return None
 
 def store_idempotency_key(idempotency_key: str, operation: str, result: Dict[str, Any]) -> None:
     """Store idempotency key with result"""
     try:
-        table.put_item(
-            Item={
-                'transaction_id': f"{operation}_{idempotency_key}",
-                'created_at': 'idempotency_check',
-                'result': result,
-                'ttl': int((datetime.utcnow() + timedelta(hours=24)).timestamp())
-            }
-        )
+        idempotency.put(idempotency_key, operation, result)
     except Exception as e:
         print(f"Failed to store idempotency key: {e}")
 
-@app.post("/payments/authorize", response_model=PaymentResponse)
-async def authorize_payment(
+def replay_claimed(idempotency_key: str, operation: str) -> PaymentResponse:
+    """Response stored by the request that claimed the key first
+
+    A claim that conflicted with a concurrent transaction may not be
+    committed yet, so the read is retried with a short backoff.
+    """
+    for attempt in range(REPLAY_ATTEMPTS):
+        result = idempotency.get(idempotency_key, operation, consistent=True)
+        if result is not None:
+            break
+        if attempt < REPLAY_ATTEMPTS - 1:
+            time.sleep(0.01 * (2 ** attempt))
+    else:
+        raise HTTPException(status_code=409, detail="Idempotency key is in use by a concurrent request")
+    idempotency.remember(idempotency_key, operation)
+    current_timer().outcome = 'replayed'
+    return PaymentResponse(**result)
+
+def new_authorization(
     request: AuthorizationRequest,
-    x_idempotency_key: str = Header(..., alias="X-Idempotency-Key")
-):
-    """Authorize a payment transaction"""
-    
-    # Check idempotency
-    existing = check_idempotency(x_idempotency_key, "authorize")
-    if existing:
-        return PaymentResponse(**existing['result'])
-    
-    # Generate transaction ID
+    processor_declined: bool = False
+) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Ledger item and response body for an authorization"""
     transaction_id = f"auth_{uuid.uuid4().hex[:16]}"
     auth_id = f"auth_{uuid.uuid4().hex[:12]}"
     
     # Simulate authorization logic
     # In production, this would integrate with payment processors
     status = "approved"
-    if request.amount > 1000000:  # $10,000 limit
-        status = "declined"
+    message = 'Authorization successful'
+    within_limit = rates.within_limit(request.amount, request.currency)
+    # Every attempt is counted, including ones already declined
+    risk_rule = risk.score(velocity_keys(
+        request.card_number, request.card_holder, request.merchant_id, request.amount, request.currency
+    ))
+    if within_limit is None:
+        status, message = "declined", 'Unsupported currency'
+    elif not within_limit:  # AUTHORIZATION_LIMIT in the base currency
+        status, message = "declined", 'Amount exceeds limit'
+    elif risk_rule is not None and risk.enforce:
+        status, message = "declined", 'Declined by risk rules'
+    elif processor_declined:
+        status, message = "declined", 'Declined by processor'
     
-    # Store transaction
     item = {
         'transaction_id': transaction_id,
         'created_at': datetime.utcnow().isoformat(),
@@ -194,13 +307,10 @@ async def authorize_payment(
         'auth_id': auth_id,
         'ttl': int((datetime.utcnow() + timedelta(days=30)).timestamp())
     }
+    if risk_rule is not None:
+        item['risk_rule'] = risk_rule
+    item['merchant_bucket'] = merchant_bucket(request.merchant_id, item['created_at'], item['transaction_id'])
     
-    try:
-        table.put_item(Item=item)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Failed to store transaction")
-    
-    # Prepare response
     response_data = {
         'transaction_id': transaction_id,
         'status': status,
@@ -208,62 +318,14 @@ async def authorize_payment(
         'currency': request.currency,
         'created_at': item['created_at'],
         'auth_id': auth_id,
-        'message': 'Authorization successful' if status == 'approved' else 'Amount exceeds limit'
+        'message': message
     }
-    
-    # Store idempotency key
-    store_idempotency_key(x_idempotency_key, "authorize", response_data)
-    
-    # Publish webhook
-    publish_webhook("payment_authorized", response_data)
-    
-    return PaymentResponse(**response_data)
+    return item, response_data
 
-@app.post("/payments/capture", response_model=PaymentResponse)
-async def capture_payment(
-    request: CaptureRequest,
-    x_idempotency_key: str = Header(..., alias="X-Idempotency-Key")
-):
-    """Capture a previously authorized payment"""
-    
-    # Check idempotency
-    existing = check_idempotency(x_idempotency_key, "capture")
-    if existing:
-        return PaymentResponse(**existing['result'])
-    
-    # Find original authorization
-    try:
-        response = table.query(
-            IndexName='card_id_index',
-            KeyConditionExpression='card_id = :auth_id',
-            FilterExpression='#type = :type',
-            ExpressionAttributeNames={'#type': 'type'},
-            ExpressionAttributeValues={
-                ':auth_id': request.auth_id,
-                ':type': 'authorization'
-            }
-        )
-        
-        auth_items = response.get('Items', [])
-        if not auth_items:
-            raise HTTPException(status_code=404, detail="Authorization not found")
-        
-        auth_item = auth_items[0]
-        if auth_item['status'] != 'approved':
-            raise HTTPException(status_code=409, detail="Authorization not approved")
-        
-        if request.amount > auth_item['amount']:
-            raise HTTPException(status_code=400, detail="Capture amount exceeds authorized amount")
-            
-    except Exception as e:
-        if isinstance(e, HTTPException):
-            raise e
-        raise HTTPException(status_code=500, detail="Failed to retrieve authorization")
-    
-    # Generate capture transaction ID
+def new_capture(request: CaptureRequest) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Ledger item and response body for a capture"""
     transaction_id = f"capture_{uuid.uuid4().hex[:16]}"
     
-    # Store capture transaction
     item = {
         'transaction_id': transaction_id,
         'created_at': datetime.utcnow().isoformat(),
@@ -274,16 +336,12 @@ async def capture_payment(
         'merchant_id': request.merchant_id,
         'description': request.description,
         'auth_id': request.auth_id,
-        'original_auth_id': auth_item['auth_id'],
+        'original_auth_id': request.auth_id,
         'ttl': int((datetime.utcnow() + timedelta(days=30)).timestamp())
     }
+    item['merchant_bucket'] = merchant_bucket(request.merchant_id, item['created_at'], item['transaction_id'])
+    item['settlement_bucket'] = settlement_bucket(item['created_at'], transaction_id)
     
-    try:
-        table.put_item(Item=item)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Failed to store capture transaction")
-    
-    # Prepare response
     response_data = {
         'transaction_id': transaction_id,
         'status': 'completed',
@@ -293,55 +351,12 @@ async def capture_payment(
         'auth_id': request.auth_id,
         'message': 'Payment captured successfully'
     }
-    
-    # Store idempotency key
-    store_idempotency_key(x_idempotency_key, "capture", response_data)
-    
-    # Publish webhook
-    publish_webhook("payment_captured", response_data)
-    
-    return PaymentResponse(**response_data)
+    return item, response_data
 
-@app.post("/payments/refund", response_model=PaymentResponse)
-async def refund_payment(
-    request: RefundRequest,
-    x_idempotency_key: str = Header(..., alias="X-Idempotency-Key")
-):
-    """Refund a captured payment"""
-    
-    # Check idempotency
-    existing = check_idempotency(x_idempotency_key, "refund")
-    if existing:
-        return PaymentResponse(**existing['result'])
-    
-    # Find original transaction
-    try:
-        response = table.get_item(
-            Key={
-                'transaction_id': request.transaction_id,
-                'created_at': 'capture'  # This would need proper lookup logic
-            }
-        )
-        
-        original_item = response.get('Item')
-        if not original_item:
-            raise HTTPException(status_code=404, detail="Transaction not found")
-        
-        if original_item['type'] != 'capture':
-            raise HTTPException(status_code=400, detail="Can only refund captured payments")
-        
-        if request.amount > original_item['amount']:
-            raise HTTPException(status_code=400, detail="Refund amount exceeds captured amount")
-            
-    except Exception as e:
-        if isinstance(e, HTTPException):
-            raise e
-        raise HTTPException(status_code=500, detail="Failed to retrieve transaction")
-    
-    # Generate refund transaction ID
+def new_refund(request: RefundRequest) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Ledger item and response body for a refund"""
     transaction_id = f"refund_{uuid.uuid4().hex[:16]}"
     
-    # Store refund transaction
     item = {
         'transaction_id': transaction_id,
         'created_at': datetime.utcnow().isoformat(),
@@ -354,13 +369,9 @@ async def refund_payment(
         'original_transaction_id': request.transaction_id,
         'ttl': int((datetime.utcnow() + timedelta(days=30)).timestamp())
     }
+    item['merchant_bucket'] = merchant_bucket(request.merchant_id, item['created_at'], item['transaction_id'])
+    item['settlement_bucket'] = settlement_bucket(item['created_at'], transaction_id)
     
-    try:
-        table.put_item(Item=item)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail="Failed to store refund transaction")
-    
-    # Prepare response
     response_data = {
         'transaction_id': transaction_id,
         'status': 'completed',
@@ -369,26 +380,476 @@ async def refund_payment(
         'created_at': item['created_at'],
         'message': 'Refund processed successfully'
     }
+    return item, response_data
+
+def record_capture(request: CaptureRequest, item: Dict[str, Any], claim: Optional[Dict[str, Any]] = None) -> None:
+    """Draw the capture down from the authorization's balance in the transaction that records it"""
+    try:
+        apply_to_balance(
+            table,
+            request.auth_id,
+            applied_field='captured_amount',
+            remaining_field='capturable_amount',
+            amount=request.amount,
+            condition='#status = :approved AND currency = :currency',
+            condition_names={'#status': 'status'},
+            condition_values={':approved': 'approved', ':currency': request.currency},
+            child_items=[item, capture_balance(item)],
+            extra_items=[claim] if claim else None
+        )
+    except BalanceCheckFailed as e:
+        if e.balance is None:
+            raise HTTPException(status_code=404, detail="Authorization not found")
+        if e.balance['status'] != 'approved':
+            raise HTTPException(status_code=409, detail="Authorization not approved")
+        if e.balance.get('currency') != request.currency:
+            raise HTTPException(status_code=400, detail="Currency does not match the authorization")
+        raise HTTPException(status_code=400, detail="Capture amount exceeds authorized amount")
+
+def record_refund(request: RefundRequest, item: Dict[str, Any], claim: Optional[Dict[str, Any]] = None) -> None:
+    """Draw the refund down from the capture's balance in the transaction that records it"""
+    try:
+        apply_to_balance(
+            table,
+            request.transaction_id,
+            applied_field='refunded_amount',
+            remaining_field='refundable_amount',
+            amount=request.amount,
+            condition='parent_type = :capture AND currency = :currency',
+            condition_names={},
+            condition_values={':capture': 'capture', ':currency': request.currency},
+            child_items=[item],
+            extra_items=[claim] if claim else None
+        )
+    except BalanceCheckFailed as e:
+        if e.balance is None:
+            raise HTTPException(status_code=404, detail="Transaction not found")
+        if e.balance.get('parent_type') != 'capture':
+            raise HTTPException(status_code=400, detail="Can only refund captured payments")
+        if e.balance.get('currency') != request.currency:
+            raise HTTPException(status_code=400, detail="Currency does not match the captured payment")
+        raise HTTPException(status_code=400, detail="Refund amount exceeds captured amount")
+
+async def simulate_processor(endpoint: str, merchant_id: str, profile: Optional[str]) -> str:
+    """Wait out the simulated processor call of a request; 502 on a simulated error"""
+    try:
+        with current_timer().phase('processor'):
+            outcome = await simulator.call(endpoint, merchant_id, profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if outcome == 'error':
+        raise HTTPException(status_code=502, detail="Payment processor unavailable")
+    return outcome
+
+async def coalesced(operation: str, idempotency_key: str, request: BaseModel, run) -> PaymentResponse:
+    """Run a payment request, or await the identical one already in flight with the same key"""
+    try:
+        response, led = await single_flight.run((operation, idempotency_key), fingerprint(request.model_dump()), run)
+    except BodyMismatch:
+        raise HTTPException(status_code=422, detail="Idempotency key is in use by a request with a different body")
+    if not led:
+        current_timer().outcome = 'coalesced'
+    return response
+
+@app.post("/payments/authorize", response_model=PaymentResponse)
+async def authorize_payment(
+    request: AuthorizationRequest,
+    x_idempotency_key: str = Header(..., alias="X-Idempotency-Key"),
+    x_simulation_profile: Optional[str] = Header(None, alias=SIMULATION_HEADER)
+):
+    """Authorize a payment transaction"""
+    timer = current_timer()
+    timer.record('validation', timer.elapsed_ms())
+    return await coalesced("authorize", x_idempotency_key, request,
+                           lambda: process_authorization(request, x_idempotency_key, x_simulation_profile))
+
+async def process_authorization(
+    request: AuthorizationRequest,
+    x_idempotency_key: str,
+    x_simulation_profile: Optional[str]
+) -> PaymentResponse:
+    """Authorize a payment transaction, once per in-flight idempotency key"""
+    timer = current_timer()
+
+    # Check idempotency
+    with timer.phase('idempotency_read'):
+        existing = check_idempotency(x_idempotency_key, "authorize")
+    if existing:
+        timer.outcome = 'replayed'
+        return PaymentResponse(**existing['result'])
+    
+    outcome = await simulate_processor("authorize", request.merchant_id, x_simulation_profile)
+    with timer.phase('risk_score'):
+        item, response_data = new_authorization(request, processor_declined=outcome == 'declined')
+    
+    # Store transaction together with its running-balance record and idempotency claim
+    try:
+        with timer.phase('ledger_write'):
+            put_items(table, [item, authorization_balance(item)],
+                      [idempotency.claim(x_idempotency_key, "authorize", response_data)])
+    except Exception as e:
+        if idempotency.claimed_elsewhere(e):
+            return replay_claimed(x_idempotency_key, "authorize")
+        raise storage_error(e, "Failed to store transaction")
+    idempotency.remember(x_idempotency_key, "authorize")
+    ledger_written([item])
     
-    # Store idempotency key
-    store_idempotency_key(x_idempotency_key, "refund", response_data)
+    # Publish webhook
+    with timer.phase('webhook_publish'):
+        publish_webhook("payment_authorized", response_data)
+    timer.outcome = response_data['status']
+    
+    return PaymentResponse(**response_data)
+
+@app.post("/payments/capture", response_model=PaymentResponse)
+async def capture_payment(
+    request: CaptureRequest,
+    x_idempotency_key: str = Header(..., alias="X-Idempotency-Key"),
+    x_simulation_profile: Optional[str] = Header(None, alias=SIMULATION_HEADER)
+):
+    """Capture a previously authorized payment"""
+    timer = current_timer()
+    timer.record('validation', timer.elapsed_ms())
+    return await coalesced("capture", x_idempotency_key, request,
+                           lambda: process_capture(request, x_idempotency_key, x_simulation_profile))
+
+async def process_capture(
+    request: CaptureRequest,
+    x_idempotency_key: str,
+    x_simulation_profile: Optional[str]
+) -> PaymentResponse:
+    """Capture a previously authorized payment, once per in-flight idempotency key"""
+    timer = current_timer()
+
+    # Check idempotency
+    with timer.phase('idempotency_read'):
+        existing = check_idempotency(x_idempotency_key, "capture")
+    if existing:
+        timer.outcome = 'replayed'
+        return PaymentResponse(**existing['result'])
+    
+    await simulate_processor("capture", request.merchant_id, x_simulation_profile)
+    item, response_data = new_capture(request)
+    
+    try:
+        with timer.phase('ledger_write'):
+            record_capture(request, item, idempotency.claim(x_idempotency_key, "capture", response_data))
+    except HTTPException:
+        raise
+    except Exception as e:
+        if idempotency.claimed_elsewhere(e):
+            return replay_claimed(x_idempotency_key, "capture")
+        raise storage_error(e, "Failed to store capture transaction")
+    idempotency.remember(x_idempotency_key, "capture")
+    ledger_written([item])
     
     # Publish webhook
-    publish_webhook("payment_refunded", response_data)
+    with timer.phase('webhook_publish'):
+        publish_webhook("payment_captured", response_data)
+    timer.outcome = response_data['status']
     
     return PaymentResponse(**response_data)
 
+@app.post("/payments/refund", response_model=PaymentResponse)
+async def refund_payment(
+    request: RefundRequest,
+    x_idempotency_key: str = Header(..., alias="X-Idempotency-Key"),
+    x_simulation_profile: Optional[str] = Header(None, alias=SIMULATION_HEADER)
+):
+    """Refund a captured payment"""
+    timer = current_timer()
+    timer.record('validation', timer.elapsed_ms())
+    return await coalesced("refund", x_idempotency_key, request,
+                           lambda: process_refund(request, x_idempotency_key, x_simulation_profile))
+
+async def process_refund(
+    request: RefundRequest,
+    x_idempotency_key: str,
+    x_simulation_profile: Optional[str]
+) -> PaymentResponse:
+    """Refund a captured payment, once per in-flight idempotency key"""
+    timer = current_timer()
+
+    # Check idempotency
+    with timer.phase('idempotency_read'):
+        existing = check_idempotency(x_idempotency_key, "refund")
+    if existing:
+        timer.outcome = 'replayed'
+        return PaymentResponse(**existing['result'])
+    
+    await simulate_processor("refund", request.merchant_id, x_simulation_profile)
+    item, response_data = new_refund(request)
+    
+    try:
+        with timer.phase('ledger_write'):
+            record_refund(request, item, idempotency.claim(x_idempotency_key, "refund", response_data))
+    except HTTPException:
+        raise
+    except Exception as e:
+        if idempotency.claimed_elsewhere(e):
+            return replay_claimed(x_idempotency_key, "refund")
+        raise storage_error(e, "Failed to store refund transaction")
+    idempotency.remember(x_idempotency_key, "refund")
+    ledger_written([item])
+    
+    # Publish webhook
+    with timer.phase('webhook_publish'):
+        publish_webhook("payment_refunded", response_data)
+    timer.outcome = response_data['status']
+    
+    return PaymentResponse(**response_data)
+
+# Operations accepted by bulk ingestion, with the models that validate them
+INGEST_OPERATIONS = {
+    'authorize': AuthorizationRequest,
+    'capture': CaptureRequest,
+    'refund': RefundRequest,
+}
+
+INGEST_WEBHOOK_EVENTS = {
+    'authorize': 'payment_authorized',
+    'capture': 'payment_captured',
+    'refund': 'payment_refunded',
+}
+
+def row_rejection(error: Exception, detail: str) -> RowError:
+    """RowError carrying the status the single-payment endpoint would return"""
+    if not isinstance(error, HTTPException):
+        error = storage_error(error, detail)
+    return RowError(error.status_code, error.detail)
+
+def write_ingest_batch(rows: List[IngestRow], publish_webhooks: bool = False) -> List[Any]:
+    """Write a batch of ingested rows; an (outcome, response) pair or RowError per row
+
+    Idempotency records for the whole batch are read in one BatchGetItem,
+    without consulting the filter of recent keys. Every new row is then
+    written with the single-payment endpoint's transaction, which claims
+    its idempotency key conditionally: a key repeated in a concurrent
+    batch, upload or request is written once and replayed everywhere else.
+    """
+    key_items = [idempotency.key(row.idempotency_key, row.operation) for row in rows]
+    keys = [key['k'] for key in key_items]
+    # The lookup and each row's write get a full latency budget of their own, however long the upload runs
+    with request_budget(REQUEST_BUDGET_MS):
+        stored = {
+            bytes(item['k']): stored_result(item)
+            for item in batch_get_items(table.meta.client, idempotency.table.name, key_items)
+        }
+
+    outcomes: List[Any] = [None] * len(rows)
+    first_index: Dict[bytes, int] = {}
+    completed = []
+    written = []
+    for index, (row, key) in enumerate(zip(rows, keys)):
+        if key in stored:
+            outcomes[index] = ('replayed', PaymentResponse(**stored[key]).model_dump(exclude_none=True))
+            continue
+        if key in first_index:
+            continue
+        first_index[key] = index
+
+        if row.operation == 'authorize':
+            item, response_data = new_authorization(row.request)
+        else:
+            new = new_capture if row.operation == 'capture' else new_refund
+            item, response_data = new(row.request)
+        claim = idempotency.claim(row.idempotency_key, row.operation, response_data)
+        try:
+            with request_budget(REQUEST_BUDGET_MS):
+                if row.operation == 'authorize':
+                    put_items(table, [item, authorization_balance(item)], [claim])
+                else:
+                    (record_capture if row.operation == 'capture' else record_refund)(row.request, item, claim)
+        except Exception as e:
+            if idempotency.claimed_elsewhere(e):
+                # Claimed by a concurrent batch, upload or request since the batch lookup
+                try:
+                    with request_budget(REQUEST_BUDGET_MS):
+                        replayed = replay_claimed(row.idempotency_key, row.operation)
+                    outcomes[index] = ('replayed', replayed.model_dump(exclude_none=True))
+                except Exception as replay_error:
+                    outcomes[index] = row_rejection(replay_error, f"Failed to store {row.operation} transaction")
+                continue
+            outcomes[index] = row_rejection(e, f"Failed to store {row.operation} transaction")
+            continue
+        outcomes[index] = ('accepted', response_data)
+        completed.append(index)
+        written.append(item)
+
+    for index in completed:
+        idempotency.remember(rows[index].idempotency_key, rows[index].operation)
+
+    # Inline projection is not part of the row's write, so each row gets another budget for it
+    for item in written:
+        with request_budget(REQUEST_BUDGET_MS):
+            ledger_written([item])
+
+    # Repeated keys within the batch replay the first row's outcome
+    for index, key in enumerate(keys):
+        if outcomes[index] is None:
+            first = outcomes[first_index[key]]
+            outcomes[index] = ('replayed', first[1]) if isinstance(first, tuple) else first
+
+    if publish_webhooks:
+        for index in sorted(completed):
+            publish_webhook(INGEST_WEBHOOK_EVENTS[rows[index].operation], outcomes[index][1])
+    return outcomes
+
+@app.post("/ingest/payments")
+async def ingest_payments(request: Request, publish_webhooks: bool = False):
+    """Bulk-ingest an NDJSON stream of authorizations, captures and refunds"""
+    ingestor = BulkIngestor(INGEST_OPERATIONS, lambda rows: write_ingest_batch(rows, publish_webhooks))
+    return NDJSONStreamingResponse(ndjson_stream(ingestor.run(request.stream())))
+
+def default_range(start: Optional[str], end: Optional[str]) -> tuple:
+    """Resolve an optional ISO-8601 range, defaulting to the last 7 days"""
+    end = end or datetime.utcnow().isoformat()
+    start = start or (datetime.fromisoformat(end[:19]) - timedelta(days=7)).isoformat()
+    return start, end
+
+@app.get("/merchants/{merchant_id}/transactions")
+async def list_merchant_transactions(
+    merchant_id: str,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """List a merchant's transactions in a time range, newest first"""
+    try:
+        start, end = default_range(start, end)
+        items, next_cursor = query_merchant_transactions(
+            table, merchant_id, start, end, limit=limit, cursor=cursor, fields=parse_fields(fields)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise storage_error(e, "Failed to query merchant transactions")
+
+    return json_response({'items': items, 'next_cursor': next_cursor})
+
+@app.get("/merchants/{merchant_id}/report")
+async def get_merchant_report(merchant_id: str, start: Optional[str] = None, end: Optional[str] = None):
+    """Summarize a merchant's transactions in a time range"""
+    try:
+        start, end = default_range(start, end)
+        return merchant_report(table, merchant_id, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise storage_error(e, "Failed to build merchant report")
+
+def read_projection(read, detail: str):
+    """Run a projection read; 400 for a bad cursor, storage errors otherwise"""
+    try:
+        return read()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise storage_error(e, detail)
+
+@app.get("/transactions")
+async def list_transactions(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """List recent transactions across merchants, newest first"""
+    items, next_cursor = read_projection(
+        lambda: projections.latest(RECENT_PARTITION, limit, cursor, parse_fields(fields)),
+        "Failed to list transactions"
+    )
+    return json_response({'items': items, 'next_cursor': next_cursor})
+
+@app.get("/transactions/changes")
+async def transaction_changes(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    fields: Optional[str] = None
+):
+    """Recent transactions inserted or updated since a change-feed cursor"""
+    return json_response(read_projection(
+        lambda: projections.changes(RECENT_PARTITION, since, limit, parse_fields(fields)),
+        "Failed to read transaction changes"
+    ))
+
+@app.get("/webhooks/events")
+async def list_webhook_events(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """List recent webhook events and their delivery status, newest first"""
+    items, next_cursor = read_projection(
+        lambda: projections.latest(WEBHOOK_PARTITION, limit, cursor, parse_fields(fields)),
+        "Failed to list webhook events"
+    )
+    return json_response({'items': items, 'next_cursor': next_cursor})
+
+@app.get("/webhooks/events/changes")
+async def webhook_event_changes(
+    since: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    fields: Optional[str] = None
+):
+    """Webhook events recorded since a change-feed cursor"""
+    return json_response(read_projection(
+        lambda: projections.changes(WEBHOOK_PARTITION, since, limit, parse_fields(fields)),
+        "Failed to read webhook event changes"
+    ))
+
+@app.get("/metrics")
+async def get_metrics():
+    """Dashboard totals, success rate and daily volume"""
+    return read_projection(projections.metrics, "Failed to read metrics")
+
+@app.get("/merchants/{merchant_id}/totals")
+async def get_merchant_totals(merchant_id: str):
+    """All-time counts and volume of one merchant"""
+    totals = read_projection(lambda: projections.merchant_totals(merchant_id), "Failed to read merchant totals")
+    if totals is None:
+        raise HTTPException(status_code=404, detail="Merchant not found")
+    return totals
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
         "timestamp": datetime.utcnow().isoformat(),
-        "service": "payments-api"
+        "service": "payments-api",
+        "idempotency_filter": idempotency.stats(),
+        "single_flight": single_flight.stats(),
+        "consumed_capacity": capacity_usage.stats(),
+        "sharded_counters": projections.sharded.stats(),
+        "feed_partitions": projections.feed_stats(),
+        "ledger_hot_keys": ledger_hot_keys.stats(),
+        "fx_rates": rates.stats(),
+        "risk": risk.stats(),
+        "simulation": simulator.stats()
     }
 
+# Built once per container; the app has no startup or shutdown hooks
+asgi_handler = Mangum(app, lifespan="off")
+
+def warm_container() -> Dict[str, Any]:
+    """Open every AWS connection pool a request can use and exercise the app"""
+    return warm_up(
+        app,
+        {
+            table.name: {'transaction_id': 'warmup', 'created_at': 'warmup'},
+            idempotency.table.name: idempotency.key('warmup', 'warmup')
+        },
+        webhook_topic_arn
+    )
+
 # Lambda handler
 def lambda_handler(event, context):
     """AWS Lambda handler function"""
-    asgi_handler = Mangum(app)
-    return asgi_handler(event, context) 
\ No newline at end of file
+    if is_warmup_event(event):
+        return warm_container()
+    return asgi_handler(event, context)
+
+if warm_on_init():
+    warm_container() 
\ No newline at end of file
@@ -0,0 +1,212 @@
+"""
+Idempotency Store for Serverless Payments Sandbox
+
+This module keeps idempotency records in their own table, apart from the ledger:
+- Records are keyed by a fixed-width 16-byte BLAKE2b hash of the
+  operation and the client's key, whatever the key's length
+- The stored response is compact JSON, zlib-compressed against a preset
+  dictionary of response field names and values
+- An in-process Bloom filter of recently stored keys lets a key this
+  process has never seen skip the GetItem
+- Skipping the read stays safe across processes: a record is claimed by a
+  conditional put in the same transaction as the ledger write, so a key
+  first used by another process cancels the write and its stored
+  response is replayed instead
+- Filter capacity and target false-positive rate are configurable;
+  stats() reports memory, fill and estimated and observed false-positive rates
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional
+
+IDEMPOTENCY_TABLE = os.environ.get('IDEMPOTENCY_TABLE', 'payments-idempotency')
+IDEMPOTENCY_TTL_HOURS = int(os.environ.get('IDEMPOTENCY_TTL_HOURS', '24'))
+IDEMPOTENCY_FILTER_CAPACITY = int(os.environ.get('IDEMPOTENCY_FILTER_CAPACITY', '200000'))
+IDEMPOTENCY_FILTER_FP_RATE = float(os.environ.get('IDEMPOTENCY_FILTER_FP_RATE', '0.01'))
+
+KEY_BYTES = 16
+
+# Encoding tag of stored results: zlib with RESULT_DICTIONARY
+RESULT_FORMAT = b'\x01'
+
+# Preset dictionary for result compression; zlib favours matches near the end
+RESULT_DICTIONARY = (
+    b'"message":"Refund processed successfully"}"message":"Payment captured successfully"}'
+    b'"message":"Amount exceeds limit"}"status":"declined","status":"completed",'
+    b'{"transaction_id":"refund_{"transaction_id":"capture_"currency":"USD","created_at":"20'
+    b'"message":"Authorization successful"}{"transaction_id":"auth_","status":"approved",'
+    b'"amount":"currency":"USD","created_at":"20","auth_id":"auth_'
+)
+
+def key_hash(idempotency_key: str, operation: str) -> bytes:
+    """Fixed-width hash of an operation's idempotency key"""
+    return hashlib.blake2b(f"{operation}\0{idempotency_key}".encode('utf-8'), digest_size=KEY_BYTES).digest()
+
+def encode_result(result: Dict[str, Any]) -> bytes:
+    compressor = zlib.compressobj(9, zdict=RESULT_DICTIONARY)
+    data = json.dumps(result, separators=(',', ':'), default=str).encode('utf-8')
+    return RESULT_FORMAT + compressor.compress(data) + compressor.flush()
+
+def decode_result(data: bytes) -> Dict[str, Any]:
+    if data[:1] != RESULT_FORMAT:
+        raise ValueError("Unknown idempotency result encoding")
+    decompressor = zlib.decompressobj(zdict=RESULT_DICTIONARY)
+    return json.loads(decompressor.decompress(data[1:]) + decompressor.flush())
+
+def stored_result(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Response held by a stored record"""
+    return decode_result(bytes(item['r']))
+
+class BloomFilter:
+    """Fixed-size Bloom filter over key hashes"""
+
+    def __init__(self, capacity: int, false_positive_rate: float):
+        self.capacity = capacity
+        self.size = max(8, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest: bytes) -> Iterable[int]:
+        # Double hashing over the two halves of the key hash
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, digest: bytes) -> None:
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+    def fill_ratio(self) -> float:
+        return int.from_bytes(self.bits, 'little').bit_count() / self.size
+
+class RecentKeys:
+    """Keys stored recently, in two Bloom filter generations
+
+    Each generation holds half the capacity at half the target
+    false-positive rate. When the current one fills, it becomes the previous
+    one and the oldest keys are forgotten, so the filter stays at its
+    configured rate however long the process lives. A forgotten key costs
+    only the read it would have skipped anyway.
+    """
+
+    def __init__(self, capacity: int = IDEMPOTENCY_FILTER_CAPACITY,
+                 false_positive_rate: float = IDEMPOTENCY_FILTER_FP_RATE):
+        self.capacity = capacity
+        self.false_positive_rate = false_positive_rate
+        self.current = self._generation()
+        self.previous = self._generation()
+        self._lock = threading.Lock()
+
+    def _generation(self) -> BloomFilter:
+        return BloomFilter(max(1, self.capacity // 2), self.false_positive_rate / 2)
+
+    def add(self, digest: bytes) -> None:
+        with self._lock:
+            if self.current.count >= self.current.capacity:
+                self.previous, self.current = self.current, self._generation()
+            self.current.add(digest)
+
+    def __contains__(self, digest: bytes) -> bool:
+        return digest in self.current or digest in self.previous
+
+    def stats(self) -> Dict[str, Any]:
+        estimate = 1 - (1 - self.current.fill_ratio() ** self.current.hash_count) \
+            * (1 - self.previous.fill_ratio() ** self.previous.hash_count)
+        return {
+            'capacity': self.capacity,
+            'target_false_positive_rate': self.false_positive_rate,
+            'memory_bytes': len(self.current.bits) + len(self.previous.bits),
+            'hash_count': self.current.hash_count,
+            'keys': self.current.count + self.previous.count,
+            'fill_ratio': round(self.current.fill_ratio(), 4),
+            'estimated_false_positive_rate': round(estimate, 6),
+        }
+
+class IdempotencyStore:
+    """Idempotency records in a dedicated table, fronted by a filter of recent keys"""
+
+    def __init__(self, table, recent: Optional[RecentKeys] = None):
+        self.table = table
+        self.recent = recent or RecentKeys()
+        self.reads_skipped = 0
+        self.reads = 0
+        self.false_positives = 0
+
+    def key(self, idempotency_key: str, operation: str) -> Dict[str, bytes]:
+        """Primary key of the record for an operation"""
+        return {'k': key_hash(idempotency_key, operation)}
+
+    def record(self, idempotency_key: str, operation: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Record holding an operation's response until its TTL"""
+        return {
+            **self.key(idempotency_key, operation),
+            'r': encode_result(result),
+            'ttl': int((datetime.utcnow() + timedelta(hours=IDEMPOTENCY_TTL_HOURS)).timestamp())
+        }
+
+    def get(self, idempotency_key: str, operation: str, consistent: bool = False) -> Optional[Dict[str, Any]]:
+        """Stored response for a key, read from the table"""
+        item = self.table.get_item(Key=self.key(idempotency_key, operation), ConsistentRead=consistent).get('Item')
+        return stored_result(item) if item else None
+
+    def lookup(self, idempotency_key: str, operation: str) -> Optional[Dict[str, Any]]:
+        """Stored response for a key, skipping the read for keys not seen recently"""
+        if key_hash(idempotency_key, operation) not in self.recent:
+            self.reads_skipped += 1
+            return None
+        self.reads += 1
+        result = self.get(idempotency_key, operation)
+        if result is None:
+            self.false_positives += 1
+        return result
+
+    def put(self, idempotency_key: str, operation: str, result: Dict[str, Any]) -> None:
+        """Store a response unconditionally"""
+        self.table.put_item(Item=self.record(idempotency_key, operation, result))
+        self.remember(idempotency_key, operation)
+
+    def claim(self, idempotency_key: str, operation: str, result: Dict[str, Any]) -> Dict[str, Any]:
+        """TransactWriteItems entry that stores a response only if the key is unused"""
+        return {
+            'Put': {
+                'TableName': self.table.name,
+                'Item': self.record(idempotency_key, operation, result),
+                'ConditionExpression': 'attribute_not_exists(k)'
+            }
+        }
+
+    def claimed_elsewhere(self, error: Exception) -> bool:
+        """Whether a cancelled transaction failed because its claim was taken, or was being taken
+
+        The claim is always the last item of the transaction. A
+        TransactionConflict on it means a concurrent request is claiming the
+        same key.
+        """
+        reasons = getattr(error, 'response', {}).get('CancellationReasons') or []
+        return bool(reasons) and reasons[-1].get('Code') in ('ConditionalCheckFailed', 'TransactionConflict')
+
+    def remember(self, idempotency_key: str, operation: str) -> None:
+        """Add a stored key to the filter of recent keys"""
+        self.recent.add(key_hash(idempotency_key, operation))
+
+    def stats(self) -> Dict[str, Any]:
+        """Filter configuration, memory and false-positive rates"""
+        negatives = self.reads_skipped + self.false_positives
+        return {
+            **self.recent.stats(),
+            'reads': self.reads,
+            'reads_skipped': self.reads_skipped,
+            'false_positives': self.false_positives,
+            'observed_false_positive_rate': round(self.false_positives / negatives, 6) if negatives else 0.0,
+        }
@@ -0,0 +1,286 @@
+"""
+Merchant/Time Secondary Index for Serverless Payments Sandbox
+
+This module owns the `merchant_index` GSI on the payments ledger:
+- Time-bucketed partition keys ("<merchant_id>#<period>") so that one
+  merchant's writes never concentrate on a single GSI partition
+- Coarser buckets (month) by default, finer ones (day/hour) for merchants
+  listed in MERCHANT_BUCKET_OVERRIDES, optionally from a change point
+  ("merchant_top:hour@2026-11-01")
+- A bucket too hot for one partition even at hourly granularity can be
+  split into shards ("merchant_top:hour/4"): each row is written to the
+  shard its transaction_id hashes to ("<bucket>#shard<n>", shard 0 being
+  the bucket itself), and queries read every shard, merged in time order
+- Query helpers that page through buckets with an opaque cursor
+- Bounded merchant reports built from index reads only, with volumes
+  in the base currency
+
+Rows keep the bucket they were written with, so reads query each era of
+a merchant's granularity and shard count with that era's buckets.
+Promote a merchant that already has rows with a change point no earlier
+than the deploy; an override without one applies to all of the
+merchant's rows.
+"""
+
+import base64
+import json
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Key
+
+from currency import BASE_CURRENCY, rates
+from response_shaping import project, projection_expression
+
+MERCHANT_INDEX_NAME = 'merchant_index'
+
+# Period formats by bucket granularity (prefixes of an ISO-8601 timestamp)
+GRANULARITY_LENGTHS = {
+    'month': 7,   # 2026-10
+    'day': 10,    # 2026-10-18
+    'hour': 13,   # 2026-10-18T13
+}
+GRANULARITY_STEPS = {
+    'day': timedelta(days=1),
+    'hour': timedelta(hours=1),
+}
+
+DEFAULT_GRANULARITY = os.environ.get('MERCHANT_BUCKET_GRANULARITY', 'month')
+
+# Upper bound on buckets touched by one range query (31 days of hourly buckets)
+MAX_BUCKETS_PER_QUERY = 744
+
+def _parse_overrides(value: str) -> Dict[str, List[Tuple[str, str, int]]]:
+    """Parse 'merchant_a:hour/4,merchant_b:day@2026-11-01' into each merchant's (since, granularity, shards) eras"""
+    overrides: Dict[str, List[Tuple[str, str, int]]] = {}
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        merchant_id, _, spec = entry.partition(':')
+        spec, _, since = spec.partition('@')
+        granularity, _, shards = spec.partition('/')
+        if granularity not in GRANULARITY_LENGTHS:
+            raise ValueError(f"Unknown bucket granularity for {merchant_id}: {granularity}")
+        if shards and (not shards.isdigit() or int(shards) < 1):
+            raise ValueError(f"Invalid bucket shard count for {merchant_id}: {shards}")
+        if since:
+            datetime.fromisoformat(since)
+        overrides.setdefault(merchant_id, []).append((since, granularity, int(shards or 1)))
+    for eras in overrides.values():
+        eras.sort()
+    return overrides
+
+MERCHANT_BUCKET_OVERRIDES = _parse_overrides(os.environ.get('MERCHANT_BUCKET_OVERRIDES', ''))
+
+def granularity_eras(merchant_id: str) -> List[Tuple[str, str, int]]:
+    """(since, granularity, shards) of each bucket layout a merchant's rows were written with, oldest first"""
+    eras = MERCHANT_BUCKET_OVERRIDES.get(merchant_id, [])
+    if not eras or eras[0][0]:
+        # Before the first change point ('' sorts first) the default applies
+        eras = [('', DEFAULT_GRANULARITY, 1)] + eras
+    return eras
+
+def _era(merchant_id: str, created_at: Optional[str]) -> Tuple[str, str, int]:
+    created_at = created_at or datetime.utcnow().isoformat()
+    return [era for era in granularity_eras(merchant_id) if era[0] <= created_at][-1]
+
+def bucket_granularity(merchant_id: str, created_at: Optional[str] = None) -> str:
+    """Bucket granularity of a merchant's rows created at created_at (default: now)"""
+    return _era(merchant_id, created_at)[1]
+
+def shard_bucket(bucket: str, shard: int) -> str:
+    """Partition key of one shard of a bucket"""
+    return bucket if shard == 0 else f"{bucket}#shard{shard}"
+
+def merchant_bucket(merchant_id: str, created_at: str, transaction_id: Optional[str] = None) -> str:
+    """Partition key for merchant_index"""
+    _, granularity, shards = _era(merchant_id, created_at)
+    bucket = f"{merchant_id}#{created_at[:GRANULARITY_LENGTHS[granularity]]}"
+    # Stable per transaction, like settlement_bucket, so a rewritten row keeps its shard
+    return shard_bucket(bucket, zlib.crc32(transaction_id.encode('utf-8')) % shards if transaction_id else 0)
+
+def _granularity_periods(merchant_id: str, granularity: str, start: str, end: str) -> List[str]:
+    length = GRANULARITY_LENGTHS[granularity]
+    current = datetime.fromisoformat(start[:19])
+    last = end[:length]
+
+    periods = []
+    while current.isoformat()[:length] <= last:
+        periods.append(f"{merchant_id}#{current.isoformat()[:length]}")
+        if granularity == 'month':
+            current = (current.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0, second=0)
+        else:
+            current += GRANULARITY_STEPS[granularity]
+        if len(periods) > MAX_BUCKETS_PER_QUERY:
+            raise ValueError("Time range too large for merchant index query")
+    return periods
+
+def sharded_periods(merchant_id: str, start: str, end: str) -> List[List[str]]:
+    """The shard keys of every bucket overlapping [start, end], oldest bucket first"""
+    eras = granularity_eras(merchant_id)
+    periods: List[List[str]] = []
+    for index, (since, granularity, shards) in enumerate(eras):
+        until = eras[index + 1][0] if index + 1 < len(eras) else None
+        era_start, era_end = max(start, since), min(end, until) if until else end
+        if era_start > era_end:
+            continue
+        periods.extend([shard_bucket(bucket, shard) for shard in range(shards)]
+                       for bucket in _granularity_periods(merchant_id, granularity, era_start, era_end))
+        if sum(map(len, periods)) > MAX_BUCKETS_PER_QUERY:
+            raise ValueError("Time range too large for merchant index query")
+    return periods
+
+def bucket_periods(merchant_id: str, start: str, end: str) -> List[str]:
+    """All bucket keys overlapping [start, end], oldest first, each era in its own granularity"""
+    return [shards[0] for shards in sharded_periods(merchant_id, start, end)]
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    """Opaque, URL-safe pagination cursor"""
+    return base64.urlsafe_b64encode(json.dumps(state, default=str).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+# Attributes of a merchant_index key, from which a shard's resume position is rebuilt
+INDEX_KEY_FIELDS = ('transaction_id', 'created_at', 'merchant_bucket')
+
+def _query_period(table, shards: List[str], positions: List[Any], start: str, end: str, limit: int,
+                  newest_first: bool, fields: Optional[List[str]]) -> Tuple[List[Dict[str, Any]], List[Any]]:
+    """Up to limit items of one bucket's shards, merged in time order, and each shard's next position
+
+    A position is None before a shard is read, the key to resume it from,
+    or True once it is exhausted.
+    """
+    if fields is not None:
+        # Merging needs created_at, and resuming a partly taken shard the key of its last taken item
+        fields = list(dict.fromkeys([*fields, *INDEX_KEY_FIELDS]))
+    read: List[Tuple[Dict[str, Any], int]] = []
+    returned = [0] * len(shards)
+    last_keys: List[Any] = [None] * len(shards)
+    for shard, bucket in enumerate(shards):
+        if positions[shard] is True:
+            continue
+        kwargs = {
+            'IndexName': MERCHANT_INDEX_NAME,
+            'KeyConditionExpression': Key('merchant_bucket').eq(bucket) & Key('created_at').between(start, end),
+            'ScanIndexForward': not newest_first,
+            'Limit': limit,
+            **projection_expression(fields),
+        }
+        if positions[shard]:
+            kwargs['ExclusiveStartKey'] = positions[shard]
+        response = table.query(**kwargs)
+        items = response.get('Items', [])
+        read.extend((item, shard) for item in items)
+        returned[shard] = len(items)
+        last_keys[shard] = response.get('LastEvaluatedKey')
+
+    # Each shard is already in time order, so a stable sort merges them
+    read.sort(key=lambda entry: entry[0]['created_at'], reverse=newest_first)
+    taken = read[:limit]
+    counts = [0] * len(shards)
+    last_taken: List[Any] = [None] * len(shards)
+    for item, shard in taken:
+        counts[shard] += 1
+        last_taken[shard] = item
+    positions = list(positions)
+    for shard in range(len(shards)):
+        if positions[shard] is True:
+            continue
+        if counts[shard] == returned[shard]:
+            positions[shard] = last_keys[shard] or True
+        elif counts[shard]:
+            positions[shard] = {name: last_taken[shard][name] for name in INDEX_KEY_FIELDS}
+    return [item for item, _ in taken], positions
+
+def query_merchant_transactions(
+    table,
+    merchant_id: str,
+    start: str,
+    end: str,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    newest_first: bool = True,
+    fields: Optional[List[str]] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """One page of a merchant's transactions created in [start, end], optionally projected"""
+    periods = sharded_periods(merchant_id, start, end)
+    if newest_first:
+        periods.reverse()
+
+    state = decode_cursor(cursor) if cursor else {'bucket': 0, 'positions': None}
+    if not isinstance(state, dict) or not isinstance(state.get('bucket'), int):
+        raise ValueError("Invalid cursor")
+    items: List[Dict[str, Any]] = []
+    bucket_index = state['bucket']
+    positions = state.get('positions')
+
+    while bucket_index < len(periods) and len(items) < limit:
+        shards = periods[bucket_index]
+        if not isinstance(positions, list) or len(positions) != len(shards):
+            positions = [None] * len(shards)
+        page, positions = _query_period(table, shards, positions, start, end, limit - len(items),
+                                        newest_first, fields)
+        items.extend(page)
+        if all(position is True for position in positions):
+            bucket_index += 1
+            positions = None
+
+    if fields is not None:
+        # Drop the key fields added for resuming shards
+        items = project(items, fields)
+    if bucket_index >= len(periods):
+        return items, None
+    return items, encode_cursor({'bucket': bucket_index, 'positions': positions})
+
+def iter_merchant_transactions(
+    table,
+    merchant_id: str,
+    start: str,
+    end: str,
+    page_size: int = 500,
+    fields: Optional[List[str]] = None
+) -> Iterator[Dict[str, Any]]:
+    """Iterate every transaction of a merchant in [start, end], oldest first"""
+    cursor = None
+    while True:
+        items, cursor = query_merchant_transactions(
+            table, merchant_id, start, end, limit=page_size, cursor=cursor, newest_first=False, fields=fields
+        )
+        yield from items
+        if cursor is None:
+            break
+
+def merchant_report(table, merchant_id: str, start: str, end: str) -> Dict[str, Any]:
+    """Counts and base-currency volumes by type and status for one merchant and time range"""
+    counts: Dict[str, int] = {}
+    volumes: Dict[str, Dict[str, int]] = {}
+    by_status: Dict[str, int] = {}
+    for item in iter_merchant_transactions(table, merchant_id, start, end,
+                                           fields=['type', 'amount', 'currency', 'status']):
+        counts[item['type']] = counts.get(item['type'], 0) + 1
+        by_currency = volumes.setdefault(item['type'], {})
+        currency = item.get('currency') or BASE_CURRENCY
+        by_currency[currency] = by_currency.get(currency, 0) + int(item['amount'])
+        by_status[item['status']] = by_status.get(item['status'], 0) + 1
+
+    # Each type's per-currency totals are converted once, not row by row
+    volume_by_currency: Dict[str, int] = {}
+    for by_currency in volumes.values():
+        for currency, amount in by_currency.items():
+            volume_by_currency[currency] = volume_by_currency.get(currency, 0) + amount
+    return {
+        'merchant_id': merchant_id,
+        'start': start,
+        'end': end,
+        'base_currency': BASE_CURRENCY,
+        'total_transactions': sum(counts.values()),
+        'by_type': {
+            type_: {'count': counts[type_], 'volume': rates.sum_to_base(volumes[type_])} for type_ in counts
+        },
+        'by_status': by_status,
+        'volume_by_currency': volume_by_currency
+    }
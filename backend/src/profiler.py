@@ -0,0 +1,159 @@
+"""
+On-Demand Sampling Profiler for Serverless Payments Sandbox
+
+This module provides middleware that profiles individual requests:
+- Enabled by environment variable, or per request by header when
+  PROFILER_ALLOW_HEADER is set (even with PROFILER_ENABLED off)
+- Samples a configurable fraction of requests and/or keeps only slow ones
+- Stack sampling from a single background thread via sys._current_frames()
+- Collapsed-stack output (flamegraph.pl / speedscope compatible) written to
+  a local directory or printed to the logs with request metadata
+
+When PROFILER_ENABLED is unset the middleware is a boolean check, plus a
+header lookup if PROFILER_ALLOW_HEADER is set.
+
+Async endpoints share the event-loop thread, so the stacks of a profiled
+request include those of any request running concurrently with it. The
+profile metadata records how many event-loop tasks were running
+(concurrent_tasks, the larger count at the start or end of the request);
+profiles with a count above 1 mix in other requests' stacks.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Optional
+
+from fastapi import FastAPI, Request
+
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'false').lower() == 'true'
+PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', '0.01'))
+PROFILER_THRESHOLD_MS = float(os.environ.get('PROFILER_THRESHOLD_MS', '0'))
+PROFILER_INTERVAL_MS = float(os.environ.get('PROFILER_INTERVAL_MS', '5'))
+PROFILER_OUTPUT_DIR = os.environ.get('PROFILER_OUTPUT_DIR')
+PROFILER_HEADER = 'X-Profile'
+PROFILER_ALLOW_HEADER = os.environ.get('PROFILER_ALLOW_HEADER', 'false').lower() == 'true'
+
+# Maximum stack depth recorded per sample
+MAX_STACK_DEPTH = 128
+
+class ProfileSession:
+    """Collapsed-stack samples for one request on one thread"""
+
+    def __init__(self, thread_id: int):
+        self.thread_id = thread_id
+        self.samples: Counter = Counter()
+
+    def collapsed(self) -> str:
+        """Render samples as 'frame;frame;frame count' lines"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common())
+
+class StackSampler:
+    """Background thread that samples the stacks of all active sessions"""
+
+    def __init__(self, interval_ms: float):
+        self.interval = interval_ms / 1000
+        self._sessions: Dict[int, ProfileSession] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start_session(self, thread_id: int) -> ProfileSession:
+        """Begin sampling the given thread"""
+        session = ProfileSession(thread_id)
+        with self._lock:
+            self._sessions[id(session)] = session
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return session
+
+    def stop_session(self, session: ProfileSession) -> None:
+        """Stop sampling for a session"""
+        with self._lock:
+            self._sessions.pop(id(session), None)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                sessions = list(self._sessions.values())
+            if not sessions:
+                # Park until the next session starts
+                self._wakeup.clear()
+                self._wakeup.wait()
+                continue
+            frames = sys._current_frames()
+            for session in sessions:
+                frame = frames.get(session.thread_id)
+                if frame is not None:
+                    session.samples[collapse_stack(frame)] += 1
+            time.sleep(self.interval)
+
+def collapse_stack(frame) -> str:
+    """Format a frame chain root-first as a semicolon separated stack"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+_sampler = StackSampler(PROFILER_INTERVAL_MS)
+
+def write_profile(session: ProfileSession, metadata: Dict) -> None:
+    """Write a profile to PROFILER_OUTPUT_DIR, or to the logs when unset"""
+    if PROFILER_OUTPUT_DIR:
+        os.makedirs(PROFILER_OUTPUT_DIR, exist_ok=True)
+        base = os.path.join(PROFILER_OUTPUT_DIR, metadata['profile_id'])
+        with open(f"{base}.collapsed", 'w') as f:
+            f.write(session.collapsed() + "\n")
+        with open(f"{base}.json", 'w') as f:
+            json.dump(metadata, f)
+    else:
+        print(json.dumps({"profile": {**metadata, "collapsed": session.collapsed()}}))
+
+def install_profiler(app: FastAPI) -> None:
+    """Install the sampling profiler middleware on a FastAPI app"""
+
+    @app.middleware("http")
+    async def profiler_middleware(request: Request, call_next):
+        forced = PROFILER_ALLOW_HEADER and request.headers.get(PROFILER_HEADER) == '1'
+        if not forced and (not PROFILER_ENABLED or random.random() >= PROFILER_SAMPLE_RATE):
+            return await call_next(request)
+
+        # Samples the event-loop thread, which concurrent requests share
+        session = _sampler.start_session(threading.get_ident())
+        concurrent_tasks = len(asyncio.all_tasks())
+        started = time.perf_counter()
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            _sampler.stop_session(session)
+            concurrent_tasks = max(concurrent_tasks, len(asyncio.all_tasks()))
+            duration_ms = (time.perf_counter() - started) * 1000
+            if forced or duration_ms >= PROFILER_THRESHOLD_MS:
+                try:
+                    write_profile(session, {
+                        'profile_id': f"prof_{uuid.uuid4().hex[:16]}",
+                        'method': request.method,
+                        'path': request.url.path,
+                        'status_code': status_code,
+                        'duration_ms': round(duration_ms, 3),
+                        'sample_count': sum(session.samples.values()),
+                        'interval_ms': PROFILER_INTERVAL_MS,
+                        'concurrent_tasks': concurrent_tasks,
+                        'timestamp': datetime.utcnow().isoformat()
+                    })
+                except Exception as e:
+                    print(f"Failed to write profile: {e}")
@@ -0,0 +1,520 @@
+"""
+Read Projections for Serverless Payments Sandbox
+
+This module keeps the read models behind the dashboard endpoints
+(/transactions, /metrics, /webhooks/events), so reads never query or scan
+the payments ledger:
+- Recent transactions (kept PROJECTION_RETENTION_DAYS), per-merchant
+  aggregates, all-time and per-day totals, and webhook delivery status,
+  all in one projections table keyed by (pk, sk)
+- The ledger's DynamoDB Stream feeds lambda_handler, which applies each
+  inserted or modified transaction row in one TransactWriteItems call;
+  the recent row carries the stream sequence number it was written from
+  and is conditioned on it, so a redelivered batch never counts twice
+- A status change (settlement) moves a row's count from the old status
+  to the new one; volumes are in the base currency at projection time
+- Webhooks are recorded as delivered by webhook_handler, subscribed to
+  the webhook topic, under the SNS message ID
+- Change feeds list recent transactions and webhook events by the time
+  they were last projected; each sync re-reads CHANGE_FEED_LAG_SECONDS,
+  so rows committed out of order by parallel stream shards are not missed
+- The recent-transaction and webhook partitions are split into
+  FEED_PARTITION_SHARDS partitions (`recent`, `recent#shard1`, ...), a
+  row's shard fixed by a hash of its ID; reads and change feeds query
+  every shard and merge them. Changing the shard count moves rows written
+  before it, so it is only raised once those have expired
+- Aggregates are write-sharded counters (see sharded_counters.py): a hot
+  merchant's totals, or the all-time and per-day totals, spread their
+  increments over several items once they are written too often or
+  throttled; MERCHANT_COUNTER_SHARDS sets a minimum for known high-volume
+  merchants
+
+PROJECTIONS_MODE=inline is the local stand-in for both consumers: the API
+applies the rows and webhooks it has just written through the same code.
+With 'stream', the consumer Lambdas do it, and each batch's capacity is
+emitted under a consumer endpoint (see telemetry.consumer_batch).
+"""
+
+import json
+import os
+import time
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+from aws_clients import GuardedTable, breakers
+from currency import BASE_CURRENCY, base_amount
+from merchant_index import decode_cursor, encode_cursor
+from response_shaping import projection_expression
+from sharded_counters import ShardedCounters
+from telemetry import CONSUMER_ENDPOINTS, consumer_batch
+
+PROJECTIONS_TABLE = os.environ.get('PROJECTIONS_TABLE', 'payments-projections')
+PROJECTIONS_MODE = os.environ.get('PROJECTIONS_MODE', 'inline')
+PROJECTION_RETENTION_DAYS = float(os.environ.get('PROJECTION_RETENTION_DAYS', '7'))
+CHANGE_FEED_LAG_SECONDS = float(os.environ.get('CHANGE_FEED_LAG_SECONDS', '5'))
+FEED_PARTITION_SHARDS = int(os.environ.get('FEED_PARTITION_SHARDS', '4'))
+
+# Endpoint names the consumers' capacity is emitted under
+STREAM_CONSUMER, WEBHOOK_CONSUMER = CONSUMER_ENDPOINTS
+
+def _parse_shard_minimums(value: str) -> Dict[str, int]:
+    """Parse 'merchant_a:8,merchant_b:4' into minimum shard counts"""
+    minimums = {}
+    for entry in filter(None, (part.strip() for part in value.split(','))):
+        merchant_id, _, shards = entry.partition(':')
+        if not shards.isdigit() or int(shards) < 1:
+            raise ValueError(f"Invalid counter shard count for {merchant_id}: {shards}")
+        minimums[merchant_id] = int(shards)
+    return minimums
+
+MERCHANT_COUNTER_SHARDS = _parse_shard_minimums(os.environ.get('MERCHANT_COUNTER_SHARDS', ''))
+
+CHANGES_INDEX_NAME = 'changes_index'
+
+# Partitions of the projections table
+RECENT_PARTITION = 'recent'
+WEBHOOK_PARTITION = 'webhooks'
+TOTALS_PARTITION = 'totals'
+
+# Ledger rows that are transactions (balance and settlement records are not)
+PROJECTED_TYPES = ('authorization', 'capture', 'refund')
+
+# Transaction attributes copied to the recent-transactions projection
+RECENT_FIELDS = (
+    'transaction_id', 'type', 'status', 'amount', 'currency', 'created_at', 'merchant_id', 'auth_id',
+    'description', 'reason', 'original_transaction_id', 'risk_rule', 'settled_at'
+)
+
+# Bookkeeping attributes never returned by the read endpoints
+INTERNAL_FIELDS = ('pk', 'sk', 'seq', 'changed', 'ttl')
+
+# Identifying field of each change feed's items
+FEED_KEYS = {
+    RECENT_PARTITION: 'transaction_id',
+    WEBHOOK_PARTITION: 'event_id',
+}
+
+# Attempts for a transaction cancelled by a concurrent write to a counter
+TRANSACTION_CONFLICT_ATTEMPTS = 3
+
+# Attempts to apply a row: merchant guesses that flip, and counters throttled and re-sharded
+APPLY_ATTEMPTS = 4
+
+# Why DynamoDB refuses a write it has no capacity for, per item and per request
+THROTTLE_REASON_CODES = ('ThrottlingError', 'ProvisionedThroughputExceeded')
+THROTTLE_ERROR_CODES = ('ThrottlingException', 'ProvisionedThroughputExceededException')
+
+# Days of per-day totals behind the dashboard metrics
+METRICS_DAYS = 30
+DAILY_VOLUME_DAYS = 7
+
+_deserializer = TypeDeserializer()
+
+def now_iso() -> str:
+    return datetime.utcnow().isoformat(timespec='microseconds')
+
+def deserialize(image: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Plain item from a DynamoDB Stream image"""
+    if image is None:
+        return None
+    return {name: _deserializer.deserialize(value) for name, value in image.items()}
+
+def feed_partition(partition: str, item_id: str) -> str:
+    """Shard of a feed partition an item is written to, stable per item"""
+    shard = zlib.crc32(item_id.encode()) % FEED_PARTITION_SHARDS
+    return partition if shard == 0 else f"{partition}#shard{shard}"
+
+def feed_partitions(partition: str) -> List[str]:
+    """Every shard of a feed partition, shard 0 first"""
+    return [partition] + [f"{partition}#shard{shard}" for shard in range(1, FEED_PARTITION_SHARDS)]
+
+def strip_internal(item: Dict[str, Any]) -> Dict[str, Any]:
+    return {name: value for name, value in item.items() if name not in INTERNAL_FIELDS}
+
+def counter_deltas(transaction: Dict[str, Any]) -> Dict[str, int]:
+    """Counters a newly written transaction adds to its aggregates"""
+    return {
+        'transactions': 1,
+        'volume': base_amount(transaction),
+        f"status_{transaction.get('status')}": 1,
+        f"type_{transaction.get('type')}": 1,
+    }
+
+def summarize(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Counts and volume of an aggregate item, grouped by status and type"""
+    summary: Dict[str, Any] = {
+        'total_transactions': int(item.get('transactions', 0)),
+        'total_volume': int(item.get('volume', 0)),
+        'by_status': {},
+        'by_type': {},
+    }
+    for name, value in item.items():
+        for prefix, group in (('status_', 'by_status'), ('type_', 'by_type')):
+            if name.startswith(prefix) and value:
+                summary[group][name[len(prefix):]] = int(value)
+    return summary
+
+class Throttled(Exception):
+    """DynamoDB throttled items of a transaction"""
+
+    def __init__(self, indexes: List[int]):
+        super().__init__(f"Throttled transaction items {indexes}")
+        self.indexes = indexes
+
+class ProjectionStore:
+    """Projection updates and reads against the projections table"""
+
+    def __init__(self, table, inline: bool = PROJECTIONS_MODE == 'inline'):
+        self.table = table
+        # Whether the API applies its own writes (the local stand-in for the consumers)
+        self.inline = inline
+        self.sharded = ShardedCounters(table)
+        # Throttled writes per feed partition shard
+        self.feed_throttles: Dict[str, int] = {}
+
+    def _counter_update(self, key: Dict[str, str], deltas: Dict[str, int],
+                        condition: Optional[str] = None) -> Dict[str, Any]:
+        names = {f"#c{i}": name for i, name in enumerate(deltas)}
+        update = {
+            'TableName': self.table.name,
+            'Key': key,
+            'UpdateExpression': 'ADD ' + ', '.join(f"#c{i} :c{i}" for i in range(len(deltas))),
+            'ExpressionAttributeNames': names,
+            'ExpressionAttributeValues': {f":c{i}": delta for i, delta in enumerate(deltas.values())},
+        }
+        if condition:
+            update['ConditionExpression'] = condition
+        return {'Update': update}
+
+    def apply(self, new: Dict[str, Any], old: Optional[Dict[str, Any]] = None,
+              sequence: Optional[int] = None) -> bool:
+        """Project one inserted (old=None) or modified ledger row; False if skipped or already applied"""
+        if new.get('type') not in PROJECTED_TYPES:
+            return False
+        # Stream sequence numbers run to 40 digits, past DynamoDB's number precision,
+        # so they are compared as zero-padded strings
+        sequence_key = f"{time.time_ns() if sequence is None else sequence:040d}"
+        changed = now_iso()
+        created_at = str(new['created_at'])
+        row = {
+            'pk': feed_partition(RECENT_PARTITION, new['transaction_id']),
+            'sk': f"{created_at}#{new['transaction_id']}",
+            'seq': sequence_key,
+            'changed': f"{changed}#{new['transaction_id']}",
+            'ttl': int((datetime.utcnow() + timedelta(days=PROJECTION_RETENTION_DAYS)).timestamp()),
+            **{field: new[field] for field in RECENT_FIELDS if new.get(field) is not None},
+        }
+        # A row is projected once per stream record; a modification needs the insert applied first
+        put = {'Put': {
+            'TableName': self.table.name,
+            'Item': row,
+            'ConditionExpression': 'attribute_not_exists(seq)' if old is None else 'seq < :seq',
+        }}
+        if old is not None:
+            put['Put']['ExpressionAttributeValues'] = {':seq': sequence_key}
+
+        if old is None:
+            deltas = counter_deltas(new)
+        elif old.get('status') != new.get('status'):
+            deltas = {f"status_{old.get('status')}": -1, f"status_{new.get('status')}": 1}
+        else:
+            deltas = {}
+        if not deltas:
+            return self._transact([put]) is None
+
+        day_key = {'pk': TOTALS_PARTITION, 'sk': f"day#{created_at[:10]}"}
+        all_key = {'pk': TOTALS_PARTITION, 'sk': 'all'}
+        merchant_key = {'pk': f"merchant#{new['merchant_id']}", 'sk': 'totals'}
+        # Optimistically assume a known merchant; a new one also bumps the merchant count.
+        # The guess flips when another shard creates (or has created) the merchant first
+        new_merchant = False
+        counters = [merchant_key, day_key, all_key]
+        for attempt in range(APPLY_ATTEMPTS):
+            merchant_target, merchant_shards = self.sharded.target(
+                merchant_key, MERCHANT_COUNTER_SHARDS.get(new['merchant_id'], 1)
+            )
+            if merchant_shards > 1:
+                # Only a merchant whose aggregate exists is sharded
+                new_merchant = False
+                merchant_update = self._counter_update(merchant_target, deltas)
+            else:
+                merchant_update = self._counter_update(
+                    merchant_key, deltas,
+                    'attribute_not_exists(transactions)' if new_merchant else 'attribute_exists(transactions)'
+                )
+            items = [
+                put,
+                merchant_update,
+                self._counter_update(self.sharded.target(day_key)[0], deltas),
+                self._counter_update(self.sharded.target(all_key)[0],
+                                     {**deltas, 'merchants': 1} if new_merchant else deltas),
+            ]
+            try:
+                failed = self._transact(items)
+            except Throttled as e:
+                for index in e.indexes:
+                    if index == 0:
+                        # The feed row's shard is fixed by its ID, so it is only backed off and reported
+                        self.feed_throttles[row['pk']] = self.feed_throttles.get(row['pk'], 0) + 1
+                    else:
+                        self.sharded.throttled(counters[index - 1])
+                if attempt == APPLY_ATTEMPTS - 1:
+                    raise
+                time.sleep(0.01 * (2 ** attempt))
+                continue
+            if failed is None:
+                return True
+            if failed == 0:
+                return False
+            if old is not None:
+                # A modification of a row whose merchant was never projected
+                return False
+            new_merchant = not new_merchant
+        raise RuntimeError(f"Merchant aggregate for {new['merchant_id']} kept changing")
+
+    def _transact(self, items: List[Dict[str, Any]]) -> Optional[int]:
+        """Write items atomically; None, or the index of the first failed condition"""
+        client = self.table.meta.client
+        for attempt in range(TRANSACTION_CONFLICT_ATTEMPTS):
+            try:
+                client.transact_write_items(TransactItems=items)
+                return None
+            except client.exceptions.TransactionCanceledException as e:
+                reasons = e.response.get('CancellationReasons', [])
+                for index, reason in enumerate(reasons):
+                    if reason.get('Code') == 'ConditionalCheckFailed':
+                        return index
+                throttled = [index for index, reason in enumerate(reasons)
+                             if reason.get('Code') in THROTTLE_REASON_CODES]
+                if throttled:
+                    raise Throttled(throttled)
+                if not any(r.get('Code') == 'TransactionConflict' for r in reasons) \
+                        or attempt == TRANSACTION_CONFLICT_ATTEMPTS - 1:
+                    raise
+                time.sleep(0.01 * (2 ** attempt))
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') in THROTTLE_ERROR_CODES:
+                    raise Throttled(list(range(len(items))))
+                raise
+
+    def written(self, items: List[Dict[str, Any]]) -> None:
+        """Inline mode: project ledger rows the API has just inserted"""
+        if not self.inline:
+            return
+        for item in items:
+            try:
+                self.apply(item)
+            except Exception as e:
+                print(f"Failed to update projections: {e}")
+
+    def record_webhook(self, event_id: str, message: Dict[str, Any]) -> None:
+        """Record a webhook the topic has accepted as delivered"""
+        payload = message.get('payload', {})
+        data = payload.get('data') or {}
+        timestamp = payload.get('timestamp') or now_iso()
+        changed = now_iso()
+        event = {
+            'pk': feed_partition(WEBHOOK_PARTITION, event_id),
+            'sk': f"{timestamp}#{event_id}",
+            'changed': f"{changed}#{event_id}",
+            'ttl': int((datetime.utcnow() + timedelta(days=PROJECTION_RETENTION_DAYS)).timestamp()),
+            'event_id': event_id,
+            'event_type': payload.get('event_type'),
+            'status': 'delivered',
+            'created_at': timestamp,
+            'delivered_at': changed,
+        }
+        if data.get('transaction_id'):
+            event['transaction_id'] = data['transaction_id']
+        # Keyed by message ID, so a redelivered notification rewrites the same row
+        self.table.put_item(Item=event)
+
+    def published(self, event_id: Optional[str], message: Dict[str, Any]) -> None:
+        """Inline mode: record a webhook the API has just published"""
+        if not self.inline or not isinstance(event_id, str):
+            return
+        try:
+            self.record_webhook(event_id, message)
+        except Exception as e:
+            print(f"Failed to record webhook delivery: {e}")
+
+    def latest(self, partition: str, limit: int = 100, cursor: Optional[str] = None,
+               fields: Optional[List[str]] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """One newest-first page of recent transactions or webhook events
+
+        Each shard is read below its own position: '' before it is read,
+        the sort key of its last returned row, or None once exhausted.
+        """
+        shards = feed_partitions(partition)
+        positions: List[Optional[str]] = [''] * len(shards)
+        if cursor:
+            state = decode_cursor(cursor)
+            before = state.get('before') if isinstance(state, dict) and state.get('feed') == partition else None
+            if not isinstance(before, list) or len(before) != len(shards) \
+                    or not all(position is None or isinstance(position, str) for position in before):
+                raise ValueError("Invalid cursor")
+            positions = before
+        if fields is not None:
+            # Shards are merged and resumed by sort key
+            fields = list(dict.fromkeys([*fields, 'sk']))
+
+        read: List[Tuple[Dict[str, Any], int]] = []
+        truncated = [False] * len(shards)
+        for shard, pk in enumerate(shards):
+            if positions[shard] is None:
+                continue
+            condition = Key('pk').eq(pk)
+            if positions[shard]:
+                condition = condition & Key('sk').lt(positions[shard])
+            response = self.table.query(
+                KeyConditionExpression=condition,
+                ScanIndexForward=False,
+                Limit=limit,
+                **projection_expression(fields),
+            )
+            read.extend((item, shard) for item in response.get('Items', []))
+            truncated[shard] = 'LastEvaluatedKey' in response
+
+        read.sort(key=lambda entry: entry[0]['sk'], reverse=True)
+        taken = read[:limit]
+        positions = list(positions)
+        for shard in range(len(shards)):
+            if positions[shard] is None:
+                continue
+            shard_taken = [item['sk'] for item, source in taken if source == shard]
+            shard_read = sum(1 for _, source in read if source == shard)
+            if len(shard_taken) == shard_read and not truncated[shard]:
+                positions[shard] = None
+            elif shard_taken:
+                positions[shard] = shard_taken[-1]
+        items = [strip_internal(item) for item, _ in taken]
+        if all(position is None for position in positions):
+            return items, None
+        return items, encode_cursor({'feed': partition, 'before': positions})
+
+    def changes(self, partition: str, cursor: Optional[str] = None, limit: int = 1000,
+                fields: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Recent transactions or webhook events projected after a cursor, in change order
+
+        The response matches the mock server's change feeds. Items may
+        repeat across syncs (each sync re-reads the lag window), so
+        replicas should upsert them by their identifying field.
+        """
+        state = decode_cursor(cursor) if cursor else None
+        reset = not isinstance(state, dict) or state.get('feed') != partition or not isinstance(state.get('after'), str)
+        after = '' if reset else state['after']
+        if fields is not None:
+            # Replicas are keyed by the identifying field, and the cursor needs the change time
+            fields = list(dict.fromkeys([FEED_KEYS[partition], *fields, 'changed']))
+
+        # Each shard's first `limit` changes hold the first `limit` of the merged feed
+        items: List[Dict[str, Any]] = []
+        has_more = False
+        for pk in feed_partitions(partition):
+            condition = Key('pk').eq(pk)
+            if after:
+                # Key attributes cannot be compared with an empty string
+                condition = condition & Key('changed').gt(after)
+            response = self.table.query(
+                IndexName=CHANGES_INDEX_NAME,
+                KeyConditionExpression=condition,
+                Limit=limit,
+                **projection_expression(fields),
+            )
+            items.extend(response.get('Items', []))
+            has_more = has_more or 'LastEvaluatedKey' in response
+        items.sort(key=lambda item: item['changed'])
+        has_more = has_more or len(items) > limit
+        items = items[:limit]
+        last = items[-1]['changed'] if items else after
+        if not has_more:
+            lag_bound = (datetime.utcnow() - timedelta(seconds=CHANGE_FEED_LAG_SECONDS)).isoformat(timespec='microseconds')
+            last = min(last, lag_bound)
+        return {
+            'items': [strip_internal(item) for item in items],
+            'cursor': encode_cursor({'feed': partition, 'after': last}),
+            'has_more': has_more,
+            'reset': reset,
+        }
+
+    def feed_stats(self) -> Dict[str, Any]:
+        """Feed partition shards and the writes throttled on each"""
+        return {'shards': FEED_PARTITION_SHARDS, 'throttled': dict(self.feed_throttles)}
+
+    def merchant_totals(self, merchant_id: str) -> Optional[Dict[str, Any]]:
+        """All-time counts and base-currency volume of one merchant"""
+        item = self.sharded.read({'pk': f"merchant#{merchant_id}", 'sk': 'totals'})
+        if item is None:
+            return None
+        return {'merchant_id': merchant_id, 'base_currency': BASE_CURRENCY, **summarize(item)}
+
+    def metrics(self) -> Dict[str, Any]:
+        """Dashboard metrics from the all-time and per-day totals"""
+        today = datetime.utcnow().date()
+        all_time = self.sharded.read({'pk': TOTALS_PARTITION, 'sk': 'all'}) or {}
+        first_day = (today - timedelta(days=METRICS_DAYS - 1)).isoformat()
+        response = self.table.query(
+            KeyConditionExpression=Key('pk').eq(TOTALS_PARTITION)
+            & Key('sk').between(f"day#{first_day}", f"day#{today.isoformat()}")
+        )
+        day_items = self.sharded.merge_shards(response.get('Items', []))
+        days = {item['sk'][len('day#'):]: summarize(item) for item in day_items}
+
+        statuses: Dict[str, int] = {}
+        types: Dict[str, int] = {}
+        for day in days.values():
+            for status, count in day['by_status'].items():
+                statuses[status] = statuses.get(status, 0) + count
+            for type_, count in day['by_type'].items():
+                types[type_] = types.get(type_, 0) + count
+        total = sum(statuses.values())
+        failed = sum(statuses.get(status, 0) for status in ('failed', 'declined'))
+        daily_dates = [(today - timedelta(days=n)).isoformat() for n in range(DAILY_VOLUME_DAYS - 1, -1, -1)]
+        return {
+            'base_currency': BASE_CURRENCY,
+            'total_transactions': int(all_time.get('transactions', 0)),
+            'total_volume': int(all_time.get('volume', 0)),
+            'active_merchants': int(all_time.get('merchants', 0)),
+            'success_rate': round(100 * (total - failed) / total, 1) if total else 100.0,
+            'daily_volume': [days[date]['total_volume'] if date in days else 0 for date in daily_dates],
+            'transaction_types': [
+                {'type': type_, 'count': count} for type_, count in sorted(types.items(), key=lambda item: -item[1])
+            ],
+        }
+
+def consumer_store() -> ProjectionStore:
+    return ProjectionStore(GuardedTable(PROJECTIONS_TABLE, breakers['projections']), inline=False)
+
+def lambda_handler(event, context):
+    """DynamoDB Stream consumer for the ledger table"""
+    store = consumer_store()
+    records = event.get('Records', [])
+    with consumer_batch(STREAM_CONSUMER, len(records)) as timer, timer.phase('projection_write'):
+        for record in records:
+            if record.get('eventName') not in ('INSERT', 'MODIFY'):
+                continue
+            change = record['dynamodb']
+            try:
+                store.apply(deserialize(change['NewImage']), deserialize(change.get('OldImage')),
+                            sequence=int(change['SequenceNumber']))
+            except Exception as e:
+                # Records before this one are applied; the batch is retried from here
+                print(f"Failed to project stream record {change['SequenceNumber']}: {e}")
+                timer.outcome = 'partial'
+                return {'batchItemFailures': [{'itemIdentifier': change['SequenceNumber']}]}
+    return {'batchItemFailures': []}
+
+def webhook_handler(event, context):
+    """SNS consumer for the webhook topic"""
+    store = consumer_store()
+    records = event.get('Records', [])
+    with consumer_batch(WEBHOOK_CONSUMER, len(records)) as timer, timer.phase('projection_write'):
+        for record in records:
+            notification = record['Sns']
+            store.record_webhook(notification['MessageId'], json.loads(notification['Message']))
+    return {'recorded': len(records)}
@@ -0,0 +1,166 @@
+"""
+Response Shaping for Serverless Payments Sandbox
+
+This module trims and compresses list responses for the polling frontend:
+- `?fields=` parsing, in-memory projection and the equivalent DynamoDB
+  ProjectionExpression, so unused attributes are never read or serialized
+- Compact JSON responses that skip FastAPI's jsonable_encoder pass
+- ASGI middleware that negotiates br (when the optional `brotli` package
+  is installed) or gzip for responses above a size threshold
+"""
+
+import gzip
+import json
+import os
+import re
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+from fastapi import Response
+
+try:
+    import brotli
+except ImportError:  # br is optional; gzip is always available
+    brotli = None
+
+COMPRESSION_MIN_BYTES = int(os.environ.get('COMPRESSION_MIN_BYTES', '1024'))
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+FIELD_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+MAX_FIELDS = 32
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+def parse_fields(value: Optional[str]) -> Optional[List[str]]:
+    """Validated, de-duplicated field list from a `fields` query parameter"""
+    if value is None or not value.strip():
+        return None
+    fields = list(dict.fromkeys(part.strip() for part in value.split(',') if part.strip()))
+    if len(fields) > MAX_FIELDS:
+        raise ValueError(f"At most {MAX_FIELDS} fields may be requested")
+    for field in fields:
+        if not FIELD_PATTERN.match(field):
+            raise ValueError(f"Invalid field name: {field}")
+    return fields
+
+def project(items: Iterable[Dict[str, Any]], fields: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """Items reduced to the requested fields (all fields when None)"""
+    if fields is None:
+        return list(items)
+    return [{field: item[field] for field in fields if field in item} for item in items]
+
+def projection_expression(fields: Optional[List[str]]) -> Dict[str, Any]:
+    """DynamoDB query/scan kwargs that read only the requested attributes"""
+    if fields is None:
+        return {}
+    names = {f"#p{i}": field for i, field in enumerate(fields)}
+    return {'ProjectionExpression': ', '.join(names), 'ExpressionAttributeNames': names}
+
+def _encode_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return str(value)
+
+def json_response(content: Any, status_code: int = 200) -> Response:
+    """Compact JSON response serialized in one json.dumps call"""
+    body = json.dumps(content, separators=(',', ':'), default=_encode_default)
+    return Response(content=body, status_code=status_code, media_type='application/json')
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding header parsed into {coding: q}"""
+    encodings = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[coding.strip().lower()] = q
+    return encodings
+
+def choose_encoding(header: str) -> Optional[str]:
+    """Best supported coding the client accepts (br preferred on ties)"""
+    accepted = accepted_encodings(header)
+    candidates = (['br'] if brotli is not None else []) + ['gzip']
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = accepted.get(coding, accepted.get('*', 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+class CompressionMiddleware:
+    """Negotiated br/gzip for complete (non-streamed) responses above a threshold"""
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get('headers') or [])
+        encoding = choose_encoding(headers.get(b'accept-encoding', b'').decode('latin-1'))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        chunks: List[bytes] = []
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message['type'] == 'http.response.start':
+                start_message = message
+                return
+            if message['type'] != 'http.response.body':
+                await send(message)
+                return
+
+            chunks.append(message.get('body', b''))
+            if message.get('more_body', False):
+                # Streamed responses go out uncompressed, chunk by chunk
+                passthrough = True
+                await send(start_message)
+                await send({'type': 'http.response.body', 'body': b''.join(chunks), 'more_body': True})
+                return
+            await self._send_complete(send, start_message, b''.join(chunks), encoding)
+
+        await self.app(scope, receive, send_wrapper)
+
+    async def _send_complete(self, send, start_message, body: bytes, encoding: str) -> None:
+        headers = [(k, v) for k, v in start_message['headers']]
+        header_map = {k.lower(): v for k, v in headers}
+        content_type = header_map.get(b'content-type', b'').decode('latin-1')
+        compressible = (
+            len(body) >= self.minimum_size
+            and b'content-encoding' not in header_map
+            and content_type.startswith(COMPRESSIBLE_TYPES)
+        )
+        if compressible:
+            body = compress(body, encoding)
+            headers = [(k, v) for k, v in headers if k.lower() not in (b'content-length', b'vary')]
+            vary = header_map.get(b'vary')
+            headers += [
+                (b'content-encoding', encoding.encode('latin-1')),
+                (b'content-length', str(len(body)).encode('latin-1')),
+                (b'vary', vary + b', Accept-Encoding' if vary else b'Accept-Encoding'),
+            ]
+        await send({**start_message, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,230 @@
+"""
+Velocity Risk Scoring for Serverless Payments Sandbox
+
+This module screens authorizations against velocity rules without any
+DynamoDB reads:
+- Attempts are counted per card (last 4 digits and holder), per merchant
+  and per amount pattern (the same amount and currency at one merchant,
+  as in card-testing runs)
+- Counts live in sliding-window count-min sketches: a ring of time slots,
+  each a fixed-size sketch with conservative updates; the oldest slot is
+  weighted by the part of it still inside the window, so counts decay
+  smoothly instead of dropping a whole slot at once
+- Rules (name, dimension, window, limit and an optional sketch width) are
+  a table, RISK_RULES as JSON or DEFAULT_RULES; an attempt that takes any count over its limit is
+  declined when RISK_MODE is 'enforce', and only flagged (the rule is
+  recorded, the attempt approved) in the default 'log' mode, so shared
+  test cards and load tests are not declined unless enforcement is chosen
+- Scoring has a hard budget of RISK_BUDGET_MS; rules not reached in time
+  are skipped (fail open) and counted in stats()
+
+Counters are per process, so each Lambda container enforces the limits on
+the traffic it serves.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+RISK_ENABLED = os.environ.get('RISK_ENABLED', 'true').lower() == 'true'
+RISK_MODE = os.environ.get('RISK_MODE', 'log')
+RISK_BUDGET_MS = float(os.environ.get('RISK_BUDGET_MS', '0.5'))
+RISK_SKETCH_WIDTH = int(os.environ.get('RISK_SKETCH_WIDTH', '16384'))
+RISK_SKETCH_DEPTH = int(os.environ.get('RISK_SKETCH_DEPTH', '4'))
+RISK_WINDOW_SLOTS = int(os.environ.get('RISK_WINDOW_SLOTS', '6'))
+
+DIMENSIONS = ('card', 'merchant', 'amount')
+
+RISK_MODES = ('enforce', 'log')
+
+# Sketch width bounds the overcount: about events per window / width per cell,
+# so long windows over many keys get wider sketches and few keys narrower ones
+DEFAULT_RULES = [
+    {'name': 'card_per_minute', 'dimension': 'card', 'window_seconds': 60, 'limit': 5, 'width': 65536},
+    {'name': 'card_per_10_minutes', 'dimension': 'card', 'window_seconds': 600, 'limit': 12, 'width': 65536},
+    {'name': 'repeated_amount', 'dimension': 'amount', 'window_seconds': 60, 'limit': 30},
+    {'name': 'merchant_per_minute', 'dimension': 'merchant', 'window_seconds': 60, 'limit': 3000, 'width': 1024},
+]
+
+class Rule:
+    """Decline when a dimension's count over a window exceeds a limit"""
+
+    __slots__ = ('name', 'dimension', 'window_seconds', 'limit', 'width')
+
+    def __init__(self, name: str, dimension: str, window_seconds: float, limit: int, width: int = RISK_SKETCH_WIDTH):
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"Unknown risk dimension: {dimension}")
+        if window_seconds <= 0 or limit < 0:
+            raise ValueError(f"Invalid window or limit in risk rule {name}")
+        self.name = name
+        self.dimension = dimension
+        self.window_seconds = float(window_seconds)
+        self.limit = limit
+        self.width = width
+
+def load_rules() -> List[Rule]:
+    """Rule table from RISK_RULES, or the defaults"""
+    raw = os.environ.get('RISK_RULES')
+    return [Rule(**rule) for rule in (json.loads(raw) if raw else DEFAULT_RULES)]
+
+def velocity_keys(card_number: str, card_holder: str, merchant_id: str, amount: int, currency: str) -> Dict[str, str]:
+    """Counter key of an authorization in each dimension"""
+    return {
+        'card': f"{card_number[-4:]}|{' '.join(card_holder.lower().split())}",
+        'merchant': merchant_id,
+        'amount': f"{merchant_id}|{amount}|{currency}",
+    }
+
+class SlidingCountMin:
+    """Count-min sketch over a sliding time window, as a ring of slot sketches"""
+
+    def __init__(self, window_seconds: float, slots: int, width: int, depth: int):
+        self.window_seconds = window_seconds
+        self.slots = slots
+        self.slot_seconds = window_seconds / slots
+        self.width = width
+        self.depth = depth
+        self.cells = width * depth
+        # One slot more than the window spans: the current one is still filling
+        self.ring = [array('I', bytes(4 * self.cells)) for _ in range(slots + 1)]
+        # Reused slots are cleared by copying from this, an order of magnitude faster than a new array
+        self.zeros = array('I', bytes(4 * self.cells))
+        self.epochs: List[Optional[int]] = [None] * (slots + 1)
+
+    def positions(self, first: int, second: int) -> List[int]:
+        """One cell per row, by double hashing"""
+        return [row * self.width + (first + row * second) % self.width for row in range(self.depth)]
+
+    def add(self, positions: List[int], now: float) -> float:
+        """Count one event and return the decayed count over the window, this event included"""
+        position = now / self.slot_seconds
+        epoch = int(position)
+        size = len(self.ring)
+        index = epoch % size
+        if self.epochs[index] != epoch:
+            self.ring[index][:] = self.zeros
+            self.epochs[index] = epoch
+
+        # Conservative update: raise only the cells holding the current minimum
+        counts = self.ring[index]
+        low = min(counts[p] for p in positions)
+        for p in positions:
+            if counts[p] == low:
+                counts[p] = low + 1
+
+        totals = [0.0] * len(positions)
+        for offset in range(size):
+            slot_epoch = epoch - offset
+            slot = slot_epoch % size
+            if self.epochs[slot] != slot_epoch:
+                continue
+            # The oldest slot counts for the part of it still inside the window
+            weight = 1.0 - (position - epoch) if offset == self.slots else 1.0
+            counts = self.ring[slot]
+            for row, p in enumerate(positions):
+                totals[row] += counts[p] * weight
+        return min(totals)
+
+    def memory_bytes(self) -> int:
+        return sum(len(counts) * counts.itemsize for counts in self.ring) + len(self.zeros) * self.zeros.itemsize
+
+class RiskEngine:
+    """Velocity rules evaluated against in-memory sliding-window counters"""
+
+    def __init__(
+        self,
+        rules: Optional[List[Rule]] = None,
+        enabled: bool = RISK_ENABLED,
+        mode: str = RISK_MODE,
+        budget_ms: float = RISK_BUDGET_MS,
+        depth: int = RISK_SKETCH_DEPTH,
+        slots: int = RISK_WINDOW_SLOTS,
+        clock=time.time
+    ):
+        if mode not in RISK_MODES:
+            raise ValueError(f"Unknown risk mode: {mode}")
+        self.rules = load_rules() if rules is None else rules
+        self.enabled = enabled
+        # Whether a broken rule declines the attempt, or is only flagged
+        self.enforce = mode == 'enforce'
+        self.budget_seconds = budget_ms / 1000
+        self.clock = clock
+        # Rules on the same dimension and window share one sketch, as wide as the widest asks
+        widths: Dict[Tuple[str, float], int] = {}
+        for rule in self.rules:
+            key = (rule.dimension, rule.window_seconds)
+            widths[key] = max(widths.get(key, 0), rule.width)
+        self.sketches: Dict[Tuple[str, float], SlidingCountMin] = {
+            key: SlidingCountMin(key[1], slots, width, depth) for key, width in widths.items()
+        }
+        self._lock = threading.Lock()
+        self.evaluated = 0
+        self.declined = 0
+        self.budget_exceeded = 0
+        self.declines_by_rule: Dict[str, int] = {}
+        self.flagged = 0
+        self.flags_by_rule: Dict[str, int] = {}
+
+    def _hashes(self, key: str) -> Tuple[int, int]:
+        # The two halves of one digest, for double hashing in every sketch of the key's dimension
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def score(self, keys: Dict[str, str]) -> Optional[str]:
+        """Count an attempt and return the first rule it breaks, if any (declined only when enforcing)"""
+        if not self.enabled:
+            return None
+        deadline = time.perf_counter() + self.budget_seconds
+        now = self.clock()
+        broken = None
+        with self._lock:
+            self.evaluated += 1
+            hashes: Dict[str, Tuple[int, int]] = {}
+            counts: Dict[Tuple[str, float], float] = {}
+            for rule in self.rules:
+                if time.perf_counter() > deadline:
+                    self.budget_exceeded += 1
+                    break
+                key = keys.get(rule.dimension)
+                if key is None:
+                    continue
+                sketch_key = (rule.dimension, rule.window_seconds)
+                if sketch_key not in counts:
+                    if rule.dimension not in hashes:
+                        hashes[rule.dimension] = self._hashes(key)
+                    sketch = self.sketches[sketch_key]
+                    counts[sketch_key] = sketch.add(sketch.positions(*hashes[rule.dimension]), now)
+                if broken is None and counts[sketch_key] > rule.limit:
+                    broken = rule.name
+            if broken is not None:
+                if self.enforce:
+                    self.declined += 1
+                    by_rule = self.declines_by_rule
+                else:
+                    self.flagged += 1
+                    by_rule = self.flags_by_rule
+                by_rule[broken] = by_rule.get(broken, 0) + 1
+        return broken
+
+    def stats(self) -> Dict[str, Any]:
+        """Rule table, decisions and memory of this process's counters"""
+        return {
+            'enabled': self.enabled,
+            'mode': 'enforce' if self.enforce else 'log',
+            'rules': [
+                {'name': r.name, 'dimension': r.dimension, 'window_seconds': r.window_seconds, 'limit': r.limit,
+                 'width': r.width}
+                for r in self.rules
+            ],
+            'evaluated': self.evaluated,
+            'declined': self.declined,
+            'declines_by_rule': dict(self.declines_by_rule),
+            'flagged': self.flagged,
+            'flags_by_rule': dict(self.flags_by_rule),
+            'budget_exceeded': self.budget_exceeded,
+            'memory_bytes': sum(sketch.memory_bytes() for sketch in self.sketches.values()),
+        }
@@ -0,0 +1,198 @@
+"""
+Time-Series Rollups for Serverless Payments Sandbox
+
+This module keeps pre-bucketed transaction counts and volumes for the
+dashboard charts:
+- Minute, hour and day buckets of count and volume, broken down by type,
+  status and merchant, updated in O(1) per transaction as it is written;
+  volumes are in the base currency (see currency.py)
+- Automatic downsampling by retention: minute buckets are dropped after
+  ROLLUP_MINUTE_RETENTION_HOURS and hour buckets after
+  ROLLUP_HOUR_RETENTION_DAYS; the coarser buckets already hold their data
+- Range queries at any resolution (or the finest one still retained for
+  the range), costing O(buckets) rather than O(transactions)
+"""
+
+import bisect
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from currency import base_amount
+
+ROLLUP_MINUTE_RETENTION_HOURS = float(os.environ.get('ROLLUP_MINUTE_RETENTION_HOURS', '24'))
+ROLLUP_HOUR_RETENTION_DAYS = float(os.environ.get('ROLLUP_HOUR_RETENTION_DAYS', '31'))
+
+# Bucket width in seconds, finest first
+RESOLUTIONS = {
+    'minute': 60,
+    'hour': 3600,
+    'day': 86400,
+}
+
+# Seconds a resolution is kept (None = forever)
+RETENTION = {
+    'minute': ROLLUP_MINUTE_RETENTION_HOURS * 3600,
+    'hour': ROLLUP_HOUR_RETENTION_DAYS * 86400,
+    'day': None,
+}
+
+GROUP_FIELDS = {
+    'type': 'type',
+    'status': 'status',
+    'merchant': 'merchant_id',
+}
+
+# Upper bound on points returned by one query
+MAX_POINTS = 2000
+
+def to_epoch(timestamp: str) -> float:
+    """Seconds since the epoch for a naive-UTC or offset ISO-8601 timestamp"""
+    parsed = datetime.fromisoformat(timestamp)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+def to_iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).replace(tzinfo=None).isoformat()
+
+class Bucket:
+    """Count and volume for one time bucket, in total and per group"""
+
+    __slots__ = ('count', 'volume', 'groups')
+
+    def __init__(self):
+        self.count = 0
+        self.volume = 0
+        self.groups: Dict[str, Dict[str, List[int]]] = {name: {} for name in GROUP_FIELDS}
+
+    def add(self, transaction: Dict[str, Any], amount: int) -> None:
+        self.count += 1
+        self.volume += amount
+        for name, field in GROUP_FIELDS.items():
+            totals = self.groups[name].setdefault(str(transaction.get(field)), [0, 0])
+            totals[0] += 1
+            totals[1] += amount
+
+class RollupStore:
+    """In-memory rollups at every resolution, safe for concurrent writers"""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.buckets: Dict[str, Dict[int, Bucket]] = {name: {} for name in RESOLUTIONS}
+        self.starts: Dict[str, List[int]] = {name: [] for name in RESOLUTIONS}
+        self._lock = threading.Lock()
+
+    def record(self, transaction: Dict[str, Any]) -> None:
+        """Add a transaction to its bucket at every retained resolution"""
+        try:
+            timestamp = to_epoch(transaction['created_at'])
+        except (KeyError, TypeError, ValueError):
+            return
+        amount = base_amount(transaction)
+        now = self.clock()
+
+        with self._lock:
+            for name, width in RESOLUTIONS.items():
+                retention = RETENTION[name]
+                if retention is not None and timestamp < now - retention:
+                    continue
+                start = int(timestamp - timestamp % width)
+                bucket = self.buckets[name].get(start)
+                if bucket is None:
+                    bucket = self.buckets[name][start] = Bucket()
+                    bisect.insort(self.starts[name], start)
+                    self._expire(name, now)
+                bucket.add(transaction, amount)
+
+    def _expire(self, name: str, now: float) -> None:
+        retention = RETENTION[name]
+        if retention is None:
+            return
+        starts = self.starts[name]
+        cutoff = bisect.bisect_left(starts, now - retention - RESOLUTIONS[name])
+        for start in starts[:cutoff]:
+            del self.buckets[name][start]
+        del starts[:cutoff]
+
+    def snapshot(self) -> Dict[str, List[List[Any]]]:
+        """JSON-serializable copy of every bucket, for restore()"""
+        with self._lock:
+            return {
+                name: [[start, bucket.count, bucket.volume, bucket.groups] for start, bucket in sorted(buckets.items())]
+                for name, buckets in self.buckets.items()
+            }
+
+    def restore(self, snapshot: Dict[str, List[List[Any]]]) -> None:
+        """Replace every bucket with those of a snapshot()"""
+        with self._lock:
+            for name in RESOLUTIONS:
+                self.buckets[name] = {}
+                for start, count, volume, groups in snapshot.get(name, []):
+                    bucket = self.buckets[name][start] = Bucket()
+                    bucket.count, bucket.volume, bucket.groups = count, volume, groups
+                self.starts[name] = sorted(self.buckets[name])
+
+    def resolution_for(self, start: float, end: float) -> str:
+        """Finest resolution still retained at start that fits in MAX_POINTS"""
+        now = self.clock()
+        for name, width in RESOLUTIONS.items():
+            retention = RETENTION[name]
+            if retention is not None and start < now - retention:
+                continue
+            if (end - start) / width <= MAX_POINTS:
+                return name
+        return 'day'
+
+    def query(
+        self,
+        start: str,
+        end: str,
+        resolution: Optional[str] = None,
+        group_by: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Zero-filled points covering [start, end] at one resolution"""
+        start_epoch, end_epoch = to_epoch(start), to_epoch(end)
+        if end_epoch < start_epoch:
+            raise ValueError("start must not be after end")
+        resolution = resolution or self.resolution_for(start_epoch, end_epoch)
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        if group_by is not None and group_by not in GROUP_FIELDS:
+            raise ValueError(f"Unknown group_by: {group_by}")
+
+        width = RESOLUTIONS[resolution]
+        first = int(start_epoch - start_epoch % width)
+        if (end_epoch - first) / width > MAX_POINTS:
+            raise ValueError("Time range too large for resolution")
+
+        points = []
+        with self._lock:
+            buckets = self.buckets[resolution]
+            for bucket_start in range(first, int(end_epoch) + 1, width):
+                bucket = buckets.get(bucket_start)
+                point = {
+                    'start': to_iso(bucket_start),
+                    'count': bucket.count if bucket else 0,
+                    'volume': bucket.volume if bucket else 0,
+                }
+                if group_by is not None:
+                    point['groups'] = {
+                        key: {'count': count, 'volume': volume}
+                        for key, (count, volume) in (bucket.groups[group_by].items() if bucket else ())
+                    }
+                points.append(point)
+
+        return {'resolution': resolution, 'start': start, 'end': end, 'group_by': group_by, 'points': points}
+
+    def totals(self, start: str, end: str, group_by: str, resolution: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """Per-group count and volume summed over [start, end]"""
+        totals: Dict[str, Dict[str, int]] = {}
+        for point in self.query(start, end, resolution, group_by)['points']:
+            for key, values in point['groups'].items():
+                summary = totals.setdefault(key, {'count': 0, 'volume': 0})
+                summary['count'] += values['count']
+                summary['volume'] += values['volume']
+        return totals
@@ -0,0 +1,345 @@
+"""
+T+1 Settlement Engine for Serverless Payments Sandbox
+
+This module settles one day of captures and refunds:
+- Reads the day's rows from the date-bucketed `settlement_index` GSI, or
+  from a segmented parallel scan of the ledger
+- Aggregates gross and net amounts per merchant and currency in parallel
+  workers (threads, or a process pool for local bulk runs)
+- Publishes `transaction_settled` webhooks in SNS batches of 10, then
+  marks the rows whose webhook was accepted settled, with batched writes
+- Writes one settlement record per merchant and currency: into the
+  payments ledger on DynamoDB (projections skip its `settlement` type),
+  and into a collection of their own in the mock server's stores, so
+  they never show up as transactions
+
+Settlement totals always cover every row of the day, settled or not, so
+re-running a day (for example after a partial failure) rewrites the
+settlement records with the same totals, stamped with the re-run's
+settled_at, and only touches rows that are still unsettled. A row whose
+webhook could not be published stays unsettled, so the re-run publishes
+it again.
+"""
+
+import argparse
+import json
+import os
+import threading
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import Attr, Key
+
+import aws_clients
+from webhooks import build_webhook_message
+
+# Number of write shards per settlement date in settlement_index
+SETTLEMENT_SHARDS = int(os.environ.get('SETTLEMENT_SHARDS', '16'))
+
+# Transaction types that move money at settlement
+SETTLEABLE_TYPES = ('capture', 'refund')
+SETTLEABLE_STATUSES = ('completed', 'settled')
+
+# Rows buffered per worker before a batched write / publish
+WRITE_BATCH_SIZE = 500
+SNS_BATCH_SIZE = 10
+
+def settlement_bucket(created_at: str, transaction_id: str) -> str:
+    """Partition key for settlement_index: settlement date plus a stable shard"""
+    shard = zlib.crc32(transaction_id.encode('utf-8')) % SETTLEMENT_SHARDS
+    return f"{created_at[:10]}#{shard}"
+
+def settlement_id(settlement_date: str, merchant_id: str, currency: str) -> str:
+    """Deterministic settlement record ID for a merchant/currency/day"""
+    return f"settlement_{settlement_date}_{merchant_id}_{currency}"
+
+class DynamoLedger:
+    """Settlement reads and writes against the DynamoDB payments ledger"""
+
+    def __init__(self, table_name: str, topic_arn: str, mode: str = 'index', scan_segments: int = 16):
+        if mode not in ('index', 'scan'):
+            raise ValueError(f"Unknown settlement read mode: {mode}")
+        self.table_name = table_name
+        self.topic_arn = topic_arn
+        self.mode = mode
+        self.scan_segments = scan_segments
+        self._table = None
+        self._sns = None
+
+    def __getstate__(self):
+        # boto3 objects are not picklable; workers open their own clients
+        state = self.__dict__.copy()
+        state['_table'] = None
+        state['_sns'] = None
+        return state
+
+    @property
+    def table(self):
+        if self._table is None:
+            self._table = aws_clients.resource('dynamodb').Table(self.table_name)
+        return self._table
+
+    @property
+    def sns(self):
+        if self._sns is None:
+            self._sns = aws_clients.client('sns')
+        return self._sns
+
+    def partitions(self, settlement_date: str) -> List[Any]:
+        """Independent units of work for one settlement date"""
+        if self.mode == 'index':
+            return [f"{settlement_date}#{shard}" for shard in range(SETTLEMENT_SHARDS)]
+        return list(range(self.scan_segments))
+
+    def read_partition(self, partition: Any, settlement_date: str) -> Iterator[Dict[str, Any]]:
+        """Page through one index bucket or scan segment"""
+        if self.mode == 'index':
+            kwargs = {
+                'IndexName': 'settlement_index',
+                'KeyConditionExpression': Key('settlement_bucket').eq(partition),
+            }
+            read = self.table.query
+        else:
+            kwargs = {
+                'Segment': partition,
+                'TotalSegments': self.scan_segments,
+                'FilterExpression': Attr('created_at').begins_with(settlement_date)
+                & Attr('type').is_in(list(SETTLEABLE_TYPES)),
+            }
+            read = self.table.scan
+
+        while True:
+            response = read(**kwargs)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                break
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def write_items(self, items: List[Dict[str, Any]]) -> None:
+        """Put full items with BatchWriteItem (25 per request, retried by boto3)"""
+        with self.table.batch_writer() as batch:
+            for item in items:
+                batch.put_item(Item=item)
+
+    def write_records(self, records: List[Dict[str, Any]]) -> None:
+        """Settlement records live in the ledger, keyed like its rows"""
+        self.write_items(records)
+
+    def publish(self, events: List[Tuple[str, Dict[str, Any]]]) -> List[int]:
+        """Publish signed webhooks with SNS PublishBatch; indexes of the events not published"""
+        failed: List[int] = []
+        for start in range(0, len(events), SNS_BATCH_SIZE):
+            entries = []
+            for offset, (event_type, data) in enumerate(events[start:start + SNS_BATCH_SIZE]):
+                entries.append({
+                    'Id': str(offset),
+                    'Message': json.dumps(build_webhook_message(event_type, data), default=str),
+                    'MessageAttributes': {
+                        'event_type': {
+                            'DataType': 'String',
+                            'StringValue': event_type
+                        }
+                    }
+                })
+            try:
+                response = self.sns.publish_batch(TopicArn=self.topic_arn, PublishBatchRequestEntries=entries)
+            except Exception as e:
+                print(f"Failed to publish settlement webhooks: {e}")
+                failed.extend(range(start, start + len(entries)))
+                continue
+            for entry in response.get('Failed', []):
+                print(f"Failed to publish settlement webhook: {entry.get('Code')} {entry.get('Message')}")
+                failed.append(start + int(entry['Id']))
+        return failed
+
+class InMemoryLedger:
+    """Settlement against an in-process list of transaction dicts (mock server)"""
+
+    def __init__(
+        self,
+        transactions: List[Dict[str, Any]],
+        on_publish: Optional[Callable[[List[Tuple[str, Dict[str, Any]]]], None]] = None,
+        partition_count: int = 4
+    ):
+        self.transactions = transactions
+        self.on_publish = on_publish
+        self.partition_count = partition_count
+        # transaction_id -> list position, built on the first write of a run
+        self._positions: Optional[Dict[str, int]] = None
+        self._lock = threading.Lock()
+        # Settlement records by ID, kept apart from the transactions
+        self.records: Dict[str, Dict[str, Any]] = {}
+
+    def partitions(self, settlement_date: str) -> List[Any]:
+        return list(range(self.partition_count))
+
+    def read_partition(self, partition: Any, settlement_date: str) -> Iterator[Dict[str, Any]]:
+        for index in range(partition, len(self.transactions), self.partition_count):
+            item = self.transactions[index]
+            if item.get('created_at', '').startswith(settlement_date):
+                yield item
+
+    def write_items(self, items: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            if self._positions is None:
+                self._positions = {t.get('transaction_id'): i for i, t in enumerate(self.transactions)}
+            for item in items:
+                position = self._positions.get(item['transaction_id'])
+                if position is None:
+                    self._positions[item['transaction_id']] = len(self.transactions)
+                    self.transactions.append(item)
+                else:
+                    self.transactions[position] = item
+
+    def write_records(self, records: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self.records.update((record['transaction_id'], record) for record in records)
+
+    def publish(self, events: List[Tuple[str, Dict[str, Any]]]) -> List[int]:
+        if self.on_publish:
+            self.on_publish(events)
+        return []
+
+def _new_totals() -> Dict[str, int]:
+    return {'capture_count': 0, 'refund_count': 0, 'gross_captured': 0, 'gross_refunded': 0, 'newly_settled': 0,
+            'unpublished': 0}
+
+def settle_partition(ledger, partition: Any, settlement_date: str, settled_at: str) -> Dict[Tuple[str, str], Dict[str, int]]:
+    """Aggregate one partition, mark its unsettled rows settled and return partial totals"""
+    totals: Dict[Tuple[str, str], Dict[str, int]] = {}
+    pending_items: List[Dict[str, Any]] = []
+    pending_events: List[Tuple[str, Dict[str, Any]]] = []
+
+    def flush():
+        if pending_items:
+            # Rows are only marked settled once their webhook is out; a re-run retries the rest
+            failed = set(ledger.publish(pending_events))
+            ledger.write_items([item for index, item in enumerate(pending_items) if index not in failed])
+            for index, item in enumerate(pending_items):
+                group = totals[(item['merchant_id'], item.get('currency', 'USD'))]
+                group['unpublished' if index in failed else 'newly_settled'] += 1
+            pending_items.clear()
+            pending_events.clear()
+
+    for item in ledger.read_partition(partition, settlement_date):
+        if item.get('type') not in SETTLEABLE_TYPES or item.get('status') not in SETTLEABLE_STATUSES:
+            continue
+
+        merchant_id = item['merchant_id']
+        currency = item.get('currency', 'USD')
+        amount = int(item['amount'])
+        group = totals.setdefault((merchant_id, currency), _new_totals())
+        if item['type'] == 'capture':
+            group['capture_count'] += 1
+            group['gross_captured'] += amount
+        else:
+            group['refund_count'] += 1
+            group['gross_refunded'] += amount
+
+        if item['status'] == 'settled':
+            continue
+
+        batch_id = settlement_id(settlement_date, merchant_id, currency)
+        pending_items.append({**item, 'status': 'settled', 'settled_at': settled_at, 'settlement_id': batch_id})
+        pending_events.append(("transaction_settled", {
+            'transaction_id': item['transaction_id'],
+            'type': item['type'],
+            'amount': amount,
+            'currency': currency,
+            'merchant_id': merchant_id,
+            'settlement_id': batch_id,
+            'settled_at': settled_at
+        }))
+        if len(pending_items) >= WRITE_BATCH_SIZE:
+            flush()
+
+    flush()
+    return totals
+
+def run_settlement(ledger, settlement_date: str, workers: int = 8, use_processes: bool = False) -> Dict[str, Any]:
+    """Settle every capture and refund created on settlement_date"""
+    settled_at = datetime.utcnow().isoformat()
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+
+    merged: Dict[Tuple[str, str], Dict[str, int]] = {}
+    with executor_class(max_workers=workers) as pool:
+        futures = [
+            pool.submit(settle_partition, ledger, partition, settlement_date, settled_at)
+            for partition in ledger.partitions(settlement_date)
+        ]
+        for future in futures:
+            for key, partial in future.result().items():
+                group = merged.setdefault(key, _new_totals())
+                for field, value in partial.items():
+                    group[field] += value
+
+    records = []
+    for (merchant_id, currency), group in sorted(merged.items()):
+        records.append({
+            'transaction_id': settlement_id(settlement_date, merchant_id, currency),
+            'created_at': 'settlement',
+            'type': 'settlement',
+            'status': 'settled',
+            'settlement_date': settlement_date,
+            'merchant_id': merchant_id,
+            'currency': currency,
+            'capture_count': group['capture_count'],
+            'refund_count': group['refund_count'],
+            'gross_captured': group['gross_captured'],
+            'gross_refunded': group['gross_refunded'],
+            'net_amount': group['gross_captured'] - group['gross_refunded'],
+            'settled_at': settled_at
+        })
+    if records:
+        ledger.write_records(records)
+
+    return {
+        'settlement_date': settlement_date,
+        'settled_at': settled_at,
+        'merchants': len({merchant_id for merchant_id, _ in merged}),
+        'transactions': sum(g['capture_count'] + g['refund_count'] for g in merged.values()),
+        'newly_settled': sum(g['newly_settled'] for g in merged.values()),
+        'unpublished': sum(g['unpublished'] for g in merged.values()),
+        'records': records
+    }
+
+def previous_day() -> str:
+    """The UTC date settled by the nightly run"""
+    return (datetime.utcnow() - timedelta(days=1)).date().isoformat()
+
+# Lambda handler (invoked by the settlement Step Functions state machine)
+def lambda_handler(event, context):
+    """AWS Lambda handler function"""
+    ledger = DynamoLedger(
+        table_name=os.environ['PAYMENTS_TABLE'],
+        topic_arn=os.environ['WEBHOOK_TOPIC_ARN'],
+        mode=os.environ.get('SETTLEMENT_READ_MODE', 'index')
+    )
+    # Lambda has no /dev/shm, so parallelism here is thread-based
+    summary = run_settlement(
+        ledger,
+        event.get('settlement_date') or previous_day(),
+        workers=int(os.environ.get('SETTLEMENT_WORKERS', '16'))
+    )
+    summary.pop('records')
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Run T+1 settlement against the payments ledger")
+    parser.add_argument('--date', default=previous_day(), help="Settlement date (YYYY-MM-DD)")
+    parser.add_argument('--mode', choices=['index', 'scan'], default='index')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--segments', type=int, default=32, help="Scan segments in scan mode")
+    parser.add_argument('--processes', action='store_true', help="Use a process pool instead of threads")
+    parser.add_argument('--table', default=os.environ.get('PAYMENTS_TABLE', 'payments-ledger'))
+    parser.add_argument('--topic-arn', default=os.environ.get('WEBHOOK_TOPIC_ARN', ''))
+    args = parser.parse_args()
+
+    ledger = DynamoLedger(args.table, args.topic_arn, mode=args.mode, scan_segments=args.segments)
+    summary = run_settlement(ledger, args.date, workers=args.workers, use_processes=args.processes)
+    print(json.dumps(summary, indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Write-Sharded Counters for Serverless Payments Sandbox
+
+This module spreads hot aggregate items over several DynamoDB items:
+- Shard 0 of a counter (pk, sk) is the item itself; shard n > 0 is
+  (pk#shard<n>, sk), so its shards sit on different partitions
+- Each increment goes to one randomly chosen shard, and reads sum the
+  shards' numeric attributes
+- The shard count is stored on shard 0 (`shards`) and only ever grows,
+  so a reader that reads shard 0 first never misses a shard; a counter is
+  only sharded once shard 0 exists
+- HotKeyDetector counts the writes to each counter in the write path: a
+  counter written more than HOT_KEY_WRITES_PER_SECOND per shard by this
+  instance, or throttled by DynamoDB, doubles its shards, up to
+  COUNTER_MAX_SHARDS
+- A minimum shard count can be set for counters known to be hot
+- The detector also reports the keys it has seen over the limit, so keys
+  it cannot shard by itself (such as ledger index partitions) can be
+  sharded by configuration
+
+Shard counts and write rates are per instance: an instance that has not
+seen a counter's growth writes to fewer shards, never to missing ones.
+"""
+
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from bulk_ingest import batch_get_items
+
+HOT_KEY_WRITES_PER_SECOND = float(os.environ.get('HOT_KEY_WRITES_PER_SECOND', '25'))
+COUNTER_MAX_SHARDS = int(os.environ.get('COUNTER_MAX_SHARDS', '16'))
+
+# Write rates are counted over windows of this length
+HOT_KEY_WINDOW_SECONDS = 1.0
+
+# Counters tracked before the least recently written one is forgotten
+MAX_TRACKED_KEYS = 10000
+
+# Keys over the limit remembered for stats(), and how many are reported
+MAX_HOT_KEYS = 100
+REPORTED_HOT_KEYS = 10
+
+# Attributes of shard 0 that are not counters
+SHARDS_ATTRIBUTE = 'shards'
+
+CounterKey = Tuple[str, str]
+
+def shard_key(key: Dict[str, str], shard: int, partition_key: str = 'pk') -> Dict[str, str]:
+    """Primary key of one shard of a counter"""
+    if shard == 0:
+        return key
+    return {**key, partition_key: f"{key[partition_key]}#shard{shard}"}
+
+def merge(base: Dict[str, Any], shards: Iterable[Dict[str, Any]], key_attributes: Tuple[str, ...]) -> Dict[str, Any]:
+    """Shard 0 with the numeric attributes of the other shards added in"""
+    merged = dict(base)
+    for item in shards:
+        for name, value in item.items():
+            if name in key_attributes or name == SHARDS_ATTRIBUTE or not isinstance(value, (int, Decimal)):
+                continue
+            merged[name] = merged.get(name, 0) + value
+    return merged
+
+class HotKeyDetector:
+    """Writes per counter in fixed windows, LRU-bounded"""
+
+    def __init__(self, writes_per_second: float = HOT_KEY_WRITES_PER_SECOND,
+                 window_seconds: float = HOT_KEY_WINDOW_SECONDS, clock=time.monotonic):
+        self.limit = writes_per_second * window_seconds
+        self.window_seconds = window_seconds
+        self.clock = clock
+        # key -> [window start, writes in the window]
+        self.windows: 'OrderedDict[CounterKey, List[float]]' = OrderedDict()
+        # key -> most writes seen in one window, for keys that went over the limit
+        self.hot: 'OrderedDict[CounterKey, int]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, key: CounterKey, shards: int) -> bool:
+        """Count a write; whether the counter's shards are each over the limit in this window"""
+        with self._lock:
+            now = self.clock()
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.window_seconds:
+                window = [now, 0]
+            self.windows[key] = window
+            self.windows.move_to_end(key)
+            if len(self.windows) > MAX_TRACKED_KEYS:
+                self.windows.popitem(last=False)
+            window[1] += 1
+            over = window[1] > self.limit * shards
+            if over:
+                self.hot[key] = max(self.hot.get(key, 0), int(window[1]))
+                self.hot.move_to_end(key)
+                if len(self.hot) > MAX_HOT_KEYS:
+                    self.hot.popitem(last=False)
+            return over
+
+    def stats(self) -> Dict[str, Any]:
+        """The keys written most often in one window, of those that went over the limit"""
+        with self._lock:
+            hottest = sorted(self.hot.items(), key=lambda entry: -entry[1])[:REPORTED_HOT_KEYS]
+            return {
+                'writes_per_second_limit': self.limit / self.window_seconds,
+                'hot_keys': {'/'.join(key): writes for key, writes in hottest},
+            }
+
+class ShardedCounters:
+    """Shard choice, growth and merged reads for counter items of one table"""
+
+    def __init__(self, table, detector: Optional[HotKeyDetector] = None, max_shards: int = COUNTER_MAX_SHARDS,
+                 partition_key: str = 'pk', sort_key: str = 'sk', rng: Optional[random.Random] = None):
+        self.table = table
+        self.detector = detector or HotKeyDetector()
+        self.max_shards = max_shards
+        self.partition_key = partition_key
+        self.sort_key = sort_key
+        self.rng = rng or random.Random()
+        # Shard counts of the counters known to be sharded
+        self.shards: Dict[CounterKey, int] = {}
+        self.counters = {'grown': 0, 'throttled': 0}
+        self._lock = threading.Lock()
+
+    def _id(self, key: Dict[str, str]) -> CounterKey:
+        return key[self.partition_key], key[self.sort_key]
+
+    def target(self, key: Dict[str, str], min_shards: int = 1) -> Tuple[Dict[str, str], int]:
+        """Key of the shard the next increment goes to, and the counter's shard count"""
+        counter = self._id(key)
+        with self._lock:
+            shards = self.shards.get(counter, 1)
+            hot = self.detector.record(counter, shards)
+        wanted = max(min_shards, shards * 2 if hot else shards)
+        if wanted > shards and shards < self.max_shards:
+            shards = self.grow(key, wanted)
+        return shard_key(key, self.rng.randrange(shards), self.partition_key), shards
+
+    def throttled(self, key: Dict[str, str]) -> None:
+        """DynamoDB throttled a write to the counter: spread it over more shards"""
+        with self._lock:
+            self.counters['throttled'] += 1
+            shards = self.shards.get(self._id(key), 1)
+        if shards < self.max_shards:
+            self.grow(key, shards * 2)
+
+    def grow(self, key: Dict[str, str], shards: int) -> int:
+        """Raise the counter's stored shard count to shards; the count now in use"""
+        shards = min(shards, self.max_shards)
+        client = self.table.meta.client
+        try:
+            client.update_item(
+                TableName=self.table.name,
+                Key=key,
+                UpdateExpression='SET #shards = :shards',
+                ConditionExpression='attribute_exists(#pk) AND (attribute_not_exists(#shards) OR #shards < :shards)',
+                ExpressionAttributeNames={'#shards': SHARDS_ATTRIBUTE, '#pk': self.partition_key},
+                ExpressionAttributeValues={':shards': shards},
+            )
+            grown = True
+        except client.exceptions.ConditionalCheckFailedException:
+            # Shard 0 does not exist yet, or another instance grew the counter first
+            item = self.table.get_item(Key=key, ConsistentRead=True).get('Item') or {}
+            shards = int(item.get(SHARDS_ATTRIBUTE, 1))
+            grown = False
+        with self._lock:
+            if grown:
+                self.counters['grown'] += 1
+            if shards > 1:
+                shards = max(shards, self.shards.get(self._id(key), 1))
+                self.shards[self._id(key)] = shards
+        return shards
+
+    def read(self, key: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """A counter with its shards summed, or None if it was never written"""
+        item = self.table.get_item(Key=key).get('Item')
+        if item is None:
+            return None
+        return self.merge_shards([item])[0]
+
+    def merge_shards(self, items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Shard-0 items already read, each with its other shards summed in"""
+        extra = [
+            shard_key(self._key(item), shard, self.partition_key)
+            for item in items for shard in range(1, int(item.get(SHARDS_ATTRIBUTE, 1)))
+        ]
+        if not extra:
+            return items
+        by_counter: Dict[CounterKey, List[Dict[str, Any]]] = {}
+        for shard in batch_get_items(self.table.meta.client, self.table.name, extra):
+            base_partition = shard[self.partition_key].rsplit('#shard', 1)[0]
+            by_counter.setdefault((base_partition, shard[self.sort_key]), []).append(shard)
+        key_attributes = (self.partition_key, self.sort_key)
+        return [merge(item, by_counter.get(self._id(item), []), key_attributes) for item in items]
+
+    def _key(self, item: Dict[str, Any]) -> Dict[str, str]:
+        return {self.partition_key: item[self.partition_key], self.sort_key: item[self.sort_key]}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hottest = sorted(self.shards.items(), key=lambda entry: -entry[1])[:10]
+            return {
+                **self.counters,
+                'sharded_keys': len(self.shards),
+                'hottest': {f"{pk}/{sk}": shards for (pk, sk), shards in hottest},
+            }
@@ -0,0 +1,565 @@
+"""
+Shared-Memory Store for the Multi-Worker Mock Server
+
+This module lets several mock server processes serve one data set:
+- An append-only record log in a tmpfs file (/dev/shm when available)
+- Writers append under an exclusive file lock, then publish the new
+  committed end offset in the log header
+- Readers never lock: each worker reads the committed offset, applies only
+  the records it has not seen yet, and serves from its local view
+- Every worker applies the same records in the same order, so all views
+  converge on the same transactions, webhooks, metrics and rollups
+- A record's position in the log is its sequence number; a change feed
+  per collection lists the sequence numbers that inserted, updated or
+  removed each item, so clients can sync a replica with changes() in
+  O(changes); a removed item is reported as a tombstone (its id and
+  deleted: true)
+- Views hold steady memory: items with a `ttl` (epoch seconds) expire once
+  it passes, as DynamoDB's TTL would, via a timing wheel (see expiry.py),
+  and each collection keeps only its last MOCK_*_LIMIT inserted items,
+  evicting the oldest like a ring buffer. Removed items leave an empty
+  slot (None) that is compacted away once half of a collection is empty
+- Expiry is written to the log by the first view that sees it, so every
+  view removes an expired item at the same sequence number
+- The log holds steady memory too: once its records since the last
+  snapshot pass MOCK_LOG_COMPACT_BYTES and the snapshot's own size, a
+  writer replaces it, under the writer lock, with a new file holding one
+  snapshot record of the view. Views finish the old file, then continue
+  in the new one after the snapshot; a view that starts later loads it
+
+Records are JSON objects framed by a 4-byte length prefix. Writers lock a
+separate `<path>.lock` file, which outlives every compaction of the log.
+"""
+
+import bisect
+import fcntl
+import hashlib
+import itertools
+import json
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from currency import base_amount
+from expiry import TimingWheel
+from merchant_index import decode_cursor, encode_cursor
+from response_shaping import project
+from rollups import RollupStore
+from settlement import InMemoryLedger
+
+# Header: committed end offset, committed record count, whether a compacted
+# log has replaced this one, end offset of the snapshot the log starts with
+HEADER = struct.Struct('<QQQQ')
+LENGTH = struct.Struct('<I')
+
+LOCK_SUFFIX = '.lock'
+
+# Bytes of records past the snapshot before the log is compacted
+MOCK_LOG_COMPACT_BYTES = int(os.environ.get('MOCK_LOG_COMPACT_BYTES', str(64 * 1024 * 1024)))
+
+# Items kept per collection; the oldest inserted item is evicted beyond the limit
+COLLECTION_LIMITS = {
+    'transactions': int(os.environ.get('MOCK_TRANSACTION_LIMIT', '100000')),
+    'webhook_events': int(os.environ.get('MOCK_WEBHOOK_EVENT_LIMIT', '10000')),
+    'webhook_endpoints': int(os.environ.get('MOCK_WEBHOOK_ENDPOINT_LIMIT', '100')),
+    'settlements': int(os.environ.get('MOCK_SETTLEMENT_LIMIT', '10000')),
+}
+
+# The field that identifies each collection's items
+COLLECTION_KEYS = {
+    'transactions': 'transaction_id',
+    'webhook_events': 'event_id',
+    'webhook_endpoints': 'id',
+    'settlements': 'transaction_id',
+}
+
+# Collections with a change feed
+CHANGE_COLLECTIONS = {name: COLLECTION_KEYS[name] for name in ('transactions', 'webhook_events')}
+
+def default_store_path() -> str:
+    """A fresh log file on tmpfs, falling back to the temp directory"""
+    directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    fd, path = tempfile.mkstemp(prefix='payments-mock-', suffix='.log', dir=directory)
+    os.close(fd)
+    return path
+
+def remove_store(path: str) -> None:
+    """Delete a log file and its lock file"""
+    for name in (path, path + LOCK_SUFFIX):
+        if os.path.exists(name):
+            os.remove(name)
+
+class SharedLog:
+    """Append-only record log shared by every process that opens the same path"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # Files of replaced logs, closed at the next switch once no read can still use them
+        self._retired_fds: List[int] = []
+        self._open_lock()
+        with self.locked():
+            if os.fstat(self.fd).st_size < HEADER.size:
+                os.pwrite(self.fd, HEADER.pack(HEADER.size, 0, 0, HEADER.size), 0)
+
+    def _open_lock(self) -> None:
+        self.lock_fd = os.open(self.path + LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0o600)
+        self.pid = os.getpid()
+        self._write_lock = threading.Lock()
+
+    @contextmanager
+    def locked(self) -> Iterator[None]:
+        """Exclusive writer lock across threads and processes"""
+        if self.pid != os.getpid():
+            # flock is per open file description, which a fork shares
+            self._open_lock()
+        with self._write_lock:
+            fcntl.flock(self.lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.lock_fd, fcntl.LOCK_UN)
+
+    def _header(self) -> Tuple[int, int, int, int]:
+        while True:
+            first = os.pread(self.fd, HEADER.size, 0)
+            if first == os.pread(self.fd, HEADER.size, 0):
+                return HEADER.unpack(first)
+
+    def committed(self) -> Tuple[int, int]:
+        """(end offset, record count) of the committed log, read without locking"""
+        end, count, _, _ = self._header()
+        return end, count
+
+    def retired(self) -> bool:
+        """Whether a compacted log has replaced this one; its committed end is then final"""
+        return bool(self._header()[2])
+
+    def snapshot_end(self) -> int:
+        return self._header()[3]
+
+    def compaction_due(self, limit: int) -> bool:
+        """Whether records past the snapshot exceed limit bytes and the snapshot's size"""
+        end, _, _, base = self._header()
+        return end - base > max(limit, base - HEADER.size)
+
+    def append(self, records: Iterable[Dict[str, Any]], only_if_empty: bool = False) -> bool:
+        """Append records atomically; with only_if_empty, only to an empty log
+
+        The caller holds locked() and has switched to the current log.
+        """
+        frames = [frame(record) for record in records]
+        end, count, retired, base = self._header()
+        # A compacted log is never empty: it starts with a snapshot
+        if not frames or (only_if_empty and end > HEADER.size):
+            return False
+        data = b''.join(frames)
+        # Data first, then the header that makes it visible to readers
+        os.pwrite(self.fd, data, end)
+        os.pwrite(self.fd, HEADER.pack(end + len(data), count + len(frames), retired, base), 0)
+        return True
+
+    def replace(self, snapshot: Dict[str, Any]) -> int:
+        """Replace the log with a new file holding one snapshot record; its end offset
+
+        The caller holds locked() and its view has applied the whole log.
+        """
+        data = frame(snapshot)
+        end = HEADER.size + len(data)
+        staging = f"{self.path}.{os.getpid()}.compacting"
+        fd = os.open(staging, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.pwrite(fd, HEADER.pack(end, 1, 0, end) + data, 0)
+        os.replace(staging, self.path)
+        # Readers of the old file learn that its end is final, and where the log went
+        old_end, count, _, base = self._header()
+        os.pwrite(self.fd, HEADER.pack(old_end, count, 1, base), 0)
+        self._switch(fd)
+        return end
+
+    def reopen(self) -> None:
+        """Switch to the log now at the path, once this one is retired and read to its end"""
+        self._switch(os.open(self.path, os.O_RDWR))
+
+    def _switch(self, fd: int) -> None:
+        for retired_fd in self._retired_fds:
+            os.close(retired_fd)
+        self._retired_fds = [self.fd]
+        self.fd = fd
+
+    def read(self, offset: int, end: int) -> List[Dict[str, Any]]:
+        """Decode the records between two committed offsets"""
+        data = os.pread(self.fd, end - offset, offset)
+        records = []
+        position = 0
+        while position < len(data):
+            (length,) = LENGTH.unpack_from(data, position)
+            position += LENGTH.size
+            records.append(json.loads(data[position:position + length]))
+            position += length
+        return records
+
+    def close(self) -> None:
+        for fd in [self.fd, self.lock_fd, *self._retired_fds]:
+            os.close(fd)
+        self._retired_fds = []
+
+def frame(record: Dict[str, Any]) -> bytes:
+    body = json.dumps(record, separators=(',', ':'), default=str).encode('utf-8')
+    return LENGTH.pack(len(body)) + body
+
+class SharedStore:
+    """Local materialized view of a SharedLog, kept current with refresh()"""
+
+    def __init__(self, path: str, limits: Optional[Dict[str, int]] = None, clock=time.time,
+                 compact_bytes: int = MOCK_LOG_COMPACT_BYTES):
+        self.log = SharedLog(path)
+        self.offset = HEADER.size
+        self.sequence = 0
+        self.clock = clock
+        self.compact_bytes = compact_bytes
+        # Collections hold None where an item expired or was evicted, until compacted
+        self.transactions: List[Optional[Dict[str, Any]]] = []
+        self.webhook_events: List[Optional[Dict[str, Any]]] = []
+        self.webhook_endpoints: List[Optional[Dict[str, Any]]] = []
+        self.settlements: List[Optional[Dict[str, Any]]] = []
+        # collection -> {item id: position in collection}
+        self.positions: Dict[str, Dict[str, int]] = {name: {} for name in COLLECTION_KEYS}
+        # collection -> ids in insertion order, at most the collection's limit
+        self.limits = {**COLLECTION_LIMITS, **(limits or {})}
+        self.inserted: Dict[str, deque] = {name: deque() for name in COLLECTION_KEYS}
+        self.removed: Dict[str, int] = {name: 0 for name in COLLECTION_KEYS}
+        # Deadlines of the (collection, item id) of items with a ttl
+        self.expiry = TimingWheel(clock())
+        # merchant_id -> sorted [(created_at, position in transactions)]
+        self.merchant_index: Dict[str, List] = {}
+        self.metrics: Dict[str, Any] = {}
+        self.rollups = RollupStore(clock)
+        # collection -> ([sequence], [item id]), in log order
+        self.change_log: Dict[str, Tuple[List[int], List[Any]]] = {name: ([], []) for name in CHANGE_COLLECTIONS}
+        # collection -> last sequence of a tombstone dropped from the feed; older cursors reset
+        self.floor: Dict[str, int] = {name: 0 for name in CHANGE_COLLECTIONS}
+        # Cursors name the log they were issued for; every view of one file shares it
+        stat = os.fstat(self.log.fd)
+        self.log_id = hashlib.blake2b(f"{path}:{stat.st_dev}:{stat.st_ino}".encode(), digest_size=6).hexdigest()
+        self._apply_lock = threading.Lock()
+
+    def refresh(self) -> int:
+        """Apply records committed by any process since the last refresh, then log expired items"""
+        end, _ = self.log.committed()
+        now = self.clock()
+        if end == self.offset and not self.log.retired() and not self.expiry.pending(now):
+            return 0
+        with self._apply_lock:
+            applied = self._catch_up()
+            due = self.expiry.advance(now)
+        if not due:
+            return applied
+        with self.log.locked():
+            with self._apply_lock:
+                # Another view may have logged them, or a put renewed their ttl
+                self._catch_up()
+                expired = [(collection, item_id) for collection, item_id in due if self._expired(collection, item_id, now)]
+            self._append({'k': 'expire', 'v': {'collection': collection, 'id': item_id}}
+                         for collection, item_id in expired)
+        with self._apply_lock:
+            return applied + self._catch_up()
+
+    def _catch_up(self) -> int:
+        """Apply the committed records not applied yet, following compactions; holds _apply_lock"""
+        applied = 0
+        while True:
+            # Read first: once a log is retired, its committed end is final
+            retired = self.log.retired()
+            end, _ = self.log.committed()
+            records = self.log.read(self.offset, end)
+            for record in records:
+                if record['k'] == 'snapshot':
+                    # A view that applied the replaced log is already in this state
+                    if record['v']['seq'] != self.sequence:
+                        self._restore(record['v'])
+                    continue
+                self.sequence += 1
+                self._apply(record['k'], record['v'])
+            applied += len(records)
+            self.offset = end
+            if not retired:
+                break
+            self.log.reopen()
+            self.offset = HEADER.size
+        self._compact()
+        return applied
+
+    def _expired(self, collection: str, item_id: Any, now: float) -> bool:
+        position = self.positions[collection].get(item_id)
+        if position is None:
+            return False
+        ttl = getattr(self, collection)[position].get('ttl')
+        return ttl is not None and float(ttl) <= now
+
+    def _apply(self, kind: str, value: Any) -> None:
+        if kind == 'transaction':
+            position = self._upsert('transactions', value)
+            if position is not None:
+                bisect.insort(self.merchant_index.setdefault(value['merchant_id'], []), (value['created_at'], position))
+            self.metrics['total_transactions'] = self.metrics.get('total_transactions', 0) + 1
+            self.metrics['total_volume'] = self.metrics.get('total_volume', 0) + base_amount(value)
+            self.rollups.record(value)
+        elif kind == 'transaction_put':
+            self._upsert('transactions', value)
+        elif kind == 'metrics':
+            self.metrics.update(value)
+        elif kind == 'webhook_event':
+            self._upsert('webhook_events', value)
+        elif kind == 'webhook_endpoint':
+            self._upsert('webhook_endpoints', value)
+        elif kind == 'settlement':
+            self._upsert('settlements', value)
+        elif kind == 'expire':
+            self._remove(value['collection'], value['id'])
+
+    def _upsert(self, collection: str, item: Dict[str, Any]) -> Optional[int]:
+        """Replace an item by id or append it; the new item's position, None if replaced"""
+        items = getattr(self, collection)
+        positions = self.positions[collection]
+        item_id = item.get(COLLECTION_KEYS[collection])
+        position = positions.get(item_id)
+        if position is None:
+            inserted = self.inserted[collection]
+            if len(inserted) >= self.limits[collection]:
+                # Ring-buffer eviction by insertion order, so every view evicts the same items
+                self._remove(collection, inserted.popleft())
+            inserted.append(item_id)
+            items.append(item)
+            position = positions[item_id] = len(items) - 1
+            new = True
+        else:
+            items[position] = item
+            new = False
+        # A put replaces the whole item, ttl included
+        if 'ttl' in item:
+            self.expiry.schedule((collection, item_id), float(item['ttl']))
+        else:
+            self.expiry.cancel((collection, item_id))
+        self._changed(collection, item_id)
+        return position if new else None
+
+    def _remove(self, collection: str, item_id: Any) -> None:
+        """Empty an expired or evicted item's slot; indexes skip it until compaction"""
+        position = self.positions[collection].pop(item_id, None)
+        if position is None:
+            return
+        self.expiry.cancel((collection, item_id))
+        getattr(self, collection)[position] = None
+        self.removed[collection] += 1
+        self._changed(collection, item_id)
+
+    def _compact(self) -> None:
+        """Drop the empty slots of collections that are at least half empty, in O(size)"""
+        for collection in COLLECTION_KEYS:
+            items = getattr(self, collection)
+            changes = self.change_log.get(collection)
+            # Upserts and removals grow the change feed without emptying slots
+            if changes and len(changes[0]) >= 2 * len(items) + self.limits[collection] + 64:
+                self._compact_changes(collection)
+            removed = self.removed[collection]
+            if not (removed and removed * 2 >= len(items)):
+                continue
+            moved: Dict[int, int] = {}
+            for position, item in enumerate(items):
+                if item is not None:
+                    moved[position] = len(moved)
+            items[:] = [item for item in items if item is not None]
+            self.positions[collection] = {item_id: moved[position] for item_id, position in self.positions[collection].items()}
+            self.removed[collection] = 0
+            if collection == 'transactions':
+                index = {}
+                for merchant_id, entries in self.merchant_index.items():
+                    kept = [(created_at, moved[position]) for created_at, position in entries if position in moved]
+                    if kept:
+                        index[merchant_id] = kept
+                self.merchant_index = index
+
+    def _compact_changes(self, collection: str) -> None:
+        """Keep each item's latest change, and the collection's limit of the latest tombstones"""
+        sequences, ids = self.change_log[collection]
+        latest = sorted(((sequence, item_id) for item_id, sequence in dict(zip(ids, sequences)).items()),
+                        key=lambda change: change[0])
+        positions = self.positions[collection]
+        tombstones = [change for change in latest if change[1] not in positions]
+        excess = len(tombstones) - self.limits[collection]
+        if excess > 0:
+            # Cursors from before a dropped tombstone could miss it, so they start over
+            self.floor[collection] = max(self.floor[collection], tombstones[excess - 1][0])
+            dropped = set(tombstones[:excess])
+            latest = [change for change in latest if change not in dropped]
+        self.change_log[collection] = ([sequence for sequence, _ in latest], [item_id for _, item_id in latest])
+
+    def _changed(self, collection: str, item_id: Any) -> None:
+        if collection not in self.change_log:
+            return
+        sequences, ids = self.change_log[collection]
+        sequences.append(self.sequence)
+        ids.append(item_id)
+
+    def _snapshot(self) -> Dict[str, Any]:
+        """The view as one snapshot record, from which _restore() rebuilds it"""
+        for collection in CHANGE_COLLECTIONS:
+            self._compact_changes(collection)
+        return {'k': 'snapshot', 'v': {
+            'seq': self.sequence,
+            'log': self.log_id,
+            'collections': {name: [item for item in getattr(self, name) if item is not None] for name in COLLECTION_KEYS},
+            'inserted': {name: list(ids) for name, ids in self.inserted.items()},
+            'changes': {name: list(zip(*changes)) for name, changes in self.change_log.items()},
+            'floor': self.floor,
+            'metrics': self.metrics,
+            'rollups': self.rollups.snapshot(),
+        }}
+
+    def _restore(self, snapshot: Dict[str, Any]) -> None:
+        """Replace the view with a snapshot's, keeping the collection and metrics objects"""
+        self.sequence = snapshot['seq']
+        self.log_id = snapshot['log']
+        self.expiry = TimingWheel(self.clock())
+        for collection, key in COLLECTION_KEYS.items():
+            items = getattr(self, collection)
+            items[:] = snapshot['collections'][collection]
+            self.positions[collection] = {item.get(key): position for position, item in enumerate(items)}
+            self.inserted[collection] = deque(snapshot['inserted'][collection])
+            self.removed[collection] = 0
+            for item in items:
+                if 'ttl' in item:
+                    self.expiry.schedule((collection, item.get(key)), float(item['ttl']))
+        self.merchant_index = {}
+        for position, transaction in enumerate(self.transactions):
+            if 'merchant_id' in transaction and 'created_at' in transaction:
+                self.merchant_index.setdefault(transaction['merchant_id'], []).append((transaction['created_at'], position))
+        for entries in self.merchant_index.values():
+            entries.sort()
+        for collection in CHANGE_COLLECTIONS:
+            changes = snapshot['changes'][collection]
+            self.change_log[collection] = ([sequence for sequence, _ in changes], [item_id for _, item_id in changes])
+        self.floor.update(snapshot['floor'])
+        self.metrics.clear()
+        self.metrics.update(snapshot['metrics'])
+        self.rollups.restore(snapshot['rollups'])
+
+    def changes(
+        self,
+        collection: str,
+        cursor: Optional[str] = None,
+        limit: int = 1000,
+        fields: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Items of a collection inserted, updated or removed after a cursor, in change order
+
+        Without a cursor, or with one issued for another log or too old for
+        the feed, the feed starts over from the first change and the
+        response has reset=True: the client should drop its replica before
+        applying the items. Each item appears once per response, in its
+        current state, and always carries its identifying field; an item
+        that expired or was evicted is a tombstone, {<field>: id, 'deleted': True}.
+        """
+        state = decode_cursor(cursor) if cursor else None
+        key = CHANGE_COLLECTIONS[collection]
+        if fields is not None and key not in fields:
+            # Replicas are keyed by it
+            fields = [key, *fields]
+        with self._apply_lock:
+            since = state.get('seq') if state else None
+            reset = (state is None or state.get('log') != self.log_id
+                     or not isinstance(since, int) or not self.floor[collection] <= since <= self.sequence)
+            if reset:
+                since = 0
+            sequences, ids = self.change_log[collection]
+            first = bisect.bisect_right(sequences, since)
+            last = min(len(sequences), first + limit)
+            has_more = last < len(sequences)
+            # Past the last change, the cursor moves to the end of the log
+            next_sequence = sequences[last - 1] if has_more else max(since, self.sequence)
+            values = getattr(self, collection)
+            positions = self.positions[collection]
+            items = []
+            for item_id in dict.fromkeys(ids[first:last]):
+                position = positions.get(item_id)
+                if position is None:
+                    # A reset replica starts empty, so it has nothing to delete
+                    if not reset:
+                        items.append({key: item_id, 'deleted': True})
+                else:
+                    items.extend(project([values[position]], fields))
+        return {
+            'items': items,
+            'cursor': encode_cursor({'log': self.log_id, 'seq': next_sequence}),
+            'has_more': has_more,
+            'reset': reset,
+        }
+
+    def merchant_transactions(
+        self,
+        merchant_id: str,
+        start: str,
+        end: str,
+        limit: int,
+        fields: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Newest-first transactions of one merchant in [start, end] via the index"""
+        entries = self.merchant_index.get(merchant_id, [])
+        low = bisect.bisect_left(entries, (start,))
+        high = bisect.bisect_right(entries, (end, len(self.transactions)))
+        transactions = self.transactions
+        newest = (transactions[entries[i][1]] for i in range(high - 1, low - 1, -1))
+        return project(itertools.islice((t for t in newest if t is not None), limit), fields)
+
+    def select(self, collection: str, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """All items of 'transactions', 'webhook_events', 'webhook_endpoints' or 'settlements', projected"""
+        return project((item for item in getattr(self, collection) if item is not None), fields)
+
+    def _append(self, records: Iterable[Dict[str, Any]], only_if_empty: bool = False) -> bool:
+        """Append records to the current log, compacting it once due; the caller holds the writer lock"""
+        if self.log.retired():
+            with self._apply_lock:
+                self._catch_up()
+        appended = self.log.append(records, only_if_empty=only_if_empty)
+        if appended and self.log.compaction_due(self.compact_bytes):
+            with self._apply_lock:
+                self._catch_up()
+                self.offset = self.log.replace(self._snapshot())
+        return appended
+
+    def write(self, records: Iterable[Tuple[str, Any]]) -> None:
+        """Append (kind, value) records and bring the local view up to date"""
+        with self.log.locked():
+            self._append({'k': kind, 'v': value} for kind, value in records)
+        self.refresh()
+
+    def seed_if_empty(self, records: Iterable[Tuple[str, Any]]) -> bool:
+        """Write the seed records unless some process already has"""
+        with self.log.locked():
+            seeded = self._append(({'k': kind, 'v': value} for kind, value in records), only_if_empty=True)
+        self.refresh()
+        return seeded
+
+class SharedStoreLedger(InMemoryLedger):
+    """Settlement ledger over a SharedStore; writes go through the shared log"""
+
+    def __init__(self, store: SharedStore, on_publish=None, partition_count: int = 4):
+        super().__init__(store.transactions, on_publish=on_publish, partition_count=partition_count)
+        self.store = store
+
+    def read_partition(self, partition: Any, settlement_date: str) -> Iterator[Dict[str, Any]]:
+        # A snapshot, as compaction may move items while the partition is read
+        for item in list(self.store.transactions)[partition::self.partition_count]:
+            if item is not None and item.get('created_at', '').startswith(settlement_date):
+                yield item
+
+    def write_items(self, items: List[Dict[str, Any]]) -> None:
+        self.store.write(('transaction_put', item) for item in items)
+
+    def write_records(self, records: List[Dict[str, Any]]) -> None:
+        self.store.write(('settlement', record) for record in records)
@@ -0,0 +1,216 @@
+"""
+Payment Processor Simulation Profiles for Serverless Payments Sandbox
+
+This module stands in for an upstream processor so that client timeouts,
+retries and concurrency limits meet realistic conditions:
+- A profile sets a latency distribution per endpoint (fixed, or lognormal
+  from a median and a p99 tail), decline and error rates, and periodic
+  brownouts that multiply latency and add errors for part of each period
+- Waits are asyncio sleeps, so one worker can hold thousands of simulated
+  processor calls in flight
+- The profile of a request comes from the X-Simulation-Profile header
+  (when SIMULATION_ALLOW_HEADER=true), then SIMULATION_MERCHANT_PROFILES
+  ('merchant_a:slow_issuer,merchant_b:flaky'), then SIMULATION_PROFILE;
+  without one, requests are not delayed
+- stats() reports per profile and endpoint the outcomes, simulated
+  latency percentiles, recent throughput and calls in flight
+
+SIMULATION_PROFILES (JSON) adds profiles or replaces built-in ones.
+"""
+
+import asyncio
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+SIMULATION_PROFILE = os.environ.get('SIMULATION_PROFILE', '')
+SIMULATION_ALLOW_HEADER = os.environ.get('SIMULATION_ALLOW_HEADER', 'false').lower() == 'true'
+SIMULATION_HEADER = 'X-Simulation-Profile'
+
+# Samples kept per profile and endpoint for percentiles and throughput
+STATS_SAMPLES = 2048
+THROUGHPUT_WINDOW_SECONDS = 60
+
+# z-score of the 99th percentile of a normal distribution
+Z_99 = 2.3263
+
+BUILTIN_PROFILES: Dict[str, Dict[str, Any]] = {
+    'typical': {
+        'latency': {'default': {'distribution': 'lognormal', 'median_ms': 120, 'p99_ms': 600}},
+        'decline_rate': 0.03,
+        'error_rate': 0.002,
+    },
+    'slow_issuer': {
+        'latency': {
+            'default': {'distribution': 'lognormal', 'median_ms': 400, 'p99_ms': 4000},
+            'authorize': {'distribution': 'lognormal', 'median_ms': 900, 'p99_ms': 8000},
+        },
+        'decline_rate': 0.08,
+        'error_rate': 0.01,
+    },
+    'flaky': {
+        'latency': {'default': {'distribution': 'lognormal', 'median_ms': 150, 'p99_ms': 1500}},
+        'decline_rate': 0.05,
+        'error_rate': 0.02,
+        'brownout': {'period_seconds': 300, 'duration_seconds': 30, 'latency_multiplier': 8, 'error_rate': 0.3},
+    },
+}
+
+class Latency:
+    """Processor latency distribution of one endpoint"""
+
+    def __init__(self, distribution: str = 'fixed', median_ms: float = 0, p99_ms: Optional[float] = None,
+                 max_ms: Optional[float] = None):
+        if distribution not in ('fixed', 'lognormal'):
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        if distribution == 'lognormal' and (median_ms <= 0 or p99_ms is None or p99_ms < median_ms):
+            raise ValueError("A lognormal latency needs 0 < median_ms <= p99_ms")
+        self.distribution = distribution
+        self.median_ms = median_ms
+        self.mu = math.log(median_ms) if median_ms > 0 else 0.0
+        self.sigma = (math.log(p99_ms) - self.mu) / Z_99 if distribution == 'lognormal' else 0.0
+        self.max_ms = max_ms
+
+    def sample_ms(self, rng: random.Random) -> float:
+        value = rng.lognormvariate(self.mu, self.sigma) if self.distribution == 'lognormal' else self.median_ms
+        return min(value, self.max_ms) if self.max_ms is not None else value
+
+class Profile:
+    """Latency, decline and error behaviour of a simulated processor"""
+
+    def __init__(self, name: str, latency: Optional[Dict[str, Dict[str, Any]]] = None,
+                 decline_rate: float = 0.0, error_rate: float = 0.0, brownout: Optional[Dict[str, float]] = None):
+        self.name = name
+        self.latency = {endpoint: Latency(**spec) for endpoint, spec in (latency or {}).items()}
+        self.decline_rate = decline_rate
+        self.error_rate = error_rate
+        self.brownout = brownout
+
+    def in_brownout(self, now: float) -> bool:
+        if not self.brownout:
+            return False
+        return now % self.brownout['period_seconds'] < self.brownout['duration_seconds']
+
+    def sample(self, endpoint: str, now: float, rng: random.Random) -> Tuple[float, str]:
+        """Simulated delay in seconds and outcome ('approved', 'declined' or 'error')"""
+        latency = self.latency.get(endpoint) or self.latency.get('default')
+        delay_ms = latency.sample_ms(rng) if latency else 0.0
+        error_rate = self.error_rate
+        if self.in_brownout(now):
+            delay_ms *= self.brownout.get('latency_multiplier', 1)
+            error_rate = min(1.0, error_rate + self.brownout.get('error_rate', 0.0))
+
+        roll = rng.random()
+        if roll < error_rate:
+            outcome = 'error'
+        elif endpoint == 'authorize' and roll < error_rate + self.decline_rate:
+            outcome = 'declined'
+        else:
+            outcome = 'approved'
+        return delay_ms / 1000, outcome
+
+def load_profiles() -> Dict[str, Profile]:
+    """Built-in profiles overlaid with SIMULATION_PROFILES"""
+    specs = {**BUILTIN_PROFILES, **json.loads(os.environ.get('SIMULATION_PROFILES') or '{}')}
+    return {name: Profile(name, **spec) for name, spec in specs.items()}
+
+def _parse_merchant_profiles(value: str) -> Dict[str, str]:
+    """Parse 'merchant_a:slow_issuer,merchant_b:flaky' into a profile map"""
+    return dict(entry.partition(':')[::2] for entry in filter(None, (part.strip() for part in value.split(','))))
+
+class EndpointStats:
+    """Outcomes and recent simulated latencies of one profile and endpoint"""
+
+    def __init__(self):
+        self.outcomes: Dict[str, int] = {}
+        self.samples: Deque[Tuple[float, float]] = deque(maxlen=STATS_SAMPLES)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def summary(self, now: float) -> Dict[str, Any]:
+        delays = sorted(delay for _, delay in self.samples)
+        recent = sum(1 for finished, _ in self.samples if finished >= now - THROUGHPUT_WINDOW_SECONDS)
+
+        def percentile(pct: float) -> float:
+            return round(delays[min(len(delays) - 1, int(len(delays) * pct / 100))], 1) if delays else 0.0
+
+        return {
+            'requests': sum(self.outcomes.values()),
+            'outcomes': dict(self.outcomes),
+            'latency_p50_ms': percentile(50),
+            'latency_p99_ms': percentile(99),
+            'throughput_per_second': round(recent / THROUGHPUT_WINDOW_SECONDS, 2),
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+        }
+
+class Simulator:
+    """Selects a profile per request and waits out its simulated processor call"""
+
+    def __init__(
+        self,
+        profiles: Optional[Dict[str, Profile]] = None,
+        default_profile: str = SIMULATION_PROFILE,
+        merchant_profiles: Optional[Dict[str, str]] = None,
+        allow_header: bool = SIMULATION_ALLOW_HEADER,
+        rng: Optional[random.Random] = None,
+        clock=time.time
+    ):
+        self.profiles = load_profiles() if profiles is None else profiles
+        self.default_profile = default_profile
+        self.merchant_profiles = _parse_merchant_profiles(os.environ.get('SIMULATION_MERCHANT_PROFILES', '')) \
+            if merchant_profiles is None else merchant_profiles
+        for name in [default_profile, *self.merchant_profiles.values()]:
+            if name and name not in self.profiles:
+                raise ValueError(f"Unknown simulation profile: {name}")
+        self.allow_header = allow_header
+        self.rng = rng or random.Random()
+        self.clock = clock
+        self.stats_by_key: Dict[Tuple[str, str], EndpointStats] = {}
+        self._lock = threading.Lock()
+
+    def select(self, merchant_id: Optional[str], header: Optional[str] = None) -> Optional[Profile]:
+        """Profile for a request: header, then merchant, then the default"""
+        if header and self.allow_header:
+            if header not in self.profiles:
+                raise ValueError(f"Unknown simulation profile: {header}")
+            return self.profiles[header]
+        name = self.merchant_profiles.get(merchant_id or '') or self.default_profile
+        return self.profiles[name] if name else None
+
+    async def call(self, endpoint: str, merchant_id: Optional[str], header: Optional[str] = None) -> str:
+        """Wait for a simulated processor call and return its outcome"""
+        profile = self.select(merchant_id, header)
+        if profile is None:
+            return 'approved'
+        delay, outcome = profile.sample(endpoint, self.clock(), self.rng)
+        with self._lock:
+            stats = self.stats_by_key.setdefault((profile.name, endpoint), EndpointStats())
+            stats.in_flight += 1
+            stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            with self._lock:
+                stats.in_flight -= 1
+                stats.outcomes[outcome] = stats.outcomes.get(outcome, 0) + 1
+                stats.samples.append((self.clock(), delay * 1000))
+        return outcome
+
+    def stats(self) -> Dict[str, Any]:
+        """Per profile and endpoint outcomes, latency and throughput"""
+        now = self.clock()
+        with self._lock:
+            by_profile: Dict[str, Dict[str, Any]] = {}
+            for (profile, endpoint), stats in sorted(self.stats_by_key.items()):
+                by_profile.setdefault(profile, {})[endpoint] = stats.summary(now)
+        return {
+            'default_profile': self.default_profile or None,
+            'merchant_profiles': dict(self.merchant_profiles),
+            'profiles': by_profile,
+        }
@@ -0,0 +1,100 @@
+"""
+Single-Flight Request Coalescing for Serverless Payments Sandbox
+
+This module runs concurrent requests that share an idempotency key once:
+- The first request for an (operation, X-Idempotency-Key) pair leads and
+  runs; requests arriving while it runs follow and await its outcome,
+  without idempotency reads or ledger writes of their own
+- Followers get the leader's response, or its error, once it finishes
+- A follower whose request body differs from the leader's is rejected:
+  the key was reused for a different request
+- If the leader is cancelled, a waiting follower takes over
+- stats() reports leaders, coalesced followers and rejected mismatches
+
+Flights are per process and work across event loops. Requests in other
+processes are still made exactly-once by the idempotency claim (see
+idempotency.py).
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+class BodyMismatch(Exception):
+    """An in-flight idempotency key was reused with a different request body"""
+
+class _Abandoned(Exception):
+    """The leader was cancelled before it finished"""
+
+class Flight:
+    """One in-flight request and the outcome its followers await"""
+
+    __slots__ = ('fingerprint', 'future')
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.future: Future = Future()
+
+def fingerprint(body: Dict[str, Any]) -> str:
+    """Stable digest of a request body"""
+    encoded = json.dumps(body, sort_keys=True, separators=(',', ':'), default=str).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+class SingleFlight:
+    """Registry of in-flight requests by key, safe across threads and event loops"""
+
+    def __init__(self):
+        self.flights: Dict[Hashable, Flight] = {}
+        self.counters: Dict[str, int] = {
+            'leaders': 0,
+            'coalesced': 0,
+            'rejected_mismatch': 0,
+        }
+        self._lock = threading.Lock()
+
+    async def run(self, key: Hashable, body_fingerprint: str, call: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Outcome of call, run once per key at a time, and whether this caller ran it"""
+        while True:
+            with self._lock:
+                flight = self.flights.get(key)
+                if flight is None:
+                    flight = self.flights[key] = Flight(body_fingerprint)
+                    self.counters['leaders'] += 1
+                    leader = True
+                elif flight.fingerprint != body_fingerprint:
+                    self.counters['rejected_mismatch'] += 1
+                    raise BodyMismatch()
+                else:
+                    self.counters['coalesced'] += 1
+                    leader = False
+
+            if leader:
+                return await self._lead(key, flight, call), True
+            try:
+                return await asyncio.wrap_future(flight.future), False
+            except _Abandoned:
+                continue
+
+    async def _lead(self, key: Hashable, flight: Flight, call: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            result = await call()
+        except Exception as e:
+            flight.future.set_exception(e)
+            raise
+        except BaseException:
+            # Cancelled: a follower runs the request instead
+            flight.future.set_exception(_Abandoned())
+            raise
+        else:
+            flight.future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self.flights[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.counters, 'in_flight': len(self.flights)}
@@ -0,0 +1,221 @@
+"""
+Request Telemetry for Serverless Payments Sandbox
+
+This module times the phases of a payment request and emits the timings
+as CloudWatch Embedded Metric Format (EMF) records:
+- Per-request phase timer carried in a context variable
+- HTTP middleware that opens the timer and flushes it on completion
+- EMF emission via AWS Lambda Powertools (printed to stdout locally)
+- DynamoDB capacity consumed by each phase (RCU/WCU), emitted alongside
+  the timings and summed per endpoint, phase and table for /health
+- Stream and topic consumers time each batch the same way, under a
+  consumer endpoint name, so the capacity they consume off the request
+  path is emitted too; their EMF records carry the records processed and
+  the units per phase and table (see load_tests/capacity_planner.py)
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from aws_lambda_powertools.metrics import EphemeralMetrics, MetricUnit
+from fastapi import FastAPI, Request
+
+METRICS_NAMESPACE = os.environ.get('POWERTOOLS_METRICS_NAMESPACE', 'PaymentsSandbox')
+SERVICE_NAME = os.environ.get('POWERTOOLS_SERVICE_NAME', 'payments-api')
+
+# Phases of a payment request, in execution order
+PHASES = (
+    'validation',
+    'idempotency_read',
+    'processor',
+    'risk_score',
+    'ledger_write',
+    'webhook_publish',
+)
+
+# Phase charged for capacity consumed outside any timed phase
+UNPHASED = 'unphased'
+
+# Endpoint names of the consumers that project the API's writes
+CONSUMER_ENDPOINTS = ('stream:projections', 'sns:projections')
+
+class RequestTimer:
+    """Accumulates per-phase wall-clock time for a single request"""
+
+    def __init__(self, endpoint: str, requests: int = 1):
+        self.endpoint = endpoint
+        # Requests, or consumer records, the timings cover
+        self.requests = requests
+        self.outcome: Optional[str] = None
+        self.current_phase: Optional[str] = None
+        self.phases: Dict[str, float] = {}
+        # (phase, table) -> [read units, write units]
+        self.capacity: Dict[Tuple[str, str], list] = {}
+        self._start = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        """Milliseconds since the request entered the middleware"""
+        return (time.perf_counter() - self._start) * 1000
+
+    def record(self, phase: str, duration_ms: float) -> None:
+        """Add a duration to a phase, summing repeated entries"""
+        self.phases[phase] = self.phases.get(phase, 0.0) + duration_ms
+
+    def consume(self, table_name: str, read_units: float, write_units: float) -> None:
+        """Charge DynamoDB capacity to the current phase"""
+        units = self.capacity.setdefault((self.current_phase or UNPHASED, table_name), [0.0, 0.0])
+        units[0] += read_units
+        units[1] += write_units
+
+    def phase_capacity(self) -> Dict[str, Tuple[float, float]]:
+        """Read and write units per phase, summed over tables"""
+        totals: Dict[str, Tuple[float, float]] = {}
+        for (phase, _), (read_units, write_units) in self.capacity.items():
+            rcu, wcu = totals.get(phase, (0.0, 0.0))
+            totals[phase] = (rcu + read_units, wcu + write_units)
+        return totals
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as the named phase"""
+        previous = self.current_phase
+        self.current_phase = name
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+            self.current_phase = previous
+
+    def emit(self, status_code: int) -> None:
+        """Flush the timings as one EMF record with endpoint/outcome dimensions"""
+        metrics = EphemeralMetrics(namespace=METRICS_NAMESPACE, service=SERVICE_NAME)
+        metrics.add_dimension(name='endpoint', value=self.endpoint)
+        metrics.add_dimension(name='outcome', value=resolve_outcome(self.outcome, status_code))
+        for name, duration_ms in self.phases.items():
+            metrics.add_metric(name=f"{name}_ms", unit=MetricUnit.Milliseconds, value=duration_ms)
+        metrics.add_metric(name='total_ms', unit=MetricUnit.Milliseconds, value=self.elapsed_ms())
+        if self.capacity:
+            total_rcu = total_wcu = 0.0
+            for name, (rcu, wcu) in self.phase_capacity().items():
+                metrics.add_metric(name=f"{name}_rcu", unit=MetricUnit.Count, value=rcu)
+                metrics.add_metric(name=f"{name}_wcu", unit=MetricUnit.Count, value=wcu)
+                total_rcu += rcu
+                total_wcu += wcu
+            metrics.add_metric(name='total_rcu', unit=MetricUnit.Count, value=total_rcu)
+            metrics.add_metric(name='total_wcu', unit=MetricUnit.Count, value=total_wcu)
+        # Not a metric: the per-table split the capacity planner reads back from the logs
+        metrics.add_metadata(key='consumed_capacity', value={
+            'requests': self.requests,
+            'units': [[phase, table_name, rcu, wcu] for (phase, table_name), (rcu, wcu) in self.capacity.items()],
+        })
+        metrics.flush_metrics()
+
+class CapacityUsage:
+    """DynamoDB capacity consumed per endpoint, phase and table since the container started"""
+
+    def __init__(self):
+        self.endpoints: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, timer: RequestTimer) -> None:
+        """Fold a finished request's capacity into its endpoint's totals"""
+        with self._lock:
+            entry = self.endpoints.setdefault(
+                timer.endpoint, {'requests': 0, 'rcu': 0.0, 'wcu': 0.0, 'phases': {}, 'tables': {}}
+            )
+            entry['requests'] += timer.requests
+            for (phase, table_name), (read_units, write_units) in timer.capacity.items():
+                for group in (entry, entry['phases'].setdefault(phase, {'rcu': 0.0, 'wcu': 0.0}),
+                              entry['tables'].setdefault(table_name, {'rcu': 0.0, 'wcu': 0.0})):
+                    group['rcu'] += read_units
+                    group['wcu'] += write_units
+
+    def stats(self) -> Dict[str, Any]:
+        """Requests and consumed units per endpoint, for endpoints that consumed any"""
+        def rounded(group):
+            return {'rcu': round(group['rcu'], 2), 'wcu': round(group['wcu'], 2)}
+
+        with self._lock:
+            return {
+                endpoint: {
+                    'requests': entry['requests'],
+                    **rounded(entry),
+                    'phases': {phase: rounded(group) for phase, group in entry['phases'].items()},
+                    'tables': {name: rounded(group) for name, group in entry['tables'].items()},
+                }
+                for endpoint, entry in sorted(self.endpoints.items())
+                if entry['phases']
+            }
+
+capacity_usage = CapacityUsage()
+
+def emit_counters(values: Dict[str, float], dimensions: Dict[str, str], unit: str = MetricUnit.Count) -> None:
+    """Flush a set of counters as one EMF record"""
+    metrics = EphemeralMetrics(namespace=METRICS_NAMESPACE, service=SERVICE_NAME)
+    for name, value in dimensions.items():
+        metrics.add_dimension(name=name, value=value)
+    for name, value in values.items():
+        metrics.add_metric(name=name, unit=unit, value=value)
+    metrics.flush_metrics()
+
+_current_timer: ContextVar[Optional[RequestTimer]] = ContextVar('request_timer', default=None)
+
+def current_timer() -> RequestTimer:
+    """Return the active request timer, or a detached one outside a request"""
+    timer = _current_timer.get()
+    if timer is None:
+        timer = RequestTimer(endpoint='detached')
+        _current_timer.set(timer)
+    return timer
+
+@contextmanager
+def consumer_batch(endpoint: str, records: int) -> Iterator[RequestTimer]:
+    """Time a consumer batch of records as one request of endpoint, then emit it"""
+    timer = RequestTimer(endpoint=endpoint, requests=records)
+    token = _current_timer.set(timer)
+    status_code = 500
+    try:
+        yield timer
+        status_code = 200
+    finally:
+        _current_timer.reset(token)
+        capacity_usage.add(timer)
+        try:
+            timer.emit(status_code)
+        except Exception as e:
+            print(f"Failed to emit consumer metrics: {e}")
+
+def resolve_outcome(outcome: Optional[str], status_code: int) -> str:
+    """Map an endpoint-supplied outcome and HTTP status to a dimension value"""
+    if status_code >= 500:
+        return 'error'
+    if status_code >= 400:
+        return 'rejected'
+    return outcome or 'ok'
+
+def instrument(app: FastAPI) -> None:
+    """Install the phase-timing middleware on a FastAPI app"""
+
+    @app.middleware("http")
+    async def phase_timing_middleware(request: Request, call_next):
+        timer = RequestTimer(endpoint=request.url.path)
+        token = _current_timer.set(timer)
+        status_code = 500
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            route = request.scope.get('route')
+            timer.endpoint = getattr(route, 'path', None) or 'unmatched'
+            _current_timer.reset(token)
+            capacity_usage.add(timer)
+            try:
+                timer.emit(status_code)
+            except Exception as e:
+                print(f"Failed to emit request metrics: {e}")
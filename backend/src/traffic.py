@@ -0,0 +1,580 @@
+"""
+Traffic Capture and Replay for Serverless Payments Sandbox
+
+This module turns real request streams into repeatable performance tests:
+- Middleware that appends each request (method, path, route, headers minus
+  secrets, body, start time, latency and status) to a compact binary log
+- Card numbers and CVVs in request bodies are replaced with test values
+  before they are written, so captures never hold cardholder data; each
+  card becomes a test card with the same last 4 digits, so per-card
+  velocity (see risk.py) replays as captured
+- A replay engine that plays a capture against any instance at 1x, 10x or
+  as fast as possible, keeping the captured gaps between requests
+- Idempotency keys are rewritten per run, so keys that were reused in the
+  capture are reused in the replay, but two runs never collide
+- IDs returned by replayed authorizations and captures are substituted
+  into the later requests that referenced the captured IDs
+- A report that compares two replay runs per endpoint and fails on
+  latency, throughput or error-rate regressions
+
+When TRAFFIC_CAPTURE_ENABLED is unset the middleware is a single boolean check.
+
+Usage:
+    python src/traffic.py replay capture.bin --url http://localhost:8000 --speed 10 --output run-b.json
+    python src/traffic.py compare run-a.json run-b.json
+"""
+
+import argparse
+import fcntl
+import http.client
+import json
+import os
+import queue
+import random
+import struct
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from fastapi import FastAPI, Request, Response
+
+TRAFFIC_CAPTURE_ENABLED = os.environ.get('TRAFFIC_CAPTURE_ENABLED', 'false').lower() == 'true'
+TRAFFIC_CAPTURE_PATH = os.environ.get(
+    'TRAFFIC_CAPTURE_PATH', os.path.join(tempfile.gettempdir(), f"traffic-{os.getpid()}.bin")
+)
+TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.environ.get('TRAFFIC_CAPTURE_SAMPLE_RATE', '1.0'))
+TRAFFIC_CAPTURE_MAX_BODY_BYTES = int(os.environ.get('TRAFFIC_CAPTURE_MAX_BODY_BYTES', str(64 * 1024)))
+
+CAPTURE_MAGIC = b'PTRC\x01'
+
+# started (epoch s), duration (ms), status, method index, flags
+RECORD = struct.Struct('<dfHBB')
+LENGTH = struct.Struct('<I')
+SHORT = struct.Struct('<H')
+
+METHODS = ('GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'HEAD', 'OPTIONS')
+
+FLAG_BODY_COMPRESSED = 1
+FLAG_BODY_OMITTED = 2
+
+# Bodies at least this large are zlib-compressed in the capture
+COMPRESS_MIN_BYTES = 256
+
+# Headers that are never captured: secrets, plus framing the replay recomputes
+REDACTED_HEADERS = {
+    'authorization', 'proxy-authorization', 'cookie', 'set-cookie', 'x-api-key', 'x-amz-security-token',
+    'host', 'content-length', 'transfer-encoding', 'connection', 'accept-encoding',
+}
+
+# Body fields replaced with test values before capture (card numbers by masked_card_number)
+MASKED_BODY_FIELDS = {
+    'card_number': None,
+    'cvv': '123',
+}
+
+# Visa test range the masked card numbers are drawn from
+MASKED_CARD_PREFIX = '40000000000'
+
+
+IDEMPOTENCY_HEADER = 'x-idempotency-key'
+
+# Body fields that carry IDs issued by earlier responses
+ID_FIELDS = ('auth_id', 'transaction_id')
+
+# How long a replayed request waits for the request that produces an ID it
+# uses, or for the earlier request with the same idempotency key
+DEPENDENCY_WAIT_SECONDS = 5.0
+
+class CaptureRecord:
+    """One captured request"""
+
+    __slots__ = ('started', 'duration_ms', 'status', 'method', 'path', 'endpoint', 'headers', 'body',
+                 'body_omitted', 'response_ids')
+
+    def __init__(self, started: float, duration_ms: float, status: int, method: str, path: str, endpoint: str,
+                 headers: Dict[str, str], body: bytes, body_omitted: bool = False,
+                 response_ids: Optional[Dict[str, str]] = None):
+        self.started = started
+        self.duration_ms = duration_ms
+        self.status = status
+        self.method = method
+        self.path = path
+        self.endpoint = endpoint
+        self.headers = headers
+        self.body = body
+        self.body_omitted = body_omitted
+        self.response_ids = response_ids or {}
+
+def _pack_pairs(pairs: Dict[str, str]) -> bytes:
+    return b''.join(f"{name}\0{value}\0".encode('utf-8') for name, value in pairs.items())
+
+def _unpack_pairs(data: bytes) -> Dict[str, str]:
+    parts = data.decode('utf-8').split('\0')[:-1]
+    return dict(zip(parts[0::2], parts[1::2]))
+
+def encode_record(record: CaptureRecord) -> bytes:
+    """Length-prefixed binary frame for a record"""
+    body, flags = record.body, 0
+    if record.body_omitted:
+        body, flags = b'', FLAG_BODY_OMITTED
+    elif len(body) >= COMPRESS_MIN_BYTES:
+        body, flags = zlib.compress(body), FLAG_BODY_COMPRESSED
+    method = METHODS.index(record.method) if record.method in METHODS else 0
+    fields = [record.path.encode('utf-8'), record.endpoint.encode('utf-8'),
+              _pack_pairs(record.headers), _pack_pairs(record.response_ids)]
+    payload = b''.join([
+        RECORD.pack(record.started, record.duration_ms, record.status, method, flags),
+        *(SHORT.pack(len(field)) + field for field in fields),
+        LENGTH.pack(len(body)), body
+    ])
+    return LENGTH.pack(len(payload)) + payload
+
+def decode_record(payload: bytes) -> CaptureRecord:
+    started, duration_ms, status, method, flags = RECORD.unpack_from(payload)
+    position = RECORD.size
+    fields = []
+    for _ in range(4):
+        (length,) = SHORT.unpack_from(payload, position)
+        position += SHORT.size
+        fields.append(payload[position:position + length])
+        position += length
+    (length,) = LENGTH.unpack_from(payload, position)
+    body = payload[position + LENGTH.size:position + LENGTH.size + length]
+    if flags & FLAG_BODY_COMPRESSED:
+        body = zlib.decompress(body)
+    return CaptureRecord(
+        started, duration_ms, status, METHODS[method], fields[0].decode('utf-8'), fields[1].decode('utf-8'),
+        _unpack_pairs(fields[2]), body, bool(flags & FLAG_BODY_OMITTED), _unpack_pairs(fields[3])
+    )
+
+def read_capture(path: str) -> Iterator[CaptureRecord]:
+    """Records of a capture file in order; a torn final record is ignored"""
+    with open(path, 'rb') as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a traffic capture")
+        while True:
+            prefix = f.read(LENGTH.size)
+            if len(prefix) < LENGTH.size:
+                return
+            (length,) = LENGTH.unpack(prefix)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            yield decode_record(payload)
+
+class CaptureWriter:
+    """Append-only capture file shared by every worker process that opens it"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.fd: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _open(self) -> int:
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(fd).st_size == 0:
+                os.write(fd, CAPTURE_MAGIC)
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        return fd
+
+    def write(self, record: CaptureRecord) -> None:
+        """Append one record with a single O_APPEND write"""
+        frame = encode_record(record)
+        with self._lock:
+            if self.fd is None:
+                self.fd = self._open()
+            os.write(self.fd, frame)
+
+    def close(self) -> None:
+        with self._lock:
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+_writer = CaptureWriter(TRAFFIC_CAPTURE_PATH)
+
+def masked_card_number(card_number: str) -> str:
+    """Luhn-valid test card number ending in the same last 4 digits"""
+    last4 = card_number[-4:] if card_number[-4:].isdigit() else '0000'
+    digits = [int(d) for d in MASKED_CARD_PREFIX + '0' + last4]
+    checksum = sum(digits[-1::-2]) + sum(sum(divmod(d * 2, 10)) for d in digits[-2::-2])
+    # The filler digit sits at an undoubled position, so it adds to the checksum as is
+    return f"{MASKED_CARD_PREFIX}{-checksum % 10}{last4}"
+
+def mask_body(body: bytes) -> bytes:
+    """Replace card data in a JSON body with test values"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    if not isinstance(data, dict) or not MASKED_BODY_FIELDS.keys() & data.keys():
+        return body
+    for field, value in MASKED_BODY_FIELDS.items():
+        if field in data:
+            data[field] = masked_card_number(str(data[field])) if field == 'card_number' else value
+    return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+def capture_headers(request: Request) -> Dict[str, str]:
+    return {name: value for name, value in request.headers.items() if name not in REDACTED_HEADERS}
+
+def response_ids(body: bytes) -> Dict[str, str]:
+    """ID fields of a JSON response body"""
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {field: data[field] for field in ID_FIELDS if isinstance(data.get(field), str)}
+
+def install_traffic_capture(app: FastAPI, writer: Optional[CaptureWriter] = None) -> None:
+    """Install the traffic capture middleware on a FastAPI app"""
+
+    @app.middleware("http")
+    async def traffic_capture_middleware(request: Request, call_next):
+        if not TRAFFIC_CAPTURE_ENABLED or random.random() >= TRAFFIC_CAPTURE_SAMPLE_RATE:
+            return await call_next(request)
+
+        started = time.time()
+        timer = time.perf_counter()
+        # Streamed uploads (no Content-Length, or too large) are recorded
+        # without their body rather than buffered
+        content_length = request.headers.get('content-length')
+        body_omitted = content_length is None or int(content_length) > TRAFFIC_CAPTURE_MAX_BODY_BYTES
+        body = b'' if body_omitted or request.method in ('GET', 'HEAD') else await request.body()
+        if request.method in ('GET', 'HEAD'):
+            body_omitted = False
+
+        response = await call_next(request)
+        ids: Dict[str, str] = {}
+        if request.method == 'POST' and response.status_code < 300 \
+                and response.headers.get('content-type', '').startswith('application/json'):
+            content = b''.join([chunk async for chunk in response.body_iterator])
+            ids = response_ids(content)
+            response = Response(content=content, status_code=response.status_code,
+                                headers=dict(response.headers), background=response.background)
+        duration_ms = (time.perf_counter() - timer) * 1000
+
+        route = request.scope.get('route')
+        path = request.url.path + (f"?{request.url.query}" if request.url.query else '')
+        try:
+            (writer or _writer).write(CaptureRecord(
+                started, duration_ms, response.status_code, request.method, path,
+                getattr(route, 'path', None) or 'unmatched', capture_headers(request),
+                mask_body(body), body_omitted, ids
+            ))
+        except Exception as e:
+            print(f"Failed to capture request: {e}")
+        return response
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+class HTTPTransport:
+    """Keep-alive HTTP connection per replay worker thread"""
+
+    def __init__(self, base_url: str, extra_headers: Optional[Dict[str, str]] = None, timeout: float = 30):
+        parts = urlsplit(base_url)
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        self.netloc = parts.netloc
+        self.prefix = parts.path.rstrip('/')
+        self.extra_headers = extra_headers or {}
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __call__(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, bytes]:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self.connection_class(self.netloc, timeout=self.timeout)
+        try:
+            connection.request(method, self.prefix + path, body or None, {**headers, **self.extra_headers})
+            response = connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            raise
+
+class Replayer:
+    """Plays captured requests against an instance, keeping their relative timing
+
+    speed is a time-compression factor (1 = captured pace, 10 = ten times
+    faster); None or 0 sends as fast as the workers allow. Requests are
+    dispatched in capture order by one thread and sent by `concurrency`
+    workers; when every worker is busy, dispatch falls behind schedule and
+    the lag is reported rather than hidden.
+    """
+
+    def __init__(self, transport: Callable[[str, str, Dict[str, str], bytes], Tuple[int, bytes]],
+                 speed: Optional[float] = 1.0, concurrency: int = 32, run_id: Optional[str] = None):
+        self.transport = transport
+        self.speed = speed or None
+        self.concurrency = concurrency
+        self.run_id = run_id or uuid.uuid4().hex[:8]
+        self._ids: Dict[str, Optional[str]] = {}
+        self._ids_changed = threading.Condition()
+        # idempotency key -> completion event of the last request dispatched with it
+        self._key_done: Dict[str, threading.Event] = {}
+
+    def _resolve(self, original: str) -> str:
+        """Replayed ID for a captured one, waiting briefly if it is still being produced"""
+        deadline = time.monotonic() + DEPENDENCY_WAIT_SECONDS
+        with self._ids_changed:
+            while original in self._ids and self._ids[original] is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._ids_changed.wait(remaining)
+            return self._ids.get(original) or original
+
+    def _publish(self, record: CaptureRecord, body: bytes) -> None:
+        replayed = response_ids(body) if body else {}
+        with self._ids_changed:
+            for field, original in record.response_ids.items():
+                if self._ids.get(original) is None:
+                    self._ids[original] = replayed.get(field) or original
+            self._ids_changed.notify_all()
+
+    def prepare(self, record: CaptureRecord) -> Tuple[Dict[str, str], bytes]:
+        """Headers and body to send: per-run idempotency keys and replayed IDs"""
+        headers = dict(record.headers)
+        if IDEMPOTENCY_HEADER in headers:
+            headers[IDEMPOTENCY_HEADER] = f"replay-{self.run_id}-{headers[IDEMPOTENCY_HEADER]}"
+        body = record.body
+        if body and any(field.encode('utf-8') in body for field in ID_FIELDS):
+            try:
+                data = json.loads(body)
+            except ValueError:
+                return headers, body
+            if isinstance(data, dict):
+                for field in ID_FIELDS:
+                    if isinstance(data.get(field), str):
+                        data[field] = self._resolve(data[field])
+                body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        return headers, body
+
+    def _send(self, sequence: int, record: CaptureRecord, scheduled: float, after: Optional[threading.Event],
+              done: Optional[threading.Event], results: List[Dict[str, Any]]) -> None:
+        started = time.monotonic()
+        if after is not None:
+            # A reused key follows the request it repeats, as it did when captured
+            after.wait(DEPENDENCY_WAIT_SECONDS)
+        headers, body = self.prepare(record)
+        sent = time.perf_counter()
+        try:
+            status, response_body = self.transport(record.method, record.path, headers, body)
+        except Exception as e:
+            print(f"Replay request failed: {e}", file=sys.stderr)
+            status, response_body = 0, b''
+        latency_ms = (time.perf_counter() - sent) * 1000
+        if record.response_ids:
+            self._publish(record, response_body if status < 300 else b'')
+        if done is not None:
+            done.set()
+        results.append({
+            'sequence': sequence,
+            'endpoint': f"{record.method} {record.endpoint}",
+            'status': status,
+            'captured_status': record.status,
+            'latency_ms': round(latency_ms, 3),
+            'captured_latency_ms': round(record.duration_ms, 3),
+            'lag_ms': round(max(0.0, started - scheduled) * 1000, 3),
+        })
+
+    def run(self, records: Iterator[CaptureRecord]) -> Dict[str, Any]:
+        """Replay records and return the run's per-request results"""
+        results: List[Dict[str, Any]] = []
+        work: queue.Queue = queue.Queue(maxsize=self.concurrency)
+
+        def worker():
+            while True:
+                item = work.get()
+                if item is None:
+                    return
+                self._send(*item, results)
+
+        workers = [threading.Thread(target=worker, daemon=True) for _ in range(self.concurrency)]
+        for thread in workers:
+            thread.start()
+
+        began = time.monotonic()
+        first = None
+        for sequence, record in enumerate(records):
+            if record.body_omitted:
+                continue
+            first = record.started if first is None else first
+            scheduled = began if self.speed is None else began + (record.started - first) / self.speed
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            if record.response_ids:
+                with self._ids_changed:
+                    for original in record.response_ids.values():
+                        self._ids.setdefault(original, None)
+            key = record.headers.get(IDEMPOTENCY_HEADER)
+            after = done = None
+            if key:
+                after = self._key_done.get(key)
+                done = self._key_done[key] = threading.Event()
+            work.put((sequence, record, scheduled, after, done))
+
+        for _ in workers:
+            work.put(None)
+        for thread in workers:
+            thread.join()
+        elapsed = time.monotonic() - began
+        results.sort(key=lambda result: result['sequence'])
+
+        return {
+            'run_id': self.run_id,
+            'speed': self.speed,
+            'concurrency': self.concurrency,
+            'started_at': datetime.utcnow().isoformat(),
+            'elapsed_s': round(elapsed, 3),
+            'requests': results,
+        }
+
+def summarize(requests: List[Dict[str, Any]], elapsed_s: float) -> Dict[str, Any]:
+    latencies = [r['latency_ms'] for r in requests]
+    return {
+        'requests': len(requests),
+        'rps': round(len(requests) / elapsed_s, 1) if elapsed_s else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p90_ms': round(percentile(latencies, 90), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'max_ms': round(max(latencies, default=0.0), 3),
+        'error_rate': round(sum(1 for r in requests if r['status'] == 0 or r['status'] >= 500) / len(requests), 4)
+        if requests else 0.0,
+        'status_mismatches': sum(1 for r in requests if r['status'] != r['captured_status']),
+        'max_lag_ms': round(max((r['lag_ms'] for r in requests), default=0.0), 3),
+    }
+
+def compare_runs(baseline: Dict[str, Any], candidate: Dict[str, Any], threshold_pct: float = 10.0,
+                 min_requests: int = 20) -> Dict[str, Any]:
+    """Overall and per-endpoint comparison of two runs, with the regressions found
+
+    A regression is a p50 or p99 latency increase, or a throughput drop, of
+    more than threshold_pct (only for endpoints with min_requests in both
+    runs), or an error rate more than one percentage point higher.
+    """
+    def grouped(run):
+        groups: Dict[str, List[Dict[str, Any]]] = {}
+        for request in run['requests']:
+            groups.setdefault(request['endpoint'], []).append(request)
+        return groups
+
+    def change(before, after):
+        return round((after - before) / before * 100, 1) if before else 0.0
+
+    regressions = []
+
+    def check(name, before, after, throughput=True):
+        if before['requests'] >= min_requests and after['requests'] >= min_requests:
+            for metric in ('p50_ms', 'p99_ms'):
+                if change(before[metric], after[metric]) > threshold_pct:
+                    regressions.append(f"{name}: {metric} {before[metric]} -> {after[metric]}")
+            if throughput and change(before['rps'], after['rps']) < -threshold_pct:
+                regressions.append(f"{name}: rps {before['rps']} -> {after['rps']}")
+        if after['error_rate'] - before['error_rate'] > 0.01:
+            regressions.append(f"{name}: error rate {before['error_rate']} -> {after['error_rate']}")
+
+    overall = {
+        'baseline': summarize(baseline['requests'], baseline['elapsed_s']),
+        'candidate': summarize(candidate['requests'], candidate['elapsed_s']),
+    }
+    check('overall', overall['baseline'], overall['candidate'])
+
+    before_groups, after_groups = grouped(baseline), grouped(candidate)
+    endpoints = {}
+    for endpoint in sorted(before_groups.keys() | after_groups.keys()):
+        before = summarize(before_groups.get(endpoint, []), baseline['elapsed_s'])
+        after = summarize(after_groups.get(endpoint, []), candidate['elapsed_s'])
+        endpoints[endpoint] = {
+            'baseline': before,
+            'candidate': after,
+            'p50_change_pct': change(before['p50_ms'], after['p50_ms']),
+            'p99_change_pct': change(before['p99_ms'], after['p99_ms']),
+        }
+        # Per-endpoint throughput follows the capture's mix, so only latency and errors count
+        check(endpoint, before, after, throughput=False)
+
+    overall['rps_change_pct'] = change(overall['baseline']['rps'], overall['candidate']['rps'])
+    overall['p50_change_pct'] = change(overall['baseline']['p50_ms'], overall['candidate']['p50_ms'])
+    overall['p99_change_pct'] = change(overall['baseline']['p99_ms'], overall['candidate']['p99_ms'])
+    return {'overall': overall, 'endpoints': endpoints, 'regressions': regressions}
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [f"{'endpoint':<40} {'requests':>8} {'p50 ms':>17} {'p99 ms':>17} {'errors':>13}"]
+
+    def row(name, entry):
+        before, after = entry['baseline'], entry['candidate']
+        lines.append(
+            f"{name[:40]:<40} {after['requests']:>8} "
+            f"{before['p50_ms']:>8.1f}>{after['p50_ms']:<8.1f} {before['p99_ms']:>8.1f}>{after['p99_ms']:<8.1f} "
+            f"{before['error_rate']:>6.2%}>{after['error_rate']:<6.2%}"
+        )
+
+    for endpoint, entry in report['endpoints'].items():
+        row(endpoint, entry)
+    row('overall', report['overall'])
+    overall = report['overall']
+    lines.append(f"throughput: {overall['baseline']['rps']} -> {overall['candidate']['rps']} req/s "
+                 f"({overall['rps_change_pct']:+.1f}%)")
+    lines.append("regressions:" if report['regressions'] else "no regressions")
+    lines.extend(f"  {regression}" for regression in report['regressions'])
+    return "\n".join(lines)
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured traffic and compare replay runs")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay = commands.add_parser('replay', help="Replay a capture against an instance")
+    replay.add_argument('capture', help="Capture file written by the traffic capture middleware")
+    replay.add_argument('--url', default='http://localhost:8000', help="Base URL of the instance under test")
+    replay.add_argument('--speed', default='1', help="Time compression factor, or 'max' for no pacing")
+    replay.add_argument('--concurrency', type=int, default=32)
+    replay.add_argument('--api-key', default=os.environ.get('PAYMENTS_API_KEY'), help="Sent as X-API-Key")
+    replay.add_argument('--output', required=True, help="Write the run's results as JSON to this path")
+
+    compare = commands.add_parser('compare', help="Compare two replay runs")
+    compare.add_argument('baseline')
+    compare.add_argument('candidate')
+    compare.add_argument('--threshold', type=float, default=10.0, help="Allowed regression in percent")
+    compare.add_argument('--min-requests', type=int, default=20, help="Ignore endpoints with fewer requests")
+    compare.add_argument('--output', help="Write the comparison as JSON to this path")
+    args = parser.parse_args()
+
+    if args.command == 'replay':
+        transport = HTTPTransport(args.url, {'X-API-Key': args.api_key} if args.api_key else None)
+        speed = None if args.speed == 'max' else float(args.speed)
+        run = Replayer(transport, speed=speed, concurrency=args.concurrency).run(read_capture(args.capture))
+        with open(args.output, 'w') as f:
+            json.dump(run, f)
+        print(json.dumps(summarize(run['requests'], run['elapsed_s']), indent=2))
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    report = compare_runs(baseline, candidate, args.threshold, args.min_requests)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    print(format_report(report))
+    sys.exit(1 if report['regressions'] else 0)
+
+if __name__ == "__main__":
+    main()
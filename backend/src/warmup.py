@@ -0,0 +1,109 @@
+"""
+Container Warm-Up for the Payments Lambda
+
+This module moves the first-request costs of a Lambda container out of
+the request path:
+- lambda_handler answers a warm-up event ({"warmup": true}) with
+  warm_up() instead of running any payment logic
+- Every DynamoDB and SNS client tier a request can be given is created
+  and makes one cheap read, so each pool holds an open TLS connection
+- A GET /health is sent through the ASGI app, which builds the middleware
+  stack the first real request would otherwise build
+- Provisioned-concurrency containers warm up during initialization,
+  before the alias routes traffic to them (WARMUP_ON_INIT=auto)
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from aws_clients import READ_TIMEOUT_TIERS, client, resource
+
+# auto: only provisioned-concurrency containers; true/false: always/never
+WARMUP_ON_INIT = os.environ.get('WARMUP_ON_INIT', 'auto').lower()
+
+WARMUP_EVENT_KEY = 'warmup'
+
+def is_warmup_event(event: Any) -> bool:
+    """Whether a Lambda event is a warm-up ping rather than an API request"""
+    return isinstance(event, dict) and event.get(WARMUP_EVENT_KEY) is True
+
+def warm_on_init() -> bool:
+    """Whether this container should warm up while it initializes"""
+    if WARMUP_ON_INIT == 'auto':
+        return os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE') == 'provisioned-concurrency'
+    return WARMUP_ON_INIT == 'true'
+
+def dependency_calls(table_keys: Dict[str, Dict[str, Any]], topic_arn: str) -> Dict[str, List[Callable[[], Any]]]:
+    """Cheap reads per client tier; the calls of one tier share its connection pool
+
+    table_keys maps each table to a key to read; the key need not exist.
+    """
+    calls: Dict[str, List[Callable[[], Any]]] = {}
+    for tier in READ_TIMEOUT_TIERS:
+        dynamodb = resource('dynamodb', tier)
+        calls[f"dynamodb@{tier}s"] = [
+            lambda table=dynamodb.Table(name), key=key: table.get_item(Key=key)
+            for name, key in table_keys.items()
+        ]
+        sns = client('sns', tier)
+        calls[f"sns@{tier}s"] = [lambda sns=sns: sns.get_topic_attributes(TopicArn=topic_arn)]
+    return calls
+
+def warm_connections(calls: Dict[str, List[Callable[[], Any]]]) -> Dict[str, Any]:
+    """Run each pool's calls in order, pools in parallel; milliseconds or error per pool"""
+
+    def run(name: str) -> Any:
+        started = time.perf_counter()
+        try:
+            for call in calls[name]:
+                call()
+        except Exception as e:
+            print(f"Warm-up of {name} failed: {e}")
+            return {'error': str(e)}
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(calls))) as pool:
+        return dict(zip(calls, pool.map(run, calls)))
+
+def warm_app(app, path: str = '/health') -> int:
+    """Send one GET through the ASGI app and return its status"""
+    messages: List[Dict[str, Any]] = []
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'https', 'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+        'headers': [(b'host', b'warmup'), (b'user-agent', b'payments-warmup')],
+        'client': ('127.0.0.1', 0), 'server': ('warmup', 443),
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    # A private loop, so the thread's current loop is left as Mangum expects it
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(app(scope, receive, send))
+    finally:
+        loop.close()
+    return next(message['status'] for message in messages if message['type'] == 'http.response.start')
+
+def warm_up(app, table_keys: Dict[str, Dict[str, Any]], topic_arn: str) -> Dict[str, Any]:
+    """Warm every connection pool and the app; a report of what was done"""
+    started = time.perf_counter()
+    connections = warm_connections(dependency_calls(table_keys, topic_arn))
+    try:
+        app_status = warm_app(app)
+    except Exception as e:
+        print(f"Warm-up of the app failed: {e}")
+        app_status = 0
+    return {
+        'warmup': True,
+        'connections': connections,
+        'app_status': app_status,
+        'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+    }
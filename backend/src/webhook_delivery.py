@@ -0,0 +1,174 @@
+"""
+Webhook Delivery for Serverless Payments Sandbox
+
+This module delivers published webhooks to merchant endpoints over HTTPS:
+- An SQS queue subscribed to the webhook topic collects events for the
+  event source's batching window (1 second in cdk/app.py), and
+  lambda_handler delivers each batch of queue messages
+- Endpoints (WEBHOOK_ENDPOINTS, JSON) choose their delivery mode: 'single'
+  posts each event's own signed envelope, 'batch' coalesces the endpoint's
+  events into signed batch envelopes of up to batch_max_events each
+- Within a batch events are delivered in publish order, and an endpoint's
+  next request is only sent once the previous one succeeded; after a
+  failure the endpoint's remaining events go back to the queue with the
+  failed ones
+- An invocation stops sending before it would run past the Lambda timeout,
+  and returns the events it did not get to, rather than timing out with
+  the whole batch in flight
+- Each event carries its event_id (the SNS message ID), so receivers can
+  drop the duplicates an at-least-once retry produces, and its sequence
+  within the transaction (see webhooks.py)
+
+SQS standard queues order messages on a best-effort basis, so events in
+different batches, or retried after a failure, can arrive out of order: a
+receiver applies an event only if its sequence is higher than the last one
+it applied for the same transaction_id.
+"""
+
+import json
+import os
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from webhooks import build_batch_message
+
+WEBHOOK_BATCH_MAX_EVENTS = int(os.environ.get('WEBHOOK_BATCH_MAX_EVENTS', '100'))
+WEBHOOK_DELIVERY_TIMEOUT_S = float(os.environ.get('WEBHOOK_DELIVERY_TIMEOUT_S', '5'))
+
+# Endpoints delivered to in parallel by one invocation
+DELIVERY_WORKERS = 16
+
+# Time kept back from the Lambda timeout to report the batch result
+DEADLINE_MARGIN_S = 1.0
+
+DELIVERY_MODES = ('single', 'batch')
+
+class Endpoint:
+    """A merchant webhook endpoint and how events are delivered to it"""
+
+    def __init__(self, id: str, url: str, events: Optional[List[str]] = None, delivery: str = 'single',
+                 batch_max_events: int = WEBHOOK_BATCH_MAX_EVENTS, **_):
+        if delivery not in DELIVERY_MODES:
+            raise ValueError(f"Unknown webhook delivery mode: {delivery}")
+        if batch_max_events < 1:
+            raise ValueError("batch_max_events must be at least 1")
+        self.id = id
+        self.url = url
+        # Event types sent to the endpoint; empty means all of them
+        self.events = set(events or ())
+        self.delivery = delivery
+        self.batch_max_events = batch_max_events if delivery == 'batch' else 1
+
+    def accepts(self, event_type: str) -> bool:
+        return not self.events or event_type in self.events
+
+def load_endpoints() -> List[Endpoint]:
+    """Endpoint table from WEBHOOK_ENDPOINTS"""
+    return [Endpoint(**spec) for spec in json.loads(os.environ.get('WEBHOOK_ENDPOINTS') or '[]')]
+
+class Event:
+    """One published webhook: its queue message, SNS message ID and signed envelope"""
+
+    __slots__ = ('receipt', 'event_id', 'message')
+
+    def __init__(self, receipt: str, event_id: str, message: Dict[str, Any]):
+        self.receipt = receipt
+        self.event_id = event_id
+        self.message = message
+
+    @property
+    def payload(self) -> Dict[str, Any]:
+        return self.message['payload']
+
+def plan_deliveries(endpoints: List[Endpoint], events: List[Event]) -> Dict[str, List[List[Event]]]:
+    """Requests per endpoint, in order: one per event, or batches of up to batch_max_events"""
+    plan: Dict[str, List[List[Event]]] = {}
+    for endpoint in endpoints:
+        matching = [event for event in events if endpoint.accepts(event.payload.get('event_type'))]
+        size = endpoint.batch_max_events
+        if matching:
+            plan[endpoint.id] = [matching[i:i + size] for i in range(0, len(matching), size)]
+    return plan
+
+def request_body(endpoint: Endpoint, events: List[Event]) -> Tuple[bytes, Dict[str, str]]:
+    """Signed request body and headers for one delivery"""
+    if endpoint.delivery == 'single':
+        # The envelope exactly as published, so existing receivers keep verifying it
+        event = events[0]
+        message = event.message
+        headers = {'X-Webhook-Event-Id': event.event_id}
+    else:
+        message = build_batch_message([{'event_id': event.event_id, **event.payload} for event in events])
+        headers = {}
+    headers.update({
+        'Content-Type': 'application/json',
+        'X-Webhook-Signature': message['signature'],
+        'X-Webhook-Event-Count': str(len(events)),
+    })
+    return json.dumps(message, default=str).encode('utf-8'), headers
+
+def post(url: str, body: bytes, headers: Dict[str, str]) -> None:
+    """POST to an endpoint; raises unless it answers 2xx"""
+    request = urllib.request.Request(url, data=body, headers=headers, method='POST')
+    with urllib.request.urlopen(request, timeout=WEBHOOK_DELIVERY_TIMEOUT_S) as response:
+        if not 200 <= response.status < 300:
+            raise RuntimeError(f"Endpoint answered {response.status}")
+
+def deliver_in_order(endpoint: Endpoint, batches: List[List[Event]], send=post,
+                     deadline: Optional[float] = None) -> Tuple[List[Event], bool]:
+    """Send an endpoint's requests one after another until deadline; the events not delivered, and whether time ran out"""
+    for index, batch in enumerate(batches):
+        remaining = [event for rest in batches[index:] for event in rest]
+        # A request is only started if it can time out before the deadline
+        if deadline is not None and time.monotonic() + WEBHOOK_DELIVERY_TIMEOUT_S > deadline:
+            print(f"Deferred {len(remaining)} webhooks to {endpoint.id}: out of time")
+            return remaining, True
+        try:
+            send(endpoint.url, *request_body(endpoint, batch))
+        except Exception as e:
+            print(f"Failed to deliver webhooks to {endpoint.id}: {e}")
+            return remaining, False
+    return [], False
+
+def parse_records(records: List[Dict[str, Any]]) -> List[Event]:
+    """Events of SQS records holding SNS notifications, in publish order"""
+    events = []
+    for record in records:
+        notification = json.loads(record['body'])
+        events.append(Event(record['messageId'], notification['MessageId'], json.loads(notification['Message'])))
+    # Stable, so events published in the same microsecond keep their queue order
+    events.sort(key=lambda event: event.payload.get('timestamp') or '')
+    return events
+
+def deliver(endpoints: List[Endpoint], events: List[Event], send=post,
+            deadline: Optional[float] = None) -> Dict[str, Any]:
+    """Deliver events to every endpoint by deadline (time.monotonic()); undelivered events and request counts"""
+    plan = plan_deliveries(endpoints, events)
+    by_id = {endpoint.id: endpoint for endpoint in endpoints}
+    with ThreadPoolExecutor(max_workers=min(DELIVERY_WORKERS, len(plan) or 1)) as executor:
+        futures = {
+            endpoint_id: executor.submit(deliver_in_order, by_id[endpoint_id], batches, send, deadline)
+            for endpoint_id, batches in plan.items()
+        }
+        results = {endpoint_id: future.result() for endpoint_id, future in futures.items()}
+    failed = {event.receipt for remaining, _ in results.values() for event in remaining}
+    return {
+        'events': len(events),
+        'requests': sum(len(batches) for batches in plan.values()),
+        'failed_endpoints': sorted(
+            endpoint_id for endpoint_id, (remaining, timed_out) in results.items() if remaining and not timed_out
+        ),
+        'deferred_endpoints': sorted(endpoint_id for endpoint_id, (_, timed_out) in results.items() if timed_out),
+        'failed_receipts': [event.receipt for event in events if event.receipt in failed],
+    }
+
+def lambda_handler(event, context):
+    """SQS consumer for the webhook delivery queue"""
+    deadline = None
+    if context is not None:
+        deadline = time.monotonic() + context.get_remaining_time_in_millis() / 1000 - DEADLINE_MARGIN_S
+    summary = deliver(load_endpoints(), parse_records(event.get('Records', [])), deadline=deadline)
+    print(json.dumps({k: v for k, v in summary.items() if k != 'failed_receipts'}))
+    return {'batchItemFailures': [{'itemIdentifier': receipt} for receipt in summary['failed_receipts']]}
@@ -0,0 +1,65 @@
+"""
+Webhook Envelope Helpers for Serverless Payments Sandbox
+
+This module builds the signed webhook envelope shared by every publisher:
+- HMAC SHA-256 payload signatures
+- The {"payload": ..., "signature": ...} message format
+- A per-transaction sequence number in each payload, so receivers can
+  put a transaction's events back in order after an out-of-order delivery
+- Batch payloads that carry several events under one signature
+"""
+
+import json
+from datetime import datetime
+from typing import Dict, Any, List
+
+import hashlib
+import hmac
+
+# In production, get secret from SSM Parameter Store
+WEBHOOK_SECRET = "webhook-secret-key"  # Replace with SSM lookup
+
+def generate_hmac_signature(payload: str, secret: str) -> str:
+    """Generate HMAC signature for webhook security"""
+    return hmac.new(
+        secret.encode('utf-8'),
+        payload.encode('utf-8'),
+        hashlib.sha256
+    ).hexdigest()
+
+# Position of each event in its transaction's lifecycle: a payment event is
+# published when the ledger row is written, transaction_settled after it
+EVENT_SEQUENCE = {
+    "payment_authorized": 1,
+    "payment_captured": 1,
+    "payment_refunded": 1,
+    "transaction_settled": 2,
+}
+
+def build_webhook_message(event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """Wrap event data in the signed webhook envelope"""
+    webhook_payload = {
+        "event_type": event_type,
+        "timestamp": datetime.utcnow().isoformat(),
+        "sequence": EVENT_SEQUENCE.get(event_type, 1),
+        "data": data
+    }
+    signature = generate_hmac_signature(json.dumps(webhook_payload), WEBHOOK_SECRET)
+    return {
+        "payload": webhook_payload,
+        "signature": signature
+    }
+
+def build_batch_message(events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Wrap several event payloads, in delivery order, in one signed envelope"""
+    batch_payload = {
+        "event_type": "batch",
+        "timestamp": datetime.utcnow().isoformat(),
+        "count": len(events),
+        "events": events
+    }
+    signature = generate_hmac_signature(json.dumps(batch_payload), WEBHOOK_SECRET)
+    return {
+        "payload": batch_payload,
+        "signature": signature
+    }
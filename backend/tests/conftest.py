@@ -0,0 +1,182 @@
+"""
+Shared fixtures for Serverless Payments Sandbox tests
+
+handler.py reads its table and topic from the environment at import time,
+so defaults are set here before any test module imports it. Besides the
+moto tables and topic, this module holds the helpers the test modules
+share: a valid authorization body, a FakeClock for time-driven
+components and an authorize factory that posts through the app.
+"""
+
+import os
+import sys
+import uuid
+
+import boto3
+import pytest
+from moto import mock_dynamodb, mock_sns
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'testing')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'testing')
+os.environ.setdefault('PAYMENTS_TABLE', 'payments-ledger')
+os.environ.setdefault('IDEMPOTENCY_TABLE', 'payments-idempotency')
+os.environ.setdefault('WEBHOOK_TOPIC_ARN', 'arn:aws:sns:us-east-1:123456789012:test-topic')
+# Tests reuse a few cards; test_risk.py installs engines of its own
+os.environ.setdefault('RISK_ENABLED', 'false')
+
+# A valid authorization request body; tests override fields as needed
+AUTHORIZATION = {
+    "amount": 2500,
+    "currency": "USD",
+    "card_number": "4242424242424242",
+    "card_holder": "John Doe",
+    "expiry_month": 12,
+    "expiry_year": 2030,
+    "cvv": "123",
+    "merchant_id": "merchant_123"
+}
+
+class FakeClock:
+    """Time source that only moves when a test sets `now`"""
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def create_payments_table(dynamodb):
+    """Create the payments ledger table with the same keys as cdk/app.py"""
+    return dynamodb.create_table(
+        TableName='payments-ledger',
+        KeySchema=[
+            {'AttributeName': 'transaction_id', 'KeyType': 'HASH'},
+            {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'transaction_id', 'AttributeType': 'S'},
+            {'AttributeName': 'created_at', 'AttributeType': 'S'},
+            {'AttributeName': 'card_id', 'AttributeType': 'S'},
+            {'AttributeName': 'settlement_bucket', 'AttributeType': 'S'},
+            {'AttributeName': 'merchant_bucket', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                'IndexName': 'card_id_index',
+                'KeySchema': [
+                    {'AttributeName': 'card_id', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            },
+            {
+                'IndexName': 'settlement_index',
+                'KeySchema': [
+                    {'AttributeName': 'settlement_bucket', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            },
+            {
+                'IndexName': 'merchant_index',
+                'KeySchema': [
+                    {'AttributeName': 'merchant_bucket', 'KeyType': 'HASH'},
+                    {'AttributeName': 'created_at', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+def create_idempotency_table(dynamodb):
+    """Create the idempotency table with the same key as cdk/app.py"""
+    return dynamodb.create_table(
+        TableName='payments-idempotency',
+        KeySchema=[{'AttributeName': 'k', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'k', 'AttributeType': 'B'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+def create_projections_table(dynamodb):
+    """Create the read projections table with the same keys as cdk/app.py"""
+    return dynamodb.create_table(
+        TableName='payments-projections',
+        KeySchema=[
+            {'AttributeName': 'pk', 'KeyType': 'HASH'},
+            {'AttributeName': 'sk', 'KeyType': 'RANGE'}
+        ],
+        AttributeDefinitions=[
+            {'AttributeName': 'pk', 'AttributeType': 'S'},
+            {'AttributeName': 'sk', 'AttributeType': 'S'},
+            {'AttributeName': 'changed', 'AttributeType': 'S'}
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                'IndexName': 'changes_index',
+                'KeySchema': [
+                    {'AttributeName': 'pk', 'KeyType': 'HASH'},
+                    {'AttributeName': 'changed', 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+        ],
+        BillingMode='PAY_PER_REQUEST'
+    )
+
+@pytest.fixture
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+    os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+    os.environ['AWS_SECURITY_TOKEN'] = 'testing'
+    os.environ['AWS_SESSION_TOKEN'] = 'testing'
+    os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+@pytest.fixture
+def dynamodb_mock(aws_credentials):
+    """Mock DynamoDB with the payments ledger, idempotency and projections tables."""
+    with mock_dynamodb():
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        create_idempotency_table(dynamodb)
+        create_projections_table(dynamodb)
+        # Counter shards learned against an earlier test's tables do not exist in these
+        from handler import projections
+        projections.sharded.shards.clear()
+        yield create_payments_table(dynamodb)
+
+@pytest.fixture
+def sns_mock(aws_credentials):
+    """Mock SNS for testing."""
+    with mock_sns():
+        sns = boto3.client('sns', region_name='us-east-1')
+        topic_arn = sns.create_topic(Name='test-topic')['TopicArn']
+        os.environ['WEBHOOK_TOPIC_ARN'] = topic_arn
+        yield sns
+
+@pytest.fixture
+def clock():
+    """A FakeClock starting at 0."""
+    return FakeClock()
+
+@pytest.fixture
+def authorize():
+    """Factory that authorizes a payment through the app and returns the response body.
+
+    Keyword arguments override fields of AUTHORIZATION; each call uses a
+    fresh idempotency key unless one is given.
+    """
+    from fastapi.testclient import TestClient
+    from handler import app
+    client = TestClient(app)
+
+    def post(idempotency_key=None, **fields):
+        response = client.post("/payments/authorize", json={**AUTHORIZATION, **fields},
+                               headers={"X-Idempotency-Key": idempotency_key or str(uuid.uuid4())})
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    return post
@@ -0,0 +1,80 @@
+"""
+Unit tests for admission control
+
+This module tests per-merchant token buckets, in-flight and latency
+shedding, and the 429 responses on the payment routes.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+
+import handler
+from admission import AdmissionController, TokenBucket
+from handler import app
+
+client = TestClient(app)
+
+class TestTokenBucket:
+    """Test token refill and retry hints."""
+
+    def test_burst_then_refill(self):
+        bucket = TokenBucket(rate=2, burst=2, now=0)
+        assert bucket.try_acquire(0)[0]
+        assert bucket.try_acquire(0)[0]
+        admitted, retry_after = bucket.try_acquire(0)
+        assert not admitted
+        assert retry_after == pytest.approx(0.5)
+        assert bucket.try_acquire(0.5)[0]
+
+class TestAdmissionController:
+    """Test shedding decisions."""
+
+    def test_merchants_are_isolated(self, clock):
+        controller = AdmissionController(rate=1, burst=2, max_in_flight=100, clock=clock)
+        for _ in range(2):
+            assert controller.try_admit("noisy") is None
+            controller.release()
+        assert controller.try_admit("noisy").reason == 'rate_limited'
+        assert controller.try_admit("quiet") is None
+        assert controller.counters['shed_rate_limited'] == 1
+
+    def test_in_flight_cap(self, clock):
+        controller = AdmissionController(rate=100, burst=100, max_in_flight=2, clock=clock)
+        assert controller.try_admit("a") is None
+        assert controller.try_admit("b") is None
+        assert controller.try_admit("c").reason == 'in_flight'
+        controller.release()
+        assert controller.try_admit("c") is None
+
+    def test_latency_overload_sheds_heavy_merchants_first(self, clock):
+        controller = AdmissionController(rate=1, burst=10, max_in_flight=100,
+                                         latency_threshold_ms=100, clock=clock)
+        for _ in range(8):
+            assert controller.try_admit("heavy") is None
+            controller.release()
+        for _ in range(3):
+            assert controller.try_admit("probe") is None
+            controller.release(backend_latency_ms=1000)
+
+        assert controller.latency_ewma_ms > 100
+        assert controller.try_admit("heavy").reason == 'latency'
+        assert controller.try_admit("light") is None
+
+class TestAdmissionMiddleware:
+    """Test 429 responses on the payment routes."""
+
+    def test_rate_limited_request_gets_retry_after(self, dynamodb_mock, sns_mock, monkeypatch):
+        controller = AdmissionController(rate=0.5, burst=1, max_in_flight=100)
+        monkeypatch.setattr(handler.admission_controller, 'try_admit', controller.try_admit)
+        monkeypatch.setattr(handler.admission_controller, 'release', controller.release)
+
+        payload = {"auth_id": "auth_missing", "amount": 100, "merchant_id": "merchant_429"}
+        first = client.post("/payments/capture", json=payload, headers={"X-Idempotency-Key": "adm-1"})
+        assert first.status_code == 404
+
+        second = client.post("/payments/capture", json=payload, headers={"X-Idempotency-Key": "adm-2"})
+        assert second.status_code == 429
+        assert second.headers["Retry-After"] == "2"
+
+    def test_health_is_not_admission_controlled(self):
+        assert client.get("/health").status_code == 200
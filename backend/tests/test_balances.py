@@ -0,0 +1,92 @@
+"""
+Unit tests for atomic running balances
+
+This module tests that repeated partial captures and refunds are summed
+against the parent's balance record.
+"""
+
+from fastapi.testclient import TestClient
+
+from balances import balance_key
+from handler import app
+
+client = TestClient(app)
+
+def capture(auth_id, amount, key, currency="USD"):
+    payload = {"auth_id": auth_id, "amount": amount, "currency": currency, "merchant_id": "merchant_123"}
+    return client.post("/payments/capture", json=payload, headers={"X-Idempotency-Key": key})
+
+def refund(transaction_id, amount, key, currency="USD"):
+    payload = {"transaction_id": transaction_id, "amount": amount, "currency": currency, "merchant_id": "merchant_123"}
+    return client.post("/payments/refund", json=payload, headers={"X-Idempotency-Key": key})
+
+class TestCaptureBalance:
+    """Test captured-so-far accounting on authorizations."""
+
+    def test_partial_captures_are_summed(self, authorize, dynamodb_mock, sns_mock):
+        auth = authorize("bal-auth-1", amount=10000)
+        assert capture(auth["auth_id"], 6000, "bal-cap-1").status_code == 200
+        assert capture(auth["auth_id"], 4000, "bal-cap-2").status_code == 200
+
+        over = capture(auth["auth_id"], 1, "bal-cap-3")
+        assert over.status_code == 400
+        assert "exceeds authorized amount" in over.json()["detail"]
+
+        balance = dynamodb_mock.get_item(Key=balance_key(auth["auth_id"]))["Item"]
+        assert balance["captured_amount"] == 10000
+        assert balance["capturable_amount"] == 0
+
+    def test_rejected_capture_leaves_no_ledger_row(self, authorize, dynamodb_mock, sns_mock):
+        auth = authorize("bal-auth-2", amount=5000)
+        assert capture(auth["auth_id"], 6000, "bal-cap-4").status_code == 400
+        rows = dynamodb_mock.scan()["Items"]
+        assert not [row for row in rows if row.get("type") == "capture"]
+
+    def test_unknown_authorization(self, dynamodb_mock, sns_mock):
+        assert capture("auth_missing", 100, "bal-cap-5").status_code == 404
+
+    def test_declined_authorization(self, authorize, dynamodb_mock, sns_mock):
+        auth = authorize("bal-auth-3", amount=1500000)
+        assert auth["status"] == "declined"
+        assert capture(auth["auth_id"], 100, "bal-cap-6").status_code == 409
+
+    def test_currency_must_match_the_authorization(self, authorize, dynamodb_mock, sns_mock):
+        auth = authorize("bal-auth-6", amount=10000)
+        for currency, key in (("EUR", "bal-cap-8"), ("XXX", "bal-cap-9")):
+            response = capture(auth["auth_id"], 100, key, currency=currency)
+            assert response.status_code == 400
+            assert response.json()["detail"] == "Currency does not match the authorization"
+        # Codes are normalized to upper case
+        captured = capture(auth["auth_id"], 100, "bal-cap-10", currency="usd")
+        assert captured.status_code == 200
+        assert captured.json()["currency"] == "USD"
+
+        balance = dynamodb_mock.get_item(Key=balance_key(auth["auth_id"]))["Item"]
+        assert balance["captured_amount"] == 100
+
+class TestRefundBalance:
+    """Test refunded-so-far accounting on captures."""
+
+    def test_partial_refunds_are_summed(self, authorize, dynamodb_mock, sns_mock):
+        auth = authorize("bal-auth-4", amount=10000)
+        captured = capture(auth["auth_id"], 8000, "bal-cap-7").json()
+
+        assert refund(captured["transaction_id"], 5000, "bal-ref-1").status_code == 200
+        assert refund(captured["transaction_id"], 3000, "bal-ref-2").status_code == 200
+        over = refund(captured["transaction_id"], 1, "bal-ref-3")
+        assert over.status_code == 400
+        assert "exceeds captured amount" in over.json()["detail"]
+
+    def test_cannot_refund_an_authorization(self, authorize, dynamodb_mock, sns_mock):
+        auth = authorize("bal-auth-5", amount=10000)
+        response = refund(auth["auth_id"], 100, "bal-ref-4")
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Can only refund captured payments"
+
+    def test_currency_must_match_the_capture(self, authorize, dynamodb_mock, sns_mock):
+        auth = authorize("bal-auth-7", amount=10000)
+        captured = capture(auth["auth_id"], 8000, "bal-cap-11").json()
+        response = refund(captured["transaction_id"], 100, "bal-ref-5", currency="EUR")
+        assert response.status_code == 400
+        assert response.json()["detail"] == "Currency does not match the captured payment"
+        assert refund(captured["transaction_id"], 100, "bal-ref-6", currency="usd").status_code == 200
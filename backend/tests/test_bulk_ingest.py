@@ -0,0 +1,112 @@
+"""
+Unit tests for bulk NDJSON ingestion
+
+This module tests incremental line parsing, per-row validation errors,
+idempotent re-uploads and the bound on in-flight batch writes.
+"""
+
+import asyncio
+import json
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from bulk_ingest import BulkIngestor, iter_lines
+from conftest import AUTHORIZATION
+from handler import INGEST_OPERATIONS, app
+
+client = TestClient(app)
+
+def ndjson(*rows):
+    return "".join((row if isinstance(row, str) else json.dumps(row)) + "\n" for row in rows)
+
+def ingest(body):
+    response = client.post("/ingest/payments", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    return lines[:-1], lines[-1]["summary"]
+
+class TestIngestEndpoint:
+    """Test ingestion against the ledger."""
+
+    def test_mixed_upload(self, dynamodb_mock, sns_mock):
+        auth = client.post("/payments/authorize", json=AUTHORIZATION, headers={"X-Idempotency-Key": "bulk-auth"}).json()
+        body = ndjson(
+            {"operation": "authorize", "idempotency_key": "bulk-1", "request": AUTHORIZATION},
+            {"operation": "capture", "idempotency_key": "bulk-2",
+             "request": {"auth_id": auth["auth_id"], "amount": 2000, "merchant_id": "merchant_123"}},
+            "{not json",
+            {"operation": "authorize", "idempotency_key": "bulk-3", "request": {**AUTHORIZATION, "amount": -5}},
+            {"operation": "capture", "idempotency_key": "bulk-4",
+             "request": {"auth_id": auth["auth_id"], "amount": 1000, "merchant_id": "merchant_123"}},
+            {"operation": "authorize", "idempotency_key": "bulk-1", "request": AUTHORIZATION}
+        )
+        results, summary = ingest(body)
+
+        assert [r["line"] for r in results] == [1, 2, 3, 4, 5, 6]
+        assert [r["outcome"] for r in results] == ["accepted", "accepted", "rejected", "rejected", "rejected", "replayed"]
+        assert results[2]["error"]["status_code"] == 400
+        assert results[3]["error"]["status_code"] == 422
+        assert "exceeds authorized amount" in results[4]["error"]["detail"]
+        assert results[5]["result"] == results[0]["result"]
+        assert summary["rows"] == 6 and summary["accepted"] == 2 and summary["rejected"] == 3
+
+        rows = dynamodb_mock.scan()["Items"]
+        authorizations = [row for row in rows if row.get("type") == "authorization"]
+        assert len(authorizations) == 2
+        assert len([row for row in rows if row.get("type") == "capture"]) == 1
+
+    def test_reupload_replays(self, dynamodb_mock, sns_mock):
+        body = ndjson(*(
+            {"operation": "authorize", "idempotency_key": f"replay-{i}", "request": AUTHORIZATION} for i in range(30)
+        ))
+        first, _ = ingest(body)
+        second, summary = ingest(body)
+
+        assert summary["replayed"] == 30
+        assert [r["result"]["transaction_id"] for r in second] == [r["result"]["transaction_id"] for r in first]
+        assert len([row for row in dynamodb_mock.scan()["Items"] if row.get("type") == "authorization"]) == 30
+
+class TestBulkIngestor:
+    """Test streaming, ordering and backpressure."""
+
+    def test_lines_split_across_chunks(self):
+        async def lines():
+            async def chunks():
+                for chunk in (b'{"a":', b'1}\n{"b"', b':2}\n' + b'x' * 40 + b'\n', b'tail'):
+                    yield chunk
+            return [line async for line in iter_lines(chunks(), max_row_bytes=32)]
+
+        assert asyncio.run(lines()) == [b'{"a":1}', b'{"b":2}', None, b'tail']
+
+    def test_in_flight_batches_are_bounded(self):
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0, 'written': 0, 'read_ahead': 0}
+
+        def write_batch(rows):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.02)
+            with lock:
+                state['active'] -= 1
+                state['written'] += len(rows)
+            return [('accepted', {'key': row.idempotency_key}) for row in rows]
+
+        ingestor = BulkIngestor(INGEST_OPERATIONS, write_batch, batch_size=5, max_in_flight=2)
+        row = {"operation": "authorize", "request": AUTHORIZATION}
+
+        async def run():
+            async def body():
+                for i in range(100):
+                    # Rows read but not yet written never exceed the in-flight bound
+                    state['read_ahead'] = max(state['read_ahead'], i - state['written'])
+                    yield ndjson({**row, "idempotency_key": f"k{i}"}).encode()
+            return [result async for result in ingestor.run(body())]
+
+        results = asyncio.run(run())
+        assert state['peak'] == 2
+        assert state['read_ahead'] <= 5 * 2
+        assert [r['result']['key'] for r in results[:-1]] == [f"k{i}" for i in range(100)]
+        assert results[-1]['summary']['accepted'] == 100
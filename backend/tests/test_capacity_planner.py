@@ -0,0 +1,136 @@
+"""
+Unit tests for the DynamoDB capacity planner
+
+This module tests reading the load-test mix from replay runs and Locust
+stats, capacity from /health and logged EMF records, the per-pattern
+projection and ranking, stream consumer charging, and table sizing.
+"""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'load_tests'))
+
+from capacity_planner import load_capacity, load_mix, merge_capacity, plan
+
+CAPACITY = {
+    '/payments/authorize': {
+        'requests': 100, 'rcu': 50.0, 'wcu': 400.0,
+        'phases': {
+            'idempotency_read': {'rcu': 50.0, 'wcu': 0.0},
+            'ledger_write': {'rcu': 0.0, 'wcu': 300.0},
+            'webhook_publish': {'rcu': 0.0, 'wcu': 100.0},
+        },
+        'tables': {
+            'ledger': {'rcu': 0.0, 'wcu': 200.0},
+            'idempotency': {'rcu': 50.0, 'wcu': 100.0},
+            'projections': {'rcu': 0.0, 'wcu': 100.0},
+        },
+    },
+    '/transactions': {
+        'requests': 10, 'rcu': 20.0, 'wcu': 0.0,
+        'phases': {'unphased': {'rcu': 20.0, 'wcu': 0.0}},
+        'tables': {'projections': {'rcu': 20.0, 'wcu': 0.0}},
+    },
+}
+
+class TestLoadTestInputs:
+    """Test reading capacity and the request mix."""
+
+    def test_replay_run_and_health_response(self, tmp_path):
+        run = tmp_path / 'run.json'
+        run.write_text(json.dumps({
+            'elapsed_s': 2.0,
+            'requests': [{'endpoint': 'POST /payments/authorize'}] * 3 + [{'endpoint': 'GET /transactions'}],
+        }))
+        health = tmp_path / 'health.json'
+        health.write_text(json.dumps({'status': 'healthy', 'consumed_capacity': CAPACITY}))
+
+        assert load_mix(str(run)) == {
+            'requests': {'/payments/authorize': 3, '/transactions': 1}, 'requests_per_second': 2.0
+        }
+        assert load_capacity(str(health)) == CAPACITY
+
+    def test_emf_log(self, tmp_path):
+        def emf(endpoint, requests, units):
+            return json.dumps({'_aws': {}, 'endpoint': endpoint,
+                               'consumed_capacity': {'requests': requests, 'units': units}})
+
+        log = tmp_path / 'consumer.log'
+        log.write_text('\n'.join([
+            '2026-10-19T10:00:00Z req-1 ' + emf('stream:projections', 10, [['projection_write', 'projections', 0.0, 80.0]]),
+            'START RequestId: req-2',
+            emf('stream:projections', 5, [['projection_write', 'projections', 1.0, 40.0]]),
+            emf('/health', 1, []),
+        ]))
+        capacity = load_capacity(str(log))
+        assert capacity['stream:projections'] == {
+            'requests': 15, 'rcu': 1.0, 'wcu': 120.0,
+            'phases': {'projection_write': {'rcu': 1.0, 'wcu': 120.0}},
+            'tables': {'projections': {'rcu': 1.0, 'wcu': 120.0}},
+        }
+        merged = merge_capacity([CAPACITY, capacity])
+        assert merged['/payments/authorize'] == CAPACITY['/payments/authorize']
+        assert merged['stream:projections']['requests'] == 15
+
+    def test_locust_stats(self, tmp_path):
+        stats = tmp_path / 'run_stats.csv'
+        stats.write_text(
+            "Type,Name,Request Count,Failure Count,Requests/s\n"
+            "POST,/payments/authorize,900,0,90.0\n"
+            "GET,/transactions,100,0,10.0\n"
+            ",Aggregated,1000,0,100.0\n"
+        )
+        assert load_mix(str(stats)) == {
+            'requests': {'/payments/authorize': 900, '/transactions': 100}, 'requests_per_second': 100.0
+        }
+
+class TestPlan:
+    """Test projection to a target rate."""
+
+    def test_patterns_are_ranked_by_cost(self):
+        mix = {'requests': {'/payments/authorize': 900, '/transactions': 100, '/payments/refund': 5},
+               'requests_per_second': 100.0}
+        result = plan(CAPACITY, mix, target_tps=1005)
+
+        assert result['scale_factor'] == 10.1
+        assert result['unmeasured_endpoints'] == ['/payments/refund']
+        first = result['patterns'][0]
+        assert (first['endpoint'], first['phase']) == ('/payments/authorize', 'ledger_write')
+        # 900 authorizations/s at 3 WCU each
+        assert first['wcu_per_request'] == 3.0
+        assert first['wcu_per_second'] == pytest.approx(2700.0)
+        assert sum(pattern['cost_share'] for pattern in result['patterns']) == pytest.approx(1.0, abs=1e-3)
+
+    def test_stream_consumer_is_charged_per_api_request(self):
+        consumer = {'requests': 300, 'rcu': 0.0, 'wcu': 880.0,
+                    'phases': {'projection_write': {'rcu': 0.0, 'wcu': 880.0}},
+                    'tables': {'projections': {'rcu': 0.0, 'wcu': 880.0}}}
+        mix = {'requests': {'/payments/authorize': 100, '/transactions': 10}, 'requests_per_second': 11.0}
+        result = plan({**CAPACITY, 'stream:projections': consumer}, mix, target_tps=110)
+
+        pattern = next(p for p in result['patterns'] if p['endpoint'] == 'stream:projections')
+        # 880 WCU over the 110 API requests measured with it
+        assert pattern['wcu_per_request'] == 8.0
+        assert pattern['wcu_per_second'] == pytest.approx(880.0)
+        assert result['patterns'][0] is pattern
+        assert result['tables']['projections']['wcu_per_second'] == pytest.approx(100.0 + 880.0)
+
+    def test_tables_are_sized_for_the_target(self):
+        mix = {'requests': {'/payments/authorize': 1}, 'requests_per_second': 10.0}
+        result = plan(CAPACITY, mix, target_tps=70, average_tps=7)
+
+        ledger = result['tables']['ledger']
+        assert ledger['wcu_per_second'] == pytest.approx(140.0)
+        assert ledger['provisioned_wcu'] == 200
+        assert ledger['provisioned_rcu'] == 1
+        # Billed on demand at the 7 TPS average: 14 WCU/s over a month
+        assert ledger['on_demand_monthly_cost'] == pytest.approx(14 * 730 * 3600 / 1e6 * 0.625, abs=0.01)
+        assert result['provisioned_monthly_cost'] > 0
+
+    def test_empty_load_test_is_rejected(self):
+        with pytest.raises(ValueError):
+            plan(CAPACITY, {'requests': {}, 'requests_per_second': 0.0}, target_tps=100)
@@ -0,0 +1,113 @@
+"""
+Unit tests for currency conversion
+
+This module tests exact conversion to the base currency, per-currency
+authorization limits, rate file reloads and base-currency report volumes.
+"""
+
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import handler
+from currency import RateTable, Rates, round_half_even
+from handler import app
+
+client = TestClient(app)
+
+RATES = {'USD': '1', 'EUR': '1.0852', 'JPY': '0.006712', 'KWD': '3.2551'}
+
+class TestConversion:
+    """Test exact integer conversion."""
+
+    def test_minor_units_are_converted_exactly(self):
+        table = RateTable('USD', RATES, 'test')
+        assert table.to_base(10000, 'EUR') == 10852        # 100.00 EUR
+        assert table.to_base(10000, 'JPY') == 6712         # 10,000 JPY, no minor unit
+        assert table.to_base(1000, 'KWD') == 326           # 1.000 KWD, three decimals
+        assert table.to_base(123456789012345678, 'EUR') == 133975307436197530
+
+    def test_rounding_is_half_even(self):
+        assert [round_half_even(n, 2) for n in (1, 3, 5, -1)] == [0, 2, 2, 0]
+        table = RateTable('USD', {'XTS': '0.5'}, 'test')
+        assert [table.to_base(amount, 'XTS') for amount in (1, 3, 5)] == [0, 2, 2]
+
+    def test_limits_are_exact_per_currency(self):
+        table = RateTable('USD', RATES, 'test', limit=1000000)
+        for currency in RATES:
+            limit = table.limits[currency]
+            numerator, denominator = table.ratios[currency]
+            assert limit * numerator <= 1000000 * denominator < (limit + 1) * numerator
+        assert table.limits['USD'] == 1000000
+
+    def test_convert_many_sums_per_currency_first(self):
+        rates = Rates()
+        amounts, currencies = [1, 1, 1, 500], ['JPY', 'JPY', 'JPY', 'USD']
+        # Row by row, each 1 JPY (0.6712 cents) rounds up to a cent; 3 JPY is 2.0136 cents
+        assert sum(rates.to_base(1, 'JPY') for _ in range(3)) == 3
+        assert rates.convert_many(amounts, currencies) == 502
+
+    def test_invalid_rates_are_rejected(self):
+        with pytest.raises(ValueError):
+            RateTable('USD', {'EUR': '-1'}, 'test')
+        with pytest.raises(ValueError):
+            RateTable('USD', {'USD': '1.1'}, 'test')
+
+class TestRateRefresh:
+    """Test periodic reloads from a rate file."""
+
+    def test_reload_after_refresh_interval(self, clock, tmp_path):
+        path = tmp_path / 'rates.json'
+        path.write_text(json.dumps({'base': 'USD', 'rates': {'EUR': '1.10'}}))
+        rates = Rates(str(path), refresh_seconds=60, clock=clock)
+        assert rates.to_base(100, 'EUR') == 110
+
+        path.write_text(json.dumps({'base': 'USD', 'rates': {'EUR': '1.20'}}))
+        clock.now = 59
+        assert rates.to_base(100, 'EUR') == 110
+        clock.now = 60
+        assert rates.to_base(100, 'EUR') == 120
+
+    def test_failed_reload_keeps_previous_table(self, clock, tmp_path):
+        path = tmp_path / 'rates.json'
+        path.write_text(json.dumps({'rates': {'EUR': '1.10'}}))
+        rates = Rates(str(path), refresh_seconds=60, clock=clock)
+
+        path.write_text('{not json')
+        clock.now = 120
+        assert rates.to_base(100, 'EUR') == 110
+        assert rates.within_limit(100, 'GBP') is None
+
+class TestAuthorizationLimit:
+    """Test the limit check and report volumes through the API."""
+
+    def test_limit_applies_in_base_currency(self, authorize, dynamodb_mock, sns_mock):
+        table = handler.rates.current()
+        assert authorize(amount=table.limits['EUR'], currency='EUR')['status'] == 'approved'
+        declined = authorize(amount=table.limits['EUR'] + 1, currency='EUR')
+        assert declined['status'] == 'declined'
+        assert declined['message'] == 'Amount exceeds limit'
+        # 1,000,000 JPY is far below $10,000
+        assert authorize(amount=1000000, currency='JPY')['status'] == 'approved'
+
+    def test_unsupported_currency_is_declined(self, authorize, dynamodb_mock, sns_mock):
+        response = authorize(amount=100, currency='XXX')
+        assert response['status'] == 'declined'
+        assert response['message'] == 'Unsupported currency'
+
+    def test_currency_codes_are_normalized(self, authorize, dynamodb_mock, sns_mock):
+        response = authorize(amount=100, currency='eur')
+        assert response['status'] == 'approved'
+        assert response['currency'] == 'EUR'
+
+    def test_report_volumes_are_in_base_currency(self, authorize, dynamodb_mock, sns_mock):
+        authorize(amount=10000, currency='EUR', merchant_id='merchant_fx_report')
+        authorize(amount=10000, currency='JPY', merchant_id='merchant_fx_report')
+        authorize(amount=2500, currency='USD', merchant_id='merchant_fx_report')
+
+        report = client.get("/merchants/merchant_fx_report/report").json()
+        expected = handler.rates.to_base(10000, 'EUR') + handler.rates.to_base(10000, 'JPY') + 2500
+        assert report['by_type']['authorization'] == {'count': 3, 'volume': expected}
+        assert report['volume_by_currency'] == {'EUR': 10000, 'JPY': 10000, 'USD': 2500}
+        assert report['base_currency'] == 'USD'
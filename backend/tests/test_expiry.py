@@ -0,0 +1,56 @@
+"""
+Unit tests for the TTL expiry engine
+
+This module tests that timing wheel deadlines are never early and at most
+one tick late across every wheel, rescheduling and cancellation, and
+catching up after a long idle period.
+"""
+
+import random
+import time
+
+from expiry import TimingWheel
+
+class TestTimingWheel:
+    """Test deadlines on the timing wheel."""
+
+    def test_expires_on_time_across_wheels(self):
+        wheel = TimingWheel(now=1000, slots=8, levels=3)
+        rng = random.Random(7)
+        # Up to 4x the wheels' 512-tick range, so top-level entries wrap and are placed again
+        deadlines = {n: 1000 + rng.uniform(0, 2048) for n in range(2000)}
+        for key, expires_at in deadlines.items():
+            wheel.schedule(key, expires_at)
+
+        expired_at = {}
+        for now in range(1001, 3050):
+            for key in wheel.advance(now):
+                expired_at[key] = now
+        assert expired_at.keys() == deadlines.keys()
+        for key, now in expired_at.items():
+            assert deadlines[key] <= now < deadlines[key] + 1
+        assert len(wheel) == 0
+
+    def test_reschedule_and_cancel(self):
+        wheel = TimingWheel(now=0)
+        wheel.schedule('moved', 10)
+        wheel.schedule('moved', 100)
+        wheel.schedule('cancelled', 10)
+        wheel.cancel('cancelled')
+        assert wheel.advance(50) == []
+        assert wheel.advance(100) == ['moved']
+
+    def test_past_deadlines_expire_on_next_advance(self):
+        wheel = TimingWheel(now=500)
+        wheel.schedule('late', 400)
+        assert wheel.pending(500)
+        assert wheel.advance(500) == ['late']
+        assert not wheel.pending(501)
+
+    def test_long_idle_period_is_skipped(self):
+        wheel = TimingWheel(now=0)
+        wheel.schedule('month', 30 * 86400)
+        started = time.perf_counter()
+        assert wheel.advance(30 * 86400 - 1) == []
+        assert wheel.advance(30 * 86400) == ['month']
+        assert time.perf_counter() - started < 0.1
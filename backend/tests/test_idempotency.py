@@ -21,6 +21,7 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
 
+from conftest import create_idempotency_table
 from handler import app, check_idempotency, store_idempotency_key, publish_webhook
 from fastapi.testclient import TestClient
 
@@ -74,6 +75,8 @@ def dynamodb_mock(aws_credentials):
             }
         )
         
+        create_idempotency_table(dynamodb)
+
         # Set environment variables
         os.environ['PAYMENTS_TABLE'] = 'payments-ledger'
         os.environ['WEBHOOK_TOPIC_ARN'] = 'arn:aws:sns:us-east-1:123456789012:test-topic'
@@ -0,0 +1,98 @@
+"""
+Unit tests for the dedicated idempotency store
+
+This module tests the Bloom filter of recent keys, result encoding, read
+skipping for first-time keys, and replays of keys claimed by another process.
+"""
+
+import json
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import handler
+from conftest import AUTHORIZATION
+from handler import app
+from idempotency import BloomFilter, IdempotencyStore, RecentKeys, decode_result, encode_result, key_hash
+
+client = TestClient(app)
+
+def other_process():
+    """A second store over the same table, with a filter of its own"""
+    return IdempotencyStore(handler.idempotency.table, RecentKeys(1000, 0.01))
+
+class TestRecentKeys:
+    """Test the filter's accuracy and aging."""
+
+    def test_false_positive_rate_near_target(self):
+        bloom = BloomFilter(10000, 0.01)
+        for i in range(10000):
+            bloom.add(key_hash(f"stored-{i}", "authorize"))
+
+        assert all(key_hash(f"stored-{i}", "authorize") in bloom for i in range(10000))
+        false_positives = sum(key_hash(f"new-{i}", "authorize") in bloom for i in range(20000))
+        assert false_positives / 20000 < 0.02
+        assert len(bloom.bits) == pytest.approx(10000 * 9.585 / 8, rel=0.01)
+
+    def test_oldest_generation_is_forgotten(self):
+        recent = RecentKeys(capacity=1000, false_positive_rate=0.001)
+        for i in range(1500):
+            recent.add(key_hash(str(i), "capture"))
+
+        assert sum(key_hash(str(i), "capture") in recent for i in range(500)) < 10
+        assert all(key_hash(str(i), "capture") in recent for i in range(500, 1500))
+        stats = recent.stats()
+        assert stats['keys'] == 1000
+        assert stats['estimated_false_positive_rate'] < 0.01
+
+    def test_result_encoding_is_compact(self):
+        result = {
+            "transaction_id": "auth_0123456789abcdef", "status": "approved", "amount": 2500, "currency": "USD",
+            "created_at": "2026-10-19T02:37:39.230234", "auth_id": "auth_0123456789ab",
+            "message": "Authorization successful"
+        }
+        encoded = encode_result(result)
+        assert decode_result(encoded) == result
+        assert len(encoded) < len(json.dumps(result, separators=(',', ':'))) / 2
+
+class TestIdempotencyFastPath:
+    """Test reads skipped and replays against the table."""
+
+    def test_first_time_key_skips_read(self, dynamodb_mock, sns_mock):
+        key = f"fresh-{uuid.uuid4()}"
+        skipped = handler.idempotency.reads_skipped
+        first = client.post("/payments/authorize", json=AUTHORIZATION, headers={"X-Idempotency-Key": key})
+        assert handler.idempotency.reads_skipped == skipped + 1
+
+        reads = handler.idempotency.reads
+        second = client.post("/payments/authorize", json=AUTHORIZATION, headers={"X-Idempotency-Key": key})
+        assert handler.idempotency.reads == reads + 1
+        assert second.json() == first.json()
+        assert "idempotency_filter" in client.get("/health").json()
+
+    def test_key_claimed_by_another_process_replays(self, dynamodb_mock, sns_mock):
+        key = f"elsewhere-{uuid.uuid4()}"
+        stored = {"transaction_id": "auth_stored", "status": "approved", "amount": 2500, "currency": "USD",
+                  "created_at": "2026-10-19T00:00:00", "auth_id": "auth_stored",
+                  "message": "Authorization successful"}
+        other_process().put(key, "authorize", stored)
+
+        response = client.post("/payments/authorize", json=AUTHORIZATION, headers={"X-Idempotency-Key": key})
+        assert response.status_code == 200
+        assert response.json()["transaction_id"] == "auth_stored"
+        # The cancelled transaction wrote no ledger rows
+        assert [row for row in dynamodb_mock.scan()["Items"] if row.get("type") == "authorization"] == []
+
+    def test_retried_full_capture_replays_instead_of_failing(self, monkeypatch, dynamodb_mock, sns_mock):
+        auth = client.post("/payments/authorize", json=AUTHORIZATION,
+                           headers={"X-Idempotency-Key": f"auth-{uuid.uuid4()}"}).json()
+        capture = {"auth_id": auth["auth_id"], "amount": 2500, "merchant_id": "merchant_123"}
+        key = f"full-capture-{uuid.uuid4()}"
+        first = client.post("/payments/capture", json=capture, headers={"X-Idempotency-Key": key}).json()
+
+        # Another process retries: its filter has never seen the key, and the balance is exhausted
+        monkeypatch.setattr(handler.idempotency, 'recent', RecentKeys(1000, 0.01))
+        retry = client.post("/payments/capture", json=capture, headers={"X-Idempotency-Key": key})
+        assert retry.status_code == 200
+        assert retry.json()["transaction_id"] == first["transaction_id"]
@@ -0,0 +1,150 @@
+"""
+Unit tests for the merchant/time secondary index
+
+This module tests bucket key generation and sharding, range enumeration
+and the paged merchant query and report endpoints.
+"""
+
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import handler
+import merchant_index
+from handler import app
+from merchant_index import bucket_periods, merchant_bucket
+
+client = TestClient(app)
+
+class TestBucketKeys:
+    """Test partition key layout."""
+
+    def test_default_bucket_is_monthly(self):
+        assert merchant_bucket("merchant_a", "2026-10-18T13:45:00") == "merchant_a#2026-10"
+
+    def test_hot_merchant_uses_hourly_buckets(self, monkeypatch):
+        monkeypatch.setitem(merchant_index.MERCHANT_BUCKET_OVERRIDES, "merchant_hot", [("", "hour", 1)])
+        assert merchant_bucket("merchant_hot", "2026-10-18T13:45:00") == "merchant_hot#2026-10-18T13"
+        assert bucket_periods("merchant_hot", "2026-10-18T22:10:00", "2026-10-19T01:00:00") == [
+            "merchant_hot#2026-10-18T22",
+            "merchant_hot#2026-10-18T23",
+            "merchant_hot#2026-10-19T00",
+            "merchant_hot#2026-10-19T01",
+        ]
+
+    def test_monthly_periods_cross_year(self):
+        assert bucket_periods("m", "2025-11-30T00:00:00", "2026-01-02T00:00:00") == [
+            "m#2025-11", "m#2025-12", "m#2026-01"
+        ]
+
+    def test_range_is_bounded(self, monkeypatch):
+        monkeypatch.setitem(merchant_index.MERCHANT_BUCKET_OVERRIDES, "merchant_hot", [("", "hour", 1)])
+        with pytest.raises(ValueError):
+            bucket_periods("merchant_hot", "2026-01-01T00:00:00", "2026-03-01T00:00:00")
+
+    def test_each_era_is_queried_with_its_own_granularity(self, monkeypatch):
+        monkeypatch.setattr(merchant_index, "MERCHANT_BUCKET_OVERRIDES",
+                            merchant_index._parse_overrides("merchant_hot:day@2026-10-30,merchant_hot:hour@2026-11-01"))
+        assert merchant_bucket("merchant_hot", "2026-10-18T13:45:00") == "merchant_hot#2026-10"
+        assert merchant_bucket("merchant_hot", "2026-10-30T13:45:00") == "merchant_hot#2026-10-30"
+        assert merchant_bucket("merchant_hot", "2026-11-01T13:45:00") == "merchant_hot#2026-11-01T13"
+        assert bucket_periods("merchant_hot", "2026-10-29T00:00:00", "2026-11-01T01:30:00") == [
+            "merchant_hot#2026-10",
+            "merchant_hot#2026-10-30",
+            "merchant_hot#2026-10-31",
+            "merchant_hot#2026-11-01",
+            "merchant_hot#2026-11-01T00",
+            "merchant_hot#2026-11-01T01",
+        ]
+
+    def test_sharded_buckets(self, monkeypatch):
+        monkeypatch.setattr(merchant_index, "MERCHANT_BUCKET_OVERRIDES",
+                            merchant_index._parse_overrides("merchant_hot:hour/4@2026-11-01"))
+        keys = {merchant_bucket("merchant_hot", "2026-11-01T13:45:00", f"auth_{n}") for n in range(40)}
+        assert keys == {"merchant_hot#2026-11-01T13"} | {f"merchant_hot#2026-11-01T13#shard{n}" for n in (1, 2, 3)}
+        # Stable per transaction
+        assert merchant_bucket("merchant_hot", "2026-11-01T13:45:00", "auth_1") == \
+            merchant_bucket("merchant_hot", "2026-11-01T13:50:00", "auth_1")
+        assert merchant_index.sharded_periods("merchant_hot", "2026-10-31T12:00:00", "2026-11-01T00:30:00") == [
+            ["merchant_hot#2026-10"],
+            ["merchant_hot#2026-11"],
+            ["merchant_hot#2026-11-01T00"] + [f"merchant_hot#2026-11-01T00#shard{n}" for n in (1, 2, 3)],
+        ]
+        with pytest.raises(ValueError):
+            merchant_index._parse_overrides("merchant_hot:hour/0")
+
+class TestMerchantEndpoints:
+    """Test index-driven reads through the API."""
+
+    def test_pages_through_merchant_transactions(self, authorize, dynamodb_mock, sns_mock):
+        created = [authorize(f"idx-{i}", merchant_id="merchant_idx")["transaction_id"] for i in range(3)]
+        authorize("idx-other", merchant_id="merchant_other")
+
+        first = client.get("/merchants/merchant_idx/transactions", params={"limit": 2}).json()
+        assert len(first["items"]) == 2
+        assert first["next_cursor"]
+
+        second = client.get(
+            "/merchants/merchant_idx/transactions", params={"limit": 2, "cursor": first["next_cursor"]}
+        ).json()
+        seen = [item["transaction_id"] for item in first["items"] + second["items"]]
+        assert sorted(seen) == sorted(created)
+        assert second["next_cursor"] is None
+
+    def test_merchant_report(self, authorize, dynamodb_mock, sns_mock):
+        authorize("report-1", merchant_id="merchant_report", amount=1000)
+        authorize("report-2", merchant_id="merchant_report", amount=1500000)
+
+        report = client.get("/merchants/merchant_report/report").json()
+        assert report["total_transactions"] == 2
+        assert report["by_type"]["authorization"] == {"count": 2, "volume": 1501000}
+        assert report["by_status"] == {"approved": 1, "declined": 1}
+
+    def test_history_survives_a_promotion(self, authorize, dynamodb_mock, sns_mock, monkeypatch):
+        before = [authorize(f"promoted-{i}", merchant_id="merchant_promoted")["transaction_id"] for i in range(2)]
+        # Promoted to hourly buckets from now on: the monthly rows stay readable
+        monkeypatch.setattr(merchant_index, "MERCHANT_BUCKET_OVERRIDES",
+                            merchant_index._parse_overrides(f"merchant_promoted:hour@{datetime.utcnow().isoformat()}"))
+        after = authorize("promoted-2", merchant_id="merchant_promoted")["transaction_id"]
+
+        items = client.get("/merchants/merchant_promoted/transactions").json()["items"]
+        assert sorted(item["transaction_id"] for item in items) == sorted(before + [after])
+        assert client.get("/merchants/merchant_promoted/report").json()["total_transactions"] == 3
+
+    def test_sharded_buckets_are_merged_in_time_order(self, authorize, dynamodb_mock, sns_mock, monkeypatch):
+        monkeypatch.setattr(merchant_index, "MERCHANT_BUCKET_OVERRIDES",
+                            merchant_index._parse_overrides("merchant_sharded:hour/4"))
+        created = [authorize(f"sharded-{i}", merchant_id="merchant_sharded")["transaction_id"] for i in range(9)]
+
+        page = client.get("/merchants/merchant_sharded/transactions",
+                          params={"fields": "transaction_id,created_at"}).json()
+        assert all(set(item) == {"transaction_id", "created_at"} for item in page["items"])
+        assert sorted(item["transaction_id"] for item in page["items"]) == sorted(created)
+        assert [item["created_at"] for item in page["items"]] == \
+            sorted((item["created_at"] for item in page["items"]), reverse=True)
+
+        # Shards that are only partly taken resume from their last taken item
+        start, end = handler.default_range(None, None)
+        seen = list(merchant_index.iter_merchant_transactions(handler.table, "merchant_sharded", start, end,
+                                                              page_size=2, fields=["transaction_id"]))
+        assert [item["transaction_id"] for item in seen] == created
+        assert client.get("/merchants/merchant_sharded/report").json()["total_transactions"] == 9
+
+    def test_invalid_cursor_is_rejected(self, dynamodb_mock):
+        response = client.get("/merchants/merchant_idx/transactions", params={"cursor": "not-a-cursor"})
+        assert response.status_code == 400
+
+    def test_fields_are_projected_by_dynamodb(self, authorize, dynamodb_mock, sns_mock):
+        authorize("fields-1", merchant_id="merchant_fields", amount=1234)
+
+        response = client.get(
+            "/merchants/merchant_fields/transactions", params={"fields": "transaction_id,amount"}
+        )
+        assert response.status_code == 200
+        item, = response.json()["items"]
+        assert set(item) == {"transaction_id", "amount"}
+        assert item["amount"] == 1234
+
+        response = client.get("/merchants/merchant_fields/transactions", params={"fields": "amount;drop"})
+        assert response.status_code == 400
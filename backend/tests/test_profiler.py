@@ -0,0 +1,77 @@
+"""
+Unit tests for the on-demand sampling profiler
+
+This module tests request selection (by sample rate or header, with the
+profiler enabled or not), the threshold filter and the collapsed-stack
+output and metadata written by the profiler middleware.
+"""
+
+import json
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+import profiler
+from handler import app
+
+client = TestClient(app)
+
+@pytest.fixture
+def profiler_enabled(monkeypatch, tmp_path):
+    """Enable the profiler with output to a temporary directory."""
+    monkeypatch.setattr(profiler, 'PROFILER_ENABLED', True)
+    monkeypatch.setattr(profiler, 'PROFILER_SAMPLE_RATE', 1.0)
+    monkeypatch.setattr(profiler, 'PROFILER_THRESHOLD_MS', 0.0)
+    monkeypatch.setattr(profiler, 'PROFILER_OUTPUT_DIR', str(tmp_path))
+    yield tmp_path
+
+class TestProfilerMiddleware:
+    """Test which requests are profiled."""
+
+    def test_disabled_writes_nothing(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(profiler, 'PROFILER_OUTPUT_DIR', str(tmp_path))
+        client.get("/health")
+        assert list(tmp_path.iterdir()) == []
+
+    def test_sampled_request_writes_profile(self, profiler_enabled):
+        client.get("/health")
+        metadata_files = list(profiler_enabled.glob("*.json"))
+        assert len(metadata_files) == 1
+        metadata = json.loads(metadata_files[0].read_text())
+        assert metadata['path'] == '/health'
+        assert metadata['status_code'] == 200
+        assert metadata['concurrent_tasks'] >= 1
+        assert (profiler_enabled / f"{metadata['profile_id']}.collapsed").exists()
+
+    def test_fast_request_below_threshold_is_dropped(self, profiler_enabled, monkeypatch):
+        monkeypatch.setattr(profiler, 'PROFILER_THRESHOLD_MS', 60_000.0)
+        client.get("/health")
+        assert list(profiler_enabled.iterdir()) == []
+
+    def test_header_forces_profile(self, profiler_enabled, monkeypatch):
+        monkeypatch.setattr(profiler, 'PROFILER_SAMPLE_RATE', 0.0)
+        monkeypatch.setattr(profiler, 'PROFILER_ALLOW_HEADER', True)
+        client.get("/health", headers={"X-Profile": "1"})
+        assert len(list(profiler_enabled.glob("*.json"))) == 1
+
+    def test_header_profiles_while_disabled(self, monkeypatch, tmp_path):
+        monkeypatch.setattr(profiler, 'PROFILER_OUTPUT_DIR', str(tmp_path))
+        monkeypatch.setattr(profiler, 'PROFILER_THRESHOLD_MS', 60_000.0)
+        client.get("/health", headers={"X-Profile": "1"})
+        assert list(tmp_path.iterdir()) == []
+
+        monkeypatch.setattr(profiler, 'PROFILER_ALLOW_HEADER', True)
+        client.get("/health", headers={"X-Profile": "1"})
+        client.get("/health")
+        assert len(list(tmp_path.glob("*.json"))) == 1
+
+class TestCollapsedStacks:
+    """Test stack formatting."""
+
+    def test_collapse_stack_is_root_first(self):
+        def inner():
+            return profiler.collapse_stack(sys._getframe())
+        stack = inner()
+        assert stack.endswith("test_profiler.py:inner")
+        assert "test_profiler.py:test_collapse_stack_is_root_first;" in stack
@@ -0,0 +1,145 @@
+"""
+Unit tests for the read projections
+
+This module tests the dashboard read endpoints, exactly-once application
+of ledger stream records, status moves on settlement, the change feeds
+and webhook delivery records.
+"""
+
+import json
+
+from boto3.dynamodb.types import TypeSerializer
+from fastapi.testclient import TestClient
+
+import handler
+import projections
+from handler import app
+from telemetry import CapacityUsage, current_timer
+from test_telemetry import emf_records
+
+client = TestClient(app)
+
+serializer = TypeSerializer()
+
+def stream_record(sequence, new, old=None):
+    change = {
+        'SequenceNumber': str(sequence),
+        'NewImage': {name: serializer.serialize(value) for name, value in new.items()},
+    }
+    if old is not None:
+        change['OldImage'] = {name: serializer.serialize(value) for name, value in old.items()}
+    return {'eventName': 'MODIFY' if old else 'INSERT', 'dynamodb': change}
+
+class NoLedger:
+    """Fails any use, to prove a read never touches the ledger"""
+
+    def __getattr__(self, name):
+        raise AssertionError(f"ledger accessed: {name}")
+
+class TestReadEndpoints:
+    """Test reads served from the projections."""
+
+    def test_reads_never_touch_the_ledger(self, authorize, monkeypatch, dynamodb_mock, sns_mock):
+        first = authorize(merchant_id="merchant_reads", amount=1000)
+        second = authorize(merchant_id="merchant_other", amount=3000)
+        monkeypatch.setattr(handler, 'table', NoLedger())
+
+        listed = client.get("/transactions", params={"fields": "transaction_id,amount"}).json()
+        assert listed['items'] == [
+            {'transaction_id': second['transaction_id'], 'amount': 3000},
+            {'transaction_id': first['transaction_id'], 'amount': 1000},
+        ]
+
+        metrics = client.get("/metrics").json()
+        assert metrics['total_transactions'] == 2
+        assert metrics['total_volume'] == 4000
+        assert metrics['active_merchants'] == 2
+        assert metrics['daily_volume'][-1] == 4000
+        assert metrics['transaction_types'] == [{'type': 'authorization', 'count': 2}]
+
+        totals = client.get("/merchants/merchant_reads/totals").json()
+        assert totals['by_status'] == {'approved': 1}
+        assert client.get("/merchants/merchant_none/totals").status_code == 404
+
+    def test_invalid_cursor_is_rejected(self, dynamodb_mock):
+        assert client.get("/transactions", params={"cursor": "not-a-cursor"}).status_code == 400
+
+class TestStreamConsumer:
+    """Test applying ledger stream records."""
+
+    def test_redelivery_counts_once_and_settlement_moves_status(self, dynamodb_mock, sns_mock):
+        row = {
+            'transaction_id': 'capture_1', 'created_at': '2026-10-19T10:00:00', 'type': 'capture',
+            'status': 'completed', 'amount': 500, 'currency': 'USD', 'merchant_id': 'merchant_stream'
+        }
+        balance = {'transaction_id': 'capture_1', 'created_at': 'balance', 'type': 'capture_balance'}
+        inserts = {'Records': [stream_record(100, row), stream_record(101, balance)]}
+        assert projections.lambda_handler(inserts, None) == {'batchItemFailures': []}
+        projections.lambda_handler(inserts, None)
+        settled = {'Records': [stream_record(200, {**row, 'status': 'settled'}, old=row)]}
+        projections.lambda_handler(settled, None)
+        projections.lambda_handler(settled, None)
+
+        totals = handler.projections.merchant_totals('merchant_stream')
+        assert totals['total_transactions'] == 1
+        assert totals['total_volume'] == 500
+        assert totals['by_status'] == {'settled': 1}
+        assert client.get("/transactions").json()['items'][0]['status'] == 'settled'
+
+    def test_batches_report_consumed_capacity(self, dynamodb_mock, sns_mock, monkeypatch, capsys):
+        usage = CapacityUsage()
+        monkeypatch.setattr('telemetry.capacity_usage', usage)
+        transact = projections.ProjectionStore._transact
+
+        def charged(store, items):
+            # moto reports no capacity for transactions; DynamoDB charges 2 WCU per item
+            current_timer().consume(projections.PROJECTIONS_TABLE, 0.0, 2.0 * len(items))
+            return transact(store, items)
+
+        monkeypatch.setattr(projections.ProjectionStore, '_transact', charged)
+        rows = [{
+            'transaction_id': f"auth_{n}", 'created_at': '2026-10-19T10:00:00', 'type': 'authorization',
+            'status': 'approved', 'amount': 500, 'currency': 'USD', 'merchant_id': 'merchant_stream'
+        } for n in range(3)]
+        projections.lambda_handler({'Records': [stream_record(300 + n, row) for n, row in enumerate(rows)]}, None)
+
+        record = next(r for r in emf_records(capsys.readouterr().out) if r.get('endpoint') == projections.STREAM_CONSUMER)
+        assert record['consumed_capacity']['requests'] == 3
+        # At least one 4-item transaction per row
+        assert record['projection_write_wcu'][0] >= 3 * 4 * 2.0
+        consumed = usage.stats()[projections.STREAM_CONSUMER]
+        assert consumed['requests'] == 3
+        assert consumed['tables'][projections.PROJECTIONS_TABLE]['wcu'] == record['total_wcu'][0]
+
+class TestChangeFeeds:
+    """Test syncing through the projection change feeds."""
+
+    def test_sync_returns_only_changes(self, authorize, monkeypatch, dynamodb_mock, sns_mock):
+        monkeypatch.setattr(projections, 'CHANGE_FEED_LAG_SECONDS', 0)
+        first = authorize()
+        snapshot = client.get("/transactions/changes", params={"fields": "status"}).json()
+        assert snapshot['reset']
+        assert snapshot['items'] == [{'transaction_id': first['transaction_id'], 'status': 'approved'}]
+
+        idle = client.get("/transactions/changes", params={"since": snapshot['cursor']}).json()
+        assert idle['items'] == [] and not idle['reset']
+
+        second = authorize()
+        delta = client.get("/transactions/changes", params={"since": idle['cursor']}).json()
+        assert [t['transaction_id'] for t in delta['items']] == [second['transaction_id']]
+
+        events = client.get("/webhooks/events/changes").json()['items']
+        assert {e['transaction_id'] for e in events} == {first['transaction_id'], second['transaction_id']}
+        assert {e['status'] for e in events} == {'delivered'}
+
+    def test_webhook_consumer_records_deliveries_once(self, dynamodb_mock):
+        message = {'payload': {'event_type': 'payment_captured', 'timestamp': '2026-10-19T10:00:00',
+                               'data': {'transaction_id': 'capture_2'}}, 'signature': 'sig'}
+        event = {'Records': [{'Sns': {'MessageId': 'msg-1', 'Message': json.dumps(message)}}]}
+        projections.webhook_handler(event, None)
+        projections.webhook_handler(event, None)
+
+        items = client.get("/webhooks/events").json()['items']
+        assert len(items) == 1
+        assert items[0]['event_id'] == 'msg-1'
+        assert items[0]['event_type'] == 'payment_captured'
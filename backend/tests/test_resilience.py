@@ -0,0 +1,221 @@
+"""
+Fault-injection tests for AWS client resilience
+
+This module points guarded clients at a local stand-in HTTP endpoint that
+hangs or fails on demand, and checks timeouts, circuit breaking, the
+webhook outbox and the 503 fallback on payment routes.
+"""
+
+import gc
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from botocore.exceptions import ClientError, ReadTimeoutError
+from fastapi.testclient import TestClient
+
+import aws_clients
+import handler
+from aws_clients import (
+    BudgetExhausted, CircuitBreaker, CircuitOpenError, GuardedClient, GuardedTable, call_timeout
+)
+from handler import app
+
+client = TestClient(app)
+
+SNS_PUBLISH_OK = (
+    '<PublishResponse xmlns="http://sns.amazonaws.com/doc/2010-03-31/">'
+    '<PublishResult><MessageId>stand-in</MessageId></PublishResult>'
+    '<ResponseMetadata><RequestId>stand-in</RequestId></ResponseMetadata>'
+    '</PublishResponse>'
+)
+SNS_INTERNAL_ERROR = (
+    '<ErrorResponse xmlns="http://sns.amazonaws.com/doc/2010-03-31/">'
+    '<Error><Type>Receiver</Type><Code>InternalError</Code><Message>injected</Message></Error>'
+    '<RequestId>stand-in</RequestId></ErrorResponse>'
+)
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.server.requests += 1
+        mode = self.server.mode
+        if mode == 'hang':
+            time.sleep(1.0)
+            return
+        is_sns = 'sns' in self.headers.get('Authorization', '')
+        if mode == 'error' and is_sns:
+            self.reply(500, 'text/xml', SNS_INTERNAL_ERROR)
+        elif mode == 'error':
+            self.reply(500, 'application/x-amz-json-1.0',
+                       {'__type': 'com.amazonaws.dynamodb.v20120810#InternalServerError', 'message': 'injected'})
+        elif mode == 'conditional':
+            self.reply(400, 'application/x-amz-json-1.0',
+                       {'__type': 'com.amazonaws.dynamodb.v20120810#ConditionalCheckFailedException', 'message': 'no'})
+        elif is_sns:
+            self.reply(200, 'text/xml', SNS_PUBLISH_OK)
+        else:
+            self.reply(200, 'application/x-amz-json-1.0', {})
+
+    def reply(self, status, content_type, body):
+        payload = body if isinstance(body, str) else json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        try:
+            self.wfile.write(payload.encode('utf-8'))
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    """Local HTTP endpoint standing in for DynamoDB and SNS"""
+    monkeypatch.setattr(aws_clients, 'AWS_MAX_ATTEMPTS', 1)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    server.mode = 'ok'
+    server.requests = 0
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    # Build the clients up front so their construction does not eat the short budget
+    for tier in aws_clients.READ_TIMEOUT_TIERS:
+        aws_clients.resource('dynamodb', tier, server.url)
+        aws_clients.client('sns', tier, server.url)
+    token = aws_clients._deadline.set(time.monotonic() + 0.5)
+    yield server
+    aws_clients._deadline.reset(token)
+    server.shutdown()
+    server.server_close()
+
+class TestCallTimeout:
+    """Test timeout tiers derived from the request budget."""
+
+    def test_no_deadline_uses_largest_tier(self):
+        assert call_timeout() == aws_clients.READ_TIMEOUT_TIERS[-1]
+
+    def test_tier_shrinks_with_budget(self, monkeypatch):
+        monkeypatch.setattr(aws_clients, 'AWS_MAX_ATTEMPTS', 2)
+        token = aws_clients._deadline.set(time.monotonic() + 2.5)
+        try:
+            assert call_timeout() == 1.0
+        finally:
+            aws_clients._deadline.reset(token)
+
+    def test_exhausted_budget_fails_fast(self):
+        token = aws_clients._deadline.set(time.monotonic() + 0.01)
+        try:
+            with pytest.raises(BudgetExhausted):
+                call_timeout()
+        finally:
+            aws_clients._deadline.reset(token)
+
+class TestCircuitBreaker:
+    """Test breaker transitions against injected faults."""
+
+    def test_hanging_dependency_opens_circuit(self, stand_in):
+        stand_in.mode = 'hang'
+        breaker = CircuitBreaker('dynamodb', failure_threshold=2, reset_seconds=60)
+        table = GuardedTable('payments-ledger', breaker, endpoint_url=stand_in.url)
+
+        for _ in range(2):
+            started = time.monotonic()
+            with pytest.raises(ReadTimeoutError):
+                table.get_item(Key={'transaction_id': 'x', 'created_at': 'y'})
+            assert time.monotonic() - started < 0.9
+
+        assert breaker.state == 'open'
+        # Collect first so a full GC pass over the suite's heap is not timed
+        gc.collect()
+        started = time.monotonic()
+        with pytest.raises(CircuitOpenError):
+            table.get_item(Key={'transaction_id': 'x', 'created_at': 'y'})
+        assert time.monotonic() - started < 0.05
+        assert stand_in.requests == 2
+
+    def test_half_open_probe_closes_circuit(self, clock, stand_in):
+        stand_in.mode = 'error'
+        breaker = CircuitBreaker('dynamodb', failure_threshold=1, reset_seconds=10, clock=clock)
+        table = GuardedTable('payments-ledger', breaker, endpoint_url=stand_in.url)
+
+        with pytest.raises(ClientError):
+            table.get_item(Key={'transaction_id': 'x', 'created_at': 'y'})
+        assert breaker.state == 'open'
+
+        stand_in.mode = 'ok'
+        clock.now = 10
+        table.get_item(Key={'transaction_id': 'x', 'created_at': 'y'})
+        assert breaker.state == 'closed'
+        assert breaker.counters['opened'] == 1
+
+    def test_failed_probe_reopens_circuit(self, clock, stand_in):
+        stand_in.mode = 'error'
+        breaker = CircuitBreaker('dynamodb', failure_threshold=1, reset_seconds=10, clock=clock)
+        table = GuardedTable('payments-ledger', breaker, endpoint_url=stand_in.url)
+
+        with pytest.raises(ClientError):
+            table.get_item(Key={'transaction_id': 'x', 'created_at': 'y'})
+        clock.now = 10
+        with pytest.raises(ClientError):
+            table.get_item(Key={'transaction_id': 'x', 'created_at': 'y'})
+        assert breaker.state == 'open'
+        with pytest.raises(CircuitOpenError):
+            table.get_item(Key={'transaction_id': 'x', 'created_at': 'y'})
+
+    def test_client_errors_do_not_trip_circuit(self, stand_in):
+        stand_in.mode = 'conditional'
+        breaker = CircuitBreaker('dynamodb', failure_threshold=1, reset_seconds=60)
+        table = GuardedTable('payments-ledger', breaker, endpoint_url=stand_in.url)
+
+        with pytest.raises(ClientError):
+            table.put_item(Item={'transaction_id': 'x', 'created_at': 'y'})
+        assert breaker.state == 'closed'
+
+class TestFallbacks:
+    """Test the webhook outbox and storage fail-fast paths."""
+
+    def test_webhooks_queue_while_sns_is_down(self, clock, stand_in, monkeypatch):
+        breaker = CircuitBreaker('sns', failure_threshold=1, reset_seconds=10, clock=clock)
+        sns = GuardedClient(lambda timeout: aws_clients.client('sns', timeout, stand_in.url), breaker)
+        monkeypatch.setattr(handler, 'sns', sns)
+        monkeypatch.setattr(handler, 'webhook_outbox', deque(maxlen=10))
+
+        stand_in.mode = 'error'
+        handler.publish_webhook('payment_authorized', {'transaction_id': 'a'})
+        handler.publish_webhook('payment_authorized', {'transaction_id': 'b'})
+        assert len(handler.webhook_outbox) == 2
+        assert stand_in.requests == 1
+
+        stand_in.mode = 'ok'
+        clock.now = 10
+        handler.publish_webhook('payment_authorized', {'transaction_id': 'c'})
+        assert len(handler.webhook_outbox) == 0
+        assert stand_in.requests == 4
+
+    def test_open_storage_circuit_returns_503(self, stand_in, monkeypatch):
+        breaker = CircuitBreaker('dynamodb', failure_threshold=1, reset_seconds=60)
+        breaker.record_failure()
+        monkeypatch.setattr(handler, 'table', GuardedTable('payments-ledger', breaker, endpoint_url=stand_in.url))
+
+        response = client.post(
+            "/payments/authorize",
+            json={
+                "amount": 1000,
+                "card_number": "4242424242424242",
+                "card_holder": "John Doe",
+                "expiry_month": 12,
+                "expiry_year": 2025,
+                "cvv": "123",
+                "merchant_id": "merchant_123"
+            },
+            headers={"X-Idempotency-Key": "resilience-503"}
+        )
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert stand_in.requests == 0
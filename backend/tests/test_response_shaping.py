@@ -0,0 +1,86 @@
+"""
+Unit tests for response shaping
+
+This module tests ?fields= parsing and projection, Accept-Encoding
+negotiation, and the compression middleware thresholds.
+"""
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+from response_shaping import (
+    CompressionMiddleware, choose_encoding, json_response, parse_fields, project, projection_expression
+)
+
+class TestProjection:
+    """Test field parsing and projection."""
+
+    def test_parse_fields(self):
+        assert parse_fields(None) is None
+        assert parse_fields(" ") is None
+        assert parse_fields("amount, status,amount") == ["amount", "status"]
+        with pytest.raises(ValueError):
+            parse_fields("amount,#status")
+
+    def test_project(self):
+        items = [{"a": 1, "b": 2, "c": 3}, {"a": 4}]
+        assert project(items, ["a", "b"]) == [{"a": 1, "b": 2}, {"a": 4}]
+        assert project(items, None) == items
+
+    def test_projection_expression(self):
+        assert projection_expression(["status", "amount"]) == {
+            "ProjectionExpression": "#p0, #p1",
+            "ExpressionAttributeNames": {"#p0": "status", "#p1": "amount"}
+        }
+        assert projection_expression(None) == {}
+
+class TestCompression:
+    """Test encoding negotiation and the middleware."""
+
+    def test_choose_encoding(self):
+        assert choose_encoding("") is None
+        assert choose_encoding("identity") is None
+        assert choose_encoding("gzip, deflate") == "gzip"
+        assert choose_encoding("gzip;q=0") is None
+        assert choose_encoding("*") in ("br", "gzip")
+
+    def make_client(self):
+        app = FastAPI()
+        app.add_middleware(CompressionMiddleware, minimum_size=100)
+
+        @app.get("/large")
+        async def large():
+            return json_response([{"id": i, "status": "approved"} for i in range(50)])
+
+        @app.get("/small")
+        async def small():
+            return json_response({"ok": True})
+
+        @app.get("/stream")
+        async def stream():
+            return StreamingResponse(iter([b"a" * 200, b"b" * 200]), media_type="application/x-ndjson")
+
+        return TestClient(app)
+
+    def test_large_responses_are_compressed(self):
+        client = self.make_client()
+        response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        # httpx decodes the body; the wire length is the compressed size
+        assert int(response.headers["content-length"]) < len(response.content)
+        assert response.json()[49] == {"id": 49, "status": "approved"}
+
+    def test_small_and_streamed_responses_pass_through(self):
+        client = self.make_client()
+        assert "content-encoding" not in client.get("/small", headers={"Accept-Encoding": "gzip"}).headers
+        streamed = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+        assert "content-encoding" not in streamed.headers
+        assert streamed.content == b"a" * 200 + b"b" * 200
+
+    def test_identity_clients_get_plain_bodies(self):
+        client = self.make_client()
+        response = client.get("/large", headers={"Accept-Encoding": "identity"})
+        assert "content-encoding" not in response.headers
@@ -0,0 +1,120 @@
+"""
+Unit tests for velocity risk scoring
+
+This module tests the sliding-window sketches, rule evaluation and its CPU
+budget, declines through the authorize endpoint, and the latency the stage
+adds at peak rate.
+"""
+
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+import handler
+from handler import app
+from risk import RiskEngine, Rule, SlidingCountMin, velocity_keys
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'load_tests'))
+
+from risk_benchmark import run as run_benchmark
+
+client = TestClient(app)
+
+# Card the API velocity tests reuse until a rule trips
+RISKY_CARD = {
+    "card_number": "4000056655665556", "card_holder": "Risky Holder", "merchant_id": "merchant_risk"
+}
+
+def card_keys(card_number="4242424242424242", holder="John Doe", merchant_id="merchant_risk", amount=2500):
+    return velocity_keys(card_number, holder, merchant_id, amount, "USD")
+
+class TestSlidingCountMin:
+    """Test windowed counting and decay."""
+
+    def test_counts_within_window_then_decays(self):
+        sketch = SlidingCountMin(window_seconds=60, slots=6, width=1024, depth=4)
+        positions = sketch.positions(12345, 678)
+        for second in range(10):
+            count = sketch.add(positions, 1000.0 + second)
+        assert count == 10
+
+        # 65s after the first event, its slot is half outside the window
+        assert sketch.add(positions, 1065.0) == pytest.approx(1 + 10 * 0.5)
+        # Two minutes on, only the new events remain
+        assert sketch.add(positions, 1130.0) == pytest.approx(1)
+
+    def test_other_keys_rarely_inflate_a_count(self, clock):
+        engine = RiskEngine([Rule('card', 'card', 60, 5, width=4096)], enabled=True, mode='enforce', clock=clock)
+        for i in range(5000):
+            engine.score(card_keys(card_number=f"{i:016d}", holder=f"holder {i}"))
+        assert engine.declined <= 5
+
+class TestRiskEngine:
+    """Test rule evaluation."""
+
+    def test_card_velocity_declines_after_limit(self, clock):
+        engine = RiskEngine([Rule('card_per_minute', 'card', 60, 3)], enabled=True, mode='enforce', clock=clock)
+        decisions = []
+        for _ in range(5):
+            clock.now += 1
+            decisions.append(engine.score(card_keys()))
+        assert decisions == [None, None, None, 'card_per_minute', 'card_per_minute']
+
+        # Same last 4 digits and holder, however the holder is spaced or cased
+        assert engine.score(card_keys(card_number="5555555555554242", holder="  JOHN   doe ")) == 'card_per_minute'
+        assert engine.score(card_keys(holder="Jane Doe")) is None
+
+        clock.now += 120
+        assert engine.score(card_keys()) is None
+        assert engine.stats()['declines_by_rule'] == {'card_per_minute': 3}
+
+    def test_first_broken_rule_in_table_order(self, clock):
+        rules = [Rule('merchant_burst', 'merchant', 10, 2), Rule('repeated_amount', 'amount', 60, 2)]
+        engine = RiskEngine(rules, enabled=True, clock=clock)
+        results = [engine.score(card_keys(card_number=f"{i:016d}")) for i in range(3)]
+        assert results == [None, None, 'merchant_burst']
+
+    def test_budget_exceeded_fails_open(self, clock):
+        engine = RiskEngine([Rule('card_per_minute', 'card', 60, 0)], enabled=True, budget_ms=-1, clock=clock)
+        assert engine.score(card_keys()) is None
+        assert engine.stats()['budget_exceeded'] == 1
+
+    def test_disabled_engine_counts_nothing(self):
+        engine = RiskEngine([Rule('card_per_minute', 'card', 60, 0)], enabled=False)
+        assert engine.score(card_keys()) is None
+        assert engine.evaluated == 0
+
+class TestAuthorizeRisk:
+    """Test the risk stage in the authorize endpoint."""
+
+    def test_velocity_decline_is_recorded(self, authorize, monkeypatch, dynamodb_mock, sns_mock):
+        monkeypatch.setattr(handler, 'risk', RiskEngine([Rule('card_per_minute', 'card', 60, 2)], enabled=True,
+                                                          mode='enforce'))
+        assert [authorize(**RISKY_CARD)['status'] for _ in range(3)] == ['approved', 'approved', 'declined']
+        declined = authorize(**RISKY_CARD)
+        assert declined['message'] == 'Declined by risk rules'
+
+        item = dynamodb_mock.get_item(
+            Key={'transaction_id': declined['transaction_id'], 'created_at': declined['created_at']}
+        )['Item']
+        assert item['risk_rule'] == 'card_per_minute'
+        assert client.get("/health").json()['risk']['declined'] == 2
+
+    def test_log_mode_flags_without_declining(self, authorize, monkeypatch, dynamodb_mock, sns_mock):
+        monkeypatch.setattr(handler, 'risk', RiskEngine([Rule('card_per_minute', 'card', 60, 2)], enabled=True))
+        assert [authorize(**RISKY_CARD)['status'] for _ in range(4)] == ['approved'] * 4
+        flagged = authorize(**RISKY_CARD)
+
+        item = dynamodb_mock.get_item(
+            Key={'transaction_id': flagged['transaction_id'], 'created_at': flagged['created_at']}
+        )['Item']
+        assert item['risk_rule'] == 'card_per_minute'
+        risk = client.get("/health").json()['risk']
+        assert (risk['mode'], risk['declined'], risk['flagged']) == ('log', 0, 3)
+
+    def test_stage_adds_well_under_a_millisecond_at_peak(self):
+        result = run_benchmark(tps=1000, seconds=30)
+        assert result['p99_ms'] < 1.0
+        assert result['false_decline_rate'] == 0.0
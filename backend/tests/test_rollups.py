@@ -0,0 +1,72 @@
+"""
+Unit tests for time-series rollups
+
+This module tests bucketing at each resolution, grouped totals,
+retention-based downsampling and automatic resolution selection.
+"""
+
+import pytest
+
+from conftest import FakeClock
+from rollups import RollupStore, to_epoch
+
+NOW = '2026-10-18T12:00:00'
+
+def transaction(created_at, amount=100, type_='capture', status='completed', merchant_id='merchant_a'):
+    return {'created_at': created_at, 'amount': amount, 'type': type_, 'status': status, 'merchant_id': merchant_id}
+
+class TestRollupStore:
+    """Test rollup writes and queries."""
+
+    def test_buckets_at_every_resolution(self):
+        rollups = RollupStore(clock=FakeClock(to_epoch(NOW)))
+        rollups.record(transaction('2026-10-18T11:58:10', amount=100))
+        rollups.record(transaction('2026-10-18T11:58:50', amount=200))
+        rollups.record(transaction('2026-10-18T11:59:30', amount=400, type_='refund'))
+
+        minutes = rollups.query('2026-10-18T11:57:00', '2026-10-18T11:59:59', resolution='minute')
+        assert [(p['start'][11:16], p['count'], p['volume']) for p in minutes['points']] == [
+            ('11:57', 0, 0), ('11:58', 2, 300), ('11:59', 1, 400)
+        ]
+        hours = rollups.query('2026-10-18T11:00:00', '2026-10-18T11:59:59', resolution='hour', group_by='type')
+        assert hours['points'][0]['groups'] == {
+            'capture': {'count': 2, 'volume': 300},
+            'refund': {'count': 1, 'volume': 400}
+        }
+        days = rollups.query('2026-10-18T00:00:00', NOW, resolution='day')
+        assert days['points'][0]['volume'] == 700
+
+    def test_totals_by_merchant(self):
+        rollups = RollupStore(clock=FakeClock(to_epoch(NOW)))
+        for merchant_id, amount in (('a', 100), ('b', 200), ('a', 300)):
+            rollups.record(transaction('2026-10-17T09:00:00', amount=amount, merchant_id=merchant_id))
+
+        totals = rollups.totals('2026-10-11T00:00:00', NOW, 'merchant', resolution='day')
+        assert totals == {'a': {'count': 2, 'volume': 400}, 'b': {'count': 1, 'volume': 200}}
+
+    def test_old_fine_buckets_are_downsampled(self):
+        clock = FakeClock(to_epoch(NOW))
+        rollups = RollupStore(clock=clock)
+        rollups.record(transaction('2026-10-18T11:00:00'))
+        rollups.record(transaction('2026-10-10T11:00:00'))
+        assert len(rollups.buckets['minute']) == 1
+
+        clock.now = to_epoch('2026-10-20T12:00:00')
+        rollups.record(transaction('2026-10-20T11:59:00'))
+        assert sorted(rollups.buckets['minute']) == [int(to_epoch('2026-10-20T11:59:00'))]
+        assert rollups.query('2026-10-18T00:00:00', '2026-10-18T23:59:59', resolution='day')['points'][0]['count'] == 1
+
+    def test_automatic_resolution(self):
+        rollups = RollupStore(clock=FakeClock(to_epoch(NOW)))
+        assert rollups.query('2026-10-18T10:00:00', NOW)['resolution'] == 'minute'
+        assert rollups.query('2026-10-10T00:00:00', NOW)['resolution'] == 'hour'
+        assert rollups.query('2026-08-01T00:00:00', NOW)['resolution'] == 'day'
+
+    def test_invalid_queries(self):
+        rollups = RollupStore(clock=FakeClock(to_epoch(NOW)))
+        with pytest.raises(ValueError):
+            rollups.query(NOW, '2026-10-17T00:00:00')
+        with pytest.raises(ValueError):
+            rollups.query('2026-01-01T00:00:00', NOW, resolution='minute')
+        with pytest.raises(ValueError):
+            rollups.query('2026-10-18T00:00:00', NOW, group_by='card_brand')
@@ -0,0 +1,127 @@
+"""
+Unit tests for the T+1 settlement engine
+
+This module tests per-merchant aggregation, idempotent re-runs, rows whose
+webhook could not be published, and the DynamoDB index and scan read paths.
+"""
+
+import pytest
+
+from settlement import (
+    DynamoLedger,
+    InMemoryLedger,
+    run_settlement,
+    settlement_bucket,
+    settlement_id,
+)
+
+DATE = "2026-10-18"
+
+def ledger_row(transaction_id, type_, amount, merchant_id="merchant_a", currency="USD",
+               created_at=f"{DATE}T10:00:00", status="completed"):
+    row = {
+        'transaction_id': transaction_id,
+        'created_at': created_at,
+        'type': type_,
+        'status': status,
+        'amount': amount,
+        'currency': currency,
+        'merchant_id': merchant_id,
+    }
+    row['settlement_bucket'] = settlement_bucket(created_at, transaction_id)
+    return row
+
+@pytest.fixture
+def rows():
+    return [
+        ledger_row("capture_1", "capture", 10000),
+        ledger_row("capture_2", "capture", 2500),
+        ledger_row("refund_1", "refund", 1500),
+        ledger_row("capture_3", "capture", 4000, merchant_id="merchant_b"),
+        ledger_row("capture_4", "capture", 900, currency="EUR"),
+        ledger_row("auth_1", "authorization", 7000, status="approved"),
+        ledger_row("capture_old", "capture", 123, created_at="2026-10-17T23:59:59"),
+    ]
+
+class TestInMemorySettlement:
+    """Test settlement against the in-process store."""
+
+    def test_net_amount_per_merchant_and_currency(self, rows):
+        published = []
+        summary = run_settlement(InMemoryLedger(rows, on_publish=published.extend), DATE, workers=2)
+
+        records = {r['transaction_id']: r for r in summary['records']}
+        usd = records[settlement_id(DATE, "merchant_a", "USD")]
+        assert usd['net_amount'] == 10000 + 2500 - 1500
+        assert usd['capture_count'] == 2 and usd['refund_count'] == 1
+        assert records[settlement_id(DATE, "merchant_b", "USD")]['net_amount'] == 4000
+        assert records[settlement_id(DATE, "merchant_a", "EUR")]['net_amount'] == 900
+        assert summary['newly_settled'] == 5
+        assert len(published) == 5
+        assert all(event_type == "transaction_settled" for event_type, _ in published)
+
+    def test_rows_are_marked_settled(self, rows):
+        ledger = InMemoryLedger(rows)
+        run_settlement(ledger, DATE, workers=2)
+        by_id = {r['transaction_id']: r for r in rows}
+        assert settlement_id(DATE, "merchant_a", "USD") in ledger.records
+        assert all(r['type'] != 'settlement' for r in rows)
+        assert by_id['capture_1']['status'] == 'settled'
+        assert by_id['refund_1']['settlement_id'] == settlement_id(DATE, "merchant_a", "USD")
+        assert by_id['auth_1']['status'] == 'approved'
+        assert by_id['capture_old']['status'] == 'completed'
+
+    def test_rerun_is_idempotent(self, rows):
+        first = run_settlement(InMemoryLedger(rows), DATE, workers=2)
+        published = []
+        second = run_settlement(InMemoryLedger(rows, on_publish=published.extend), DATE, workers=2)
+
+        net = lambda summary: {r['transaction_id']: r['net_amount'] for r in summary['records']}
+        assert net(first) == net(second)
+        assert second['newly_settled'] == 0
+        assert published == []
+
+    def test_unpublished_rows_are_settled_by_the_rerun(self, rows):
+        class RefundsRejected(InMemoryLedger):
+            def publish(self, events):
+                return [index for index, (_, data) in enumerate(events) if data['type'] == 'refund']
+
+        published = []
+        first = run_settlement(RefundsRejected(rows), DATE, workers=2)
+        by_id = {r['transaction_id']: r for r in rows}
+        assert first['unpublished'] == 1 and first['newly_settled'] == 4
+        assert by_id['refund_1']['status'] == 'completed'
+
+        second = run_settlement(InMemoryLedger(rows, on_publish=published.extend), DATE, workers=2)
+        assert second['newly_settled'] == 1
+        assert [data['transaction_id'] for _, data in published] == ['refund_1']
+        assert {r['transaction_id']: r for r in rows}['refund_1']['status'] == 'settled'
+
+    def test_writes_do_not_rescan_the_ledger(self, rows):
+        ledger = InMemoryLedger([ledger_row(f"capture_{n}", "capture", 100) for n in range(20000)])
+        ledger.write_items([])
+        positions = ledger._positions
+        ledger.write_items([ledger_row("capture_new", "capture", 100)])
+        assert ledger._positions is positions
+        assert positions["capture_new"] == 20000
+
+class TestDynamoSettlement:
+    """Test the DynamoDB read paths."""
+
+    @pytest.mark.parametrize("mode", ["index", "scan"])
+    def test_settles_from_ledger(self, dynamodb_mock, sns_mock, rows, mode):
+        for row in rows:
+            dynamodb_mock.put_item(Item=row)
+
+        # moto ignores Segment/TotalSegments, so scan with a single segment
+        ledger = DynamoLedger('payments-ledger', sns_mock.list_topics()['Topics'][0]['TopicArn'],
+                              mode=mode, scan_segments=1)
+        summary = run_settlement(ledger, DATE, workers=2)
+
+        assert summary['transactions'] == 5
+        stored = dynamodb_mock.get_item(
+            Key={'transaction_id': settlement_id(DATE, "merchant_a", "USD"), 'created_at': 'settlement'}
+        )['Item']
+        assert stored['net_amount'] == 11000
+        capture = dynamodb_mock.get_item(Key={'transaction_id': 'capture_1', 'created_at': f"{DATE}T10:00:00"})['Item']
+        assert capture['status'] == 'settled'
@@ -0,0 +1,185 @@
+"""
+Unit tests for write-sharded counters
+
+This module tests hot-key detection and reporting, shard growth and
+merged reads, projected aggregates that stay exact while a hot merchant's
+counters are sharded or throttled, and the sharded feed partitions.
+"""
+
+import random
+
+import boto3
+import pytest
+
+import projections
+from conftest import FakeClock
+from projections import ProjectionStore, Throttled, _parse_shard_minimums
+from sharded_counters import HotKeyDetector, ShardedCounters
+
+def projections_table():
+    return boto3.resource('dynamodb', region_name='us-east-1').Table(projections.PROJECTIONS_TABLE)
+
+def transaction(n, merchant_id='merchant_hot', amount=100):
+    return {
+        'transaction_id': f"auth_{n}", 'created_at': f"2026-10-19T10:00:{n:02d}", 'type': 'authorization',
+        'status': 'approved', 'amount': amount, 'currency': 'USD', 'merchant_id': merchant_id
+    }
+
+def partitions(table, prefix):
+    return sorted({item['pk'] for item in table.scan()['Items'] if item['pk'].startswith(prefix)})
+
+class TestHotKeyDetector:
+    """Test per-window write counting."""
+
+    def test_limit_scales_with_shards_and_resets_each_window(self, clock):
+        detector = HotKeyDetector(writes_per_second=5, clock=clock)
+        assert not any(detector.record(('merchant#a', 'totals'), 1) for _ in range(5))
+        assert detector.record(('merchant#a', 'totals'), 1)
+        assert not detector.record(('merchant#a', 'totals'), 2)
+        assert not detector.record(('merchant#b', 'totals'), 1)
+        clock.now += 1
+        assert not detector.record(('merchant#a', 'totals'), 1)
+
+    def test_reports_the_keys_over_the_limit(self, clock):
+        detector = HotKeyDetector(writes_per_second=2, clock=clock)
+        for _ in range(5):
+            detector.record(('merchant_index', 'merchant_hot#2026-10'), 1)
+        for _ in range(2):
+            detector.record(('merchant_index', 'merchant_quiet#2026-10'), 1)
+        clock.now += 1
+        detector.record(('merchant_index', 'merchant_hot#2026-10'), 1)
+        assert detector.stats() == {
+            'writes_per_second_limit': 2.0, 'hot_keys': {'merchant_index/merchant_hot#2026-10': 5}
+        }
+
+class TestShardedCounters:
+    """Test shard growth and merged reads."""
+
+    def test_increments_spread_and_reads_sum_the_shards(self, dynamodb_mock):
+        table = projections_table()
+        key = {'pk': 'merchant#spread', 'sk': 'totals'}
+        counters = ShardedCounters(table, HotKeyDetector(clock=FakeClock()), rng=random.Random(3))
+        # Never sharded before shard 0 exists
+        assert counters.grow(key, 4) == 1
+
+        table.put_item(Item={**key, 'transactions': 1})
+        for _ in range(40):
+            target, shards = counters.target(key, min_shards=4)
+            table.update_item(Key=target, UpdateExpression='ADD transactions :one',
+                              ExpressionAttributeValues={':one': 1})
+        assert shards == 4
+        assert partitions(table, 'merchant#spread') == [
+            'merchant#spread', 'merchant#spread#shard1', 'merchant#spread#shard2', 'merchant#spread#shard3'
+        ]
+        assert counters.read(key)['transactions'] == 41
+
+        # An instance that has not seen the growth adopts the stored count
+        other = ShardedCounters(table, HotKeyDetector(clock=FakeClock()))
+        assert other.grow(key, 2) == 4
+        assert other.stats()['hottest'] == {'merchant#spread/totals': 4}
+
+    def test_counts_never_exceed_the_maximum(self, clock, dynamodb_mock):
+        table = projections_table()
+        key = {'pk': 'totals', 'sk': 'all'}
+        table.put_item(Item={**key, 'transactions': 0})
+        counters = ShardedCounters(table, HotKeyDetector(writes_per_second=1, clock=clock), max_shards=8)
+        for _ in range(200):
+            counters.target(key)
+        assert counters.shards[('totals', 'all')] == 8
+        assert counters.stats()['grown'] == 3
+
+class TestShardedProjections:
+    """Test aggregates of a hot merchant."""
+
+    def test_hot_merchant_totals_stay_exact(self, clock, dynamodb_mock):
+        table = projections_table()
+        store = ProjectionStore(table, inline=False)
+        store.sharded = ShardedCounters(table, HotKeyDetector(writes_per_second=2, clock=clock),
+                                        rng=random.Random(5))
+        for n in range(30):
+            assert store.apply(transaction(n))
+        store.apply(transaction(30, merchant_id='merchant_quiet'))
+
+        assert len(partitions(table, 'merchant#merchant_hot')) > 1
+        assert len(partitions(table, 'totals')) > 1
+        totals = store.merchant_totals('merchant_hot')
+        assert totals['total_transactions'] == 30
+        assert totals['total_volume'] == 3000
+        assert totals['by_status'] == {'approved': 30}
+        metrics = store.metrics()
+        assert metrics['total_transactions'] == 31
+        assert metrics['active_merchants'] == 2
+
+    def test_throttled_counter_is_resharded(self, clock, dynamodb_mock, monkeypatch):
+        table = projections_table()
+        store = ProjectionStore(table, inline=False)
+        store.sharded = ShardedCounters(table, HotKeyDetector(clock=clock))
+        store.apply(transaction(0))
+        transact = store._transact
+        throttles = []
+
+        def throttle_once(items):
+            if not throttles:
+                throttles.append(items)
+                raise Throttled([1])
+            return transact(items)
+
+        monkeypatch.setattr(store, '_transact', throttle_once)
+        assert store.apply(transaction(1))
+        assert store.sharded.stats()['throttled'] == 1
+        assert store.sharded.shards[('merchant#merchant_hot', 'totals')] == 2
+        assert store.merchant_totals('merchant_hot')['total_transactions'] == 2
+
+    def test_minimum_shards_per_merchant(self, dynamodb_mock, monkeypatch):
+        monkeypatch.setattr(projections, 'MERCHANT_COUNTER_SHARDS', _parse_shard_minimums('merchant_hot:4'))
+        table = projections_table()
+        store = ProjectionStore(table, inline=False)
+        for n in range(20):
+            store.apply(transaction(n))
+        assert store.sharded.shards[('merchant#merchant_hot', 'totals')] == 4
+        assert store.merchant_totals('merchant_hot')['total_transactions'] == 20
+        with pytest.raises(ValueError):
+            _parse_shard_minimums('merchant_hot:0')
+
+class TestFeedPartitions:
+    """Test the sharded recent-transaction partition."""
+
+    def test_rows_are_spread_and_read_merged(self, dynamodb_mock, monkeypatch):
+        monkeypatch.setattr(projections, 'CHANGE_FEED_LAG_SECONDS', 0)
+        table = projections_table()
+        store = ProjectionStore(table, inline=False)
+        for n in range(12):
+            store.apply(transaction(n))
+        assert partitions(table, 'recent') == ['recent', 'recent#shard1', 'recent#shard2', 'recent#shard3']
+
+        items, cursor = store.latest(projections.RECENT_PARTITION, fields=['transaction_id'])
+        assert [item['transaction_id'] for item in items] == [f"auth_{n}" for n in range(11, -1, -1)]
+        assert cursor is None
+
+        seen, cursor = [], None
+        while True:
+            page = store.changes(projections.RECENT_PARTITION, cursor, limit=5)
+            seen.extend(item['transaction_id'] for item in page['items'])
+            cursor = page['cursor']
+            if not page['has_more']:
+                break
+        assert seen == [f"auth_{n}" for n in range(12)]
+
+    def test_throttled_feed_row_is_retried_and_reported(self, dynamodb_mock, monkeypatch):
+        table = projections_table()
+        store = ProjectionStore(table, inline=False)
+        transact = store._transact
+        throttles = []
+
+        def throttle_once(items):
+            if not throttles:
+                throttles.append(items)
+                raise Throttled([0])
+            return transact(items)
+
+        monkeypatch.setattr(store, '_transact', throttle_once)
+        assert store.apply(transaction(0))
+        pk = projections.feed_partition(projections.RECENT_PARTITION, 'auth_0')
+        assert store.feed_stats() == {'shards': projections.FEED_PARTITION_SHARDS, 'throttled': {pk: 1}}
+        assert store.sharded.stats()['throttled'] == 0
+        assert store.merchant_totals('merchant_hot')['total_transactions'] == 1
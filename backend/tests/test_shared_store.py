@@ -0,0 +1,306 @@
+"""
+Unit tests for the shared-memory mock store
+
+This module tests that separate views of one log converge, that seeding
+happens once, and that concurrent writer processes never lose or tear
+records.
+"""
+
+import multiprocessing
+import os
+import uuid
+
+import pytest
+
+from settlement import run_settlement
+from shared_store import HEADER, SharedStore, SharedStoreLedger, default_store_path, remove_store
+
+@pytest.fixture
+def store_path():
+    path = default_store_path()
+    yield path
+    remove_store(path)
+
+def make_transaction(merchant_id='merchant_a', created_at='2026-10-17T10:00:00', amount=100, **extra):
+    return {
+        'transaction_id': f"txn_{uuid.uuid4().hex[:16]}",
+        'type': 'capture',
+        'status': 'completed',
+        'amount': amount,
+        'currency': 'USD',
+        'merchant_id': merchant_id,
+        'created_at': created_at,
+        **extra
+    }
+
+def write_transactions(store, count):
+    for i in range(count):
+        store.write([('transaction', make_transaction(merchant_id=f"merchant_{os.getpid()}", amount=i + 1))])
+
+class TestSharedStore:
+    """Test views over one shared log."""
+
+    def test_views_converge(self, store_path):
+        writer, reader = SharedStore(store_path), SharedStore(store_path)
+        writer.write([('metrics', {'success_rate': 95.2})])
+        writer.write([('transaction', make_transaction(amount=250))])
+        writer.write([('webhook_event', {'event_id': 'evt_1'})])
+
+        assert reader.refresh() == 3
+        assert reader.refresh() == 0
+        assert reader.transactions == writer.transactions
+        assert reader.metrics == {'success_rate': 95.2, 'total_transactions': 1, 'total_volume': 250}
+        assert [e['event_id'] for e in reader.webhook_events] == ['evt_1']
+
+    def test_put_replaces_by_id(self, store_path):
+        writer, reader = SharedStore(store_path), SharedStore(store_path)
+        transaction = make_transaction()
+        writer.write([('transaction', transaction)])
+        writer.write([('transaction_put', {**transaction, 'status': 'settled'})])
+
+        reader.refresh()
+        assert len(reader.transactions) == 1
+        assert reader.transactions[0]['status'] == 'settled'
+        assert reader.metrics['total_transactions'] == 1
+
+    def test_merchant_index(self, store_path):
+        store = SharedStore(store_path)
+        for day in ('15', '16', '17'):
+            store.write([('transaction', make_transaction(created_at=f"2026-10-{day}T10:00:00"))])
+        store.write([('transaction', make_transaction(merchant_id='merchant_b'))])
+
+        items = store.merchant_transactions('merchant_a', '2026-10-16', '2026-10-18', limit=10)
+        assert [t['created_at'][:10] for t in items] == ['2026-10-17', '2026-10-16']
+
+    def test_seed_only_once(self, store_path):
+        first, second = SharedStore(store_path), SharedStore(store_path)
+        assert first.seed_if_empty([('transaction', make_transaction())])
+        assert not second.seed_if_empty([('transaction', make_transaction())])
+        assert len(second.transactions) == 1
+
+    def test_settlement_writes_are_shared(self, store_path):
+        worker, other = SharedStore(store_path), SharedStore(store_path)
+        worker.write([('transaction', make_transaction()) for _ in range(3)])
+
+        run_settlement(SharedStoreLedger(worker), '2026-10-17', workers=2)
+        other.refresh()
+        settled = [t for t in other.transactions if t.get('type') == 'capture']
+        assert {t['status'] for t in settled} == {'settled'}
+        assert len(other.transactions) == 3
+        assert [r['type'] for r in other.select('settlements')] == ['settlement']
+        assert other.metrics['total_transactions'] == 3
+
+    def test_concurrent_writer_processes(self, store_path):
+        store = SharedStore(store_path)
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=write_transactions, args=(store, 100)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        reader = SharedStore(store_path)
+        reader.refresh()
+        assert store.log.committed()[1] == 400
+        assert len(reader.transactions) == 400
+        assert len({t['transaction_id'] for t in reader.transactions}) == 400
+        assert reader.metrics['total_volume'] == 4 * sum(range(1, 101))
+        for merchant_id in reader.merchant_index:
+            assert len(reader.merchant_index[merchant_id]) == 100
+
+    def test_concurrent_writers_compact_the_log(self, store_path):
+        store = SharedStore(store_path, compact_bytes=8192)
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=write_transactions, args=(store, 100)) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        reader = SharedStore(store_path)
+        reader.refresh()
+        # The log now starts with a snapshot
+        assert reader.log.snapshot_end() > HEADER.size
+        assert len({t['transaction_id'] for t in reader.select('transactions')}) == 400
+        assert reader.metrics['total_volume'] == 4 * sum(range(1, 101))
+        store.refresh()
+        assert store.select('transactions') == reader.select('transactions')
+
+class TestChangeFeed:
+    """Test syncing a replica through the change feed."""
+
+    def test_sync_returns_only_changes(self, store_path):
+        writer, reader = SharedStore(store_path), SharedStore(store_path)
+        first, second = make_transaction(), make_transaction()
+        writer.write([('transaction', first), ('transaction', second)])
+        reader.refresh()
+        snapshot = reader.changes('transactions')
+        assert snapshot['reset'] and not snapshot['has_more']
+        assert [t['transaction_id'] for t in snapshot['items']] == [first['transaction_id'], second['transaction_id']]
+
+        idle = reader.changes('transactions', snapshot['cursor'])
+        assert idle['items'] == [] and not idle['reset']
+
+        writer.write([('transaction_put', {**first, 'status': 'settled'}), ('transaction_put', {**first, 'status': 'paid'})])
+        writer.write([('webhook_event', {'event_id': 'evt_1'})])
+        reader.refresh()
+        delta = reader.changes('transactions', idle['cursor'], fields=['status'])
+        assert delta['items'] == [{'transaction_id': first['transaction_id'], 'status': 'paid'}]
+        assert reader.changes('webhook_events', snapshot['cursor'])['items'] == [{'event_id': 'evt_1'}]
+
+    def test_pages_follow_has_more(self, store_path):
+        store = SharedStore(store_path)
+        store.write([('transaction', make_transaction(amount=i)) for i in range(5)])
+        store.refresh()
+        cursor, amounts, pages = None, [], 0
+        while True:
+            page = store.changes('transactions', cursor, limit=2)
+            amounts += [t['amount'] for t in page['items']]
+            cursor, pages = page['cursor'], pages + 1
+            if not page['has_more']:
+                break
+        assert amounts == [0, 1, 2, 3, 4]
+        assert pages == 3
+
+    def test_cursor_from_another_log_resets(self, store_path):
+        store = SharedStore(store_path)
+        store.write([('transaction', make_transaction())])
+        store.refresh()
+        cursor = store.changes('transactions')['cursor']
+
+        other_path = default_store_path()
+        try:
+            other = SharedStore(other_path)
+            other.write([('transaction', make_transaction())])
+            other.refresh()
+            page = other.changes('transactions', cursor)
+            assert page['reset']
+            assert len(page['items']) == 1
+        finally:
+            os.remove(other_path)
+
+class Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+class TestRetention:
+    """Test TTL expiry and ring-buffer limits in a view."""
+
+    def test_expired_items_leave_every_read(self, store_path):
+        clock = Clock(1_800_000_000)
+        store = SharedStore(store_path, clock=clock)
+        kept = make_transaction(ttl=clock.now + 3600)
+        expiring = [make_transaction(ttl=clock.now + 60) for _ in range(3)]
+        store.write([('transaction', t) for t in [kept, *expiring]])
+        store.write([('webhook_event', {'event_id': 'evt_1', 'ttl': clock.now + 60})])
+        cursor = store.changes('transactions')['cursor']
+        store.write([('transaction_put', {**expiring[0], 'status': 'settled'})])
+
+        clock.now += 61
+        store.refresh()
+        assert store.select('transactions') == [kept]
+        assert store.select('webhook_events') == []
+        assert store.merchant_transactions('merchant_a', '', '~', limit=10) == [kept]
+        assert sorted(store.changes('transactions', cursor)['items'], key=lambda item: item['transaction_id']) == sorted(
+            ({'transaction_id': t['transaction_id'], 'deleted': True} for t in expiring),
+            key=lambda item: item['transaction_id']
+        )
+        # Three of four slots emptied, so the view was compacted
+        assert store.transactions == [kept]
+        assert store.metrics['total_transactions'] == 4
+
+    def test_limits_evict_oldest_in_every_view(self, store_path):
+        writer = SharedStore(store_path, limits={'transactions': 3, 'webhook_events': 2})
+        reader = SharedStore(store_path, limits={'transactions': 3, 'webhook_events': 2})
+        transactions = [make_transaction(amount=i) for i in range(10)]
+        writer.write([('transaction', t) for t in transactions])
+        writer.write([('webhook_event', {'event_id': f"evt_{i}"}) for i in range(5)])
+        reader.refresh()
+
+        for store in (writer, reader):
+            assert [t['amount'] for t in store.select('transactions')] == [7, 8, 9]
+            assert [e['event_id'] for e in store.select('webhook_events')] == ['evt_3', 'evt_4']
+            assert len(store.transactions) <= 2 * 3
+            assert sum(len(entries) for entries in store.merchant_index.values()) <= 2 * 3
+        assert [t['amount'] for t in reader.changes('transactions')['items']] == [7, 8, 9]
+
+    def test_removals_are_tombstones_in_every_view(self, store_path):
+        clock = Clock(1_800_000_000)
+        writer = SharedStore(store_path, limits={'transactions': 2}, clock=clock)
+        reader = SharedStore(store_path, limits={'transactions': 2}, clock=clock)
+        first, second = make_transaction(), make_transaction(ttl=clock.now + 60)
+        writer.write([('transaction', first), ('transaction', second)])
+        reader.refresh()
+        cursor = reader.changes('transactions')['cursor']
+
+        third = make_transaction()
+        writer.write([('transaction', third)])
+        clock.now += 61
+        reader.refresh()
+        assert reader.changes('transactions', cursor)['items'] == [
+            {'transaction_id': first['transaction_id'], 'deleted': True},
+            third,
+            {'transaction_id': second['transaction_id'], 'deleted': True},
+        ]
+
+    def test_expiry_is_logged_once(self, store_path):
+        clock = Clock(1_800_000_000)
+        views = [SharedStore(store_path, clock=clock) for _ in range(2)]
+        views[0].write([('transaction', make_transaction(ttl=clock.now + 60))])
+        clock.now += 61
+        for view in views:
+            view.refresh()
+        # Both views removed it at the same sequence number
+        assert [view.sequence for view in views] == [2, 2]
+        assert views[0].log.committed()[1] == 2
+        assert all(view.select('transactions') == [] for view in views)
+
+class TestCompaction:
+    """Test that the log is replaced by a snapshot once it grows."""
+
+    def test_views_continue_across_compactions(self, store_path):
+        clock = Clock(1_800_000_000)
+        limits = {'transactions': 20}
+        writer = SharedStore(store_path, limits=limits, clock=clock, compact_bytes=4096)
+        reader = SharedStore(store_path, limits=limits, clock=clock)
+        writer.write([('transaction', make_transaction(ttl=clock.now + 60))])
+        reader.refresh()
+        old_cursor = reader.changes('transactions')['cursor']
+
+        written = [make_transaction(amount=i) for i in range(200)]
+        for transaction in written[:190]:
+            writer.write([('transaction', transaction)])
+        reader.refresh()
+        cursor = reader.changes('transactions')['cursor']
+        for transaction in written[190:]:
+            writer.write([('transaction', transaction)])
+        clock.now += 61
+        reader.refresh()
+        # Each compaction leaves one snapshot and fewer than compact_bytes of records
+        assert os.path.getsize(store_path) < 3 * 4096
+        late = SharedStore(store_path, limits=limits, clock=clock)
+        late.refresh()
+
+        for view in (writer, reader, late):
+            view.refresh()
+            assert view.select('transactions') == written[-20:]
+            assert view.metrics['total_transactions'] == 201
+            assert view.log_id == writer.log_id
+        page = late.changes('transactions', cursor, limit=1000)
+        assert not page['reset']
+        assert [item for item in page['items'] if 'deleted' not in item] == written[-10:]
+        assert [item['transaction_id'] for item in page['items'] if 'deleted' in item] == [
+            t['transaction_id'] for t in written[170:180]
+        ]
+        assert late.changes('transactions', page['cursor'])['items'] == []
+        # Tombstones older than the last limit of them are gone, so older cursors start over
+        assert late.changes('transactions', old_cursor)['reset']
+
+        # Later writes reach views that started before and after the compactions
+        extra = make_transaction()
+        reader.write([('transaction', extra)])
+        late.refresh()
+        assert late.select('transactions')[-1] == extra
@@ -0,0 +1,115 @@
+"""
+Unit tests for processor simulation profiles
+
+This module tests latency distributions, brownouts, profile selection,
+non-blocking waits and simulated outcomes through the payment endpoints.
+"""
+
+import asyncio
+import random
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+import handler
+from conftest import AUTHORIZATION as DEFAULT_AUTHORIZATION
+from handler import app
+from simulation import Latency, Profile, Simulator
+
+client = TestClient(app)
+
+AUTHORIZATION = {**DEFAULT_AUTHORIZATION, "merchant_id": "merchant_sim"}
+
+def simulator(**profiles):
+    return Simulator({name: Profile(name, **spec) for name, spec in profiles.items()},
+                     default_profile='', merchant_profiles={}, allow_header=True, rng=random.Random(3))
+
+class TestProfiles:
+    """Test sampled latencies and outcomes."""
+
+    def test_lognormal_matches_median_and_p99(self):
+        latency = Latency('lognormal', median_ms=100, p99_ms=1000)
+        rng = random.Random(1)
+        samples = sorted(latency.sample_ms(rng) for _ in range(50000))
+        assert samples[25000] == pytest.approx(100, rel=0.05)
+        assert samples[49500] == pytest.approx(1000, rel=0.1)
+
+    def test_brownout_slows_and_fails_part_of_each_period(self):
+        profile = Profile('flaky', latency={'default': {'median_ms': 100}}, error_rate=0.0,
+                          brownout={'period_seconds': 300, 'duration_seconds': 30,
+                                    'latency_multiplier': 5, 'error_rate': 1.0})
+        rng = random.Random(0)
+        assert profile.sample('capture', 600 + 10, rng) == (0.5, 'error')
+        assert profile.sample('capture', 600 + 40, rng) == (0.1, 'approved')
+
+    def test_only_authorizations_are_declined(self):
+        profile = Profile('declining', decline_rate=1.0)
+        rng = random.Random(0)
+        assert profile.sample('authorize', 0, rng)[1] == 'declined'
+        assert profile.sample('refund', 0, rng)[1] == 'approved'
+
+    def test_selection_prefers_header_then_merchant_then_default(self):
+        profiles = {name: Profile(name) for name in ('slow', 'fast', 'base')}
+        sim = Simulator(profiles, default_profile='base', merchant_profiles={'merchant_a': 'slow'}, allow_header=True)
+        assert sim.select('merchant_a', 'fast').name == 'fast'
+        assert sim.select('merchant_a').name == 'slow'
+        assert sim.select('merchant_b').name == 'base'
+        with pytest.raises(ValueError):
+            sim.select('merchant_a', 'unknown')
+
+        locked = Simulator(profiles, default_profile='', merchant_profiles={}, allow_header=False)
+        assert locked.select('merchant_a', 'fast') is None
+
+class TestNonBlockingWaits:
+    """Test that simulated calls overlap."""
+
+    def test_thousands_of_calls_in_flight(self):
+        sim = simulator(steady={'latency': {'default': {'median_ms': 200}}})
+
+        async def burst():
+            return await asyncio.gather(*(sim.call('authorize', 'm', 'steady') for _ in range(2000)))
+
+        started = time.perf_counter()
+        outcomes = asyncio.run(burst())
+        assert time.perf_counter() - started < 2
+        assert outcomes == ['approved'] * 2000
+
+        stats = sim.stats()['profiles']['steady']['authorize']
+        assert stats['max_in_flight'] == 2000
+        assert stats['in_flight'] == 0
+        assert stats['latency_p99_ms'] == 200.0
+        assert stats['throughput_per_second'] == pytest.approx(2000 / 60, rel=0.01)
+
+class TestEndpointSimulation:
+    """Test simulated outcomes through the API."""
+
+    def test_processor_decline_is_stored(self, monkeypatch, dynamodb_mock, sns_mock):
+        monkeypatch.setattr(handler, 'simulator', simulator(declining={'decline_rate': 1.0}))
+        response = client.post("/payments/authorize", json=AUTHORIZATION,
+                               headers={"X-Idempotency-Key": str(uuid.uuid4()), "X-Simulation-Profile": "declining"})
+        assert response.status_code == 200
+        assert response.json()["status"] == "declined"
+        assert response.json()["message"] == "Declined by processor"
+
+        health = client.get("/health").json()
+        assert health["simulation"]["profiles"]["declining"]["authorize"]["outcomes"] == {"declined": 1}
+
+    def test_processor_error_writes_nothing_and_retry_succeeds(self, monkeypatch, dynamodb_mock, sns_mock):
+        monkeypatch.setattr(handler, 'simulator', simulator(failing={'error_rate': 1.0}))
+        key = str(uuid.uuid4())
+        failed = client.post("/payments/authorize", json=AUTHORIZATION,
+                             headers={"X-Idempotency-Key": key, "X-Simulation-Profile": "failing"})
+        assert failed.status_code == 502
+        assert dynamodb_mock.scan()["Items"] == []
+
+        retried = client.post("/payments/authorize", json=AUTHORIZATION, headers={"X-Idempotency-Key": key})
+        assert retried.status_code == 200
+        assert retried.json()["status"] == "approved"
+
+    def test_unknown_profile_is_rejected(self, dynamodb_mock, sns_mock, monkeypatch):
+        monkeypatch.setattr(handler, 'simulator', simulator())
+        response = client.post("/payments/authorize", json=AUTHORIZATION,
+                               headers={"X-Idempotency-Key": str(uuid.uuid4()), "X-Simulation-Profile": "nope"})
+        assert response.status_code == 400
@@ -0,0 +1,130 @@
+"""
+Unit tests for single-flight request coalescing
+
+This module tests that followers share the leader's outcome, that a
+different body under an in-flight key is rejected, that a follower takes
+over from a cancelled leader, and that concurrent identical payment
+requests do their storage work once.
+"""
+
+import asyncio
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from fastapi.testclient import TestClient
+
+import handler
+from conftest import AUTHORIZATION as DEFAULT_AUTHORIZATION
+from handler import app
+from simulation import Profile, Simulator
+from single_flight import BodyMismatch, SingleFlight
+
+client = TestClient(app)
+
+AUTHORIZATION = {**DEFAULT_AUTHORIZATION, "merchant_id": "merchant_flight"}
+
+class TestSingleFlight:
+    """Test leaders and followers of one key."""
+
+    def test_followers_share_the_leaders_result(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {'transaction_id': 'auth_1'}
+
+        async def burst():
+            return await asyncio.gather(*(flights.run(('authorize', 'k'), 'body', work) for _ in range(50)))
+
+        outcomes = asyncio.run(burst())
+        assert len(calls) == 1
+        assert [led for _, led in outcomes].count(True) == 1
+        assert {result['transaction_id'] for result, _ in outcomes} == {'auth_1'}
+        assert flights.stats() == {'leaders': 1, 'coalesced': 49, 'rejected_mismatch': 0, 'in_flight': 0}
+
+    def test_errors_reach_followers_and_bodies_must_match(self):
+        flights = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0.05)
+            raise RuntimeError("processor down")
+
+        async def burst():
+            leader = asyncio.ensure_future(flights.run('k', 'body', failing))
+            await asyncio.sleep(0)
+            with pytest.raises(BodyMismatch):
+                await flights.run('k', 'other body', failing)
+            return await asyncio.gather(leader, flights.run('k', 'body', failing), return_exceptions=True)
+
+        outcomes = asyncio.run(burst())
+        assert [str(outcome) for outcome in outcomes] == ["processor down"] * 2
+        assert flights.stats()['rejected_mismatch'] == 1
+
+    def test_follower_takes_over_from_a_cancelled_leader(self):
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return 'done'
+
+        async def burst():
+            leader = asyncio.ensure_future(flights.run('k', 'body', work))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flights.run('k', 'body', work))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        assert asyncio.run(burst()) == ('done', True)
+        assert flights.stats()['leaders'] == 2
+
+class TestCoalescedPayments:
+    """Test concurrent identical requests through the API."""
+
+    @pytest.fixture
+    def slow_processor(self, monkeypatch):
+        # Every request is still in flight when the last one arrives
+        profiles = {'slow': Profile('slow', latency={'default': {'median_ms': 300}})}
+        monkeypatch.setattr(handler, 'simulator', Simulator(profiles, default_profile='slow', merchant_profiles={},
+                                                            allow_header=False, rng=random.Random(2)))
+        monkeypatch.setattr(handler, 'single_flight', SingleFlight())
+
+    def test_identical_requests_write_once(self, dynamodb_mock, sns_mock, slow_processor):
+        key = str(uuid.uuid4())
+        reads = handler.idempotency.reads + handler.idempotency.reads_skipped
+
+        def send(_):
+            return client.post("/payments/authorize", json=AUTHORIZATION, headers={"X-Idempotency-Key": key})
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            responses = list(executor.map(send, range(8)))
+
+        assert {response.status_code for response in responses} == {200}
+        assert len({response.text for response in responses}) == 1
+        assert handler.idempotency.reads + handler.idempotency.reads_skipped == reads + 1
+        assert len([item for item in dynamodb_mock.scan()['Items'] if item['type'] == 'authorization']) == 1
+        assert client.get("/health").json()['single_flight'] == {
+            'leaders': 1, 'coalesced': 7, 'rejected_mismatch': 0, 'in_flight': 0
+        }
+
+    def test_different_body_under_an_in_flight_key_is_rejected(self, dynamodb_mock, sns_mock, slow_processor):
+        key = str(uuid.uuid4())
+        bodies = [AUTHORIZATION, {**AUTHORIZATION, "amount": 9900}]
+
+        def send(body):
+            return client.post("/payments/authorize", json=body, headers={"X-Idempotency-Key": key})
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(send, bodies[0])
+            while not handler.single_flight.flights:
+                time.sleep(0.001)
+            second = executor.submit(send, bodies[1])
+            responses = [first.result(), second.result()]
+
+        assert responses[0].status_code == 200
+        assert responses[1].status_code == 422
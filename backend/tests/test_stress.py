@@ -0,0 +1,224 @@
+"""
+Concurrency stress tests for exactly-once idempotency
+
+This module fires concurrent bursts that share X-Idempotency-Key values
+at the app in-process, with single-flight coalescing bypassed as if each
+request reached a different process, and checks that each key writes exactly one ledger
+row and every request gets the same response, including bulk-ingest
+batches that repeat the burst's keys. Throughput and latency
+percentiles of each burst are recorded as test properties (JUnit XML) and
+written as JSON to STRESS_RESULTS_DIR.
+
+Bursts are sized by STRESS_THREADS, STRESS_KEYS and
+STRESS_REQUESTS_PER_KEY. Everything runs offline against moto.
+"""
+
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import pytest
+from botocore.client import BaseClient
+from fastapi.testclient import TestClient
+
+import handler
+from balances import balance_key
+from bulk_ingest import BulkIngestor
+from conftest import AUTHORIZATION as DEFAULT_AUTHORIZATION
+from handler import INGEST_OPERATIONS, app, write_ingest_batch
+
+STRESS_THREADS = int(os.environ.get('STRESS_THREADS', '32'))
+STRESS_KEYS = int(os.environ.get('STRESS_KEYS', '8'))
+STRESS_REQUESTS_PER_KEY = int(os.environ.get('STRESS_REQUESTS_PER_KEY', '25'))
+
+client = TestClient(app)
+
+AUTHORIZATION = {**DEFAULT_AUTHORIZATION, "merchant_id": "merchant_stress"}
+
+class AtomicDynamoDB:
+    """Serializes AWS calls, as DynamoDB applies each request atomically and moto does not under threads
+
+    With conflict_rate, a transaction that touches an idempotency key
+    already claimed is cancelled with TransactionConflict instead, as
+    DynamoDB does when it overlaps the claiming transaction.
+    """
+
+    def __init__(self, conflict_rate: float = 0.0):
+        self.conflict_rate = conflict_rate
+        self.rng = random.Random(11)
+        self.claimed = set()
+        self.conflicts = 0
+        self.lock = threading.Lock()
+
+    def install(self, monkeypatch):
+        make_api_call = BaseClient._make_api_call
+        atomic = self
+
+        def serialized(client, operation_name, api_params):
+            with atomic.lock:
+                if operation_name != 'TransactWriteItems':
+                    return make_api_call(client, operation_name, api_params)
+                claims = [entry['Put']['Item']['k'] for entry in api_params['TransactItems']
+                          if entry.get('Put', {}).get('TableName') == handler.IDEMPOTENCY_TABLE]
+                if any(claim in atomic.claimed for claim in claims) and atomic.rng.random() < atomic.conflict_rate:
+                    atomic.conflicts += 1
+                    reasons = [{'Code': 'None'}] * (len(api_params['TransactItems']) - 1)
+                    raise client.exceptions.TransactionCanceledException({
+                        'Error': {'Code': 'TransactionCanceledException', 'Message': 'Transaction cancelled'},
+                        'CancellationReasons': reasons + [{'Code': 'TransactionConflict'}],
+                    }, operation_name)
+                result = make_api_call(client, operation_name, api_params)
+                atomic.claimed.update(claims)
+                return result
+
+        monkeypatch.setattr(BaseClient, '_make_api_call', serialized)
+        return self
+
+class Uncoalesced:
+    """Runs every request itself, as requests spread over processes would
+
+    The single-flight registry would otherwise make the burst's followers
+    await one leader per key, and the idempotency claim under test would
+    never be contended.
+    """
+
+    async def run(self, key, body_fingerprint, call):
+        return await call(), True
+
+@pytest.fixture
+def uncoalesced(monkeypatch):
+    monkeypatch.setattr(handler, 'single_flight', Uncoalesced())
+
+@pytest.fixture
+def unthrottled(monkeypatch):
+    """Admission control sized for the burst, so no request is shed"""
+    controller = handler.admission_controller
+    monkeypatch.setattr(controller, 'max_in_flight', STRESS_THREADS * 4)
+    monkeypatch.setattr(controller, 'rate', 1e6)
+    monkeypatch.setattr(controller, 'burst', 1e6)
+    monkeypatch.setattr(controller, 'buckets', type(controller.buckets)())
+
+@pytest.fixture
+def results(record_property, tmp_path_factory):
+    """Records a burst's throughput and latency percentiles"""
+    directory = os.environ.get('STRESS_RESULTS_DIR') or str(tmp_path_factory.mktemp('stress'))
+
+    def record(name, summary):
+        for metric, value in summary.items():
+            record_property(metric, value)
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{name}.json"), 'w') as f:
+            json.dump(summary, f, indent=2)
+
+    return record
+
+def burst(path, bodies_and_keys):
+    """Send (body, key) requests from STRESS_THREADS threads; responses and a throughput summary"""
+    def send(body_and_key):
+        body, key = body_and_key
+        started = time.perf_counter()
+        response = client.post(path, json=body, headers={"X-Idempotency-Key": key})
+        return key, response, (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=STRESS_THREADS) as executor:
+        outcomes = list(executor.map(send, bodies_and_keys))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, _, latency in outcomes)
+    summary = {
+        'requests': len(outcomes),
+        'threads': STRESS_THREADS,
+        'requests_per_second': round(len(outcomes) / elapsed, 1),
+        **{f"latency_p{p}_ms": round(latencies[min(len(latencies) - 1, len(latencies) * p // 100)], 2)
+           for p in (50, 95, 99)},
+        'latency_max_ms': round(latencies[-1], 2),
+    }
+    return [(key, response) for key, response, _ in outcomes], summary
+
+def assert_identical_per_key(responses):
+    by_key = {}
+    for key, response in responses:
+        assert response.status_code == 200, response.text
+        by_key.setdefault(key, set()).add(response.text)
+    for key, bodies in by_key.items():
+        assert len(bodies) == 1, f"{key} got {len(bodies)} different responses"
+    return {key: json.loads(next(iter(bodies))) for key, bodies in by_key.items()}
+
+def ledger_rows(table, type_):
+    return [item for item in table.scan()['Items'] if item.get('type') == type_]
+
+def shuffled_requests(body, keys):
+    requests = [(body, key) for key in keys for _ in range(STRESS_REQUESTS_PER_KEY)]
+    random.Random(5).shuffle(requests)
+    return requests
+
+class TestIdempotencyUnderConcurrency:
+    """Test exactly-once writes for bursts sharing idempotency keys."""
+
+    def test_authorize_burst_writes_once_per_key(self, monkeypatch, dynamodb_mock, sns_mock, unthrottled, uncoalesced, results):
+        AtomicDynamoDB().install(monkeypatch)
+        keys = [str(uuid.uuid4()) for _ in range(STRESS_KEYS)]
+        responses, summary = burst("/payments/authorize", shuffled_requests(AUTHORIZATION, keys))
+        results('authorize_burst', summary)
+
+        by_key = assert_identical_per_key(responses)
+        rows = ledger_rows(dynamodb_mock, 'authorization')
+        assert len(rows) == STRESS_KEYS
+        assert {row['transaction_id'] for row in rows} == {body['transaction_id'] for body in by_key.values()}
+        assert len(ledger_rows(dynamodb_mock, 'authorization_balance')) == STRESS_KEYS
+
+    def test_capture_burst_moves_the_balance_once(self, monkeypatch, dynamodb_mock, sns_mock, unthrottled, uncoalesced, results):
+        AtomicDynamoDB().install(monkeypatch)
+        auth = client.post("/payments/authorize", json=AUTHORIZATION,
+                           headers={"X-Idempotency-Key": str(uuid.uuid4())}).json()
+        keys = [str(uuid.uuid4()) for _ in range(STRESS_KEYS)]
+        capture = {"auth_id": auth["auth_id"], "amount": 100, "merchant_id": "merchant_stress"}
+        responses, summary = burst("/payments/capture", shuffled_requests(capture, keys))
+        results('capture_burst', summary)
+
+        assert_identical_per_key(responses)
+        assert len(ledger_rows(dynamodb_mock, 'capture')) == STRESS_KEYS
+        balance = dynamodb_mock.get_item(Key=balance_key(auth["auth_id"]))['Item']
+        assert balance['captured_amount'] == Decimal(100 * STRESS_KEYS)
+        assert balance['capturable_amount'] == Decimal(2500 - 100 * STRESS_KEYS)
+
+    def test_conflicting_claims_replay_the_winner(self, monkeypatch, dynamodb_mock, sns_mock, unthrottled, uncoalesced, results):
+        atomic = AtomicDynamoDB(conflict_rate=0.5).install(monkeypatch)
+        keys = [str(uuid.uuid4()) for _ in range(STRESS_KEYS)]
+        responses, summary = burst("/payments/authorize", shuffled_requests(AUTHORIZATION, keys))
+        results('authorize_conflict_burst', {**summary, 'conflicts': atomic.conflicts})
+        assert atomic.conflicts > 0
+
+        assert_identical_per_key(responses)
+        assert len(ledger_rows(dynamodb_mock, 'authorization')) == STRESS_KEYS
+
+    def test_ingest_batches_sharing_keys_write_once(self, dynamodb_mock, sns_mock, monkeypatch, unthrottled, uncoalesced):
+        AtomicDynamoDB().install(monkeypatch)
+        keys = [str(uuid.uuid4()) for _ in range(STRESS_KEYS)]
+        # Every in-flight batch repeats every key, racing the same keys sent to /payments/authorize
+        rows = [{"operation": "authorize", "idempotency_key": key, "request": AUTHORIZATION}
+                for _ in range(STRESS_REQUESTS_PER_KEY) for key in keys]
+        ingestor = BulkIngestor(INGEST_OPERATIONS, write_ingest_batch, batch_size=len(keys), max_in_flight=4)
+
+        async def ingest():
+            async def body():
+                yield "".join(json.dumps(row) + "\n" for row in rows).encode()
+            return [result async for result in ingestor.run(body())]
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            requests = executor.submit(burst, "/payments/authorize", shuffled_requests(AUTHORIZATION, keys))
+            ingested = asyncio.run(ingest())
+            responses, _ = requests.result()
+
+        by_key = assert_identical_per_key(responses)
+        for result in ingested[:-1]:
+            assert result["outcome"] in ("accepted", "replayed"), result
+            assert result["result"]["transaction_id"] == by_key[result["idempotency_key"]]["transaction_id"]
+        assert len(ledger_rows(dynamodb_mock, 'authorization')) == STRESS_KEYS
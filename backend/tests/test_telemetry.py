@@ -0,0 +1,126 @@
+"""
+Unit tests for per-phase request telemetry
+
+This module tests that payment requests emit CloudWatch EMF records with
+per-phase timings and endpoint/outcome dimensions, and that the DynamoDB
+capacity each phase consumed is emitted and summed per endpoint.
+"""
+
+import json
+
+from fastapi.testclient import TestClient
+
+import handler
+from aws_clients import consumed_units
+from handler import app
+from telemetry import PHASES, UNPHASED, CapacityUsage, RequestTimer, resolve_outcome
+
+client = TestClient(app)
+
+def emf_records(output: str):
+    """Parse the EMF records printed to stdout"""
+    return [json.loads(line) for line in output.splitlines() if line.startswith('{"_aws"')]
+
+class TestRequestTimer:
+    """Test phase accumulation."""
+
+    def test_repeated_phase_is_summed(self):
+        timer = RequestTimer(endpoint='/payments/capture')
+        timer.record('validation', 1.5)
+        timer.record('validation', 2.5)
+        assert timer.phases['validation'] == 4.0
+
+    def test_phase_tracks_current_phase(self):
+        timer = RequestTimer(endpoint='/payments/authorize')
+        with timer.phase('ledger_write'):
+            assert timer.current_phase == 'ledger_write'
+        assert timer.current_phase is None
+        assert 'ledger_write' in timer.phases
+
+    def test_outcome_resolution(self):
+        assert resolve_outcome('approved', 200) == 'approved'
+        assert resolve_outcome(None, 200) == 'ok'
+        assert resolve_outcome('approved', 409) == 'rejected'
+        assert resolve_outcome(None, 500) == 'error'
+
+class TestEmbeddedMetrics:
+    """Test EMF emission from the payment endpoints."""
+
+    def test_authorize_emits_all_phases(self, dynamodb_mock, sns_mock, capsys):
+        payload = {
+            "amount": 5000,
+            "currency": "USD",
+            "card_number": "4242424242424242",
+            "card_holder": "John Doe",
+            "expiry_month": 12,
+            "expiry_year": 2030,
+            "cvv": "123",
+            "merchant_id": "merchant_123"
+        }
+        response = client.post("/payments/authorize", json=payload, headers={"X-Idempotency-Key": "emf-auth-1"})
+        assert response.status_code == 200
+
+        records = emf_records(capsys.readouterr().out)
+        record = next(r for r in records if r.get('endpoint') == '/payments/authorize')
+        assert record['outcome'] == 'approved'
+        for phase in PHASES:
+            assert f"{phase}_ms" in record
+        assert 'total_ms' in record
+
+    def test_replay_outcome(self, dynamodb_mock, sns_mock, capsys):
+        payload = {
+            "amount": 5000,
+            "card_number": "4242424242424242",
+            "card_holder": "John Doe",
+            "expiry_month": 12,
+            "expiry_year": 2030,
+            "cvv": "123",
+            "merchant_id": "merchant_123"
+        }
+        headers = {"X-Idempotency-Key": "emf-auth-replay"}
+        client.post("/payments/authorize", json=payload, headers=headers)
+        client.post("/payments/authorize", json=payload, headers=headers)
+
+        records = [r for r in emf_records(capsys.readouterr().out) if r.get('endpoint') == '/payments/authorize']
+        assert [r['outcome'] for r in records] == ['approved', 'replayed']
+
+class TestConsumedCapacity:
+    """Test capacity accounting per phase and endpoint."""
+
+    def test_units_split_by_operation(self):
+        assert consumed_units('GetItem', {'TableName': 'ledger', 'CapacityUnits': 0.5}) == [('ledger', 0.5, 0.0)]
+        assert consumed_units('PutItem', {'TableName': 'ledger', 'CapacityUnits': 2.0}) == [('ledger', 0.0, 2.0)]
+        assert consumed_units('TransactWriteItems', [
+            {'TableName': 'ledger', 'CapacityUnits': 6.0, 'ReadCapacityUnits': 2.0, 'WriteCapacityUnits': 4.0},
+            {'TableName': 'idempotency', 'CapacityUnits': 2.0, 'WriteCapacityUnits': 2.0},
+        ]) == [('ledger', 2.0, 4.0), ('idempotency', 0.0, 2.0)]
+        assert consumed_units('Query', None) == []
+
+    def test_capacity_is_charged_to_the_current_phase(self):
+        timer = RequestTimer(endpoint='/payments/capture')
+        timer.consume('ledger', 1.0, 0.0)
+        with timer.phase('ledger_write'):
+            timer.consume('ledger', 0.0, 4.0)
+            timer.consume('idempotency', 0.0, 2.0)
+        assert timer.phase_capacity() == {UNPHASED: (1.0, 0.0), 'ledger_write': (0.0, 6.0)}
+
+        usage = CapacityUsage()
+        usage.add(timer)
+        usage.add(RequestTimer(endpoint='/payments/capture'))
+        assert usage.stats()['/payments/capture'] == {
+            'requests': 2, 'rcu': 1.0, 'wcu': 6.0,
+            'phases': {UNPHASED: {'rcu': 1.0, 'wcu': 0.0}, 'ledger_write': {'rcu': 0.0, 'wcu': 6.0}},
+            'tables': {'ledger': {'rcu': 1.0, 'wcu': 4.0}, 'idempotency': {'rcu': 0.0, 'wcu': 2.0}},
+        }
+
+    def test_requests_report_consumed_capacity(self, dynamodb_mock, sns_mock, monkeypatch, capsys):
+        monkeypatch.setattr(handler, 'capacity_usage', CapacityUsage())
+        monkeypatch.setattr('telemetry.capacity_usage', handler.capacity_usage)
+        client.get("/transactions")
+
+        record = next(r for r in emf_records(capsys.readouterr().out) if r.get('endpoint') == '/transactions')
+        assert record['total_rcu'] == record[f"{UNPHASED}_rcu"]
+        assert record['total_rcu'][0] > 0
+        capacity = client.get("/health").json()['consumed_capacity']
+        assert capacity['/transactions']['requests'] == 1
+        assert capacity['/transactions']['tables']['payments-projections']['rcu'] > 0
@@ -0,0 +1,133 @@
+"""
+Unit tests for traffic capture and replay
+
+This module tests secret redaction in captures, the binary log round trip,
+replay pacing, idempotency-key and ID rewriting, and run comparison.
+"""
+
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import traffic
+from conftest import AUTHORIZATION as DEFAULT_AUTHORIZATION
+from handler import app
+from traffic import CaptureRecord, CaptureWriter, Replayer, compare_runs, read_capture
+
+client = TestClient(app)
+
+AUTHORIZATION = {**DEFAULT_AUTHORIZATION, "card_number": "5555555555554444", "cvv": "987"}
+
+@pytest.fixture
+def capture(monkeypatch, tmp_path):
+    """Enable capture into a temporary file."""
+    path = tmp_path / "capture.bin"
+    writer = CaptureWriter(str(path))
+    monkeypatch.setattr(traffic, 'TRAFFIC_CAPTURE_ENABLED', True)
+    monkeypatch.setattr(traffic, 'TRAFFIC_CAPTURE_SAMPLE_RATE', 1.0)
+    monkeypatch.setattr(traffic, '_writer', writer)
+    yield path
+    writer.close()
+
+def client_transport(method, path, headers, body):
+    response = client.request(method, path, headers=headers, content=body or None)
+    return response.status_code, response.content
+
+def record(started, path="/health", body=b''):
+    return CaptureRecord(started, 1.0, 200, "GET", path, path, {}, body)
+
+class TestCapture:
+    """Test what the middleware writes."""
+
+    def test_disabled_writes_nothing(self, tmp_path, monkeypatch):
+        path = tmp_path / "capture.bin"
+        monkeypatch.setattr(traffic, '_writer', CaptureWriter(str(path)))
+        client.get("/health")
+        assert not path.exists()
+
+    def test_records_requests_without_secrets(self, capture, dynamodb_mock, sns_mock):
+        response = client.post("/payments/authorize", json=AUTHORIZATION, headers={
+            "X-Idempotency-Key": "capture-1", "X-API-Key": "secret", "Authorization": "Bearer secret"
+        })
+        assert response.status_code == 200
+        client.get("/health?verbose=1")
+
+        authorize, health = list(read_capture(str(capture)))
+        assert authorize.method == "POST" and authorize.status == 200
+        assert authorize.endpoint == "/payments/authorize"
+        assert authorize.headers["x-idempotency-key"] == "capture-1"
+        assert "x-api-key" not in authorize.headers and "authorization" not in authorize.headers
+        assert b"5555555555554444" not in authorize.body and b"987" not in authorize.body
+        assert json.loads(authorize.body)["card_number"] == traffic.masked_card_number("5555555555554444")
+        assert authorize.response_ids == {"auth_id": response.json()["auth_id"],
+                                          "transaction_id": response.json()["transaction_id"]}
+        assert health.path == "/health?verbose=1" and health.duration_ms > 0
+
+    def test_torn_tail_is_ignored(self, tmp_path):
+        path = tmp_path / "capture.bin"
+        writer = CaptureWriter(str(path))
+        writer.write(record(1.0))
+        writer.write(record(2.0, body=b'x' * 1000))
+        writer.close()
+        with open(path, 'ab') as f:
+            f.write(b'\x40\x00\x00\x00partial')
+
+        records = list(read_capture(str(path)))
+        assert [r.started for r in records] == [1.0, 2.0]
+        assert records[1].body == b'x' * 1000
+
+class TestReplay:
+    """Test replay against the app."""
+
+    def test_replay_rewrites_keys_and_ids(self, capture, monkeypatch, dynamodb_mock, sns_mock):
+        auth = client.post("/payments/authorize", json=AUTHORIZATION, headers={"X-Idempotency-Key": "a-1"}).json()
+        capture_request = {"auth_id": auth["auth_id"], "amount": 1000, "merchant_id": "merchant_123"}
+        client.post("/payments/capture", json=capture_request, headers={"X-Idempotency-Key": "c-1"})
+        client.post("/payments/capture", json=capture_request, headers={"X-Idempotency-Key": "c-1"})
+        records = list(read_capture(str(capture)))
+        monkeypatch.setattr(traffic, 'TRAFFIC_CAPTURE_ENABLED', False)
+
+        # Two workers, so captures may be dispatched before their authorization returns
+        runs = [Replayer(client_transport, speed=None, concurrency=2).run(iter(records)) for _ in range(2)]
+
+        for run in runs:
+            assert [r['status'] for r in run['requests']] == [200, 200, 200]
+            assert all(r['status'] == r['captured_status'] for r in run['requests'])
+        captures = [row for row in dynamodb_mock.scan()["Items"] if row.get("type") == "capture"]
+        # One capture per run: the reused key was replayed, not written twice
+        assert len(captures) == 3
+        assert len({row["auth_id"] for row in captures}) == 3
+
+    def test_speed_scales_gaps(self):
+        records = [record(100.0 + i * 0.2) for i in range(3)]
+        sent = []
+
+        def transport(method, path, headers, body):
+            sent.append(time.monotonic())
+            return 200, b'{}'
+
+        Replayer(transport, speed=1, concurrency=1).run(iter(records))
+        assert sent[-1] - sent[0] == pytest.approx(0.4, abs=0.1)
+        sent.clear()
+        Replayer(transport, speed=10, concurrency=1).run(iter(records))
+        assert sent[-1] - sent[0] == pytest.approx(0.04, abs=0.03)
+
+class TestCompare:
+    """Test regression detection between runs."""
+
+    def run(self, latency_ms, status=200, count=50):
+        return {'elapsed_s': 1.0, 'requests': [
+            {'endpoint': 'GET /health', 'status': status, 'captured_status': 200,
+             'latency_ms': latency_ms, 'lag_ms': 0.0} for _ in range(count)
+        ]}
+
+    def test_unchanged_runs_pass(self):
+        report = compare_runs(self.run(10.0), self.run(10.5))
+        assert report['regressions'] == []
+        assert report['endpoints']['GET /health']['p50_change_pct'] == 5.0
+
+    def test_latency_and_errors_regress(self):
+        assert any('p99_ms' in r for r in compare_runs(self.run(10.0), self.run(20.0))['regressions'])
+        assert any('error rate' in r for r in compare_runs(self.run(10.0), self.run(10.0, status=503))['regressions'])
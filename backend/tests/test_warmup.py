@@ -0,0 +1,74 @@
+"""
+Unit tests for container warm-up
+
+This module tests warm-up event handling, the connection pools it opens,
+and the init-time warm-up switch.
+"""
+
+import asyncio
+import json
+
+import warmup
+from aws_clients import READ_TIMEOUT_TIERS
+from handler import app, lambda_handler
+
+def api_gateway_event(method, path, body=None):
+    return {
+        "resource": path,
+        "path": path,
+        "httpMethod": method,
+        "headers": {"Content-Type": "application/json"},
+        "multiValueHeaders": {"Content-Type": ["application/json"]},
+        "queryStringParameters": None,
+        "multiValueQueryStringParameters": None,
+        "requestContext": {"resourcePath": path, "httpMethod": method, "stage": "v1",
+                           "identity": {"sourceIp": "127.0.0.1"}},
+        "body": json.dumps(body) if body is not None else None,
+        "isBase64Encoded": False,
+    }
+
+class TestWarmupEvent:
+    """Test the warm-up path of lambda_handler."""
+
+    def test_warmup_opens_every_pool_without_payment_logic(self, dynamodb_mock, sns_mock):
+        result = lambda_handler({"warmup": True}, None)
+
+        assert result["warmup"] is True
+        assert result["app_status"] == 200
+        assert set(result["connections"]) == {
+            f"{service}@{tier}s" for service in ("dynamodb", "sns") for tier in READ_TIMEOUT_TIERS
+        }
+        assert all(isinstance(ms, float) for ms in result["connections"].values())
+        assert dynamodb_mock.scan()["Items"] == []
+
+    def test_failed_dependency_is_reported(self, dynamodb_mock, sns_mock):
+        missing_topic = "arn:aws:sns:us-east-1:123456789012:missing-topic"
+        result = warmup.warm_up(app, {dynamodb_mock.name: {"transaction_id": "warmup", "created_at": "warmup"}},
+                                missing_topic)
+        assert all("error" in result["connections"][f"sns@{tier}s"] for tier in READ_TIMEOUT_TIERS)
+        assert all(isinstance(result["connections"][f"dynamodb@{tier}s"], float) for tier in READ_TIMEOUT_TIERS)
+
+    def test_api_requests_still_served(self, dynamodb_mock, sns_mock):
+        # Mangum sets the thread's event loop once; asyncio.run() in other tests clears it
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        for _ in range(2):
+            response = lambda_handler(api_gateway_event("GET", "/health"), None)
+            assert response["statusCode"] == 200
+            assert json.loads(response["body"])["status"] == "healthy"
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    def test_only_warmup_events_match(self):
+        assert warmup.is_warmup_event({"warmup": True})
+        assert not warmup.is_warmup_event({"warmup": "yes"})
+        assert not warmup.is_warmup_event(api_gateway_event("GET", "/health"))
+
+    def test_init_warmup_follows_initialization_type(self, monkeypatch):
+        monkeypatch.setattr(warmup, 'WARMUP_ON_INIT', 'auto')
+        monkeypatch.setenv('AWS_LAMBDA_INITIALIZATION_TYPE', 'provisioned-concurrency')
+        assert warmup.warm_on_init()
+        monkeypatch.setenv('AWS_LAMBDA_INITIALIZATION_TYPE', 'on-demand')
+        assert not warmup.warm_on_init()
+        monkeypatch.setattr(warmup, 'WARMUP_ON_INIT', 'true')
+        assert warmup.warm_on_init()
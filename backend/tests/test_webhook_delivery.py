@@ -0,0 +1,153 @@
+"""
+Unit tests for webhook delivery
+
+This module tests per-endpoint delivery modes, coalescing into signed batch
+envelopes, publish ordering, and retries after a failed request.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from webhook_delivery import WEBHOOK_DELIVERY_TIMEOUT_S, Endpoint, deliver, lambda_handler, parse_records
+from webhooks import WEBHOOK_SECRET, build_webhook_message, generate_hmac_signature
+
+def sqs_record(n, event_type='payment_authorized', transaction_id=None):
+    message = build_webhook_message(event_type, {'transaction_id': transaction_id or f"auth_{n}"})
+    message['payload']['timestamp'] = f"2026-10-19T10:00:00.{n:06d}"
+    notification = {'MessageId': f"msg-{n}", 'Message': json.dumps(message)}
+    return {'messageId': f"sqs-{n}", 'body': json.dumps(notification)}
+
+class Recorder:
+    def __init__(self, fail_on=None):
+        self.requests = []
+        self.fail_on = fail_on
+
+    def __call__(self, url, body, headers):
+        if self.fail_on is not None and len(self.requests) == self.fail_on:
+            self.fail_on = None
+            raise RuntimeError("503")
+        self.requests.append((url, json.loads(body), headers))
+
+class TestCoalescing:
+    """Test how events become requests."""
+
+    def test_batches_cut_requests_by_an_order_of_magnitude(self):
+        events = parse_records([sqs_record(n) for n in range(1000)])
+        send = Recorder()
+        summary = deliver([Endpoint('ep_batch', 'https://batch.example', delivery='batch', batch_max_events=100)],
+                          events, send)
+        assert summary['requests'] == 10
+        assert summary['failed_receipts'] == []
+
+        _, message, headers = send.requests[0]
+        assert message['payload']['count'] == 100
+        assert headers['X-Webhook-Event-Count'] == '100'
+        assert message['signature'] == generate_hmac_signature(json.dumps(message['payload']), WEBHOOK_SECRET)
+        assert message['payload']['events'][0]['event_id'] == 'msg-0'
+
+    def test_single_endpoints_get_the_published_envelope(self):
+        records = [sqs_record(0), sqs_record(1, event_type='payment_refunded')]
+        send = Recorder()
+        deliver([Endpoint('ep_single', 'https://single.example', events=['payment_refunded'])],
+                parse_records(records), send)
+        assert len(send.requests) == 1
+        _, message, headers = send.requests[0]
+        assert message == json.loads(json.loads(records[1]['body'])['Message'])
+        assert headers['X-Webhook-Event-Id'] == 'msg-1'
+
+    def test_unknown_delivery_mode_is_rejected(self):
+        with pytest.raises(ValueError):
+            Endpoint('ep', 'https://example', delivery='stream')
+
+class TestOrdering:
+    """Test publish ordering across batches and failures."""
+
+    def test_events_are_delivered_in_publish_order(self):
+        records = [sqs_record(n, transaction_id='capture_1') for n in range(30)]
+        random.Random(4).shuffle(records)
+        send = Recorder()
+        deliver([Endpoint('ep', 'https://example', delivery='batch', batch_max_events=7)], parse_records(records), send)
+        delivered = [event['event_id'] for _, message, _ in send.requests for event in message['payload']['events']]
+        assert delivered == [f"msg-{n}" for n in range(30)]
+
+    def test_failure_holds_back_the_endpoints_later_events(self):
+        records = [sqs_record(n) for n in range(10)]
+        send = Recorder(fail_on=1)
+        endpoints = [Endpoint('ep', 'https://example', delivery='batch', batch_max_events=4)]
+        summary = deliver(endpoints, parse_records(records), send)
+        assert len(send.requests) == 1
+        assert summary['failed_endpoints'] == ['ep']
+        assert summary['failed_receipts'] == [f"sqs-{n}" for n in range(4, 10)]
+
+    def test_events_carry_their_sequence_in_the_transaction(self):
+        captured, settled = parse_records([
+            sqs_record(0, event_type='payment_captured', transaction_id='capture_1'),
+            sqs_record(1, event_type='transaction_settled', transaction_id='capture_1'),
+        ])
+        assert (captured.payload['sequence'], settled.payload['sequence']) == (1, 2)
+
+class TestDeadline:
+    """Test the work done per invocation."""
+
+    def test_requests_stop_before_the_deadline(self):
+        send = Recorder()
+
+        def slow_send(url, body, headers):
+            time.sleep(0.1)
+            send(url, body, headers)
+
+        endpoints = [Endpoint('ep_single', 'https://single.example'),
+                     Endpoint('ep_batch', 'https://batch.example', delivery='batch', batch_max_events=10)]
+        # Time for the first request of each endpoint only
+        summary = deliver(endpoints, parse_records([sqs_record(n) for n in range(10)]), slow_send,
+                          deadline=time.monotonic() + WEBHOOK_DELIVERY_TIMEOUT_S + 0.05)
+        assert len(send.requests) == 2
+        assert summary['deferred_endpoints'] == ['ep_single']
+        assert summary['failed_endpoints'] == []
+        assert summary['failed_receipts'] == [f"sqs-{n}" for n in range(1, 10)]
+
+    def test_handler_returns_what_it_has_no_time_for(self, monkeypatch):
+        monkeypatch.setenv('WEBHOOK_ENDPOINTS', json.dumps([{'id': 'ep', 'url': 'https://unreachable.example'}]))
+
+        class Context:
+            def get_remaining_time_in_millis(self):
+                return 1000
+
+        result = lambda_handler({'Records': [sqs_record(0), sqs_record(1)]}, Context())
+        assert result == {'batchItemFailures': [{'itemIdentifier': 'sqs-0'}, {'itemIdentifier': 'sqs-1'}]}
+
+class TestLambdaHandler:
+    """Test delivery over HTTP through the SQS consumer."""
+
+    def test_posts_batches_and_reports_failures(self, monkeypatch):
+        received = []
+
+        class Receiver(BaseHTTPRequestHandler):
+            def do_POST(self):
+                received.append((self.path, json.loads(self.rfile.read(int(self.headers['Content-Length'])))))
+                self.send_response(200 if self.path == '/ok' else 500)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = HTTPServer(('127.0.0.1', 0), Receiver)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+        monkeypatch.setenv('WEBHOOK_ENDPOINTS', json.dumps([
+            {'id': 'ok', 'url': f"{base}/ok", 'delivery': 'batch', 'batch_max_events': 50},
+            {'id': 'down', 'url': f"{base}/down", 'events': ['payment_refunded']},
+        ]))
+        try:
+            result = lambda_handler({'Records': [sqs_record(0), sqs_record(1, event_type='payment_refunded')]}, None)
+        finally:
+            server.shutdown()
+
+        assert result == {'batchItemFailures': [{'itemIdentifier': 'sqs-1'}]}
+        ok_batches = [body for path, body in received if path == '/ok']
+        assert [event['event_id'] for event in ok_batches[0]['payload']['events']] == ['msg-0', 'msg-1']
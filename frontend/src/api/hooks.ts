@@ -22,33 +22,104 @@ export interface Metrics {
 }
 
 export interface WebhookEvent {
+  event_id: string;
   event_type: string;
   endpoint: string;
   status: 'delivered' | 'failed' | 'pending';
   timestamp: string;
 }
 
-// API functions
-const fetchTransactions = async (): Promise<Transaction[]> => {
-  const response = await api.get('/transactions');
-  return response.data;
+// Columns rendered by the list pages; the API projects responses to these
+const TRANSACTION_FIELDS = 'transaction_id,type,status,amount,currency,created_at,merchant_id';
+const WEBHOOK_EVENT_FIELDS = 'event_id,event_type,status,endpoint_url,response_time,created_at';
+
+// Local replica of a list, kept current through its change feed
+interface Replica<T> {
+  cursor: string;
+  items: T[];
+  // Item key -> index in items
+  index: Map<unknown, number>;
+}
+
+interface ChangePage<T> {
+  // An item that expired or was evicted comes back as its key and deleted: true
+  items: (T & { deleted?: boolean })[];
+  cursor: string;
+  has_more: boolean;
+  reset: boolean;
+}
+
+// Fetch only what changed since the replica's cursor; an idle sync returns no items
+const syncReplica = async <T extends object>(
+  path: string,
+  key: keyof T,
+  fields: string,
+  replica: Replica<T> | undefined
+): Promise<Replica<T>> => {
+  let { cursor, items, index } = replica ?? { cursor: undefined, items: [] as T[], index: new Map() };
+  let changed = false;
+  // Positions of deleted items, dropped once every page is applied
+  const removed = new Set<number>();
+  let page: ChangePage<T>;
+  do {
+    const response = await api.get<ChangePage<T>>(path, { params: { since: cursor, fields } });
+    page = response.data;
+    if (page.reset) {
+      items = [];
+      index = new Map();
+      removed.clear();
+      changed = true;
+    }
+    if (page.items.length && !changed) {
+      // Copy once, so the previous replica stays unchanged for React
+      items = [...items];
+      index = new Map(index);
+      changed = true;
+    }
+    for (const item of page.items) {
+      const position = index.get(item[key]);
+      if (item.deleted) {
+        if (position !== undefined) {
+          index.delete(item[key]);
+          removed.add(position);
+        }
+      } else if (position === undefined) {
+        index.set(item[key], items.length);
+        items.push(item);
+      } else {
+        items[position] = item;
+      }
+    }
+    cursor = page.cursor;
+  } while (page.has_more);
+  if (removed.size) {
+    items = items.filter((_, position) => !removed.has(position));
+    index = new Map(items.map((item, position) => [item[key], position]));
+  }
+  return { cursor: cursor as string, items, index };
 };
 
+const replicaItems = <T,>(replica: Replica<T>): T[] => replica.items;
+
+// API functions
 const fetchMetrics = async (): Promise<Metrics> => {
   const response = await api.get('/metrics');
   return response.data;
 };
 
-const fetchWebhookEvents = async (): Promise<WebhookEvent[]> => {
-  const response = await api.get('/webhooks/events');
-  return response.data;
-};
-
 // React Query hooks
 export const useTransactions = () => {
+  const queryClient = useQueryClient();
+
   return useQuery({
     queryKey: ['transactions'],
-    queryFn: fetchTransactions,
+    queryFn: () => syncReplica<Transaction>(
+      '/transactions/changes', 'transaction_id', TRANSACTION_FIELDS,
+      queryClient.getQueryData<Replica<Transaction>>(['transactions'])
+    ),
+    select: replicaItems,
+    // Unchanged lists keep their identity without a deep comparison
+    structuralSharing: false,
     staleTime: 30000, // 30 seconds
   });
 };
@@ -63,9 +134,16 @@ export const useMetrics = () => {
 };
 
 export const useWebhookEvents = () => {
+  const queryClient = useQueryClient();
+
   return useQuery({
     queryKey: ['webhook-events'],
-    queryFn: fetchWebhookEvents,
+    queryFn: () => syncReplica<WebhookEvent>(
+      '/webhooks/events/changes', 'event_id', WEBHOOK_EVENT_FIELDS,
+      queryClient.getQueryData<Replica<WebhookEvent>>(['webhook-events'])
+    ),
+    select: replicaItems,
+    structuralSharing: false,
     staleTime: 15000, // 15 seconds
   });
 };
@@ -80,7 +158,7 @@ export const useCreateTransaction = () => {
       return response.data;
     },
     onSuccess: () => {
-      // Invalidate and refetch transactions
+      // Refetching syncs only the new transaction into the replica
       queryClient.invalidateQueries({ queryKey: ['transactions'] });
       queryClient.invalidateQueries({ queryKey: ['metrics'] });
     },